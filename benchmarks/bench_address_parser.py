@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк parse_address: попередня реалізація (без кешу, ~8 regex на виклик)
+vs поточна parse_address (LRU-кеш + префільтр компонентів) vs пакетна parse_addresses.
+
+Корпус — синтетичні адреси з повторами (як у реальних візурах: одні й ті самі
+вулиці в багатьох immobili і між повторними парсингами). Для кожної адреси
+перевіряється, що AddressParts ідентичні попередній реалізації.
+
+Запуск:
+    python -m benchmarks.bench_address_parser                  # 100k адрес, ~5k унікальних
+    python -m benchmarks.bench_address_parser --size 100000 --unique 100000
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import re
+import time
+from typing import Callable, List, Optional
+
+from uppi.parsers.address_parser import (
+    AddressParts,
+    address_cache_info,
+    clear_address_cache,
+    parse_address,
+    parse_addresses,
+)
+
+# ---------------------------------------------------------
+# Попередня реалізація (еталон для порівняння)
+# ---------------------------------------------------------
+
+_LEGACY_STREET_TYPE_REGEX = re.compile(
+    r"""
+    ^
+    (VIA|VIALE|PIAZZA|P\.?ZZA|CORSO|STRADA|VICOLO|LARGO|BORGO|
+     LOCALITÀ|LOC\.?|LOCALITA|FRAZIONE|FRAZ\.?|CONTRADA)
+    \s+
+    (.+)
+    $
+    """,
+    re.IGNORECASE | re.UNICODE | re.VERBOSE,
+)
+_LEGACY_COMPONENT_PATTERNS = {
+    "scala": re.compile(r"\b(?:SCALA|SC\.?)\s*([A-Z0-9]+)\b", re.IGNORECASE),
+    "interno": re.compile(r"\b(?:INTERNO|INT\.?)\s*([A-Z0-9]+)\b", re.IGNORECASE),
+    "piano": re.compile(r"\b(?:PIANO|P\.)\s*(T|TERRA|RIALZATO|AMMEZZATO|S\d|[-A-Z0-9°]+)\b", re.IGNORECASE),
+}
+_LEGACY_CIVICO_REGEXES = [
+    re.compile(r"\b(?:N\.?|NUM\.?|CIVICO)\s*([\d]+[A-Z]?([\-/\dA-Z]+)?)\b", re.IGNORECASE),
+    re.compile(r"\b([\d]+[A-Z]?([\-/\dA-Z]+)?)\s*$", re.IGNORECASE),
+]
+_LEGACY_SNC_REGEX = re.compile(r"\b(N\.?\s*)?SNC\b", re.IGNORECASE)
+
+
+def legacy_parse_address(text: str) -> AddressParts:
+    raw = text.replace("\n", " ").strip()
+
+    via_type: Optional[str] = None
+    m = _LEGACY_STREET_TYPE_REGEX.match(raw)
+    if m:
+        via_type = m.group(1).upper().replace(".", "").replace("PZZA", "PIAZZA")
+        via_name = m.group(2).strip()
+    else:
+        via_name = raw
+    working_tail = via_name
+
+    via_num: Optional[str] = None
+    if _LEGACY_SNC_REGEX.search(working_tail):
+        working_tail = _LEGACY_SNC_REGEX.sub(" ", working_tail).strip()
+    else:
+        for regex in _LEGACY_CIVICO_REGEXES:
+            m = regex.search(working_tail)
+            if not m:
+                continue
+            via_num = m.group(1)
+            working_tail = regex.sub(" ", working_tail, count=1).strip()
+            break
+
+    found = {"scala": None, "interno": None, "piano": None}
+    for key, pattern in _LEGACY_COMPONENT_PATTERNS.items():
+        m = pattern.search(working_tail)
+        if not m:
+            continue
+        found[key] = m.group(1).strip().upper()
+        working_tail = pattern.sub(" ", working_tail, count=1).strip()
+
+    return AddressParts(
+        via_type=via_type,
+        via_name=re.sub(r"\s{2,}", " ", working_tail).strip() or None,
+        via_num=via_num,
+        scala=found["scala"],
+        interno=found["interno"],
+        piano=found["piano"],
+        indirizzo_raw=raw,
+    )
+
+
+# ---------------------------------------------------------
+# Корпус
+# ---------------------------------------------------------
+
+STREET_TYPES = ["VIA", "VIALE", "PIAZZA", "P.ZZA", "CORSO", "STRADA", "VICOLO", "LARGO", "LOC.", "FRAZ.", "CONTRADA", ""]
+STREET_NAMES = [
+    "ROMA", "DELLA RIVIERA", "XX SETTEMBRE", "GARIBALDI", "NAZIONALE ADRIATICA", "MARCONI", "D'ANNUNZIO",
+    "TIBURTINA VALERIA", "DEI MILLE", "FIRENZE", "LUNGOMARE MATTEOTTI", "SAN SILVESTRO", "DEL CIRCUITO",
+    "PINDARO", "SCALO", "INTERNATI", "PIANELLA", "COLLE PINETA", "VITTORIO EMANUELE II", "DELLE PALME",
+]
+CIVICI = ["n. {n}", "n.{n}", "N. {n}/A", "{n}", "civico {n}B", "n. SNC", "SNC", "NUM. {n}-{m}", ""]
+COMPONENTS = [
+    "Scala {s}", "SC. {s}", "Interno {i}", "INT.{i}", "int {i}", "Piano {p}", "P. {p}", "piano T", "Piano S1",
+]
+
+
+def build_corpus(size: int, unique: int, seed: int = 7) -> List[str]:
+    rng = random.Random(seed)
+    pool: List[str] = []
+    for _ in range(unique):
+        parts = [rng.choice(STREET_TYPES), rng.choice(STREET_NAMES)]
+        parts.append(rng.choice(CIVICI).format(n=rng.randint(1, 400), m=rng.randint(1, 9)))
+        for comp in rng.sample(COMPONENTS, rng.randint(0, 3)):
+            parts.append(comp.format(s=rng.choice("ABCU1"), i=rng.randint(1, 40), p=rng.choice(["T", "1", "2", "S1", "-1"])))
+        text = " ".join(p for p in parts if p)
+        if rng.random() < 0.05:
+            text = text.replace(" Scala", "\nScala")
+        pool.append(text)
+
+    # Повтори з перекосом до популярних адрес
+    weights = [1.0 / (rank + 1) for rank in range(len(pool))]
+    return rng.choices(pool, weights=weights, k=size)
+
+
+# ---------------------------------------------------------
+# main
+# ---------------------------------------------------------
+
+def _timed(fn: Callable[[], List[AddressParts]]):
+    t0 = time.perf_counter()
+    result = fn()
+    return result, time.perf_counter() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк parse_address / parse_addresses")
+    parser.add_argument("--size", type=int, default=100_000, help="Кількість адрес у корпусі")
+    parser.add_argument("--unique", type=int, default=5_000, help="Кількість унікальних адрес")
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.size, max(1, min(args.unique, args.size)))
+    print(f"Корпус: {len(corpus)} адрес, унікальних: {len(set(corpus))}")
+
+    legacy, t_legacy = _timed(lambda: [legacy_parse_address(t) for t in corpus])
+
+    clear_address_cache()
+    single, t_single = _timed(lambda: [parse_address(t) for t in corpus])
+    info = address_cache_info()
+
+    clear_address_cache()
+    batch, t_batch = _timed(lambda: parse_addresses(corpus))
+
+    clear_address_cache()
+    cold_unique, t_unique = _timed(lambda: parse_addresses(list(dict.fromkeys(corpus))))
+
+    print("=" * 72)
+    print(f"  {'варіант':<36}  {'час, ms':>9}  {'адрес/s':>12}")
+    for label, sec in [
+        ("попередня parse_address", t_legacy),
+        ("parse_address (LRU)", t_single),
+        ("parse_addresses (batch)", t_batch),
+        ("parse_addresses, лише унікальні", t_unique),
+    ]:
+        n = len(cold_unique) if label.endswith("унікальні") else len(corpus)
+        print(f"  {label:<36}  {sec * 1000:>9.1f}  {n / sec:>12.0f}")
+    print(f"  LRU: hits={info.hits} misses={info.misses} currsize={info.currsize}")
+    print(f"  Speedup batch vs попередня: {t_legacy / t_batch:.1f}x")
+
+    mismatches = [
+        (t, a, b) for t, a, b, c in zip(corpus, legacy, single, batch) if not (a == b == c)
+    ]
+    legacy_unique = [legacy_parse_address(t) for t in dict.fromkeys(corpus)]
+    mismatches += [(u.indirizzo_raw, u, l) for u, l in zip(cold_unique, legacy_unique) if u != l]
+    if mismatches:
+        print(f"❌ AddressParts відрізняються для {len(mismatches)} адрес, наприклад:")
+        for text, a, b in mismatches[:10]:
+            print(f"   {text!r}\n     попередня: {a}\n     нова:      {b}")
+    else:
+        print("✅ AddressParts ідентичні попередній реалізації")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк холодного старту: час імпорту точок входу (python -X importtime).
+
+Кожен модуль імпортується в окремому чистому інтерпретаторі; з виводу
+-X importtime беремо кумулятивний час модуля і найважчі залежності.
+Змінні AE_* / SISTER_* з оточення прибираються, щоб перевірити,
+що імпорт не падає без конфігу.
+
+Запуск:
+    python -m benchmarks.bench_import_time
+    python -m benchmarks.bench_import_time --top 15 uppi.pipelines
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import subprocess
+import sys
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+ENTRY_POINTS = [
+    "uppi.spiders.uppi_spider",
+    "uppi.pipelines",
+    "uppi.cli.inspect_clients",
+    "uppi.cli.reparse_visure",
+    "uppi.services.visura_policy",
+]
+
+# Префікси змінних, які прибираємо з оточення дочірнього процесу
+STRIP_ENV_PREFIXES = ("AE_", "SISTER_", "TWO_CAPTCHA_")
+
+
+@dataclass
+class ImportResult:
+    module: str
+    total_ms: float = 0.0
+    error: str = ""
+    # (кумулятивний час, мс; пакет) — найважчі сторонні пакети
+    heaviest: List[Tuple[float, str]] = field(default_factory=list)
+
+
+def _clean_env() -> Dict[str, str]:
+    return {k: v for k, v in os.environ.items() if not k.startswith(STRIP_ENV_PREFIXES)}
+
+
+def measure(module: str, top: int) -> ImportResult:
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        env=_clean_env(),
+    )
+    result = ImportResult(module=module)
+    if proc.returncode != 0:
+        result.error = (proc.stderr.strip().splitlines() or ["?"])[-1]
+        return result
+
+    packages: Dict[str, float] = {}
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line[len("import time:"):].split("|")
+        try:
+            cumulative_us = int(parts[1].strip())
+        except ValueError:
+            continue
+        name = parts[2].strip()
+        if name == module:
+            result.total_ms = cumulative_us / 1000.0
+        # Кореневі пакети сторонніх бібліотек (camelot, fitz, docx, minio, ...)
+        if "." not in name and name != "uppi" and name not in sys.stdlib_module_names:
+            packages[name] = max(packages.get(name, 0.0), cumulative_us / 1000.0)
+
+    result.heaviest = sorted(((ms, name) for name, ms in packages.items()), reverse=True)[:top]
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Час холодного імпорту точок входу uppi (python -X importtime)")
+    parser.add_argument("modules", nargs="*", help=f"Модулі (за замовчуванням: {', '.join(ENTRY_POINTS)})")
+    parser.add_argument("--top", type=int, default=8, help="Скільки найважчих імпортів показати")
+    args = parser.parse_args()
+
+    for module in args.modules or ENTRY_POINTS:
+        res = measure(module, args.top)
+        print("=" * 80)
+        if res.error:
+            print(f"❌ {module}: імпорт впав: {res.error}")
+            continue
+        print(f"{module}: {res.total_ms:.0f} ms")
+        for ms, name in res.heaviest:
+            print(f"    {ms:>8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк часу БД у VisuraProcessor.process_item (без SISTER, парсингу та MinIO).
+
+Потрібна жива PostgreSQL зі схемою (DB_* з .env). Бенчмарк створює тимчасових
+локаторів BENCH..., для кожного — кілька immobili і прогоняє process_item по
+YAML-items (адреси, персони, елементи A-D, контракт, канон, атестація).
+Генерація DOCX виконується, upload — ні. Наприкінці всі BENCH-дані видаляються.
+
+Час БД міряється проксі над з'єднанням: execute / fetch* / commit / rollback
+та вихід з pipeline (саме там у pipeline mode чекаємо відповіді сервера).
+Виграш pipeline mode росте з RTT до сервера — міряйте проти реальної БД, не localhost.
+
+Запуск:
+    python -m benchmarks.bench_process_item_db                     # pipeline (DB_PIPELINE)
+    python -m benchmarks.bench_process_item_db --no-pipeline --save no_pipeline.json
+    python -m benchmarks.bench_process_item_db --compare no_pipeline.json
+
+"До" (psycopg2, до переходу на psycopg 3): скрипт не залежить від драйвера, тож
+його можна прогнати на старій ревізії і порівняти:
+    cp benchmarks/bench_process_item_db.py /tmp/ && git checkout <rev>
+    PYTHONPATH=. python /tmp/bench_process_item_db.py --save before.json
+    git checkout - && python -m benchmarks.bench_process_item_db --compare before.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import shutil
+import statistics
+import time
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterator, List
+
+from uppi.domain import db as domain_db
+from uppi.domain.immobile import Immobile
+from uppi.domain.storage import DOWNLOADS_DIR
+from uppi.services import visura_processor
+from uppi.services.db_repo import db_bulk_upsert_immobili, db_upsert_person
+from uppi.services.visura_processor import VisuraProcessor
+from uppi.utils.item_mapper import map_yaml_to_item
+
+CF_PREFIX = "BENCH"
+BENCH_COMUNE = "BENCHVILLE"
+
+logger = logging.getLogger("bench_process_item_db")
+
+
+# ---------------------------------------------------------
+# Проксі з'єднання з таймінгом
+# ---------------------------------------------------------
+
+@dataclass
+class DbTimer:
+    seconds: float = 0.0
+    executes: int = 0
+    waits: int = 0  # fetch / commit / rollback / вихід з pipeline
+
+    @contextmanager
+    def measure(self, wait: bool) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds += time.perf_counter() - t0
+            if wait:
+                self.waits += 1
+            else:
+                self.executes += 1
+
+
+class _TimedCursor:
+    def __init__(self, cur, timer: DbTimer):
+        self._cur = cur
+        self._timer = timer
+
+    def __enter__(self):
+        self._cur.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._cur.__exit__(*exc)
+
+    def execute(self, *args, **kwargs):
+        with self._timer.measure(wait=False):
+            return self._cur.execute(*args, **kwargs)
+
+    def fetchone(self):
+        with self._timer.measure(wait=True):
+            return self._cur.fetchone()
+
+    def fetchall(self):
+        with self._timer.measure(wait=True):
+            return self._cur.fetchall()
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+
+class _TimedPipeline:
+    def __init__(self, pipeline, timer: DbTimer):
+        self._pipeline = pipeline
+        self._timer = timer
+
+    def __enter__(self):
+        self._pipeline.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        with self._timer.measure(wait=True):
+            return self._pipeline.__exit__(*exc)
+
+
+class TimedConnection:
+    def __init__(self, conn, timer: DbTimer):
+        self._conn = conn
+        self._timer = timer
+
+    def cursor(self, *args, **kwargs):
+        return _TimedCursor(self._conn.cursor(*args, **kwargs), self._timer)
+
+    def commit(self):
+        with self._timer.measure(wait=True):
+            return self._conn.commit()
+
+    def rollback(self):
+        with self._timer.measure(wait=True):
+            return self._conn.rollback()
+
+    def pipeline(self):
+        return _TimedPipeline(self._conn.pipeline(), self._timer)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+# ---------------------------------------------------------
+# Дані
+# ---------------------------------------------------------
+
+def bench_cf(i: int) -> str:
+    return f"{CF_PREFIX}{i:011d}"
+
+
+def seed(n_clients: int, immobili_per_client: int) -> None:
+    with domain_db.pg_connection() as conn:
+        for i in range(n_clients):
+            cf = bench_cf(i)
+            db_upsert_person(conn, cf, "BENCH", f"CLIENT{i}")
+            db_bulk_upsert_immobili(conn, cf, [
+                (Immobile(foglio="10", numero=str(100 + k), sub=str(k + 1), categoria="A/2", classe="2",
+                          consistenza="5 vani", rendita="500,00", superficie_totale=80.0 + k, micro_zona="1"),
+                 None)
+                for k in range(immobili_per_client)
+            ])
+        conn.commit()
+
+
+def cleanup(n_clients: int) -> None:
+    with domain_db.pg_connection() as conn:
+        with conn.cursor() as cur:
+            # persons -> immobili / visure / contracts / ... — ON DELETE CASCADE
+            cur.execute("DELETE FROM public.persons WHERE cf LIKE %s;", (CF_PREFIX + "%",))
+            cur.execute("DELETE FROM public.addresses WHERE comune = %s;", (BENCH_COMUNE,))
+        conn.commit()
+    for i in range(n_clients):
+        shutil.rmtree(DOWNLOADS_DIR / bench_cf(i), ignore_errors=True)
+
+
+def yaml_client(i: int, k: int) -> Dict[str, Any]:
+    return {
+        "LOCATORE_CF": bench_cf(i),
+        "LOCATORE_COMUNE_RES": BENCH_COMUNE,
+        "LOCATORE_VIA": f"VIA ROMA {i}",
+        "LOCATORE_CIVICO": str(i + 1),
+        "CONDUTTORE_NOME": "VERDI GIUSEPPE",
+        "CONDUTTORE_CF": f"{CF_PREFIX}C{i:010d}",
+        "CONDUTTORE_COMUNE": BENCH_COMUNE,
+        "CONDUTTORE_VIA": "VIA FIRENZE 1",
+        "FOGLIO": "10",
+        "NUMERO": str(100 + k),
+        "SUB": str(k + 1),
+        "IMMOBILE_COMUNE": BENCH_COMUNE,
+        "IMMOBILE_VIA": f"VIA DEL BENCH {k}",
+        "CONTRATTO_DATA": "2024-01-15",
+        "DURATA_ANNI": "3",
+        "ENERGY_CLASS": "E",
+        "A1": "X", "B1": "X", "B2": "X", "C1": "X", "C3": "X", "D1": "X",
+    }
+
+
+# ---------------------------------------------------------
+# Прогін
+# ---------------------------------------------------------
+
+@dataclass
+class BenchResult:
+    label: str
+    items: int
+    db_ms: List[float] = field(default_factory=list)
+    wall_ms: List[float] = field(default_factory=list)
+    executes: int = 0
+    waits: int = 0
+
+    def summary(self) -> Dict[str, float]:
+        db_sorted = sorted(self.db_ms)
+        return {
+            "db_ms_mean": statistics.fmean(self.db_ms),
+            "db_ms_p50": statistics.median(self.db_ms),
+            "db_ms_p95": db_sorted[max(0, int(len(db_sorted) * 0.95) - 1)],
+            "wall_ms_mean": statistics.fmean(self.wall_ms),
+            "executes_per_item": self.executes / self.items,
+            "waits_per_item": self.waits / self.items,
+        }
+
+
+class _BenchSpider:
+    name = "bench"
+    logger = logger
+
+
+class _NoUpload:
+    def upload_file(self, *args, **kwargs):
+        pass
+
+    def object_exists(self, *args, **kwargs):
+        return False
+
+
+def run(label: str, n_clients: int, immobili_per_client: int, rounds: int) -> BenchResult:
+    processor = VisuraProcessor()
+    processor.storage_service = _NoUpload()
+    spider = _BenchSpider()
+    result = BenchResult(label=label, items=0)
+
+    real_pg_connection = visura_processor.pg_connection
+    current = DbTimer()
+
+    @contextmanager
+    def timed_pg_connection(*args, **kwargs):
+        with real_pg_connection(*args, **kwargs) as conn:
+            yield TimedConnection(conn, current)
+
+    visura_processor.pg_connection = timed_pg_connection
+    try:
+        # Перший раунд — прогрів (створення контрактів, пул, prepared statements)
+        for rnd in range(rounds + 1):
+            for i in range(n_clients):
+                for k in range(immobili_per_client):
+                    item = map_yaml_to_item(yaml_client(i, k))
+                    current.seconds, current.executes, current.waits = 0.0, 0, 0
+                    t0 = time.perf_counter()
+                    processor.process_item(item, spider)
+                    wall = time.perf_counter() - t0
+                    if rnd == 0:
+                        continue
+                    result.items += 1
+                    result.db_ms.append(current.seconds * 1000)
+                    result.wall_ms.append(wall * 1000)
+                    result.executes += current.executes
+                    result.waits += current.waits
+    finally:
+        visura_processor.pg_connection = real_pg_connection
+        processor.close()
+    return result
+
+
+def print_report(res: BenchResult, baseline: Dict[str, Any] | None) -> None:
+    summary = res.summary()
+    print("=" * 80)
+    print(f"{res.label}: {res.items} items")
+    for key, value in summary.items():
+        line = f"  {key:<20} {value:>10.2f}"
+        if baseline and key in baseline["summary"]:
+            before = baseline["summary"][key]
+            if before:
+                line += f"   (було {before:.2f}, {value / before:.2f}x)"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Час БД у VisuraProcessor.process_item")
+    parser.add_argument("--clients", type=int, default=10, help="Кількість тимчасових локаторів")
+    parser.add_argument("--immobili", type=int, default=3, help="Immobili (items) на локатора")
+    parser.add_argument("--rounds", type=int, default=3, help="Скільки разів прогнати всі items (після прогріву)")
+    parser.add_argument("--no-pipeline", action="store_true", help="Вимкнути pipeline mode (DB_PIPELINE=False)")
+    parser.add_argument("--save", help="Зберегти результат у JSON")
+    parser.add_argument("--compare", help="JSON попереднього прогону для порівняння")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    if args.no_pipeline and hasattr(domain_db, "DB_PIPELINE"):
+        domain_db.DB_PIPELINE = False
+    label = "no-pipeline" if not getattr(domain_db, "DB_PIPELINE", False) else "pipeline"
+
+    cleanup(args.clients)
+    try:
+        seed(args.clients, args.immobili)
+        res = run(label, args.clients, args.immobili, max(1, args.rounds))
+    finally:
+        cleanup(args.clients)
+        domain_db.close_pool()
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_report(res, baseline)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump({**asdict(res), "summary": res.summary()}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк рушіїв таблиць VisuraParser: PyMuPDF find_tables() vs camelot lattice.
+
+Для кожного PDF:
+- час витягування таблиць по кожній сторінці для обох рушіїв (+ speedup),
+- перевірка еквівалентності: повний parse() обома рушіями має дати однакові immobili.
+
+Запуск:
+    python -m benchmarks.bench_table_engines                 # усі PDF з downloads/
+    python -m benchmarks.bench_table_engines a.pdf b.pdf     # конкретні файли
+    python -m benchmarks.bench_table_engines --repeat 3
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import fitz
+
+from uppi.parsers.visura_pdf_parser import (
+    DOWNLOADS_DIR,
+    TABLE_ENGINE_CAMELOT,
+    TABLE_ENGINE_PYMUPDF,
+    VisuraParser,
+)
+
+
+def find_sample_pdfs() -> List[Path]:
+    if not DOWNLOADS_DIR.exists():
+        return []
+    return sorted(DOWNLOADS_DIR.rglob("*.pdf"))
+
+
+def time_page_tables(parser: VisuraParser, pdf_path: Path, repeat: int) -> List[float]:
+    """Найкращий час (сек) витягування таблиць для кожної сторінки."""
+    timings: List[float] = []
+    with fitz.open(str(pdf_path)) as doc:
+        for page_idx in range(len(doc)):
+            page = doc[page_idx]
+            best = float("inf")
+            for _ in range(repeat):
+                t0 = time.perf_counter()
+                # Чистий рушій, без fallback на camelot у _extract_tables
+                if parser.table_engine == TABLE_ENGINE_PYMUPDF:
+                    parser._extract_tables_pymupdf(page)
+                else:
+                    parser._extract_tables_camelot(str(pdf_path), page_idx)
+                best = min(best, time.perf_counter() - t0)
+            timings.append(best)
+    return timings
+
+
+def diff_rows(a: List[Dict[str, Any]], b: List[Dict[str, Any]]) -> List[str]:
+    out: List[str] = []
+    if len(a) != len(b):
+        out.append(f"кількість immobili: {len(a)} vs {len(b)}")
+    for idx, (ra, rb) in enumerate(zip(a, b), start=1):
+        for key in sorted(set(ra) | set(rb)):
+            if ra.get(key) != rb.get(key):
+                out.append(f"#{idx} {key}: {ra.get(key)!r} vs {rb.get(key)!r}")
+    return out
+
+
+def bench_pdf(pdf_path: Path, repeat: int) -> bool:
+    fast = VisuraParser(table_engine=TABLE_ENGINE_PYMUPDF)
+    slow = VisuraParser(table_engine=TABLE_ENGINE_CAMELOT)
+
+    t_fast = time_page_tables(fast, pdf_path, repeat)
+    t_slow = time_page_tables(slow, pdf_path, repeat)
+
+    print("=" * 80)
+    print(f"PDF: {pdf_path} ({len(t_fast)} сторінок)")
+    print(f"  {'page':>4}  {'camelot, ms':>12}  {'pymupdf, ms':>12}  {'speedup':>8}")
+    for idx, (ts, tf) in enumerate(zip(t_slow, t_fast), start=1):
+        speedup = ts / tf if tf > 0 else float("inf")
+        print(f"  {idx:>4}  {ts * 1000:>12.1f}  {tf * 1000:>12.1f}  {speedup:>7.1f}x")
+
+    total_slow, total_fast = sum(t_slow), sum(t_fast)
+    total_speedup = total_slow / total_fast if total_fast > 0 else float("inf")
+    print(f"  {'всього':>4}  {total_slow * 1000:>12.1f}  {total_fast * 1000:>12.1f}  {total_speedup:>7.1f}x")
+
+    rows_fast = fast.parse(pdf_path)
+    rows_slow = slow.parse(pdf_path)
+    diffs = diff_rows(rows_slow, rows_fast)
+    if diffs:
+        print(f"  ❌ Результати НЕ еквівалентні ({len(diffs)} відмінностей, camelot vs pymupdf):")
+        for d in diffs[:20]:
+            print(f"     {d}")
+        return False
+
+    print(f"  ✅ Результати еквівалентні: {len(rows_fast)} immobili")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк рушіїв таблиць VisuraParser (pymupdf vs camelot)")
+    parser.add_argument("pdfs", nargs="*", help="PDF-візури (за замовчуванням — усі PDF з downloads/)")
+    parser.add_argument("--repeat", type=int, default=1, help="Скільки разів міряти кожну сторінку (береться мінімум)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    pdfs = [Path(p) for p in args.pdfs] or find_sample_pdfs()
+    if not pdfs:
+        print(f"❌ Немає PDF для бенчмарку (передайте шляхи або покладіть візури в {DOWNLOADS_DIR})")
+        return
+
+    all_ok = True
+    for pdf_path in pdfs:
+        all_ok = bench_pdf(pdf_path, max(1, args.repeat)) and all_ok
+
+    print("=" * 80)
+    print("✅ Усі візури еквівалентні" if all_ok else "❌ Є розбіжності між рушіями")
+
+
+if __name__ == "__main__":
+    main()
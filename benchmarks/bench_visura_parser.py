@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк VisuraParser на синтетичних візурах (benchmarks/synthetic_visura.py).
+
+Для кожного масштабу (кількість immobili) і кожного рушія таблиць:
+- pages/s та immobili/s (найкращий з --repeat прогонів повного parse()),
+- пікова пам'ять: RSS процесу (ru_maxrss) і приріст відносно RSS після імпортів,
+- перевірка коректності проти очікуваних значень генератора.
+
+Кожна пара (рушій, масштаб) міряється в окремому процесі (spawn), щоб пік RSS
+одного прогону не маскував інший.
+
+Запуск:
+    python -m benchmarks.bench_visura_parser                       # 1, 10, 200 immobili, обидва рушії
+    python -m benchmarks.bench_visura_parser --scales 1 10 200 1000
+    python -m benchmarks.bench_visura_parser --engines pymupdf --repeat 5
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import multiprocessing as mp
+import resource
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List
+
+import fitz
+
+from benchmarks.synthetic_visura import compare_with_expected, write_synthetic_visura
+from uppi.parsers.visura_pdf_parser import TABLE_ENGINES, VisuraParser
+
+DEFAULT_SCALES = [1, 10, 200]
+
+
+@dataclass
+class BenchResult:
+    engine: str
+    n_immobili: int
+    pages: int
+    best_sec: float
+    baseline_rss_mb: float
+    peak_rss_mb: float
+    diffs: int
+
+    @property
+    def pages_per_sec(self) -> float:
+        return self.pages / self.best_sec if self.best_sec > 0 else float("inf")
+
+    @property
+    def immobili_per_sec(self) -> float:
+        return self.n_immobili / self.best_sec if self.best_sec > 0 else float("inf")
+
+
+def _maxrss_mb() -> float:
+    # Linux: ru_maxrss у КБ
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def _run_one(pdf_path: str, engine: str, n_immobili: int, expected: List[Dict], repeat: int, queue) -> None:
+    """Виконується в окремому процесі: повний parse() `repeat` разів."""
+    logging.basicConfig(level=logging.WARNING)
+    parser = VisuraParser(table_engine=engine)
+    with fitz.open(pdf_path) as doc:
+        pages = len(doc)
+    baseline = _maxrss_mb()
+
+    best = float("inf")
+    parsed: List[Dict] = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        parsed = parser.parse(pdf_path)
+        best = min(best, time.perf_counter() - t0)
+
+    diffs = compare_with_expected(parsed, expected)
+    for d in diffs[:10]:
+        print(f"     [{engine}, {n_immobili}] {d}")
+
+    queue.put(BenchResult(engine, n_immobili, pages, best, baseline, _maxrss_mb(), len(diffs)))
+
+
+def bench(scales: List[int], engines: List[str], repeat: int, rows_per_page: int) -> List[BenchResult]:
+    ctx = mp.get_context("spawn")
+    results: List[BenchResult] = []
+
+    with tempfile.TemporaryDirectory(prefix="uppi_bench_visura_") as tmp:
+        for n in scales:
+            pdf_path = str(Path(tmp) / f"visura_{n}.pdf")
+            expected = write_synthetic_visura(pdf_path, n, rows_per_page=rows_per_page)
+
+            for engine in engines:
+                queue = ctx.Queue()
+                proc = ctx.Process(target=_run_one, args=(pdf_path, engine, n, expected, repeat, queue))
+                proc.start()
+                results.append(queue.get())
+                proc.join()
+
+    return results
+
+
+def print_report(results: List[BenchResult]) -> None:
+    print("=" * 96)
+    print(
+        f"{'engine':>8}  {'immobili':>8}  {'pages':>5}  {'best, ms':>10}  {'pages/s':>9}  "
+        f"{'immobili/s':>10}  {'peak RSS, MB':>12}  {'Δ RSS, MB':>9}  {'ok':>3}"
+    )
+    for r in results:
+        print(
+            f"{r.engine:>8}  {r.n_immobili:>8}  {r.pages:>5}  {r.best_sec * 1000:>10.1f}  "
+            f"{r.pages_per_sec:>9.1f}  {r.immobili_per_sec:>10.1f}  {r.peak_rss_mb:>12.1f}  "
+            f"{r.peak_rss_mb - r.baseline_rss_mb:>9.1f}  {'✅' if not r.diffs else '❌':>3}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк VisuraParser на синтетичних візурах")
+    parser.add_argument("--scales", type=int, nargs="+", default=DEFAULT_SCALES, help="Кількість immobili у візурі")
+    parser.add_argument("--engines", nargs="+", default=list(TABLE_ENGINES), choices=TABLE_ENGINES)
+    parser.add_argument("--repeat", type=int, default=3, help="Скільки разів парсити (береться мінімум)")
+    parser.add_argument("--rows-per-page", type=int, default=14, help="Immobili на сторінці синтетичної візури")
+    args = parser.parse_args()
+
+    results = bench(args.scales, args.engines, max(1, args.repeat), max(1, args.rows_per_page))
+    print_report(results)
+
+    if any(r.diffs for r in results):
+        print("❌ Є розбіжності з очікуваними значеннями генератора")
+    else:
+        print("✅ Усі результати збігаються з очікуваними")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,325 @@
+"""
+Генератор синтетичних PDF-візур (PyMuPDF) для тестів і бенчмарків VisuraParser.
+
+Реальні візури містять персональні дані, тому для перевірки швидкості та
+коректності парсера генеруємо документи тієї ж форми:
+- сторінка-intestazione з рядком "ПРІЗВИЩЕ Ім'я (CF: ...)" (VisuraParser.NAME_CF)
+  і lattice-таблицею DATI ANAGRAFICI / DIRITTI E ONERI REALI, яку парсер має пропустити;
+- сторінки з рядком "Immobili siti nel Comune di ... (Codice ...)" і lattice-таблицею
+  immobili: згрупований заголовок (DATI IDENTIFICATIVI / DATI DI CLASSAMENTO /
+  ALTRE INFORMAZIONI), клітинки superficie та rendita;
+- сторінки-легенди без таблиць наприкінці.
+
+Приклад:
+    expected = write_synthetic_visura("/tmp/visura.pdf", n_immobili=200)
+"""
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import fitz
+
+PAGE_WIDTH = 842  # A4 landscape
+PAGE_HEIGHT = 595
+MARGIN_X = 21
+TABLE_TOP = 90
+HEADER_ROW_HEIGHT = 20
+ROW_HEIGHT = 30
+FONT_SIZE = 5.5
+
+# (заголовок колонки, ширина). Заголовки повторюють реальні візури і те,
+# що очікує VisuraParser._classify_table (порожня 8-ма колонка -> classe, "Classe Consistenza" -> consistenza).
+IMMOBILI_COLUMNS: List[Tuple[str, float]] = [
+    ("", 20),
+    ("Sez.\nUrb.", 28),
+    ("Foglio", 34),
+    ("Numero", 38),
+    ("Sub", 26),
+    ("Zona\nCens.", 30),
+    ("Micro\nZona", 30),
+    ("Categoria", 44),
+    ("", 28),
+    ("Classe Consistenza", 54),
+    ("Superficie\nCatastale", 96),
+    ("Rendita", 62),
+    ("Indirizzo", 200),
+    ("Dati ulteriori", 110),
+]
+
+# Групи першого рядка заголовка: (текст, перша колонка, остання колонка)
+GROUPED_HEADER: List[Tuple[str, int, int]] = [
+    ("DATI IDENTIFICATIVI", 0, 4),
+    ("DATI DI CLASSAMENTO", 5, 11),
+    ("ALTRE INFORMAZIONI", 12, 13),
+]
+
+INTESTAZIONE_COLUMNS: List[Tuple[str, float]] = [
+    ("N.", 30),
+    ("DATI ANAGRAFICI", 330),
+    ("CODICE FISCALE", 140),
+    ("DIRITTI E ONERI REALI", 300),
+]
+
+COMUNI: List[Tuple[str, str]] = [("PESCARA", "G482"), ("MONTESILVANO", "F646"), ("CHIETI", "C632")]
+STREET_TYPES = ["VIA", "VIALE", "PIAZZA", "CORSO", "STRADA", "VICOLO", "LARGO"]
+STREET_NAMES = [
+    "ROMA", "DELLA RIVIERA", "XX SETTEMBRE", "GARIBALDI", "NAZIONALE ADRIATICA", "MARCONI",
+    "D'ANNUNZIO", "TIBURTINA VALERIA", "DEI MILLE", "FIRENZE", "LUNGOMARE MATTEOTTI",
+]
+CATEGORIE = ["A/2", "A/3", "A/4", "C/6", "C/2"]
+
+
+@dataclass(frozen=True)
+class SyntheticOwner:
+    surname: str = "ROSSI"
+    name: str = "Mario"
+    cf: str = "RSSMRA80A01G482X"
+
+
+def _fmt_it(value: float) -> str:
+    """1234.5 -> '1234,50' (італійський десятковий роздільник)."""
+    return f"{value:.2f}".replace(".", ",")
+
+
+def _make_immobile(rng: random.Random, idx: int, comune: Tuple[str, str]) -> Dict[str, Any]:
+    totale = rng.randint(25, 240)
+    escluse = max(totale - rng.randint(0, 12), 1)
+    rendita = round(rng.uniform(50, 2500), 2)
+    civico = rng.randint(1, 400)
+
+    address = f"{rng.choice(STREET_TYPES)} {rng.choice(STREET_NAMES)} n. {civico}"
+    if rng.random() < 0.6:
+        address += f" Scala {rng.choice('ABCU')}"
+    if rng.random() < 0.6:
+        address += f" Interno {rng.randint(1, 30)}"
+    address += f" Piano {rng.choice(['T', '1', '2', '3', 'S1'])}"
+
+    return {
+        "table_num_immobile": str(idx),
+        "sez_urbana": "",
+        "foglio": str(rng.randint(1, 60)),
+        "numero": str(rng.randint(1, 4000)),
+        "sub": str(rng.randint(1, 120)),
+        "zona_cens": str(rng.randint(1, 3)),
+        "micro_zona": str(rng.randint(1, 9)),
+        "categoria": rng.choice(CATEGORIE),
+        "classe": str(rng.randint(1, 6)),
+        "consistenza": f"{rng.randint(2, 9)},{rng.choice(['0', '5'])} vani",
+        "superficie_totale": float(totale),
+        "superficie_escluse": float(escluse),
+        "rendita_value": rendita,
+        "indirizzo": address,
+        "dati_ulteriori": "Annotazione" if rng.random() < 0.2 else "",
+        "immobile_comune": comune[0],
+        "immobile_comune_code": comune[1],
+    }
+
+
+def _immobile_cells(imm: Dict[str, Any]) -> List[str]:
+    superficie = (
+        f"Totale: {imm['superficie_totale']:.0f} mq\n"
+        f"Totale escluse aree\nscoperte**: {imm['superficie_escluse']:.0f} mq"
+    )
+    return [
+        imm["table_num_immobile"],
+        imm["sez_urbana"],
+        imm["foglio"],
+        imm["numero"],
+        imm["sub"],
+        imm["zona_cens"],
+        imm["micro_zona"],
+        imm["categoria"],
+        imm["classe"],
+        imm["consistenza"],
+        superficie,
+        f"Euro {_fmt_it(imm['rendita_value'])}",
+        imm["indirizzo"],
+        imm["dati_ulteriori"],
+    ]
+
+
+def _col_edges(widths: Sequence[float]) -> List[float]:
+    edges = [float(MARGIN_X)]
+    for w in widths:
+        edges.append(edges[-1] + w)
+    return edges
+
+
+def _cell_text(page, rect: fitz.Rect, text: str) -> None:
+    if text:
+        page.insert_textbox(rect + (1.5, 1.5, -1.5, -1.0), text, fontsize=FONT_SIZE, fontname="helv")
+
+
+def _draw_table(
+    page,
+    top: float,
+    columns: Sequence[Tuple[str, float]],
+    rows: Sequence[Sequence[str]],
+    grouped: Optional[Sequence[Tuple[str, int, int]]] = None,
+) -> float:
+    """Малює lattice-таблицю (усі лінії сітки). Повертає y нижнього краю."""
+    xs = _col_edges([w for _, w in columns])
+    y = top
+    shape = page.new_shape()
+
+    # Рядок згрупованого заголовка: вертикальні лінії тільки на межах груп
+    if grouped:
+        bottom = y + HEADER_ROW_HEIGHT
+        shape.draw_line((xs[0], y), (xs[-1], y))
+        for text, first, last in grouped:
+            shape.draw_line((xs[first], y), (xs[first], bottom))
+            _cell_text(page, fitz.Rect(xs[first], y, xs[last + 1], bottom), text)
+        shape.draw_line((xs[-1], y), (xs[-1], bottom))
+        y = bottom
+
+    # Заголовок колонок
+    bottom = y + HEADER_ROW_HEIGHT
+    shape.draw_line((xs[0], y), (xs[-1], y))
+    for i, (title, _) in enumerate(columns):
+        _cell_text(page, fitz.Rect(xs[i], y, xs[i + 1], bottom), title)
+    for x in xs:
+        shape.draw_line((x, y), (x, bottom))
+    y = bottom
+
+    # Дані
+    for cells in rows:
+        bottom = y + ROW_HEIGHT
+        shape.draw_line((xs[0], y), (xs[-1], y))
+        for i, text in enumerate(cells):
+            _cell_text(page, fitz.Rect(xs[i], y, xs[i + 1], bottom), text)
+        for x in xs:
+            shape.draw_line((x, y), (x, bottom))
+        y = bottom
+
+    shape.draw_line((xs[0], y), (xs[-1], y))
+    shape.finish(color=(0, 0, 0), width=0.5)
+    shape.commit()
+    return y
+
+
+def _page_footer(page, page_no: int) -> None:
+    page.insert_text((MARGIN_X, PAGE_HEIGHT - 20), f"Visura telematica - Pagina {page_no}", fontsize=7)
+
+
+def expected_parsed_row(imm: Dict[str, Any], owner: SyntheticOwner) -> Dict[str, Any]:
+    """Ключові поля, які VisuraParser має повернути для згенерованого immobile."""
+    return {
+        "table_num_immobile": imm["table_num_immobile"],
+        "foglio": imm["foglio"],
+        "numero": imm["numero"],
+        "sub": imm["sub"],
+        "zona_cens": imm["zona_cens"],
+        "micro_zona": imm["micro_zona"],
+        "categoria": imm["categoria"],
+        "classe": imm["classe"],
+        "consistenza": imm["consistenza"],
+        "superficie_totale": imm["superficie_totale"],
+        "superficie_escluse": imm["superficie_escluse"],
+        "rendita": f"€ {float(_fmt_it(imm['rendita_value']).replace(',', '.'))}",
+        "indirizzo_raw": imm["indirizzo"],
+        "immobile_comune": imm["immobile_comune"],
+        "immobile_comune_code": imm["immobile_comune_code"],
+        "locatore_surname": owner.surname,
+        "locatore_name": owner.name,
+        "locatore_codice_fiscale": owner.cf,
+    }
+
+
+def build_synthetic_visura(
+    n_immobili: int,
+    rows_per_page: int = 14,
+    n_comuni: int = 1,
+    legend_pages: int = 1,
+    owner: SyntheticOwner = SyntheticOwner(),
+    seed: int = 42,
+) -> Tuple[fitz.Document, List[Dict[str, Any]]]:
+    """
+    Створює fitz.Document із N immobili на M сторінках.
+    M = 1 (intestazione) + ceil(N / rows_per_page) по кожному comune + legend_pages.
+    Повертає (doc, expected_rows) — expected_rows у порядку, в якому їх має віддати парсер.
+    """
+    rng = random.Random(seed)
+    doc = fitz.open()
+    expected: List[Dict[str, Any]] = []
+    page_no = 0
+
+    # 1) Intestazione
+    page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+    page_no += 1
+    page.insert_text((MARGIN_X, 40), "Visura per soggetto", fontsize=12)
+    page.insert_text((MARGIN_X, 60), "Situazione degli atti informatizzati al 01/01/2026", fontsize=8)
+    page.insert_text((MARGIN_X, 78), f"{owner.surname} {owner.name} (CF: {owner.cf})", fontsize=9)
+    _draw_table(
+        page,
+        TABLE_TOP,
+        INTESTAZIONE_COLUMNS,
+        [["1", f"{owner.surname} {owner.name} nato a PESCARA il 01/01/1980", owner.cf, "Proprieta' per 1/1"]],
+    )
+    _page_footer(page, page_no)
+
+    # 2) Immobili, розподілені між comuni
+    comuni = COMUNI[: max(1, min(n_comuni, len(COMUNI)))]
+    per_comune = [n_immobili // len(comuni)] * len(comuni)
+    for i in range(n_immobili % len(comuni)):
+        per_comune[i] += 1
+
+    table_idx = 0
+    for comune, count in zip(comuni, per_comune):
+        immobili = []
+        for _ in range(count):
+            table_idx += 1
+            immobili.append(_make_immobile(rng, table_idx, comune))
+
+        for start in range(0, len(immobili), rows_per_page):
+            chunk = immobili[start:start + rows_per_page]
+            page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+            page_no += 1
+            page.insert_text(
+                (MARGIN_X, 70),
+                f"Immobili siti nel Comune di {comune[0]} (Codice {comune[1]})",
+                fontsize=9,
+            )
+            _draw_table(page, TABLE_TOP, IMMOBILI_COLUMNS, [_immobile_cells(imm) for imm in chunk], GROUPED_HEADER)
+            _page_footer(page, page_no)
+            expected.extend(expected_parsed_row(imm, owner) for imm in chunk)
+
+    # 3) Легенда / footer без таблиць
+    for _ in range(legend_pages):
+        page = doc.new_page(width=PAGE_WIDTH, height=PAGE_HEIGHT)
+        page_no += 1
+        page.insert_text((MARGIN_X, 40), "Legenda", fontsize=12)
+        page.insert_textbox(
+            fitz.Rect(MARGIN_X, 60, PAGE_WIDTH - MARGIN_X, 300),
+            "Unita' immobiliari urbane: dati derivanti da atti di aggiornamento catastale.\n"
+            "Rendita: valore attribuito ai fini fiscali.\n"
+            "Superficie catastale calcolata ai sensi del D.P.R. 138/98.",
+            fontsize=8,
+        )
+        _page_footer(page, page_no)
+
+    return doc, expected
+
+
+def write_synthetic_visura(path: str | Path, n_immobili: int, **kwargs: Any) -> List[Dict[str, Any]]:
+    """Зберігає синтетичну візуру у path і повертає expected_rows."""
+    doc, expected = build_synthetic_visura(n_immobili, **kwargs)
+    try:
+        doc.save(str(path))
+    finally:
+        doc.close()
+    return expected
+
+
+def compare_with_expected(parsed: List[Dict[str, Any]], expected: List[Dict[str, Any]]) -> List[str]:
+    """Розбіжності між результатом парсера і expected_rows (порожній список — все збіглося)."""
+    diffs: List[str] = []
+    if len(parsed) != len(expected):
+        diffs.append(f"кількість immobili: {len(parsed)} vs очікувано {len(expected)}")
+    for idx, (got, exp) in enumerate(zip(parsed, expected), start=1):
+        for key, value in exp.items():
+            if got.get(key) != value:
+                diffs.append(f"#{idx} {key}: {got.get(key)!r} vs очікувано {value!r}")
+    return diffs
@@ -0,0 +1,134 @@
+"""
+Спільний фейк psycopg-з'єднання для тестів db_repo / сервісів (PostgreSQL у тестах немає).
+
+    conn = fake_conn(rows=[(7, "hash")])                 # fetchone / fetchall віддають rows по черзі
+    conn = fake_conn(handler=lambda sql, params: [...])   # відповідь залежно від запиту
+
+Кожен execute записується в conn.calls як (sql, params); psycopg.sql.Composable — як рядок,
+звичайний рядок — той самий об'єкт (тести можуть перевіряти `sql is SOME_SQL`).
+handler повертає рядки результату саме цього запиту (None — брати з rows) або кидає виняток.
+
+pg_conn — справжня PostgreSQL для поведінкових тестів SQL: тільки якщо DB_HOST задано в оточенні
+(не в .env) і схема мігрована до останньої версії (python -m uppi.utils.db_utils.migrate up);
+інакше тест пропускається. Усе, що тест пише, відкочується.
+"""
+import os
+from contextlib import contextmanager
+
+import pytest
+from psycopg.pq import PipelineStatus, TransactionStatus
+from psycopg.sql import Composable
+
+
+class FakePgConn:
+    pipeline_status = PipelineStatus.OFF
+
+
+class FakeInfo:
+    transaction_status = TransactionStatus.IDLE
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+        self.rowcount = -1
+        self._result = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        text = sql.as_string() if isinstance(sql, Composable) else sql
+        self.conn.calls.append((text, params))
+        self.conn.info.transaction_status = TransactionStatus.INTRANS
+        result = self.conn.handler(text, params) if self.conn.handler else None
+        self._result = list(result) if result is not None else None
+        self.rowcount = self.conn.rowcount
+
+    def fetchone(self):
+        if self._result is not None:
+            return self._result.pop(0) if self._result else None
+        return self.conn.rows.pop(0) if self.conn.rows else None
+
+    def fetchall(self):
+        if self._result is not None:
+            rows, self._result = self._result, []
+        else:
+            rows, self.conn.rows = self.conn.rows, []
+        return rows
+
+
+class FakeConn:
+    pgconn = FakePgConn()
+
+    def __init__(self, rows=None, handler=None, rowcount=-1):
+        self.rows = list(rows or [])
+        self.handler = handler
+        self.rowcount = rowcount
+        self.info = FakeInfo()
+        self.calls = []
+        self.commits = 0
+        self.rollbacks = 0
+        self.closed = False
+
+    @property
+    def statements(self):
+        return [sql for sql, _ in self.calls]
+
+    def cursor(self, row_factory=None):
+        return FakeCursor(self)
+
+    @contextmanager
+    def pipeline(self):
+        yield
+
+    def commit(self):
+        self.commits += 1
+        self.info.transaction_status = TransactionStatus.IDLE
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.info.transaction_status = TransactionStatus.IDLE
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def fake_conn():
+    """Фабрика FakeConn: fake_conn(rows=..., handler=..., rowcount=...)."""
+    return FakeConn
+
+
+@pytest.fixture
+def pg_conn():
+    if not os.environ.get("DB_HOST"):
+        pytest.skip("потрібна PostgreSQL: DB_HOST / DB_* в оточенні")
+
+    import psycopg
+
+    from uppi.domain.db import get_pg_connection
+    from uppi.utils.db_utils.migrate import MIGRATIONS_DIR, discover_migrations
+
+    try:
+        conn = get_pg_connection()
+    except psycopg.OperationalError as e:
+        pytest.skip(f"PostgreSQL недоступна: {e}")
+    try:
+        latest = discover_migrations(MIGRATIONS_DIR)[-1].version
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass('public.schema_migrations') IS NOT NULL;")
+            migrated = cur.fetchone()[0]
+            if migrated:
+                cur.execute("SELECT max(version) FROM public.schema_migrations;")
+                migrated = cur.fetchone()[0] == latest
+        conn.rollback()
+        if not migrated:
+            pytest.skip(f"схема не на міграції {latest:04d}: python -m uppi.utils.db_utils.migrate up")
+        yield conn
+    finally:
+        conn.rollback()
+        conn.close()
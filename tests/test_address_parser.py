@@ -1,6 +1,11 @@
 import pytest
 
-from uppi.parsers.address_parser import parse_address
+from uppi.parsers.address_parser import (
+    address_cache_info,
+    clear_address_cache,
+    parse_address,
+    parse_addresses,
+)
 
 
 # ---------------------------------------------------------
@@ -251,4 +256,35 @@ def test_parse_address_components(raw, expected):
     assert parsed.piano == expected["piano"]
 
     # Raw-рядок завжди має зберігатися без змін
-    assert parsed.indirizzo_raw == raw
\ No newline at end of file
+    assert parsed.indirizzo_raw == raw
+
+# ---------------------------------------------------------
+# Пакетний парсинг і кеш
+# ---------------------------------------------------------
+
+def test_parse_addresses_matches_single_calls():
+    raws = [
+        "VIALE DELLA RIVIERA n. 285 Scala U Interno 1 Piano 1",
+        "VIA XX SETTEMBRE n. 15",
+        "VIALE DELLA RIVIERA n. 285 Scala U Interno 1 Piano 1",
+        "  VIA XX SETTEMBRE n. 15\n",
+        "PIAZZA GARIBALDI n. 2",
+    ]
+
+    assert parse_addresses(raws) == [parse_address(r) for r in raws]
+
+
+def test_parse_address_cache_keyed_by_normalized_raw():
+    clear_address_cache()
+
+    first = parse_address("VIA ROMA n. 5\nScala B")
+    second = parse_address("  VIA ROMA n. 5 Scala B ")
+
+    assert first is second
+    info = address_cache_info()
+    assert (info.hits, info.misses) == (1, 1)
+
+
+def test_parse_addresses_rejects_non_strings():
+    with pytest.raises(TypeError):
+        parse_addresses(["VIA ROMA 1", None])
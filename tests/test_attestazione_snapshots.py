@@ -0,0 +1,126 @@
+import re
+from collections import Counter
+
+from itemadapter import ItemAdapter
+from psycopg.types.json import Jsonb
+
+from uppi.domain.immobile import Immobile
+from uppi.services import db_repo
+from uppi.services.db_repo import INSERT_ATTESTAZIONE_SQL
+from uppi.services.visura_processor import ITEM_RUNTIME_FIELDS
+from uppi.utils.db_utils.migrate import MIGRATIONS_DIR, discover_migrations
+from uppi.utils.db_utils.snapshots import SnapshotStorageReport
+
+CF = "SNPTST80A01G482X"
+
+
+def test_insert_attestazione_stores_snapshot_by_hash_in_one_statement(fake_conn):
+    conn = fake_conn()
+    snapshot = {"contract_id": "c-1", "yaml_item": {"a1": "X"}, "template_version": "v2"}
+
+    db_repo.db_insert_attestazione_log(
+        conn, "c-1", "generated", "attestazioni", "obj.docx", snapshot,
+        error=None, author_login_masked="us***", author_login_sha256="f" * 64, template_version="v2",
+    )
+
+    assert len(conn.calls) == 1
+    sql, params = conn.calls[0]
+    assert sql is INSERT_ATTESTAZIONE_SQL
+    # Метадані запуску — колонки рядка, а не частина знімка (інакше знімки не дедуплікуються)
+    assert isinstance(params["snapshot"], Jsonb) and params["snapshot"].obj == snapshot
+    assert params["author_masked"] == "us***" and params["error"] is None and params["template_version"] == "v2"
+
+
+def runtime_fields_migration():
+    return next(m for m in discover_migrations(MIGRATIONS_DIR) if m.name == "snapshot_runtime_fields")
+
+
+def test_runtime_fields_migration_strips_item_runtime_fields():
+    keys = re.search(r"ARRAY\[(.*?)\]::text\[\]", runtime_fields_migration().sql, re.S).group(1)
+    # Старі знімки чистяться від тих самих полів, яких нові знімки вже не містять
+    assert set(re.findall(r"'([a-z_]+)'", keys)) == ITEM_RUNTIME_FIELDS
+
+
+# ---- справжня PostgreSQL (pg_conn пропускає тести без DB_HOST) ----
+
+SNAPSHOT = {"contract_id": "c-1", "yaml_item": {"locatore_cf": CF, "a1": "X"}, "template_version": "v2"}
+
+
+def make_contract(conn) -> str:
+    db_repo.db_upsert_person(conn, CF, "SNAPSHOT", "TEST")
+    (imm_id,) = db_repo.db_bulk_upsert_immobili(conn, CF, [(Immobile(foglio="1", numero="1", sub="1"), None)])
+    return db_repo.db_upsert_contract(conn, imm_id, ItemAdapter({"durata_anni": "3"}))
+
+
+def log_attestazione(conn, contract_id, snapshot) -> None:
+    db_repo.db_insert_attestazione_log(
+        conn, contract_id, "generated", "attestazioni", "obj.docx", snapshot,
+        error=None, author_login_masked="us***", author_login_sha256="f" * 64, template_version="v2",
+    )
+
+
+def snapshots_of(conn, contract_id):
+    """[(snapshot_hash, data)] атестацій контракту; hash перераховано на сервері з data."""
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT a.snapshot_hash, s.data, encode(sha256(convert_to(s.data::text, 'UTF8')), 'hex')
+            FROM public.attestazioni a JOIN public.attestazione_snapshots s ON s.hash = a.snapshot_hash
+            WHERE a.contract_id = %s;
+            """,
+            (contract_id,),
+        )
+        rows = cur.fetchall()
+    # Знімок адресовано вмістом: ключ — sha256 канонічного jsonb::text
+    assert all(stored == recomputed for stored, _, recomputed in rows)
+    return [(h, data) for h, data, _ in rows]
+
+
+def count_snapshots(conn, hashes) -> int:
+    with conn.cursor() as cur:
+        cur.execute("SELECT count(*) FROM public.attestazione_snapshots WHERE hash = ANY(%s);", (list(hashes),))
+        return cur.fetchone()[0]
+
+
+def test_same_snapshot_is_stored_once(pg_conn):
+    contract_id = make_contract(pg_conn)
+
+    log_attestazione(pg_conn, contract_id, SNAPSHOT)
+    log_attestazione(pg_conn, contract_id, dict(reversed(list(SNAPSHOT.items()))))
+    log_attestazione(pg_conn, contract_id, {**SNAPSHOT, "template_version": "v3"})
+
+    rows = snapshots_of(pg_conn, contract_id)
+    # Порядок ключів не важливий: дві атестації посилаються на один знімок, третя — на свій
+    assert sorted(Counter(h for h, _ in rows).values()) == [1, 2]
+    assert SNAPSHOT in [data for _, data in rows]
+    assert count_snapshots(pg_conn, {h for h, _ in rows}) == 2
+
+
+def test_runtime_fields_migration_dedups_old_snapshots_and_drops_replaced(pg_conn):
+    contract_id = make_contract(pg_conn)
+    log_attestazione(pg_conn, contract_id, SNAPSHOT)
+    # Знімки до ITEM_RUNTIME_FIELDS: службові поля прогону в yaml_item роблять кожен унікальним
+    for run in range(2):
+        yaml_item = {**SNAPSHOT["yaml_item"], "job_id": run, "stage_outcomes": {"persons": {"status": "ok"}}}
+        log_attestazione(pg_conn, contract_id, {**SNAPSHOT, "yaml_item": yaml_item})
+    old_hashes = {h for h, _ in snapshots_of(pg_conn, contract_id)}
+    assert len(old_hashes) == 3
+
+    with pg_conn.cursor() as cur:
+        cur.execute(runtime_fields_migration().sql)
+
+    rows = snapshots_of(pg_conn, contract_id)
+    # Усі три атестації тепер на одному знімку — тому самому, що пише db_insert_attestazione_log
+    assert len(rows) == 3 and len({h for h, _ in rows}) == 1
+    assert rows[0][1] == SNAPSHOT
+    # Замінені знімки видалено, той, на який посилаються, — ні
+    assert count_snapshots(pg_conn, old_hashes) == 1
+
+
+def test_storage_report_math():
+    report = SnapshotStorageReport(
+        attestazioni=10, snapshots=2, logical_bytes=10 * 4096, stored_bytes=2 * 4096, table_bytes=16384
+    )
+    assert report.saved_bytes == 8 * 4096
+    assert report.dedup_ratio == 5.0
+    assert SnapshotStorageReport(0, 0, 0, 0, 8192).dedup_ratio == 0.0
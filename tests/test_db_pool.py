@@ -0,0 +1,110 @@
+import threading
+import time
+
+import psycopg
+import pytest
+
+from uppi.domain.db import PgConnectionPool, PoolTimeout
+
+
+def server_gone(sql, params):
+    raise psycopg.OperationalError("server closed the connection unexpectedly")
+
+
+def make_pool(fake_conn, **kwargs):
+    opened = []
+
+    def connect():
+        conn = fake_conn()
+        opened.append(conn)
+        return conn
+
+    kwargs.setdefault("min_size", 1)
+    kwargs.setdefault("max_size", 2)
+    kwargs.setdefault("timeout_sec", 0.2)
+    return PgConnectionPool(connect=connect, **kwargs), opened
+
+
+def test_connection_is_reused_and_rolled_back_on_return(fake_conn):
+    pool, opened = make_pool(fake_conn)
+
+    with pool.connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT 1")
+    with pool.connection() as conn2:
+        pass
+
+    assert conn2 is conn
+    assert len(opened) == 1
+    assert conn.rollbacks == 1  # незавершену транзакцію відкотили при поверненні
+    stats = pool.stats()
+    assert (stats.checkouts, stats.created, stats.size, stats.idle) == (2, 1, 1, 1)
+
+
+def test_exception_inside_context_rolls_back_and_returns_connection(fake_conn):
+    pool, opened = make_pool(fake_conn)
+
+    with pytest.raises(RuntimeError):
+        with pool.connection() as conn:
+            raise RuntimeError("boom")
+
+    assert conn.rollbacks == 1
+    assert pool.stats().idle == 1
+
+
+def test_pool_timeout_when_exhausted(fake_conn):
+    pool, _ = make_pool(fake_conn, max_size=1)
+    conn = pool.getconn()
+
+    with pytest.raises(PoolTimeout):
+        pool.getconn(timeout=0.05)
+    assert pool.stats().timeouts == 1
+
+    pool.putconn(conn)
+
+
+def test_waiting_checkout_is_counted(fake_conn):
+    pool, _ = make_pool(fake_conn, max_size=1)
+    conn = pool.getconn()
+
+    def release():
+        time.sleep(0.05)
+        pool.putconn(conn)
+
+    threading.Thread(target=release).start()
+    assert pool.getconn(timeout=2) is conn
+
+    stats = pool.stats()
+    assert stats.waits == 1
+    assert stats.wait_max_sec >= 0.04
+
+
+def test_expired_and_unhealthy_connections_are_replaced(fake_conn):
+    pool, opened = make_pool(fake_conn, max_lifetime_sec=0.01, check_idle_sec=0)
+    with pool.connection():
+        pass
+    time.sleep(0.02)
+    with pool.connection() as conn:
+        pass
+    assert conn is not opened[0] and opened[0].closed
+
+    pool.max_lifetime_sec = 0
+    conn.handler = server_gone
+    with pool.connection() as healthy:
+        pass
+    assert healthy is not conn and conn.closed
+
+    stats = pool.stats()
+    assert stats.closed_expired == 1
+    assert stats.closed_unhealthy == 1
+
+
+def test_closed_pool_rejects_checkout(fake_conn):
+    pool, opened = make_pool(fake_conn)
+    with pool.connection():
+        pass
+    pool.close()
+
+    assert opened[0].closed
+    with pytest.raises(psycopg.InterfaceError):
+        pool.getconn()
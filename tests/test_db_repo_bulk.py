@@ -0,0 +1,112 @@
+import pytest
+
+from uppi.domain.immobile import Immobile
+from uppi.services import db_repo
+from uppi.services.db_repo import (
+    db_bulk_upsert_addresses,
+    db_bulk_upsert_immobili,
+    merge_duplicate_immobile_params,
+)
+
+CF = "RSSMRA80A01G482X"
+
+
+def imm(foglio, numero, sub, **kwargs):
+    return Immobile(foglio=foglio, numero=numero, sub=sub, **kwargs)
+
+
+def test_merge_duplicates_follows_sequential_coalesce_semantics():
+    params = [
+        db_repo._immobile_params(CF, imm("1", "10", "2", categoria="A/2", classe="3"), 100, 7),
+        db_repo._immobile_params(CF, imm("1", "11", "", categoria="C/6"), None, 7),
+        db_repo._immobile_params(CF, imm("1", "10", "2", categoria="A/3", sez_urbana="X"), None, 7),
+    ]
+
+    merged, mapping = merge_duplicate_immobile_params(params)
+
+    assert mapping == [0, 1, 0]
+    assert len(merged) == 2
+    # Наступний рядок оновлює COALESCE-колонки не-NULL значеннями ...
+    assert merged[0]["categoria"] == "A/3"
+    # ... але NULL не затирає попереднє значення
+    assert merged[0]["classe"] == "3"
+    assert merged[0]["visura_addr_id"] == 100
+    # sez_urbana не в SET — лишається від INSERT першого рядка
+    assert merged[0]["sez_urbana"] is None
+
+
+def test_bulk_immobili_maps_returning_rows_back_to_input_order(fake_conn):
+    # RETURNING у довільному порядку
+    conn = fake_conn(rows=[(502, "1", "11", ""), (501, "1", "10", "2")])
+
+    ids = db_bulk_upsert_immobili(
+        conn, CF,
+        [(imm("1", "10", "2"), 100), (imm("1", "11", None), None), (imm("1", "10", "2"), None)],
+        source_visura_id=7,
+    )
+
+    assert ids == [501, 502, 501]
+    assert len(conn.calls) == 1
+    sql, params = conn.calls[0]
+    # Один масив на колонку (unnest), по елементу на унікальний immobile
+    assert "unnest(" in sql and "%(foglio)s::text[]" in sql
+    assert params["numero"] == ["10", "11"]
+    assert params["visura_addr_id"] == [100, None]
+    assert params["source_visura_id"] == [7, 7]
+
+
+def test_bulk_immobili_requires_foglio_and_numero(fake_conn):
+    with pytest.raises(ValueError):
+        db_bulk_upsert_immobili(fake_conn(), CF, [(imm("1", None, "1"), None)])
+
+
+def test_bulk_addresses_skips_incomplete_and_keeps_order(fake_conn):
+    conn = fake_conn(rows=[(2, 11, "h2"), (0, 10, "h0")])
+
+    ids = db_bulk_upsert_addresses(conn, [
+        {"comune": "PESCARA", "via_full": "VIA ROMA", "civico": "5"},
+        {"comune": None, "via_full": "VIA ROMA"},
+        {"comune": "PESCARA", "via_type": "VIALE", "via_name": "MARCONI"},
+    ])
+
+    assert ids == [10, None, 11]
+    ords, comuni, vie = conn.calls[0][1][:3]
+    assert ords == [0, 2]
+    assert vie[1] == "VIALE MARCONI"
+
+
+def test_bulk_upserts_with_empty_input_do_not_query(fake_conn):
+    conn = fake_conn()
+    assert db_bulk_upsert_immobili(conn, CF, []) == []
+    assert db_bulk_upsert_addresses(conn, [{"comune": None}]) == [None]
+    assert conn.calls == []
+
+
+def test_element_changes_split_upserts_and_deletes():
+    adapter = {"a1": "X", "b2": " - ", "c3": "", "d13": "x", "d1": None}
+
+    codes, values, delete_codes = db_repo.immobile_element_changes(adapter)
+
+    assert codes == ["A1", "D13"]
+    assert values == ["X", "x"]
+    assert delete_codes == ["B2"]
+
+
+def test_element_writes_use_single_statement(fake_conn):
+    conn = fake_conn()
+
+    db_repo.db_upsert_immobile_elements(conn, 42, {"a1": "X", "b2": "-"})
+
+    assert len(conn.calls) == 1
+    params = conn.calls[0][1]
+    assert params["immobile_id"] == 42
+    assert params["codes"] == ["A1"] and params["values"] == ["X"]
+    assert params["delete_codes"] == ["B2"]
+    # старий формат (grp='A', code='1') прибирається для всіх зачеплених ключів
+    assert params["touched_codes"] == ["A1", "B2"]
+
+
+def test_element_writes_skip_query_when_nothing_to_change(fake_conn):
+    conn = fake_conn()
+    db_repo.db_upsert_immobile_elements(conn, 42, {"a1": None, "b1": ""})
+    assert conn.calls == []
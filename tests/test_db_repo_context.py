@@ -0,0 +1,48 @@
+from uppi.services import db_repo
+
+CONTRACT_ID = "7f9c0c2e-0000-4000-8000-000000000001"
+
+
+def contract_row(**overrides):
+    row = {
+        "id": CONTRACT_ID, "immobile_id": 5, "durata_anni": 3,
+        "loc_cf": "RSSMRA80A01G482X", "loc_name": "MARIO", "loc_surname": "ROSSI",
+        "loc_comune": "PESCARA", "loc_via": "VIA ROMA", "loc_civico": "5",
+        "cond_cf": None, "cond_name": None, "cond_surname": None, "cond_comune": None, "cond_via": None,
+        "imm_comune": "PESCARA", "imm_via": "VIA FIRENZE", "imm_civico": "10",
+        "imm_piano": "2", "imm_interno": None, "imm_energy_class": "G",
+        "ctx_elements": {"A|A1": "X", "B|2": None, "D|D13": "x"},
+        "ctx_canone_inputs": {"canone_input": {"istat": 1.5}, "result": {"zona": 1}},
+    }
+    row.update(overrides)
+    return row
+
+
+def test_context_is_loaded_with_a_single_query(fake_conn):
+    conn = fake_conn(rows=[contract_row()])
+
+    ctx = db_repo.db_load_contract_context(conn, CONTRACT_ID)
+
+    assert len(conn.calls) == 1
+    # Елементи: і канонічний 'A1', і старий формат grp='B', code='2'
+    assert ctx["elements"] == {"a1": "X", "b2": "", "d13": "x"}
+    assert ctx["canone_calc"] == {"canone_input": {"istat": 1.5}, "result": {"zona": 1}}
+    assert ctx["immobile"]["energy_class"] == "G"
+    assert ctx["parties"]["LOCATORE"]["cf"] == "RSSMRA80A01G482X"
+    assert "CONDUTTORE" not in ctx["parties"]
+    # Службові колонки агрегатів не потрапляють у contract (і далі в snapshot)
+    assert "ctx_elements" not in ctx["contract"] and "ctx_canone_inputs" not in ctx["contract"]
+
+
+def test_context_without_elements_or_canone(fake_conn):
+    conn = fake_conn(rows=[contract_row(ctx_elements=None, ctx_canone_inputs=None)])
+
+    ctx = db_repo.db_load_contract_context(conn, CONTRACT_ID)
+
+    assert ctx["elements"] == {}
+    assert ctx["canone_calc"] is None
+
+
+def test_missing_contract_returns_empty_context(fake_conn):
+    ctx = db_repo.db_load_contract_context(fake_conn(), CONTRACT_ID)
+    assert ctx["contract"] == {} and ctx["canone_calc"] is None
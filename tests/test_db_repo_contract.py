@@ -0,0 +1,165 @@
+import itertools
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from uppi.services import db_repo
+from uppi.services.db_repo import CONTRACT_PATCH_FIELDS, UPSERT_CONTRACT_SQL, contract_patch_params
+from uppi.utils.parse_utils import clean_str, parse_date, safe_float
+
+TODAY = date(2026, 3, 1)
+
+
+def legacy_resolve(adapter, old_contract):
+    """Попередня Python-логіка db_upsert_contract (SELECT + резолв у Python), еталон для порівняння."""
+    kind = (clean_str(adapter.get("contract_kind")) or "CONCORDATO").upper()
+    if kind not in ["CONCORDATO", "TRANSITORIO", "STUDENTI"]:
+        kind = "CONCORDATO"
+
+    raw = adapter.get("arredato")
+    if str(raw).strip() == "-":
+        arredato = 0.0
+    elif raw is not None and str(raw).strip() != "":
+        arredato = safe_float(raw) or 0.0
+    else:
+        arredato = float(old_contract.get("arredato_pct") or 0.0)
+
+    raw = adapter.get("durata_anni")
+    if str(raw).strip() == "-":
+        durata = None
+    elif raw is not None and str(raw).strip() != "":
+        durata = int(raw)
+    else:
+        durata = old_contract.get("durata_anni")
+    if durata is None:
+        durata = 3
+
+    raw = adapter.get("istat")
+    if str(raw).strip() == "-":
+        istat = 0.0
+    elif raw is not None and str(raw).strip() != "":
+        istat = safe_float(raw) or 0.0
+    else:
+        istat = float(old_contract.get("istat_rate") or 0.0)
+
+    raw = adapter.get("ignore_surcharges")
+    if str(raw).strip() == "-":
+        ignore = False
+    elif raw is not None and str(raw).strip() != "":
+        ignore = str(raw).lower() in ("true", "1", "yes", "y")
+    else:
+        ignore = bool(old_contract.get("ignore_surcharges")) if old_contract else False
+
+    return {
+        "contract_kind": kind,
+        "conduttore_cf": clean_str(adapter.get("conduttore_cf")) or old_contract.get("conduttore_cf"),
+        "start_date": parse_date(adapter.get("contratto_data")) or old_contract.get("start_date") or TODAY,
+        "durata_anni": durata,
+        "decorrenza_data": parse_date(adapter.get("decorrenza_data")) or old_contract.get("decorrenza_data"),
+        "registrazione_data": parse_date(adapter.get("registrazione_data")) or old_contract.get("registrazione_data"),
+        "registrazione_num": clean_str(adapter.get("registrazione_num")) or old_contract.get("registrazione_num"),
+        "agenzia_entrate_sede": clean_str(adapter.get("agenzia_entrate_sede")) or old_contract.get("agenzia_entrate_sede"),
+        "canone_contrattuale_mensile": (
+            safe_float(adapter.get("canone_contrattuale_mensile")) or old_contract.get("canone_contrattuale_mensile")
+        ),
+        "istat_rate": istat,
+        "arredato_pct": arredato,
+        "ignore_surcharges": ignore,
+    }
+
+
+def sql_resolve(params, old_contract):
+    """Те, що обчислює UPSERT_CONTRACT_SQL: COALESCE(параметр, колонка в БД, дефолт)."""
+    row = {"contract_kind": params["kind"]}
+    for column, param, _, has_default in CONTRACT_PATCH_FIELDS:
+        candidates = [params[param], old_contract.get(column)]
+        if has_default:
+            candidates.append(params[f"{param}_default"])
+        row[column] = next((v for v in candidates if v is not None), None)
+    return row
+
+
+def normalize(row):
+    # NUMERIC з БД (Decimal) і float з Python — одне й те саме значення в колонці
+    return {k: float(v) if isinstance(v, Decimal) else v for k, v in row.items()}
+
+
+OLD_CONTRACTS = [
+    {},
+    {
+        "contract_kind": "TRANSITORIO", "conduttore_cf": "BNCLRA90B41G482Y", "start_date": date(2020, 1, 1),
+        "durata_anni": 4, "decorrenza_data": date(2020, 2, 1), "registrazione_data": date(2020, 2, 10),
+        "registrazione_num": "123/3T", "agenzia_entrate_sede": "PESCARA",
+        "canone_contrattuale_mensile": Decimal("550.00"), "istat_rate": Decimal("0.0150"),
+        "arredato_pct": Decimal("0.1000"), "ignore_surcharges": True,
+    },
+    {
+        "contract_kind": "CONCORDATO", "conduttore_cf": None, "start_date": None, "durata_anni": None,
+        "decorrenza_data": None, "registrazione_data": None, "registrazione_num": None,
+        "agenzia_entrate_sede": None, "canone_contrattuale_mensile": None, "istat_rate": None,
+        "arredato_pct": None, "ignore_surcharges": False,
+    },
+]
+
+PATCH_VALUES = {
+    "durata_anni": [None, "", "-", "5", 6],
+    "arredato": [None, "", " - ", "0,2", "abc", 0],
+    "istat": [None, "-", "1.5", "0"],
+    "ignore_surcharges": [None, "-", "yes", "False", True],
+}
+
+PLAIN_ADAPTERS = [
+    {},
+    {"contract_kind": "studenti", "conduttore_cf": "VRDGPP70C01G482Z", "contratto_data": "15/04/2024",
+     "decorrenza_data": "2024-05-01", "registrazione_data": "2024-05-10", "registrazione_num": "9/3T",
+     "agenzia_entrate_sede": "CHIETI", "canone_contrattuale_mensile": "620,50"},
+    {"contract_kind": "boh", "canone_contrattuale_mensile": "0", "contratto_data": "non è una data"},
+]
+
+
+def adapters():
+    keys = list(PATCH_VALUES)
+    for base in PLAIN_ADAPTERS:
+        for combo in itertools.product(*(PATCH_VALUES[k] for k in keys)):
+            yield {**base, **{k: v for k, v in zip(keys, combo) if v is not None}}
+
+
+def test_sql_patch_semantics_match_python_logic():
+    checked = 0
+    for adapter in adapters():
+        params = contract_patch_params(adapter, today=TODAY)
+        for old in OLD_CONTRACTS:
+            assert normalize(sql_resolve(params, old)) == normalize(legacy_resolve(adapter, old)), (adapter, old)
+            checked += 1
+    assert checked > 1000
+
+
+@pytest.mark.parametrize("column, param, sql_type, has_default", CONTRACT_PATCH_FIELDS)
+def test_sql_uses_declared_coalesce_for_every_patch_field(column, param, sql_type, has_default):
+    default = f", %({param}_default)s::{sql_type}" if has_default else ""
+    assert f"{column} = COALESCE(%({param})s::{sql_type}, c.{column}{default})" in UPSERT_CONTRACT_SQL
+    insert_expr = f"COALESCE(%({param})s::{sql_type}{default})" if has_default else f"%({param})s::{sql_type}"
+    assert insert_expr in UPSERT_CONTRACT_SQL
+
+
+def test_invalid_durata_still_raises():
+    with pytest.raises(ValueError):
+        contract_patch_params({"durata_anni": "tre"})
+
+
+def test_upsert_contract_is_a_single_statement(fake_conn):
+    conn = fake_conn(rows=[("7f9c0c2e-0000-4000-8000-000000000001",)])
+
+    contract_id = db_repo.db_upsert_contract(conn, 5, {"durata_anni": "-"})
+
+    assert contract_id == "7f9c0c2e-0000-4000-8000-000000000001"
+    assert len(conn.calls) == 1
+    sql, params = conn.calls[0]
+    assert sql is UPSERT_CONTRACT_SQL
+    assert params["immobile_id"] == 5 and params["durata"] == 3 and params["kind"] == "CONCORDATO"
+
+
+def test_upsert_contract_without_returned_row_raises(fake_conn):
+    with pytest.raises(RuntimeError):
+        db_repo.db_upsert_contract(fake_conn(), 5, {})
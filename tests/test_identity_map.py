@@ -0,0 +1,104 @@
+import hashlib
+
+from uppi.services import db_repo
+from uppi.services.identity_map import IdentityMap, address_content_hash
+
+CF = "RSSMRA80A01G482X"
+
+
+def test_content_hash_matches_generated_column_expression():
+    expected = hashlib.md5(b"PESCARA|VIA ROMA|SNC").hexdigest()
+    assert address_content_hash(" Pescara ", "via \t roma", None) == expected
+    assert address_content_hash("PESCARA", "VIA ROMA", "SNC") == expected
+
+
+def test_content_hash_keeps_characters_postgres_does_not_expand():
+    # Python: 'ß'.upper() == 'SS'; PostgreSQL upper() лишає 'ß'
+    assert address_content_hash("BOLZANO", "VIA STRAßE", "1") != address_content_hash("BOLZANO", "VIA STRASSE", "1")
+
+
+def test_address_upsert_is_skipped_after_commit(fake_conn):
+    imap = IdentityMap()
+    addr = {"comune": "PESCARA", "via_full": "VIA ROMA", "civico": "5"}
+    h = address_content_hash("PESCARA", "VIA ROMA", "5")
+
+    conn = fake_conn(rows=[(7, h)])
+    assert db_repo.db_upsert_address(conn, addr, identity_map=imap) == 7
+    imap.commit()
+    assert db_repo.db_upsert_address(conn, dict(addr, via_full="via  roma"), identity_map=imap) == 7
+
+    assert len(conn.calls) == 1
+    assert imap.stats.address_hits == 1 and imap.stats.address_misses == 1
+
+
+def test_address_is_not_cached_when_db_hash_differs(fake_conn):
+    imap = IdentityMap()
+    conn = fake_conn(rows=[(7, "other-hash")] * 2)
+    addr = {"comune": "PESCARA", "via_full": "VIA ROMA"}
+
+    db_repo.db_upsert_address(conn, addr, identity_map=imap)
+    db_repo.db_upsert_address(conn, addr, identity_map=imap)
+
+    assert len(conn.calls) == 2
+    assert imap.stats.hash_mismatches == 2
+
+
+def test_rollback_discards_pending_entries():
+    imap = IdentityMap()
+    imap.remember_address("h", "h", 1)
+    imap.remember_person(CF, ("ROSSI", "MARIO", None))
+    assert imap.get_address_id("h") == 1
+
+    imap.rollback()
+
+    assert imap.get_address_id("h") is None
+    assert not imap.person_unchanged(CF, ("ROSSI", "MARIO", None))
+
+
+def test_person_write_skipped_when_payload_adds_nothing(fake_conn):
+    imap = IdentityMap()
+    conn = fake_conn()
+
+    db_repo.db_upsert_person(conn, CF, "ROSSI", "MARIO", address_id=3, identity_map=imap)
+    # None не перезаписує (COALESCE) — той самий рядок у БД
+    db_repo.db_upsert_person(conn, CF, "ROSSI", None, address_id=None, identity_map=imap)
+    db_repo.db_upsert_person(conn, CF, "ROSSI", "MARIO", address_id=3, identity_map=imap)
+    assert len(conn.calls) == 1
+
+    db_repo.db_upsert_person(conn, CF, "ROSSI", "MARIO", address_id=4, identity_map=imap)
+    assert len(conn.calls) == 2
+    assert imap.stats.as_dict()["person_hit_rate"] == 0.5
+
+
+def test_bulk_addresses_query_only_misses(fake_conn):
+    imap = IdentityMap()
+    cached = address_content_hash("PESCARA", "VIA ROMA", "5")
+    imap.remember_address(cached, cached, 10)
+    imap.commit()
+    new_hash = address_content_hash("PESCARA", "VIALE MARCONI", None)
+    conn = fake_conn(rows=[(1, 11, new_hash)])
+
+    ids = db_repo.db_bulk_upsert_addresses(conn, [
+        {"comune": "PESCARA", "via_full": "VIA ROMA", "civico": "5"},
+        {"comune": "PESCARA", "via_full": "VIALE MARCONI"},
+    ], identity_map=imap)
+
+    assert ids == [10, 11]
+    assert conn.calls[0][1][0] == [1]  # ord: лише адреса, якої немає в карті
+    imap.commit()
+    assert imap.get_address_id(new_hash) == 11
+
+
+def test_rollback_to_savepoint_keeps_earlier_pending_entries():
+    imap = IdentityMap()
+    imap.remember_person(CF, ("ROSSI", None, None))
+    mark = imap.savepoint()
+    imap.remember_person(CF, (None, "MARIO", 5))
+    imap.remember_address("h", None, 9)
+
+    imap.rollback_to(mark)
+    imap.commit()
+
+    assert imap.person_unchanged(CF, ("ROSSI", None, None))
+    assert not imap.person_unchanged(CF, (None, "MARIO", None))
+    assert imap.get_address_id("h") is None
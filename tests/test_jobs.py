@@ -0,0 +1,167 @@
+from pathlib import Path
+
+import pytest
+
+from uppi.services import jobs
+from uppi.services.db_repo import (
+    LEASE_JOBS_SQL,
+    JobRow,
+    db_enqueue_job,
+    db_extend_job_lease,
+    db_fail_job,
+    db_lease_jobs,
+    db_release_job,
+)
+from uppi.services.jobs import JobFailed, JobWorker, LeaseHeartbeat, enqueue_fetch_visura, payload_digest, retry_delay
+
+MIGRATION = Path(__file__).resolve().parents[1] / "uppi" / "utils" / "db_utils" / "migrations" / "0006_jobs.sql"
+
+
+def job(attempts=1, max_attempts=3):
+    return JobRow(7, "process_client", "key", {}, attempts, max_attempts)
+
+
+def test_retry_delay_grows_exponentially_with_equal_jitter():
+    assert retry_delay(1, 30, 3600, rand=lambda: 0.0) == 15
+    assert retry_delay(1, 30, 3600, rand=lambda: 1.0) == 30
+    assert retry_delay(3, 30, 3600, rand=lambda: 1.0) == 120
+    # Стеля
+    assert retry_delay(20, 30, 3600, rand=lambda: 1.0) == 3600
+    assert 1800 <= retry_delay(20, 30, 3600) <= 3600
+
+
+def test_enqueue_is_idempotent_by_kind_and_key(fake_conn):
+    conn = fake_conn(rows=[(41,)])
+    assert db_enqueue_job(conn, "fetch_visura", "k", {"a": 1}, 5) == 41
+    # Конфлікт — RETURNING нічого не повертає
+    assert db_enqueue_job(conn, "fetch_visura", "k", {"a": 1}, 5) is None
+
+    sql, params = conn.calls[0]
+    assert "ON CONFLICT (kind, idempotency_key) DO NOTHING" in sql
+    assert params[:2] == ("fetch_visura", "k")
+    assert "UNIQUE (kind, idempotency_key)" in MIGRATION.read_text(encoding="utf-8")
+
+
+def test_fetch_visura_key_depends_on_client_record(fake_conn):
+    client = {"LOCATORE_CF": "RSSMRA80A01G482X", "contract_kind": "CONCORDATO"}
+    conn = fake_conn(rows=[(1,), (2,)])
+
+    enqueue_fetch_visura(conn, client)
+    enqueue_fetch_visura(conn, {**client, "contract_kind": "TRANSITORIO"})
+
+    first, second = (params[1] for _, params in conn.calls)
+    assert first.startswith("RSSMRA80A01G482X:") and first.endswith(payload_digest(client))
+    assert first != second
+
+
+def test_lease_skips_locked_rows_and_hides_them_for_visibility_timeout(fake_conn):
+    conn = fake_conn(rows=[(7, "process_client", "key", {"item": {}}, 1, 5)])
+
+    leased = db_lease_jobs(conn, "process_client", "node-1", 10, 900)
+
+    assert leased == [JobRow(7, "process_client", "key", {"item": {}}, 1, 5)]
+    assert "FOR UPDATE SKIP LOCKED" in LEASE_JOBS_SQL
+    assert "run_after = now() + make_interval(secs => %(visibility_sec)s)" in LEASE_JOBS_SQL
+    assert conn.calls[0][1] == {"kind": "process_client", "worker": "node-1", "limit": 10, "visibility_sec": 900.0}
+
+
+def test_fail_job_is_fenced_by_attempt(fake_conn):
+    conn = fake_conn()
+    assert db_fail_job(conn, 7, 2, "boom", 60) is False
+    sql, params = conn.calls[0]
+    assert "attempts = %(attempt)s AND status = 'running'" in sql
+    assert params["retry"] is True and params["attempt"] == 2
+
+
+def test_extend_and_release_are_fenced_by_attempt(fake_conn):
+    conn = fake_conn(rows=[(7,)])
+    assert db_extend_job_lease(conn, 7, 2, 900) is True
+    # Задачу вже перехопили (attempts змінився) — RETURNING порожній
+    assert db_release_job(conn, 7, 2) is False
+
+    (extend_sql, extend_params), (release_sql, release_params) = conn.calls
+    assert "run_after = now() + make_interval(secs => %s)" in extend_sql
+    assert extend_params == (900.0, 7, 2)
+    # Повернення в чергу віддає спробу назад
+    assert "status = 'queued', attempts = attempts - 1" in release_sql
+    assert "attempts = %s AND status = 'running'" in release_sql
+    assert release_params == (7, 2)
+
+
+class RecordingWorker(JobWorker):
+    kind = "process_client"
+
+    def __init__(self, outcome):
+        super().__init__(worker="test")
+        self.outcome = outcome
+
+    def handle(self, job):
+        if isinstance(self.outcome, Exception):
+            raise self.outcome
+        return self.outcome
+
+
+@pytest.fixture
+def finished(monkeypatch):
+    calls = []
+    monkeypatch.setattr(jobs, "extend_lease", lambda j, visibility_sec=None: True)
+    monkeypatch.setattr(jobs, "complete_job", lambda j, result=None: calls.append(("done", j.id, result)) or True)
+
+    def fake_fail(j, error):
+        calls.append(("fail", j.id, error))
+        return retry_delay(j.attempts) if j.attempts < j.max_attempts else None
+
+    monkeypatch.setattr(jobs, "fail_job", fake_fail)
+    return calls
+
+
+def test_run_job_completes_with_handler_result(finished):
+    worker = RecordingWorker({"ok": True})
+    worker.run_job(job())
+    assert finished == [("done", 7, {"ok": True})]
+    assert worker.stats.as_dict() == {"leased": 0, "done": 1, "retried": 0, "failed": 0, "lost": 0}
+
+
+def test_run_job_retries_until_attempts_are_exhausted(finished):
+    worker = RecordingWorker(JobFailed("processing failed"))
+    worker.run_job(job(attempts=1))
+    worker.run_job(job(attempts=3))
+    assert finished == [("fail", 7, "processing failed"), ("fail", 7, "processing failed")]
+    assert worker.stats.retried == 1 and worker.stats.failed == 1
+
+
+def test_run_until_empty_stops_on_empty_lease(finished, monkeypatch):
+    worker = RecordingWorker({})
+    batches = [[job(), job()], []]
+    monkeypatch.setattr(worker, "lease", lambda: batches.pop(0))
+
+    stats = worker.run(until_empty=True)
+
+    assert stats.done == 2 and batches == []
+
+
+def test_run_job_skips_job_whose_lease_was_taken_over(finished, monkeypatch):
+    monkeypatch.setattr(jobs, "extend_lease", lambda j, visibility_sec=None: False)
+    worker = RecordingWorker(JobFailed("must not run"))
+
+    worker.run_job(job())
+
+    # Ні handle, ні complete/fail: задачею вже володіє інший воркер
+    assert finished == []
+    assert worker.stats.lost == 1
+
+
+def test_heartbeat_extends_lease_until_stopped_or_lost(monkeypatch):
+    extended = []
+
+    def fake_extend(j, visibility_sec):
+        extended.append((j.id, visibility_sec))
+        return len(extended) < 3
+
+    monkeypatch.setattr(jobs, "extend_lease", fake_extend)
+    with LeaseHeartbeat(job(), 900, interval_sec=0.01) as heartbeat:
+        assert heartbeat.lost.wait(5)
+
+    assert extended == [(7, 900)] * 3
+    assert heartbeat.interval_sec == 0.01
+    assert LeaseHeartbeat(job(), 900).interval_sec == 300
@@ -0,0 +1,43 @@
+import os
+import subprocess
+import sys
+
+import pytest
+from decouple import UndefinedValueError
+
+from uppi.config import get_ae_config
+
+HEAVY_MODULES = ["camelot", "pandas", "cv2", "docx", "twocaptcha"]
+
+
+def _run_without_ae_env(code: str) -> subprocess.CompletedProcess:
+    env = {k: v for k, v in os.environ.items() if not k.startswith(("AE_", "SISTER_", "TWO_CAPTCHA_"))}
+    return subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, env=env)
+
+
+@pytest.mark.parametrize("module", ["uppi.spiders.uppi_spider", "uppi.pipelines", "uppi.services"])
+def test_entry_points_import_without_heavy_deps_and_ae_env(module):
+    proc = _run_without_ae_env(
+        f"import sys, {module}\n"
+        f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))"
+    )
+    assert proc.returncode == 0, proc.stderr
+    assert proc.stdout.strip() == ""
+
+
+def test_visura_policy_does_not_import_db_stack():
+    proc = _run_without_ae_env("import sys, uppi.services.visura_policy; print('psycopg' in sys.modules)")
+    assert proc.returncode == 0, proc.stderr
+    assert proc.stdout.strip() == "False"
+
+
+def test_ae_config_resolved_on_demand(monkeypatch):
+    for name in list(os.environ):
+        if name.startswith(("AE_", "SISTER_", "TWO_CAPTCHA_")):
+            monkeypatch.delenv(name)
+    get_ae_config.cache_clear()
+    try:
+        with pytest.raises(UndefinedValueError):
+            get_ae_config()
+    finally:
+        get_ae_config.cache_clear()
@@ -0,0 +1,122 @@
+import pytest
+
+from uppi.services import db_repo
+from uppi.utils.db_utils import index_check
+from uppi.utils.db_utils.index_check import ExplainingConnection, IndexCheckReport, seq_scans
+from uppi.utils.db_utils.migrate import (
+    MIGRATIONS_DIR,
+    MIGRATIONS_LOCK_KEY,
+    MigrationError,
+    discover_migrations,
+    migrate,
+    pending_migrations,
+)
+
+
+def migration_conn(fake_conn, applied=None, plan=None):
+    """schema_migrations — словник applied (змінюється на місці); EXPLAIN повертає plan."""
+    applied = {} if applied is None else applied
+    plan = plan or {"Node Type": "Result"}
+
+    def handler(sql, params):
+        if "FROM public.schema_migrations" in sql:
+            return [(v, name, checksum) for v, (name, checksum) in sorted(applied.items())]
+        if sql.startswith("EXPLAIN"):
+            return [([{"Plan": plan}],)]
+        if "INSERT INTO public.schema_migrations" in sql:
+            version, name, checksum, _ = params
+            applied[version] = (name, checksum)
+        return None
+
+    return fake_conn(handler=handler)
+
+
+def write_migrations(tmp_path, *names):
+    for name in names:
+        (tmp_path / name).write_text(f"-- {name}\nSELECT 1;\n", encoding="utf-8")
+    return discover_migrations(tmp_path)
+
+
+def test_discover_orders_by_version(tmp_path):
+    migrations = write_migrations(tmp_path, "0010_late.sql", "0002_second.sql", "0001_first.sql")
+    assert [m.label for m in migrations] == ["0001_first", "0002_second", "0010_late"]
+
+
+@pytest.mark.parametrize("names", [("0001_a.sql", "0001_b.sql"), ("1_bad.sql",), ("0003_Bad-Name.sql",)])
+def test_discover_rejects_bad_directory(tmp_path, names):
+    with pytest.raises(MigrationError):
+        write_migrations(tmp_path, *names)
+
+
+def test_pending_skips_applied_and_detects_edits(tmp_path):
+    first, second = write_migrations(tmp_path, "0001_first.sql", "0002_second.sql")
+    assert pending_migrations({1: ("first", first.checksum)}, [first, second]) == [second]
+
+    with pytest.raises(MigrationError, match="змінено"):
+        pending_migrations({1: ("first", "stale")}, [first, second])
+    with pytest.raises(MigrationError, match="не в каталозі"):
+        pending_migrations({3: ("gone", "x")}, [first, second])
+
+
+def test_migrate_applies_in_order_under_advisory_lock(tmp_path, fake_conn):
+    migrations = write_migrations(tmp_path, "0001_first.sql", "0002_second.sql", "0003_third.sql")
+    applied_rows = {1: ("first", migrations[0].checksum)}
+    conn = migration_conn(fake_conn, applied=applied_rows)
+
+    applied = migrate(conn, migrations, target=2)
+
+    assert [m.version for m in applied] == [2]
+    assert set(applied_rows) == {1, 2}
+    executed = [sql for sql, _ in conn.calls]
+    assert executed[0] == "SELECT pg_advisory_lock(%s);" and conn.calls[0][1] == (MIGRATIONS_LOCK_KEY,)
+    assert executed[-1] == "SELECT pg_advisory_unlock(%s);"
+    assert "-- 0002_second.sql\nSELECT 1;\n" in executed
+    assert "-- 0003_third.sql\nSELECT 1;\n" not in executed
+
+    # Повторний запуск нічого не застосовує
+    assert migrate(conn, migrations) == [migrations[2]]
+    assert migrate(conn, migrations) == []
+
+
+def test_shipped_migrations():
+    migrations = discover_migrations(MIGRATIONS_DIR)
+    assert [m.version for m in migrations][:2] == [1, 2]
+    baseline = migrations[0].sql
+    # Транзакцією керує раннер
+    assert "BEGIN;" not in baseline and "COMMIT;" not in baseline
+    assert "CREATE UNIQUE INDEX IF NOT EXISTS idx_addresses_hash ON public.addresses(content_hash)" in baseline
+    assert "UNIQUE (owner_cf, foglio, numero, sub)" in baseline
+    assert "UNIQUE(contract_id, calculated_at)" in baseline
+    assert "idx_attestazioni_contract_id ON public.attestazioni(contract_id)" in baseline
+    assert "ON public.contracts(immobile_id, created_at DESC)" in migrations[1].sql
+
+
+def test_seq_scans_walks_nested_plans():
+    plan = {
+        "Node Type": "Nested Loop",
+        "Plans": [
+            {"Node Type": "Index Scan", "Relation Name": "contracts"},
+            {"Node Type": "Aggregate", "Plans": [{"Node Type": "Seq Scan", "Relation Name": "immobile_elements"}]},
+        ],
+    }
+    assert seq_scans(plan) == ["immobile_elements"]
+
+
+def test_explaining_connection_labels_queries_by_repository_function(fake_conn):
+    conn = migration_conn(fake_conn, plan={"Node Type": "Seq Scan", "Relation Name": "visure"})
+    report = IndexCheckReport()
+
+    db_repo.db_clear_visura_checksum(ExplainingConnection(conn, report), "RSSMRA80A01G482X")
+
+    assert [(p.function, p.seq_scans) for p in report.plans] == [("db_clear_visura_checksum", ["visure"])]
+    explain_sql, explain_params = conn.calls[0]
+    assert explain_sql.startswith("EXPLAIN (FORMAT JSON) ") and explain_params == ("RSSMRA80A01G482X",)
+    # Сам запит теж виконано
+    assert conn.calls[1][0] == explain_sql[len("EXPLAIN (FORMAT JSON) "):]
+    assert not report.ok
+
+
+def test_repository_functions_include_db_and_fetch_helpers():
+    names = index_check.repository_functions()
+    assert "db_upsert_contract" in names and "fetch_visura_states_async" in names
+    assert "contract_patch_params" not in names
@@ -0,0 +1,53 @@
+import pytest
+from psycopg.errors import LockNotAvailable
+
+from uppi.services.db_repo import OWNER_LOCK_NAMESPACE
+from uppi.services.owner_lock import OwnerLockStats, OwnerLockTimeout, lock_owner
+
+CF = "RSSMRA80A01G482X"
+
+
+def lock_conn(fake_conn, free=True, lock_error=False):
+    def handler(sql, params):
+        if "pg_try_advisory_xact_lock" in sql:
+            return [(free,)]
+        if "current_setting" in sql:
+            return [("0",)]
+        if "pg_advisory_xact_lock" in sql:
+            if lock_error:
+                raise LockNotAvailable("canceling statement due to lock timeout")
+            return [("",)]
+        return None
+
+    return fake_conn(handler=handler)
+
+
+def test_free_owner_is_locked_without_waiting(fake_conn):
+    conn, stats = lock_conn(fake_conn, free=True), OwnerLockStats()
+
+    assert lock_owner(conn, CF, stats) == 0.0
+
+    assert conn.calls == [("SELECT pg_try_advisory_xact_lock(%s, hashtext(%s));", (OWNER_LOCK_NAMESPACE, CF))]
+    assert stats.as_dict()["acquired"] == 1 and stats.contended == 0
+
+
+def test_busy_owner_waits_with_local_lock_timeout_and_restores_it(fake_conn):
+    conn, stats = lock_conn(fake_conn, free=False), OwnerLockStats()
+
+    lock_owner(conn, CF, stats, timeout_ms=1500)
+
+    executed = [(sql, params) for sql, params in conn.calls]
+    assert executed[2] == ("SELECT set_config('lock_timeout', %s, true);", ("1500ms",))
+    assert executed[3][0] == "SELECT pg_advisory_xact_lock(%s, hashtext(%s));"
+    assert executed[4] == ("SELECT set_config('lock_timeout', %s, true);", ("0",))
+    assert (stats.acquired, stats.contended, stats.timeouts) == (1, 1, 0)
+
+
+def test_lock_timeout_is_counted_and_raised(fake_conn):
+    conn, stats = lock_conn(fake_conn, free=False, lock_error=True), OwnerLockStats()
+
+    with pytest.raises(OwnerLockTimeout) as exc_info:
+        lock_owner(conn, CF, stats, timeout_ms=10)
+
+    assert exc_info.value.cf == CF
+    assert (stats.acquired, stats.contended, stats.timeouts) == (0, 1, 1)
@@ -0,0 +1,130 @@
+from datetime import date
+
+from uppi.utils.db_utils import partitions
+from uppi.utils.db_utils.migrate import MIGRATIONS_DIR, discover_migrations
+from uppi.utils.db_utils.partitions import (
+    PARTITIONED_TABLES,
+    add_months,
+    expired_partitions,
+    partition_month,
+    run_maintenance,
+)
+
+
+class PartitionedDb:
+    """Каталог партицій і кількість рядків у них — відповіді на запити partitions.py."""
+
+    def __init__(self, partitions, rows, superseded, default_months=None):
+        self.partitions = {name: set(parts) for name, parts in partitions.items()}
+        self.rows = rows
+        self.superseded = superseded
+        self.remaining = {}
+        self.default_months = default_months or {}
+        self.orphan_snapshots = 2
+
+    def handle(self, text, params):
+        if "FROM pg_inherits" in text:
+            parent = params[0].removeprefix("public.")
+            return [(name,) for name in sorted(self.partitions[parent])]
+        if "date_trunc('month'" in text:
+            parent = next(t.name for t in PARTITIONED_TABLES if f'"{t.name}_default"' in text)
+            return [(m,) for m in self.default_months.get(parent, [])]
+        if text.startswith("SELECT public.ensure_monthly_partition"):
+            parent, _, month = params
+            self.partitions[parent].add(f"{parent}_p{month:%Y%m}")
+        elif "attestazione_snapshots" in text:
+            return [(self.orphan_snapshots,)]
+        elif text.startswith("WITH deleted AS"):
+            part = text.split("DELETE FROM public.")[1].split('"')[1]
+            self.remaining[part] = self.rows[part] - self.superseded.get(part, 0)
+            return [(self.superseded.get(part, 0),)]
+        elif text.startswith("SELECT NOT EXISTS"):
+            part = text.split('"')[1]
+            return [(self.remaining[part] == 0,)]
+        elif text.startswith("SELECT count(*) FILTER"):
+            part = text.rsplit("FROM public.", 1)[1].split('"')[1]
+            superseded = self.superseded.get(part, 0)
+            return [(superseded, superseded == self.rows[part])]
+        elif text.startswith("DROP TABLE"):
+            part = text.split('"')[1]
+            for names in self.partitions.values():
+                names.discard(part)
+        return []
+
+
+def make_conn(fake_conn, default_months=None):
+    db = PartitionedDb(
+        partitions={
+            "canone_calcoli": {"canone_calcoli_default", "canone_calcoli_p202301", "canone_calcoli_p202402",
+                               "canone_calcoli_p202603"},
+            "attestazioni": {"attestazioni_default", "attestazioni_p202312", "attestazioni_p202603"},
+        },
+        # p202301: усі рядки застарілі -> дроп; p202312: лишається останній запис контракту
+        rows={"canone_calcoli_p202301": 5, "canone_calcoli_p202402": 3, "attestazioni_p202312": 4},
+        superseded={"canone_calcoli_p202301": 5, "attestazioni_p202312": 3},
+        default_months=default_months,
+    )
+    return fake_conn(handler=db.handle), db
+
+
+def test_month_helpers():
+    assert add_months(date(2026, 1, 1), -1) == date(2025, 12, 1)
+    assert add_months(date(2025, 11, 1), 14) == date(2027, 1, 1)
+    assert partition_month("canone_calcoli_p202402") == date(2024, 2, 1)
+    assert partition_month("canone_calcoli_default") is None
+    assert expired_partitions(
+        ["x_default", "x_p202402", "x_p202401", "x_p202403"], cutoff=date(2024, 3, 1)
+    ) == ["x_p202401", "x_p202402"]
+
+
+def test_maintenance_creates_ahead_and_drains_default(fake_conn):
+    conn, _ = make_conn(fake_conn, default_months={"attestazioni": [date(2025, 7, 1)]})
+
+    report = run_maintenance(conn, today=date(2026, 3, 18), months_ahead=2, retention_months=24)
+
+    assert report.created == [
+        "canone_calcoli_p202604", "canone_calcoli_p202605",
+        "attestazioni_p202507", "attestazioni_p202604", "attestazioni_p202605",
+    ]
+
+
+def test_retention_keeps_latest_rows_and_drops_only_empty_partitions(fake_conn):
+    conn, db = make_conn(fake_conn)
+
+    # cutoff = 2024-03: p202301, p202402, p202312 прострочені
+    report = run_maintenance(conn, today=date(2026, 3, 18), months_ahead=0, retention_months=24)
+
+    assert report.dropped == ["canone_calcoli_p202301"]
+    assert report.rows_deleted == {"canone_calcoli_p202301": 5, "attestazioni_p202312": 3}
+    assert "canone_calcoli_p202301" not in db.partitions["canone_calcoli"]
+    assert "attestazioni_p202312" in db.partitions["attestazioni"]
+    # Після retention — GC знімків атестацій під блокуванням
+    assert report.snapshots_deleted == 2
+    assert conn.calls[-2][0] == "LOCK TABLE public.attestazione_snapshots IN SHARE ROW EXCLUSIVE MODE;"
+    # Свіжі партиції retention не чіпає
+    touched = [sql for sql, _ in conn.calls if sql.startswith("WITH deleted AS")]
+    assert len(touched) == 3 and not any("p202603" in sql for sql in touched)
+
+
+def test_dry_run_changes_nothing(fake_conn):
+    conn, _ = make_conn(fake_conn)
+
+    report = run_maintenance(conn, today=date(2026, 3, 18), months_ahead=1, retention_months=24, dry_run=True)
+
+    assert report.dropped == ["canone_calcoli_p202301"]
+    assert report.created == ["canone_calcoli_p202604", "attestazioni_p202604"]
+    executed = [sql for sql, _ in conn.calls]
+    assert not any(sql.startswith(("WITH deleted AS (DELETE FROM public.\"", "DROP TABLE", "SELECT public.ensure_monthly_partition"))
+                   for sql in executed)
+    assert conn.commits == 0
+
+
+def test_partition_migration_keeps_keys_for_upserts():
+    migration = next(m for m in discover_migrations(MIGRATIONS_DIR) if m.name == "partition_audit_tables")
+    text = migration.sql
+    assert "PARTITION BY RANGE (calculated_at)" in text and "PARTITION BY RANGE (generated_at)" in text
+    # db_insert_canone_calc: ON CONFLICT (contract_id, calculated_at)
+    assert "UNIQUE (contract_id, calculated_at)" in text
+    for table in partitions.PARTITIONED_TABLES:
+        assert f"CREATE TABLE public.{table.name}_default PARTITION OF public.{table.name} DEFAULT" in text
+        assert f"ensure_monthly_partition('{table.name}', '{table.key_column}'" in text
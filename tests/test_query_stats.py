@@ -0,0 +1,71 @@
+import logging
+
+from uppi.services import db_repo
+from uppi.services.query_stats import InstrumentedConnection, QueryStats, redact_params, statement_label
+
+
+def timed_conn(fake_conn, monkeypatch, execute_sec, rowcount=1):
+    """Кожен execute "триває" execute_sec за perf_counter, який бачить query_stats."""
+    clock = [0.0]
+
+    def handler(sql, params):
+        clock[0] += execute_sec
+
+    monkeypatch.setattr("uppi.services.query_stats.time.perf_counter", lambda: clock[0])
+    return fake_conn(handler=handler, rowcount=rowcount)
+
+
+def test_labels_come_from_repository_function(fake_conn, monkeypatch):
+    raw = timed_conn(fake_conn, monkeypatch, execute_sec=0.01, rowcount=2)
+    stats = QueryStats()
+    conn = InstrumentedConnection(raw, stats, slow_query_ms=0)
+
+    db_repo.db_clear_visura_checksum(conn, "RSSMRA80A01H501U")
+    db_repo.db_clear_visura_checksum(conn, "RSSMRA80A01H501U")
+    with conn.cursor() as cur:
+        cur.execute("SELECT 1")
+    conn.commit()
+
+    assert set(stats.statements) == {"clear_visura_checksum", "other", "commit"}
+    st = stats.statements["clear_visura_checksum"]
+    assert (st.calls, st.rows) == (2, 4)
+    assert round(st.total_sec, 3) == 0.02 and round(st.max_sec, 3) == 0.01
+    assert raw.commits == 1
+    assert stats.total_calls == 4
+
+
+def test_slow_query_log_redacts_params(fake_conn, monkeypatch, caplog):
+    raw = timed_conn(fake_conn, monkeypatch, execute_sec=0.5)
+    conn = InstrumentedConnection(raw, QueryStats(), slow_query_ms=250)
+
+    with caplog.at_level(logging.WARNING, logger="uppi.slow_query"):
+        db_repo.db_clear_visura_checksum(conn, "RSSMRA80A01H501U")
+
+    assert len(caplog.records) == 1
+    message = caplog.records[0].getMessage()
+    assert message.startswith("[SLOW_QUERY] clear_visura_checksum 500.0 ms")
+    assert "RSSMRA80A01H501U" not in message and "<str>" in message
+
+
+def test_fast_queries_are_not_logged(fake_conn, monkeypatch, caplog):
+    raw = timed_conn(fake_conn, monkeypatch, execute_sec=0.01)
+    conn = InstrumentedConnection(raw, QueryStats(), slow_query_ms=250)
+
+    with caplog.at_level(logging.WARNING, logger="uppi.slow_query"):
+        db_repo.db_clear_visura_checksum(conn, "RSSMRA80A01H501U")
+
+    assert not caplog.records
+
+
+def test_merge_summary_and_redaction():
+    run, item = QueryStats(), QueryStats()
+    run.observe("load_immobili", 0.2, 0.2, new_call=True, rows=3)
+    item.observe("load_immobili", 0.1, 0.1, new_call=True, rows=1)
+    item.observe("upsert_contract", 0.05, 0.05, new_call=True, rows=1)
+    run.merge(item)
+
+    assert run.as_dict()["load_immobili"] == {"calls": 2, "total_ms": 300.0, "max_ms": 200.0, "rows": 4}
+    summary = item.summary(top=1)
+    assert summary["statements"] == 2 and list(summary["top"]) == ["load_immobili"]
+    assert statement_label("db_upsert_person") == "upsert_person" and statement_label(None) == "other"
+    assert redact_params({"cf": "X", "ids": [1, 2], "n": None}) == {"cf": "<str>", "ids": "<list[2]>", "n": None}
@@ -0,0 +1,89 @@
+import threading
+
+from benchmarks.synthetic_visura import write_synthetic_visura
+from tests.test_sandboxed_parser import MisbehavingParser
+from uppi.cli.reparse_visure import ReparseStats, SandboxPool, run_reparse
+from uppi.parsers.sandboxed_parser import PARSE_ERROR_TIMEOUT, VisuraParseError
+
+
+def test_writes_start_before_all_downloads_finish_and_pdfs_are_removed(tmp_path):
+    targets = [(f"CF{i}", f"visure/CF{i}.pdf") for i in range(6)]
+    last_download = threading.Event()
+    applied, on_disk, applied_before_last_download = [], [], []
+
+    def download(cf, obj_name):
+        if cf == "CF5":
+            # Останнє завантаження чекає, поки перші CF вже записані
+            assert last_download.wait(5)
+            applied_before_last_download.append(len(applied))
+        path = tmp_path / f"{cf}.pdf"
+        path.write_bytes(b"%PDF")
+        return path
+
+    def apply(cf, parsed_dicts, parse_report):
+        applied.append(cf)
+        on_disk.append(len(list(tmp_path.iterdir())))
+        if len(applied) == 3:
+            last_download.set()
+        return True
+
+    stats = run_reparse(
+        targets, download, lambda path: ([{"foglio": "1"}], {}), apply,
+        ReparseStats(pdfs_total=6), workers=1, download_workers=1,
+    )
+
+    assert sorted(applied) == [cf for cf, _ in targets]
+    # Перші CF записані ще до завершення останнього завантаження
+    [written] = applied_before_last_download
+    assert 3 <= written < len(targets)
+    assert (stats.pdfs_parsed, stats.immobili, stats.failed) == (6, 6, {})
+    # Не більше workers + download_workers PDF одночасно, і жодного після завершення
+    assert max(on_disk) <= 2
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_parse_and_download_failures_are_recorded_and_the_run_continues(tmp_path):
+    targets = [("CF_OK", "a"), ("CF_HANG", "b"), ("CF_GONE", "c")]
+
+    def download(cf, obj_name):
+        if cf == "CF_GONE":
+            raise OSError("NoSuchKey")
+        path = tmp_path / f"{cf}.pdf"
+        path.write_bytes(b"%PDF")
+        return path
+
+    def parse(pdf_path):
+        if "CF_HANG" in pdf_path:
+            raise VisuraParseError(PARSE_ERROR_TIMEOUT, pdf_path, "no result after 1s", 1.2)
+        return [{"foglio": "1"}], {}
+
+    stats = run_reparse(
+        targets, download, parse, lambda cf, rows, report: True,
+        ReparseStats(pdfs_total=3), workers=2, download_workers=2,
+    )
+
+    assert stats.pdfs_parsed == 1 and stats.pdfs_failed == 2
+    assert stats.failed["CF_HANG"]["kind"] == "timeout"
+    assert stats.failed["CF_HANG"]["message"] == "no result after 1s"
+    assert stats.failed["CF_GONE"] == {"kind": "download", "message": "NoSuchKey"}
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_sandbox_pool_survives_hanging_pdf(tmp_path):
+    good = tmp_path / "visura.pdf"
+    write_synthetic_visura(good, n_immobili=2)
+    sandboxes = SandboxPool("pymupdf", timeout_sec=1, max_rss_mb=None, parser_factory=MisbehavingParser)
+    applied = {}
+    try:
+        stats = run_reparse(
+            [("CF_HANG", "a"), ("CF_OK", "b")],
+            lambda cf, obj_name: tmp_path / "hang.pdf" if cf == "CF_HANG" else good,
+            sandboxes.parse,
+            lambda cf, rows, report: applied.setdefault(cf, len(rows)) is not None,
+            ReparseStats(pdfs_total=2), workers=1, download_workers=1,
+        )
+    finally:
+        sandboxes.close()
+
+    assert applied == {"CF_OK": 2}
+    assert stats.failed["CF_HANG"]["kind"] == "timeout"
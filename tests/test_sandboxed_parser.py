@@ -0,0 +1,115 @@
+import time
+
+import pytest
+
+from benchmarks.synthetic_visura import write_synthetic_visura
+from uppi.parsers.sandboxed_parser import (
+    PARSE_ERROR_MEMORY,
+    PARSE_ERROR_TIMEOUT,
+    SandboxedVisuraParser,
+    VisuraParseError,
+)
+from uppi.parsers.visura_pdf_parser import VisuraParser
+
+
+class MisbehavingParser(VisuraParser):
+    """Парсер для воркера: hang.pdf зависає, alloc.pdf роздуває RSS, решта — звичайний парсинг."""
+
+    def parse_iter(self, pdf_path, report=None):
+        name = str(pdf_path)
+        if name.endswith("alloc.pdf"):
+            # Заповнені (а не нульові) сторінки, щоб RSS справді зріс
+            ballast = [b"x" * (16 * 1024 * 1024) for _ in range(32)]  # noqa: F841
+            time.sleep(60)
+        if name.endswith("hang.pdf"):
+            yield {"partial": True}
+            time.sleep(60)
+        yield from super().parse_iter(pdf_path, report=report)
+
+
+def test_parse_error_as_dict():
+    err = VisuraParseError(PARSE_ERROR_TIMEOUT, "/tmp/v.pdf", "no result after 120s", 120.04, None, 3)
+    assert err.as_dict() == {
+        "kind": "timeout",
+        "pdf_path": "/tmp/v.pdf",
+        "message": "no result after 120s",
+        "elapsed_sec": 120.04,
+        "rss_mb": None,
+        "rows_emitted": 3,
+    }
+    assert "timeout" in str(err)
+
+
+def test_sandboxed_parser_missing_pdf_returns_empty(tmp_path):
+    parser = SandboxedVisuraParser(timeout_sec=60)
+    try:
+        assert parser.parse(tmp_path / "missing.pdf") == []
+        # Воркер переживає документ і використовується повторно
+        assert parser._proc is not None and parser._proc.is_alive()
+    finally:
+        parser.close()
+    assert parser._proc is None
+
+
+def test_sandboxed_parser_returns_report(tmp_path):
+    pdf_path = tmp_path / "visura.pdf"
+    write_synthetic_visura(pdf_path, n_immobili=2)
+
+    parser = SandboxedVisuraParser(timeout_sec=60)
+    try:
+        rows, report = parser.parse_with_report(pdf_path)
+    finally:
+        parser.close()
+
+    assert len(rows) == report.rows_emitted == 2
+    assert report.pdf_path == str(pdf_path)
+    assert report.pages[1].rows_emitted == 2
+
+
+def assert_recovers_in_fresh_worker(parser, tmp_path, old_pid):
+    pdf_path = tmp_path / "visura.pdf"
+    write_synthetic_visura(pdf_path, n_immobili=2)
+    assert len(parser.parse(pdf_path)) == 2
+    assert parser._proc.pid != old_pid
+
+
+def test_hanging_parse_times_out_and_next_parse_uses_fresh_worker(tmp_path):
+    parser = SandboxedVisuraParser(timeout_sec=1, poll_interval_sec=0.05, parser_factory=MisbehavingParser)
+    try:
+        parser._ensure_worker()
+        old_pid = parser._proc.pid
+        rows = []
+        with pytest.raises(VisuraParseError) as exc_info:
+            for row in parser.parse_iter(tmp_path / "hang.pdf"):
+                rows.append(row)
+
+        error = exc_info.value
+        assert error.kind == PARSE_ERROR_TIMEOUT
+        assert error.pdf_path == str(tmp_path / "hang.pdf")
+        assert error.elapsed_sec > 1 and error.rows_emitted == len(rows) == 1
+        # Воркер вбито, а не залишено висіти
+        assert parser._proc is None
+
+        assert_recovers_in_fresh_worker(parser, tmp_path, old_pid)
+    finally:
+        parser.close()
+
+
+def test_parse_over_rss_limit_is_killed_and_next_parse_uses_fresh_worker(tmp_path):
+    parser = SandboxedVisuraParser(
+        timeout_sec=30, max_rss_mb=256, poll_interval_sec=0.05, parser_factory=MisbehavingParser
+    )
+    try:
+        parser._ensure_worker()
+        old_pid = parser._proc.pid
+        with pytest.raises(VisuraParseError) as exc_info:
+            parser.parse(tmp_path / "alloc.pdf")
+
+        error = exc_info.value
+        assert error.kind == PARSE_ERROR_MEMORY
+        assert error.rss_mb > 256 and error.as_dict()["kind"] == "memory"
+        assert parser._proc is None
+
+        assert_recovers_in_fresh_worker(parser, tmp_path, old_pid)
+    finally:
+        parser.close()
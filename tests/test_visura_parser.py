@@ -0,0 +1,166 @@
+import pytest
+
+from benchmarks.synthetic_visura import compare_with_expected, write_synthetic_visura
+from uppi.parsers.visura_pdf_parser import (
+    FALLBACK_NO_IMMOBILI_TABLES,
+    FALLBACK_NO_TABLES,
+    PAGE_SKIP_NO_IMMOBILI,
+    TABLE_SKIP_EMPTY,
+    TABLE_SKIP_INTABULAZIONE,
+    TABLE_SKIP_NO_REAL_ESTATE,
+    ParseReport,
+    VisuraParser,
+)
+
+
+HEADER_GROUPED = ["DATI IDENTIFICATIVI", "", "", "", "", "DATI DI CLASSAMENTO", "", "", "", "", "ALTRE INFORMAZIONI", ""]
+HEADER = [
+    "", "Sez.\nUrb.", "Foglio", "Numero", "Sub", "Zona\nCens.", "Micro\nZona", "Categoria", "",
+    "Classe Consistenza", "Superficie\nCatastale", "Rendita",
+]
+ROW = [
+    "1", "", "12", "345", "6", "1", "2", "A/2", "3", "5,5 vani",
+    "Totale: 98 m²\nTotale escluse aree\nscoperte**: 95 m²", "Euro 568,10",
+]
+
+
+def table_rows(rows_raw):
+    """Рядки immobili з таблиці так, як їх віддає parse_iter: _classify_table + _iter_data_rows."""
+    parser = VisuraParser()
+    header, data_start_row, reason = parser._classify_table(rows_raw)
+    if reason:
+        return reason
+    return list(parser._iter_data_rows(header, rows_raw[data_start_row:]))
+
+
+def test_grouped_header_rows():
+    [imm] = table_rows([HEADER_GROUPED, HEADER, ROW])
+    assert imm["table_num_immobile"] == "1"
+    assert imm["sez_urbana"] == ""
+    assert imm["foglio"] == "12"
+    assert imm["numero"] == "345"
+    assert imm["sub"] == "6"
+    assert imm["zona_cens"] == "1"
+    assert imm["micro_zona"] == "2"
+    assert imm["categoria"] == "A/2"
+    assert imm["classe"] == "3"
+    assert imm["consistenza"] == "5,5 vani"
+    assert imm["superficie_totale"] == 98.0
+    assert imm["superficie_escluse"] == 95.0
+    assert imm["rendita"] == "€ 568.1"
+
+
+def test_intabulazione_table_gives_no_rows():
+    rows = [["Nominativo", "DATI ANAGRAFICI", "DIRITTI E ONERI REALI"], ["1", "ROSSI MARIO", "Proprieta' 1/1"]]
+    assert table_rows(rows) == TABLE_SKIP_INTABULAZIONE
+
+
+def test_empty_table_gives_no_rows():
+    assert table_rows([]) == TABLE_SKIP_EMPTY
+
+
+def test_unknown_table_engine():
+    with pytest.raises(ValueError):
+        VisuraParser(table_engine="tabula")
+
+
+def test_page_prefilter():
+    parser = VisuraParser()
+    assert parser._page_has_immobili_table("Immobili siti nel Comune di PESCARA (Codice G482)")
+    assert parser._page_has_immobili_table("N. Sez. Urb. Foglio Numero Sub Zona Cens.")
+    assert not parser._page_has_immobili_table("Legenda\nDATI ANAGRAFICI\nDIRITTI E ONERI REALI")
+
+
+def test_extract_name_cf_and_comune_from_text():
+    parser = VisuraParser()
+    text = "Visura per soggetto\nROSSI Mario (CF: RSSMRA80A01G482X)\nImmobili siti nel Comune di PESCARA (Codice G482)"
+    assert parser._extract_name_cf(text) == {
+        "locatore_surname": "ROSSI",
+        "locatore_name": "Mario",
+        "cf": "RSSMRA80A01G482X",
+    }
+    assert parser._extract_comune(text) == ("PESCARA", "G482")
+
+
+def test_parse_synthetic_visura_end_to_end(tmp_path):
+    pdf_path = tmp_path / "visura.pdf"
+    expected = write_synthetic_visura(pdf_path, n_immobili=5, rows_per_page=3, n_comuni=2)
+
+    parsed = VisuraParser().parse(pdf_path)
+
+    assert compare_with_expected(parsed, expected) == []
+    assert {row["immobile_comune"] for row in parsed} == {"PESCARA", "MONTESILVANO"}
+
+
+def test_classify_table_skip_reasons():
+    parser = VisuraParser()
+    assert parser._classify_table([["N.", "DATI ANAGRAFICI", "CODICE FISCALE"]])[2] == TABLE_SKIP_INTABULAZIONE
+    assert parser._classify_table([["Data", "Descrizione"], ["01/01/2020", "x"]])[2] == TABLE_SKIP_NO_REAL_ESTATE
+    assert parser._classify_table([HEADER_GROUPED, HEADER, ROW])[1:] == (2, None)
+
+
+def test_parse_report_for_synthetic_visura(tmp_path):
+    pdf_path = tmp_path / "visura.pdf"
+    write_synthetic_visura(pdf_path, n_immobili=5, rows_per_page=3)
+
+    rows, report = VisuraParser().parse_with_report(pdf_path)
+
+    # intestazione + 2 сторінки immobili + легенда
+    assert report.pages_total == 4
+    assert report.rows_emitted == len(rows) == 5
+    assert [p.skipped_reason for p in report.pages] == [PAGE_SKIP_NO_IMMOBILI, None, None, PAGE_SKIP_NO_IMMOBILI]
+    assert [p.rows_emitted for p in report.pages] == [0, 3, 2, 0]
+    assert report.tables_found == 2 and report.tables_skipped == 0
+    assert report.pages[1].engine == "pymupdf" and report.pages[1].fallback_reason is None
+
+    data = report.as_dict()
+    assert data["pages_skipped"] == 2
+    assert ParseReport.from_dict(data).as_dict() == data
+
+
+def test_parse_report_missing_pdf(tmp_path):
+    report = ParseReport()
+    assert list(VisuraParser().parse_iter(tmp_path / "missing.pdf", report=report)) == []
+    assert report.error and report.pages == []
+
+
+@pytest.mark.parametrize(
+    "pymupdf_tables, reason",
+    [([], FALLBACK_NO_TABLES), ([[["N.", "DATI ANAGRAFICI", "CODICE FISCALE"]]], FALLBACK_NO_IMMOBILI_TABLES)],
+)
+def test_camelot_fallback_when_pymupdf_gives_no_immobili_tables(tmp_path, monkeypatch, pymupdf_tables, reason):
+    pdf_path = tmp_path / "visura.pdf"
+    write_synthetic_visura(pdf_path, n_immobili=1)
+    parser = VisuraParser()
+    camelot_pages = []
+    monkeypatch.setattr(parser, "_extract_tables_pymupdf", lambda page: pymupdf_tables)
+    monkeypatch.setattr(
+        parser, "_extract_tables_camelot", lambda path, idx: camelot_pages.append(idx) or [[HEADER_GROUPED, HEADER, ROW]]
+    )
+
+    rows, report = parser.parse_with_report(pdf_path)
+
+    # camelot читає тільки сторінку, що пройшла префільтр
+    assert camelot_pages == [1]
+    assert [r["foglio"] for r in rows] == ["12"]
+    page = report.pages[1]
+    assert (page.engine, page.fallback_reason, page.tables_found) == ("camelot", reason, 1)
+    assert report.as_dict()["pages"][1]["fallback_reason"] == reason
+
+
+def test_failed_camelot_fallback_keeps_pymupdf_result(tmp_path, monkeypatch):
+    pdf_path = tmp_path / "visura.pdf"
+    write_synthetic_visura(pdf_path, n_immobili=1)
+    parser = VisuraParser()
+    monkeypatch.setattr(parser, "_extract_tables_pymupdf", lambda page: [])
+
+    def no_camelot(path, idx):
+        raise ImportError("No module named 'camelot'")
+
+    monkeypatch.setattr(parser, "_extract_tables_camelot", no_camelot)
+
+    rows, report = parser.parse_with_report(pdf_path)
+
+    assert rows == []
+    page = report.pages[1]
+    assert (page.engine, page.fallback_reason, page.error) == ("pymupdf", FALLBACK_NO_TABLES, None)
@@ -0,0 +1,187 @@
+import json
+import logging
+from datetime import datetime
+from uuid import UUID
+
+from itemadapter import ItemAdapter
+from psycopg.errors import CheckViolation
+
+from uppi.domain.immobile import Immobile
+from uppi.services import visura_processor
+from uppi.services.attestazione_generator import build_template_params, template_params_fingerprint
+from uppi.services.db_repo import VisuraState
+from uppi.services.visura_processor import TEMPLATE_VERSION, VisuraProcessor
+from uppi.utils.parse_utils import prepare_for_json
+
+
+class FakeStorageService:
+    def __init__(self, exists: bool):
+        self.exists = exists
+
+    def object_exists(self, bucket, object_name):
+        return self.exists
+
+
+def make_processor(minio_exists: bool = True) -> VisuraProcessor:
+    processor = VisuraProcessor()
+    processor.storage_service = FakeStorageService(minio_exists)
+    return processor
+
+
+def make_state(checksum):
+    return VisuraState(
+        cf="RSSMRA80A01G482X",
+        pdf_bucket="visure",
+        pdf_object="visure/RSSMRA80A01G482X.pdf",
+        fetched_at=datetime.utcnow(),
+        id=1,
+        checksum_sha256=checksum,
+    )
+
+
+def test_visura_unchanged_same_checksum():
+    processor = make_processor()
+    adapter = ItemAdapter({})
+    assert processor._is_visura_unchanged(
+        make_state("abc"), "abc", "visure", "visure/RSSMRA80A01G482X.pdf", adapter
+    ) is True
+
+
+def test_visura_changed_checksum():
+    processor = make_processor()
+    assert processor._is_visura_unchanged(
+        make_state("abc"), "def", "visure", "visure/RSSMRA80A01G482X.pdf", ItemAdapter({})
+    ) is False
+
+
+def test_visura_unchanged_but_missing_in_minio():
+    processor = make_processor(minio_exists=False)
+    assert processor._is_visura_unchanged(
+        make_state("abc"), "abc", "visure", "visure/RSSMRA80A01G482X.pdf", ItemAdapter({})
+    ) is False
+
+
+def test_visura_unchanged_force_update():
+    processor = make_processor()
+    adapter = ItemAdapter({"force_update_visura": True})
+    assert processor._is_visura_unchanged(
+        make_state("abc"), "abc", "visure", "visure/RSSMRA80A01G482X.pdf", adapter
+    ) is False
+
+
+def test_visura_no_previous_state():
+    processor = make_processor()
+    assert processor._is_visura_unchanged(
+        None, "abc", "visure", "visure/RSSMRA80A01G482X.pdf", ItemAdapter({})
+    ) is False
+
+
+class FakeSpider:
+    logger = logging.getLogger("test_spider")
+
+
+def test_failed_stage_rolls_back_to_savepoint_and_continues(fake_conn):
+    processor = make_processor()
+    conn = fake_conn()
+    outcomes = {}
+
+    with processor._stage(conn, "persons", outcomes, FakeSpider()):
+        processor.identity_map.remember_address("h1", None, 1)
+    with processor._stage(conn, "visura", outcomes, FakeSpider()):
+        processor.identity_map.remember_address("h2", None, 2)
+        raise ValueError("bad row")
+
+    assert outcomes == {
+        "persons": {"status": "ok", "error": None},
+        "visura": {"status": "failed", "error": "bad row"},
+    }
+    assert conn.statements == [
+        'SAVEPOINT "persons"', 'RELEASE SAVEPOINT "persons"',
+        'SAVEPOINT "visura"', 'ROLLBACK TO SAVEPOINT "visura"', 'RELEASE SAVEPOINT "visura"',
+    ]
+    # ID з відкоченого етапу не потрапляють в identity map
+    processor.identity_map.commit()
+    assert processor.identity_map.get_address_id("h1") == 1
+    assert processor.identity_map.get_address_id("h2") is None
+
+
+def render_inputs():
+    adapter = ItemAdapter({"locatore_cf": "RSSMRA80A01G482X", "contratto_data": "01/02/2024"})
+    imm = Immobile(foglio="1", numero="2", sub="3", categoria="A/2", superficie_totale=70.0)
+    return adapter, imm, {"elements": {"a1": "X"}}
+
+
+def test_fingerprint_follows_template_params_and_version():
+    adapter, imm, ctx = render_inputs()
+    params = build_template_params(adapter, imm, ctx)
+    fp = template_params_fingerprint(params, TEMPLATE_VERSION)
+
+    assert fp == template_params_fingerprint(build_template_params(adapter, imm, ctx), TEMPLATE_VERSION)
+    assert fp != template_params_fingerprint(params, TEMPLATE_VERSION + "_next")
+    changed = build_template_params(adapter, imm, {"elements": {"a1": "X", "b1": "X"}})
+    assert fp != template_params_fingerprint(changed, TEMPLATE_VERSION)
+
+
+def test_unchanged_inputs_skip_render_upload_and_log(fake_conn):
+    adapter, imm, ctx = render_inputs()
+    fp = template_params_fingerprint(build_template_params(adapter, imm, ctx), TEMPLATE_VERSION)
+    processor = make_processor()
+    conn = fake_conn(rows=[(fp,)])
+
+    status = processor._render_attestazione(conn, adapter, "RSSMRA80A01G482X", 1, imm, "c-1", ctx, None)
+
+    assert status == "unchanged"
+    # Тільки пошук відбитка: жодного INSERT в attestazioni
+    assert len(conn.calls) == 1 and "input_fingerprint" in conn.statements[0]
+
+
+def test_changed_or_forced_inputs_are_rendered(fake_conn):
+    processor = make_processor()
+
+    assert processor._attestazione_unchanged(fake_conn(rows=[("old",)]), "c-1", "new") is False
+    assert processor._attestazione_unchanged(fake_conn(), "c-1", "new") is False
+
+    conn = fake_conn(rows=[("same",)])
+    assert processor._attestazione_unchanged(conn, "c-1", "same", force=True) is False
+    processor.force_render = True
+    assert processor._attestazione_unchanged(conn, "c-1", "same") is False
+    assert conn.calls == []
+
+
+def test_failed_immobile_update_rolls_back_only_its_savepoint(fake_conn, monkeypatch):
+    def handler(sql, params):
+        if "UPDATE public.immobili" in sql and params[-1] == 2:
+            raise CheckViolation('new row violates check constraint "immobili_energy_class_check"')
+        if "pg_try_advisory_xact_lock" in sql:
+            return [(True,)]
+        return [(1,)]
+
+    immobili = [(i, Immobile(foglio="1", numero=str(i), sub="1", categoria="A/2")) for i in (1, 2, 3)]
+    monkeypatch.setattr(visura_processor, "db_load_immobili", lambda conn, cf: immobili)
+    monkeypatch.setattr(visura_processor, "db_upsert_contract", lambda conn, imm_id, adapter: f"c-{imm_id}")
+    monkeypatch.setattr(visura_processor, "db_load_contract_context", lambda conn, cid: {"contract": {}})
+    monkeypatch.setattr(visura_processor, "compute_base_canone", lambda can_in: None)
+    processor = make_processor()
+    monkeypatch.setattr(processor, "_render_attestazione", lambda *args, **kwargs: "generated")
+    conn = fake_conn(handler=handler)
+    item = {"locatore_cf": "RSSMRA80A01G482X", "energy_class": "A"}
+    adapter = ItemAdapter(item)
+
+    processor._process_in_transaction(conn, item, adapter, "RSSMRA80A01G482X", None, FakeSpider())
+
+    assert [o["status"] for o in adapter["immobili_outcomes"]] == ["ok", "failed", "ok"]
+    assert "immobili_energy_class_check" in adapter["immobili_outcomes"][1]["error"]
+    assert {name: o["status"] for name, o in adapter["stage_outcomes"].items()} == {"persons": "ok", "visura": "ok"}
+    # Відкочено тільки savepoint другого immobile — транзакція item-а (і lock власника) комітиться
+    assert conn.statements.count('ROLLBACK TO SAVEPOINT "immobile"') == 1
+    assert (conn.commits, conn.rollbacks) == (1, 0)
+    assert adapter.get("processing_error") is None
+
+
+def test_snapshot_with_psycopg3_uuids_is_json_serializable():
+    # psycopg 3 повертає uuid-колонки (contract_ctx.contract.id тощо) як uuid.UUID, а не str
+    contract_id = UUID("3a5e4874-dcca-4286-a230-cc72cc2cd026")
+    snapshot = prepare_for_json({"contract_ctx": {"contract": {"id": contract_id}}, "ids": [contract_id]})
+    assert json.loads(json.dumps(snapshot)) == {
+        "contract_ctx": {"contract": {"id": str(contract_id)}}, "ids": [str(contract_id)],
+    }
@@ -10,7 +10,6 @@ import os
 import base64
 from typing import Any
 
-from twocaptcha import TwoCaptcha
 from playwright.async_api import Page, TimeoutError as PlaywrightTimeoutError
 
 from uppi.ae.uppi_selectors import UppiSelectors
@@ -152,8 +151,10 @@ async def _solve_captcha(
         logger.exception("[CAPTCHA] Failed to encode screenshot to base64: %s", e)
         return None
 
-    # Відправляємо в 2Captcha
+    # Відправляємо в 2Captcha (клієнт з requests імпортуємо тільки коли CAPTCHA справді є)
     try:
+        from twocaptcha import TwoCaptcha
+
         solver = TwoCaptcha(solver_key)
         # У деяких версіях TwoCaptcha normal() приймає base64 без параметра 'file'
         result = solver.normal(captcha_base64)
@@ -8,13 +8,10 @@ Playwright-хелпери для навігації всередині SISTER п
 
 from typing import Any, Optional
 
-from decouple import config
 from playwright.async_api import Page, TimeoutError as PlaywrightTimeoutError
 
 from uppi.ae.uppi_selectors import UppiSelectors
-
-# URL сторінки "Visure catastali" (безпосередня форма пошуку)
-SISTER_VISURE_CATASTALI_URL = config("SISTER_VISURE_CATASTALI_URL")
+from uppi.config import get_ae_config
 
 
 async def open_sister_service(
@@ -137,8 +134,9 @@ async def navigate_to_visure_catastali(
 
     try:
         # Переходимо напряму на URL форми Visure catastali
-        await sister_page.goto(SISTER_VISURE_CATASTALI_URL, wait_until="networkidle", timeout=60_000)
-        logger.debug("[NAVIGATE] Opened Visure catastali URL: %s", SISTER_VISURE_CATASTALI_URL)
+        visure_url = get_ae_config().sister_visure_catastali_url
+        await sister_page.goto(visure_url, wait_until="networkidle", timeout=60_000)
+        logger.debug("[NAVIGATE] Opened Visure catastali URL: %s", visure_url)
 
         # Можливе вікно "Conferma Lettura"
         try:
@@ -9,18 +9,13 @@ import psycopg
 from psycopg.rows import dict_row
 
 from uppi.domain.clients import load_clients
+from uppi.domain.db import get_pg_connection
 
 
 # =========================================================
 # DB config
 # =========================================================
 
-DB_HOST = config("DB_HOST", default="localhost")
-DB_PORT = config("DB_PORT", default="5432")
-DB_NAME = config("DB_NAME", default="uppi_db")
-DB_USER = config("DB_USER", default="uppi_user")
-DB_PASSWORD = config("DB_PASSWORD", default="uppi_password")
-
 UPPI_CLIENTS_YAML = config("UPPI_CLIENTS_YAML", default="clients/clients.yml")
 
 
@@ -30,13 +25,8 @@ UPPI_CLIENTS_YAML = config("UPPI_CLIENTS_YAML", default="clients/clients.yml")
 
 def get_conn() -> psycopg.Connection:
     try:
-        return psycopg.connect(
-            host=DB_HOST,
-            port=DB_PORT,
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-        )
+        # Ті самі налаштування (DB_*, DB_SSL_MODE), що й у pipeline
+        return get_pg_connection()
     except Exception as e:
         raise RuntimeError(f"❌ DB connection failed: {e}") from e
 
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Черга задач jobs (uppi/services/jobs.py): додавання, воркери, стан.
+
+Запуск:
+    python -m uppi.cli.jobs enqueue                          # задачі fetch_visura для всього clients.yml
+    python -m uppi.cli.jobs enqueue --cf RSSMRA80A01G482X
+    python -m uppi.cli.jobs work process_client              # воркер (на будь-якій кількості вузлів)
+    python -m uppi.cli.jobs work render_attestazione --until-empty
+    python -m uppi.cli.jobs work process_client --force-render  # генерувати й незмінені атестації
+    python -m uppi.cli.jobs work fetch_visura                # павук: scrapy crawl uppi -a source=jobs
+    python -m uppi.cli.jobs status
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import subprocess
+import sys
+import time
+from typing import List, Optional
+
+from uppi.domain.db import pg_connection
+from uppi.services.db_repo import db_count_ready_jobs, db_job_counts
+from uppi.services.jobs import FETCH_VISURA, JOB_KINDS, JOBS_BATCH_SIZE, JOBS_POLL_SEC, enqueue_fetch_visura
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(cfs: Optional[List[str]]) -> int:
+    from uppi.domain.clients import load_clients
+
+    created = duplicates = 0
+    with pg_connection() as conn:
+        for client in load_clients():
+            cf = client.get("LOCATORE_CF")
+            if not cf or (cfs and cf not in cfs):
+                continue
+            if enqueue_fetch_visura(conn, client) is None:
+                duplicates += 1
+            else:
+                created += 1
+        conn.commit()
+    print(f"✅ fetch_visura: нових задач {created}, вже в черзі {duplicates}")
+    return created
+
+
+def work_fetch_visura(batch: int, poll_sec: float, until_empty: bool) -> None:
+    """Павук — окремий процес на кожен пакет (Twisted reactor не перезапускається в одному процесі)."""
+    while True:
+        with pg_connection() as conn:
+            ready = db_count_ready_jobs(conn, FETCH_VISURA)
+            conn.rollback()
+        if ready:
+            subprocess.run(
+                [sys.executable, "-m", "scrapy", "crawl", "uppi", "-a", "source=jobs", "-a", f"batch={batch}"],
+                check=False,
+            )
+            continue
+        if until_empty:
+            return
+        time.sleep(poll_sec)
+
+
+def work(kind: str, batch: int, poll_sec: float, until_empty: bool, force_render: bool = False) -> None:
+    if kind == FETCH_VISURA:
+        work_fetch_visura(batch, poll_sec, until_empty)
+        return
+
+    from uppi.domain.db import close_pool
+    from uppi.services.job_workers import WORKERS
+
+    worker = WORKERS[kind](batch_size=batch, force_render=force_render)
+    try:
+        worker.run(poll_sec=poll_sec, until_empty=until_empty)
+    except KeyboardInterrupt:
+        # Взяті, але не завершені задачі повернуться в чергу після visibility timeout
+        logger.warning("[JOBS] Worker interrupted: %s", worker.stats.as_dict())
+    finally:
+        worker.close()
+        close_pool()
+
+
+def status() -> None:
+    with pg_connection() as conn:
+        counts = db_job_counts(conn)
+        conn.rollback()
+    statuses = ("queued", "running", "done", "failed")
+    print(f"{'kind':<22}" + "".join(f"{s:>10}" for s in statuses))
+    for kind in JOB_KINDS:
+        print(f"{kind:<22}" + "".join(f"{counts.get((kind, s), 0):>10}" for s in statuses))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Черга задач jobs: enqueue / work / status")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_enqueue = sub.add_parser("enqueue", help="Додати задачі fetch_visura з clients.yml")
+    p_enqueue.add_argument("--cf", action="append", help="Тільки вказаний CF (можна кілька разів)")
+
+    p_work = sub.add_parser("work", help="Запустити воркер")
+    p_work.add_argument("kind", choices=JOB_KINDS)
+    p_work.add_argument("--batch", type=int, default=JOBS_BATCH_SIZE, help="Задач за один lease")
+    p_work.add_argument("--poll-sec", type=float, default=JOBS_POLL_SEC, help="Пауза, коли черга порожня")
+    p_work.add_argument("--until-empty", action="store_true", help="Завершитись, щойно черга порожня")
+    p_work.add_argument(
+        "--force-render", action="store_true",
+        help="Генерувати атестації, навіть якщо їх вхід не змінився з останньої генерації",
+    )
+
+    sub.add_parser("status", help="Кількість задач по kind / status")
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s %(message)s")
+
+    if args.command == "enqueue":
+        cfs = [cf.strip().upper() for cf in args.cf or [] if cf.strip()] or None
+        enqueue(cfs)
+    elif args.command == "work":
+        work(args.kind, max(1, args.batch), args.poll_sec, args.until_empty, args.force_render)
+    else:
+        status()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
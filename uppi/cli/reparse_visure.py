@@ -0,0 +1,425 @@
+#!/usr/bin/env python3
+"""
+Масовий повторний парсинг усіх збережених візур з object storage (без SISTER).
+
+Потрібно після виправлень у VisuraParser / parse_address, щоб оновити immobili
+для всього портфеля:
+- список усіх об'єктів під префіксом visure/ у бакеті візур,
+- паралельне завантаження PDF (потоки),
+- паралельний парсинг: кожен потік парсингу має власний SandboxedVisuraParser (окремий процес
+  з лімітом часу і пам'яті), тож зависання / OOM camelot на битому PDF вбиває тільки його воркер,
+- запис через ті самі upsert-функції, що й pipeline, одна транзакція на CF — у міру готовності,
+  паралельно із завантаженням; одночасно в роботі (і на диску) не більше workers + download-workers PDF.
+
+Запуск:
+    python -m uppi.cli.reparse_visure                   # усі візури
+    python -m uppi.cli.reparse_visure --cf RSSMRA80A01G482X
+    python -m uppi.cli.reparse_visure --dry-run         # тільки diff, без запису
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from uppi.domain.db import pg_connection
+from uppi.domain.immobile import Immobile
+from uppi.domain.object_storage import ObjectStorage
+from uppi.parsers.sandboxed_parser import SandboxedVisuraParser, VisuraParseError
+from uppi.parsers.visura_pdf_parser import TABLE_ENGINES, VisuraParser
+from uppi.services.db_repo import (
+    db_load_immobili,
+    db_update_visura_parse_report,
+    fetch_visura_state,
+    immobile_db_row,
+    immobile_from_parsed_dict,
+)
+from uppi.services.owner_lock import lock_owner
+from uppi.services.storage_minio import StorageService
+from uppi.services.visura_processor import (
+    PRUNE_OLD_IMMOBILI_WITHOUT_CONTRACTS,
+    VISURA_PARSER_MAX_RSS_MB,
+    VISURA_PARSER_TIMEOUT_SEC,
+    VISURA_TABLE_ENGINE,
+    upsert_parsed_immobili,
+)
+
+logger = logging.getLogger(__name__)
+
+# Поля immobili, які порівнюємо в --dry-run (ті, що оновлює db_upsert_immobile)
+DIFF_FIELDS = [
+    "zona_cens",
+    "micro_zona",
+    "categoria",
+    "classe",
+    "consistenza",
+    "rendita",
+    "superficie_totale",
+    "superficie_escluse",
+    "superficie_raw",
+]
+
+ImmobileKey = Tuple[str, str, str]
+ParseResult = Tuple[List[Dict[str, Any]], Dict[str, Any]]
+
+
+@dataclass
+class ReparseStats:
+    pdfs_total: int = 0
+    pdfs_parsed: int = 0
+    immobili: int = 0
+    download_sec: float = 0.0
+    elapsed_sec: float = 0.0
+    # CF -> помилка: VisuraParseError.as_dict() для парсингу, {"kind": "download" / "db", ...} для решти
+    failed: Dict[str, Dict[str, Any]] = field(default_factory=dict)
+
+    @property
+    def pdfs_failed(self) -> int:
+        return len(self.failed)
+
+    def report(self) -> None:
+        elapsed = self.elapsed_sec or 1e-9
+        print("=" * 80)
+        print(f"PDF: {self.pdfs_parsed}/{self.pdfs_total} оброблено, помилок: {self.pdfs_failed}")
+        for cf, error in sorted(self.failed.items()):
+            print(f"  ❌ {cf}: [{error.get('kind')}] {error.get('message')}")
+        print(f"Immobili: {self.immobili}")
+        print(f"Час: {self.elapsed_sec:.1f} c (з них сумарно на завантаження: {self.download_sec:.1f} c)")
+        print(f"Throughput: {self.pdfs_parsed / elapsed:.2f} PDF/s, {self.immobili / elapsed:.2f} immobili/s")
+
+
+# =========================================================
+# workers
+# =========================================================
+
+class SandboxPool:
+    """
+    SandboxedVisuraParser на кожен потік парсингу. Воркер, що завис або перевищив RSS,
+    вбивається і перезапускається на наступному PDF, решта потоків працює далі.
+    """
+
+    def __init__(
+        self,
+        table_engine: str,
+        timeout_sec: float,
+        max_rss_mb: Optional[float],
+        parser_factory: Callable[..., Any] = VisuraParser,
+    ):
+        self.table_engine = table_engine
+        self.timeout_sec = timeout_sec
+        self.max_rss_mb = max_rss_mb
+        self.parser_factory = parser_factory
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._parsers: List[SandboxedVisuraParser] = []
+
+    def parse(self, pdf_path: str) -> ParseResult:
+        """Повертає (immobili, ParseReport.as_dict()); ліміти — VisuraParseError."""
+        parser = getattr(self._local, "parser", None)
+        if parser is None:
+            parser = SandboxedVisuraParser(
+                table_engine=self.table_engine,
+                timeout_sec=self.timeout_sec,
+                max_rss_mb=self.max_rss_mb,
+                parser_factory=self.parser_factory,
+            )
+            self._local.parser = parser
+            with self._lock:
+                self._parsers.append(parser)
+        rows, report = parser.parse_with_report(pdf_path)
+        return rows, report.as_dict()
+
+    def close(self) -> None:
+        with self._lock:
+            parsers, self._parsers = self._parsers, []
+        for parser in parsers:
+            parser.close()
+
+
+# =========================================================
+# diff
+# =========================================================
+
+def immobile_key(imm: Immobile) -> ImmobileKey:
+    row = immobile_db_row(imm)
+    return row.get("foglio") or "", row.get("numero") or "", row.get("sub") or ""
+
+
+def diff_immobili(
+    current: List[Tuple[int, Immobile]],
+    parsed_dicts: List[Dict[str, Any]],
+) -> List[str]:
+    """
+    Людський diff між immobili в БД і результатом парсингу.
+    Враховує семантику upsert: None з парсера не затирає значення в БД (COALESCE).
+    """
+    db_rows = {immobile_key(imm): (imm_id, immobile_db_row(imm)) for imm_id, imm in current}
+    new_rows: Dict[ImmobileKey, Dict[str, Any]] = {}
+    for d in parsed_dicts:
+        imm = immobile_from_parsed_dict(d)
+        new_rows[immobile_key(imm)] = immobile_db_row(imm)
+
+    lines: List[str] = []
+    for key in sorted(new_rows.keys() - db_rows.keys()):
+        lines.append(f"  + F={key[0]} N={key[1]} S={key[2]}")
+
+    for key in sorted(db_rows.keys() - new_rows.keys()):
+        imm_id, _ = db_rows[key]
+        lines.append(f"  - F={key[0]} N={key[1]} S={key[2]} (id={imm_id}, prune якщо без контрактів)")
+
+    for key in sorted(db_rows.keys() & new_rows.keys()):
+        imm_id, old = db_rows[key]
+        new = new_rows[key]
+        for column in DIFF_FIELDS:
+            if new.get(column) is not None and new.get(column) != old.get(column):
+                lines.append(
+                    f"  ~ F={key[0]} N={key[1]} S={key[2]} (id={imm_id}) {column}: {old.get(column)!r} -> {new.get(column)!r}"
+                )
+
+    return lines
+
+
+# =========================================================
+# DB
+# =========================================================
+
+def apply_for_cf(
+    conn,
+    cf: str,
+    parsed_dicts: List[Dict[str, Any]],
+    dry_run: bool,
+    prune: bool,
+    parse_report: Optional[Dict[str, Any]] = None,
+) -> bool:
+    """Одна транзакція на CF. Повертає True, якщо CF оброблено без помилок."""
+    try:
+        state = fetch_visura_state(conn, cf)
+        if state is None:
+            print(f"⚠️ {cf}: немає запису в visure, пропускаю")
+            conn.rollback()
+            return False
+
+        if not parsed_dicts:
+            print(f"⚠️ {cf}: парсер не знайшов жодного immobile, immobili не чіпаю")
+            if parse_report is not None and not dry_run:
+                # Звіт зберігаємо: саме для таких візур він і потрібен
+                db_update_visura_parse_report(conn, cf, parse_report)
+                conn.commit()
+            else:
+                conn.rollback()
+            return False
+
+        if dry_run:
+            lines = diff_immobili(db_load_immobili(conn, cf), parsed_dicts)
+            print(f"[{cf}] {len(parsed_dicts)} immobili, змін: {len(lines)}")
+            for line in lines:
+                print(line)
+            conn.rollback()
+            return True
+
+        # Той самий lock, що й у VisuraProcessor: не перемежовуємось з pipeline на цьому CF
+        lock_owner(conn, cf)
+        keep_ids = upsert_parsed_immobili(conn, cf, parsed_dicts, state.id, prune)
+        if parse_report is not None:
+            db_update_visura_parse_report(conn, cf, parse_report)
+        conn.commit()
+        print(f"✅ {cf}: {len(keep_ids)} immobili оновлено")
+        return True
+    except Exception as e:
+        logger.exception("[REPARSE] DB error for %s: %s", cf, e)
+        print(f"❌ {cf}: помилка БД: {e}")
+        conn.rollback()
+        return False
+
+
+# =========================================================
+# main
+# =========================================================
+
+def run_reparse(
+    targets: Iterable[Tuple[str, str]],
+    download: Callable[[str, str], Path],
+    parse: Callable[[str], ParseResult],
+    apply: Callable[[str, List[Dict[str, Any]], Dict[str, Any]], bool],
+    stats: ReparseStats,
+    workers: int,
+    download_workers: int,
+) -> ReparseStats:
+    """
+    Конвеєр завантаження -> парсинг -> запис. Головний потік пише в БД (одне з'єднання),
+    як тільки CF розпарсено, і підкидає нові завантаження; одночасно в роботі не більше
+    workers + download_workers CF. PDF видаляється, щойно його CF оброблено.
+    """
+    window = workers + download_workers
+    pending_targets = iter(targets)
+    # future -> (етап, CF, шлях до PDF)
+    in_flight: Dict[Any, Tuple[str, str, Optional[Path]]] = {}
+
+    def finish(cf: str, pdf_path: Optional[Path], error: Optional[Dict[str, Any]] = None) -> None:
+        if error is not None:
+            stats.failed[cf] = error
+        if pdf_path is not None:
+            pdf_path.unlink(missing_ok=True)
+
+    download_lock = threading.Lock()
+
+    def timed_download(cf: str, obj_name: str) -> Path:
+        t0 = time.perf_counter()
+        try:
+            return download(cf, obj_name)
+        finally:
+            with download_lock:
+                stats.download_sec += time.perf_counter() - t0
+
+    with ThreadPoolExecutor(max_workers=download_workers) as dl_pool, \
+            ThreadPoolExecutor(max_workers=workers) as parse_pool:
+
+        def refill() -> None:
+            while len(in_flight) < window:
+                target = next(pending_targets, None)
+                if target is None:
+                    return
+                cf, obj_name = target
+                in_flight[dl_pool.submit(timed_download, cf, obj_name)] = ("download", cf, None)
+
+        refill()
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for fut in done:
+                stage, cf, pdf_path = in_flight.pop(fut)
+
+                if stage == "download":
+                    try:
+                        pdf_path = fut.result()
+                    except Exception as e:
+                        print(f"❌ {cf}: не вдалося завантажити візуру: {e}")
+                        finish(cf, None, {"kind": "download", "message": str(e)})
+                        continue
+                    in_flight[parse_pool.submit(parse, str(pdf_path))] = ("parse", cf, pdf_path)
+                    continue
+
+                try:
+                    parsed_dicts, parse_report = fut.result()
+                except VisuraParseError as e:
+                    print(f"❌ {cf}: {e}")
+                    finish(cf, pdf_path, e.as_dict())
+                    continue
+                except Exception as e:
+                    print(f"❌ {cf}: помилка парсингу: {e}")
+                    finish(cf, pdf_path, {"kind": "exception", "message": f"{type(e).__name__}: {e}"})
+                    continue
+
+                if apply(cf, parsed_dicts, parse_report):
+                    stats.pdfs_parsed += 1
+                    stats.immobili += len(parsed_dicts)
+                    finish(cf, pdf_path)
+                else:
+                    finish(cf, pdf_path, {"kind": "db", "message": "CF не оновлено, див. вивід вище"})
+            refill()
+
+    return stats
+
+
+def reparse(
+    cfs: Optional[List[str]],
+    table_engine: str,
+    workers: Optional[int],
+    download_workers: int,
+    dry_run: bool,
+    prune: bool,
+    timeout_sec: float = VISURA_PARSER_TIMEOUT_SEC,
+    max_rss_mb: Optional[float] = VISURA_PARSER_MAX_RSS_MB,
+) -> ReparseStats:
+    storage = ObjectStorage()
+    storage_service = StorageService(storage)
+    bucket = storage.cfg.visure_bucket
+
+    targets: List[Tuple[str, str]] = []
+    for obj_name in storage_service.list_objects(bucket, ObjectStorage.VISURE_PREFIX):
+        cf = storage.cf_from_visura_object_name(obj_name)
+        if cf and (not cfs or cf in cfs):
+            targets.append((cf, obj_name))
+
+    stats = ReparseStats(pdfs_total=len(targets))
+    if not targets:
+        return stats
+
+    t0 = time.perf_counter()
+    sandboxes = SandboxPool(table_engine, timeout_sec, max_rss_mb)
+    try:
+        with tempfile.TemporaryDirectory(prefix="uppi_reparse_") as tmp, pg_connection() as conn:
+            run_reparse(
+                targets,
+                download=lambda cf, obj_name: storage_service.download_file(bucket, obj_name, Path(tmp) / f"{cf}.pdf"),
+                parse=sandboxes.parse,
+                apply=lambda cf, parsed_dicts, parse_report: apply_for_cf(
+                    conn, cf, parsed_dicts, dry_run=dry_run, prune=prune, parse_report=parse_report
+                ),
+                stats=stats,
+                workers=workers or os.cpu_count() or 1,
+                download_workers=download_workers,
+            )
+    finally:
+        sandboxes.close()
+
+    stats.elapsed_sec = time.perf_counter() - t0
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Повторний парсинг усіх візур з object storage (visure/) та оновлення immobili.\n"
+            "SISTER не використовується."
+        )
+    )
+    parser.add_argument("--cf", action="append", help="Тільки вказаний CF (можна кілька разів)")
+    parser.add_argument("--dry-run", action="store_true", help="Показати diff з БД, нічого не записувати")
+    parser.add_argument("--engine", default=VISURA_TABLE_ENGINE, choices=TABLE_ENGINES, help="Рушій таблиць парсера")
+    parser.add_argument("--workers", type=int, default=None, help="Процеси для парсингу (за замовчуванням — CPU)")
+    parser.add_argument("--download-workers", type=int, default=8, help="Потоки для завантаження PDF")
+    parser.add_argument(
+        "--timeout-sec", type=float, default=VISURA_PARSER_TIMEOUT_SEC,
+        help="Ліміт часу на один PDF; воркер, що завис, вбивається (VISURA_PARSER_TIMEOUT_SEC)",
+    )
+    parser.add_argument(
+        "--max-rss-mb", type=float, default=VISURA_PARSER_MAX_RSS_MB,
+        help="Ліміт RSS воркера парсингу, 0 — без ліміту (VISURA_PARSER_MAX_RSS_MB)",
+    )
+    parser.add_argument(
+        "--no-prune",
+        action="store_true",
+        help="Не видаляти старі immobili без контрактів (PRUNE_OLD_IMMOBILI_WITHOUT_CONTRACTS)",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    cfs = [cf.strip().upper() for cf in args.cf or [] if cf.strip()] or None
+    stats = reparse(
+        cfs=cfs,
+        table_engine=args.engine,
+        workers=max(1, args.workers) if args.workers else None,
+        download_workers=max(1, args.download_workers),
+        dry_run=args.dry_run,
+        prune=PRUNE_OLD_IMMOBILI_WITHOUT_CONTRACTS and not args.no_prune,
+        timeout_sec=args.timeout_sec,
+        max_rss_mb=args.max_rss_mb or None,
+    )
+
+    if not stats.pdfs_total:
+        print("❌ Не знайдено жодної візури під visure/")
+        return
+
+    stats.report()
+
+
+if __name__ == "__main__":
+    main()
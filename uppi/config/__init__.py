@@ -1,4 +1,5 @@
+from uppi.config.ae_config import AeConfig, get_ae_config
 from uppi.config.app_config import AppConfig, DatabaseConfig, VisuraCacheConfig
 from uppi.config.clients import ClientConfig
 
-__all__ = ["AppConfig", "DatabaseConfig", "VisuraCacheConfig", "ClientConfig"]
+__all__ = ["AeConfig", "get_ae_config", "AppConfig", "DatabaseConfig", "VisuraCacheConfig", "ClientConfig"]
@@ -0,0 +1,43 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+from functools import lru_cache
+
+from decouple import config
+
+
+@dataclass(frozen=True)
+class AeConfig:
+    """
+    Доступи та URL AE / SISTER.
+
+    Читаються з env тільки при першому зверненні (get_ae_config()), а не під час
+    імпорту модулів: павук, pipeline і CLI імпортуються без AE_* у середовищі,
+    а відсутня змінна дає помилку лише тоді, коли реально йдемо в SISTER.
+    """
+    login_url: str
+    url_servizi: str
+    sister_logout_url: str
+    sister_visure_catastali_url: str
+    two_captcha_api_key: str
+    username: str
+    password: str
+    pin: str
+
+    @classmethod
+    def from_env(cls) -> "AeConfig":
+        return cls(
+            login_url=config("AE_LOGIN_URL"),
+            url_servizi=config("AE_URL_SERVIZI"),
+            sister_logout_url=config("SISTER_LOGOUT_URL"),
+            sister_visure_catastali_url=config("SISTER_VISURE_CATASTALI_URL"),
+            two_captcha_api_key=config("TWO_CAPTCHA_API_KEY"),
+            username=config("AE_USERNAME"),
+            password=config("AE_PASSWORD"),
+            pin=config("AE_PIN"),
+        )
+
+
+@lru_cache(maxsize=1)
+def get_ae_config() -> AeConfig:
+    return AeConfig.from_env()
@@ -1,12 +1,21 @@
 # uppi/domain/db.py
 from __future__ import annotations
 
+import atexit
 import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager, nullcontext
+from dataclasses import asdict, dataclass
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, Optional, Tuple
 
-import psycopg2
+import psycopg
 from decouple import config
+from psycopg import InterfaceError, OperationalError, sql
+from psycopg.pq import PipelineStatus, TransactionStatus
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type, before_sleep_log
-from psycopg2 import OperationalError, InterfaceError
 
 
 logger = logging.getLogger(__name__)
@@ -17,18 +26,47 @@ DB_NAME = config("DB_NAME", default="uppi_db")
 DB_USER = config("DB_USER", default="uppi_user")
 DB_PASSWORD = config("DB_PASSWORD", default="uppi_password")
 DB_SSL_MODE = config("DB_SSL_MODE", default="prefer")
+# Після скількох виконань запит стає server-side prepared statement (psycopg 3).
+# Порожнє значення вимикає підготовку (потрібно за PgBouncer у transaction mode).
+DB_PREPARE_THRESHOLD = config("DB_PREPARE_THRESHOLD", default="5").strip()
+# Pipeline mode для обробки item: дрібні upsert-и відправляються, не чекаючи відповіді на кожен
+DB_PIPELINE = config("DB_PIPELINE", default="True").strip().lower() == "true"
 
+# Пул з'єднань (один на процес): spider, pipeline і CLI беруть з'єднання через pg_connection()
+DB_POOL_MIN_SIZE = int(config("DB_POOL_MIN_SIZE", default="1"))
+DB_POOL_MAX_SIZE = int(config("DB_POOL_MAX_SIZE", default="5"))
+DB_POOL_MAX_LIFETIME_SEC = float(config("DB_POOL_MAX_LIFETIME_SEC", default="1800"))
+DB_POOL_TIMEOUT_SEC = float(config("DB_POOL_TIMEOUT_SEC", default="30"))
+# З'єднання, що простояло в пулі довше за це, перед видачею перевіряється SELECT 1 (0 — перевіряти завжди)
+DB_POOL_CHECK_IDLE_SEC = float(config("DB_POOL_CHECK_IDLE_SEC", default="5"))
 
-@retry(
+
+def _connect_kwargs() -> Dict[str, Any]:
+    return {
+        "host": DB_HOST,
+        "port": DB_PORT,
+        "dbname": DB_NAME,
+        "user": DB_USER,
+        "password": DB_PASSWORD,
+        "sslmode": DB_SSL_MODE,
+        "autocommit": False,
+        "prepare_threshold": int(DB_PREPARE_THRESHOLD) if DB_PREPARE_THRESHOLD else None,
+    }
+
+
+_CONNECT_RETRY = retry(
     stop=stop_after_attempt(3),
     wait=wait_exponential(multiplier=1, min=1, max=20),
     retry=retry_if_exception_type((OperationalError, InterfaceError)),
     before_sleep=before_sleep_log(logger, logging.WARNING),
     reraise=True,
 )
-def get_pg_connection():
+
+
+@_CONNECT_RETRY
+def get_pg_connection() -> psycopg.Connection:
     """
-    Отримати новий конекшн до PostgreSQL (psycopg2).
+    Отримати новий конекшн до PostgreSQL (psycopg 3).
 
     Важливо:
     - autocommit = False (транзакції керуються явно)
@@ -38,17 +76,18 @@ def get_pg_connection():
     - тільки на connect()
     """
     try:
-        conn = psycopg2.connect(
-            host=DB_HOST,
-            port=DB_PORT,
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-            sslmode=DB_SSL_MODE,
-        )
-        conn.autocommit = False
-        return conn
-    except psycopg2.Error as e:
+        return psycopg.connect(**_connect_kwargs())
+    except psycopg.Error as e:
+        logger.exception("[DB] Не вдалося підключитися до PostgreSQL: %s", e)
+        raise
+
+
+@_CONNECT_RETRY
+async def get_pg_async_connection() -> psycopg.AsyncConnection:
+    """Асинхронний конекшн (psycopg 3) для коду, що працює в asyncio-реакторі Scrapy."""
+    try:
+        return await psycopg.AsyncConnection.connect(**_connect_kwargs())
+    except psycopg.Error as e:
         logger.exception("[DB] Не вдалося підключитися до PostgreSQL: %s", e)
         raise
 
@@ -57,23 +96,379 @@ def db_has_visura(cf: str) -> bool:
     """
     Повертає True, якщо візура для заданого CF існує в таблиці visure.
     """
-    conn = None
     try:
-        conn = get_pg_connection()
-        with conn.cursor() as cur:
-            cur.execute("SELECT 1 FROM public.visure WHERE cf = %s LIMIT 1;", (cf,))
-            exists = cur.fetchone() is not None
+        with pg_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1 FROM public.visure WHERE locatore_cf = %s LIMIT 1;", (cf,))
+                exists = cur.fetchone() is not None
             logger.debug("[DB] db_has_visura(%s) → %s", cf, exists)
             conn.commit()
             return exists
-    except psycopg2.Error as e:
+    except psycopg.Error as e:
         logger.exception("[DB] Помилка при перевірці visura для %s: %s", cf, e)
-        if conn is not None:
+        return False
+
+
+# =========================================================
+# Connection pool
+# =========================================================
+
+class PoolTimeout(OperationalError):
+    """Не дочекалися вільного з'єднання в пулі за DB_POOL_TIMEOUT_SEC."""
+
+
+@dataclass
+class PoolStats:
+    checkouts: int = 0
+    waits: int = 0  # видачі, яким довелося чекати на вільне з'єднання
+    wait_total_sec: float = 0.0
+    wait_max_sec: float = 0.0
+    timeouts: int = 0
+    created: int = 0
+    closed_expired: int = 0  # закриті через max lifetime
+    closed_unhealthy: int = 0  # не пройшли health check / повернуті зламаними
+    size: int = 0
+    idle: int = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["wait_total_sec"] = round(self.wait_total_sec, 4)
+        data["wait_max_sec"] = round(self.wait_max_sec, 4)
+        return data
+
+
+@dataclass
+class _PooledConn:
+    conn: Any
+    created_at: float
+    returned_at: float
+
+
+class PgConnectionPool:
+    """
+    Потокобезпечний пул psycopg-з'єднань.
+
+    - min_size з'єднань відкривається при першій видачі, максимум max_size одночасно;
+    - при видачі: закриті / зламані / старші за max_lifetime_sec з'єднання замінюються,
+      а ті, що простояли довше check_idle_sec, перевіряються SELECT 1;
+    - при поверненні незавершена транзакція відкочується;
+    - stats() — лічильники видач і часу очікування на вільне з'єднання.
+
+    Нові з'єднання відкриваються через get_pg_connection() (з тими самими retry).
+    """
+
+    def __init__(
+        self,
+        min_size: int = DB_POOL_MIN_SIZE,
+        max_size: int = DB_POOL_MAX_SIZE,
+        max_lifetime_sec: float = DB_POOL_MAX_LIFETIME_SEC,
+        timeout_sec: float = DB_POOL_TIMEOUT_SEC,
+        check_idle_sec: float = DB_POOL_CHECK_IDLE_SEC,
+        connect=None,
+    ):
+        if max_size < 1 or min_size < 0 or min_size > max_size:
+            raise ValueError(f"Invalid pool size: min={min_size}, max={max_size}")
+
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_lifetime_sec = max_lifetime_sec
+        self.timeout_sec = timeout_sec
+        self.check_idle_sec = check_idle_sec
+        self._connect = connect or get_pg_connection
+
+        self._cond = threading.Condition()
+        self._idle: Deque[_PooledConn] = deque()
+        self._in_use: Dict[int, _PooledConn] = {}
+        self._opening = 0
+        self._closed = False
+        self._filled = False
+        self._stats = PoolStats()
+
+    # ---- public API ----
+
+    def getconn(self, timeout: Optional[float] = None):
+        timeout = self.timeout_sec if timeout is None else timeout
+        self._fill_min()
+
+        t0 = time.monotonic()
+        waited = False
+        while True:
+            pooled, must_open = self._reserve(t0, timeout)
+            if pooled is None and not must_open:
+                waited = True
+                continue
+
+            if must_open:
+                pooled = self._open()
+            elif self._expired(pooled):
+                self._discard(pooled, expired=True)
+                continue
+            elif not self._is_healthy(pooled):
+                self._discard(pooled, unhealthy=True)
+                continue
+
+            wait_sec = time.monotonic() - t0
+            with self._cond:
+                self._in_use[id(pooled.conn)] = pooled
+                st = self._stats
+                st.checkouts += 1
+                if waited:
+                    st.waits += 1
+                st.wait_total_sec += wait_sec
+                st.wait_max_sec = max(st.wait_max_sec, wait_sec)
+            return pooled.conn
+
+    def putconn(self, conn, discard: bool = False) -> None:
+        with self._cond:
+            pooled = self._in_use.pop(id(conn), None)
+        if pooled is None:
+            # Не наше з'єднання — просто закриваємо
+            _close_quietly(conn)
+            return
+
+        if not discard and not conn.closed:
+            try:
+                if conn.info.transaction_status != TransactionStatus.IDLE:
+                    conn.rollback()
+            except psycopg.Error:
+                discard = True
+
+        if discard or conn.closed or self._closed:
+            self._discard(pooled, unhealthy=discard or bool(conn.closed))
+            return
+
+        if self._expired(pooled):
+            self._discard(pooled, expired=True)
+            return
+
+        pooled.returned_at = time.monotonic()
+        with self._cond:
+            self._idle.append(pooled)
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None) -> Iterator[Any]:
+        """
+        with pool.connection() as conn: ...
+        Комміт — на боці викликача; при виключенні транзакція відкочується,
+        а з'єднання зі зламаним каналом не повертається в пул.
+        """
+        conn = self.getconn(timeout)
+        try:
+            yield conn
+        except BaseException:
+            broken = False
+            try:
+                if not conn.closed:
+                    conn.rollback()
+            except psycopg.Error:
+                broken = True
+            self.putconn(conn, discard=broken or bool(conn.closed))
+            raise
+        else:
+            self.putconn(conn)
+
+    def stats(self) -> PoolStats:
+        with self._cond:
+            snapshot = PoolStats(**asdict(self._stats))
+            snapshot.idle = len(self._idle)
+            snapshot.size = len(self._idle) + len(self._in_use) + self._opening
+        return snapshot
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._cond.notify_all()
+        for pooled in idle:
+            _close_quietly(pooled.conn)
+
+    # ---- internals ----
+
+    def _fill_min(self) -> None:
+        """Відкриває min_size з'єднань при першій видачі (не в конструкторі — БД може бути ще недоступна)."""
+        if self._filled:
+            return
+        with self._cond:
+            missing = max(0, self.min_size - len(self._idle) - len(self._in_use) - self._opening)
+            self._opening += missing
+            self._filled = True
+
+        for _ in range(missing):
             try:
-                conn.rollback()
+                pooled = self._open()
             except Exception:
-                pass
-        return False
+                with self._cond:
+                    self._filled = False
+                raise
+            with self._cond:
+                self._idle.append(pooled)
+                self._cond.notify()
+
+    def _reserve(self, t0: float, timeout: float) -> Tuple[Optional[_PooledConn], bool]:
+        """
+        (idle-з'єднання, False) або (None, True) — можна відкрити нове.
+        (None, False) — дочекалися сигналу, треба повторити спробу.
+        """
+        with self._cond:
+            if self._closed:
+                raise InterfaceError("connection pool is closed")
+            if self._idle:
+                return self._idle.pop(), False
+            if len(self._in_use) + self._opening < self.max_size:
+                self._opening += 1
+                return None, True
+
+            remaining = timeout - (time.monotonic() - t0)
+            if remaining <= 0:
+                self._stats.timeouts += 1
+                raise PoolTimeout(f"No free PostgreSQL connection after {timeout:.1f}s (max_size={self.max_size})")
+            self._cond.wait(remaining)
+            return None, False
+
+    def _open(self) -> _PooledConn:
+        try:
+            conn = self._connect()
+        finally:
+            with self._cond:
+                self._opening -= 1
+        now = time.monotonic()
+        with self._cond:
+            self._stats.created += 1
+        return _PooledConn(conn, now, now)
+
+    def _expired(self, pooled: _PooledConn) -> bool:
+        return bool(self.max_lifetime_sec) and time.monotonic() - pooled.created_at > self.max_lifetime_sec
+
+    def _is_healthy(self, pooled: _PooledConn) -> bool:
+        conn = pooled.conn
+        if conn.closed:
+            return False
+        if time.monotonic() - pooled.returned_at < self.check_idle_sec:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except psycopg.Error as e:
+            logger.warning("[DB_POOL] Health check failed, replacing connection: %s", e)
+            return False
+
+    def _discard(self, pooled: _PooledConn, unhealthy: bool = False, expired: bool = False) -> None:
+        _close_quietly(pooled.conn)
+        with self._cond:
+            if expired:
+                self._stats.closed_expired += 1
+            elif unhealthy:
+                self._stats.closed_unhealthy += 1
+            self._cond.notify()
+
+
+def _close_quietly(conn) -> None:
+    try:
+        conn.close()
+    except Exception:
+        pass
+
+
+_pool: Optional[PgConnectionPool] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> PgConnectionPool:
+    """Пул поточного процесу (після fork дочірній процес отримує власний)."""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = PgConnectionPool()
+            _pool_pid = os.getpid()
+        return _pool
+
+
+def close_pool() -> None:
+    global _pool, _pool_pid
+    with _pool_lock:
+        pool, pid = _pool, _pool_pid
+        _pool, _pool_pid = None, None
+    # З'єднання, успадковані після fork, належать батьківському процесу — їх не чіпаємо
+    if pool is not None and pid == os.getpid():
+        pool.close()
+
+
+atexit.register(close_pool)
+
+
+@contextmanager
+def pg_connection(timeout: Optional[float] = None) -> Iterator[Any]:
+    """
+    З'єднання з процесного пулу:
+
+        with pg_connection() as conn:
+            ...
+            conn.commit()
+    """
+    with get_pool().connection(timeout) as conn:
+        yield conn
+
+
+def pipeline(conn, enabled: Optional[bool] = None):
+    """
+    Pipeline mode psycopg 3 (with pipeline(conn): ...): запити без результату відправляються
+    одразу один за одним, синхронізація — лише на fetch*/commit. DB_PIPELINE=False вимикає.
+    """
+    enabled = DB_PIPELINE if enabled is None else enabled
+    return conn.pipeline() if enabled else nullcontext(conn)
+
+
+def _in_pipeline(conn) -> bool:
+    return conn.pgconn.pipeline_status != PipelineStatus.OFF
+
+
+@contextmanager
+def savepoint(conn, name: str) -> Iterator[Any]:
+    """
+    SAVEPOINT усередині поточної транзакції:
+
+        with savepoint(conn, "immobile"):
+            ...  # виняток -> ROLLBACK TO SAVEPOINT, далі виняток летить до викликача
+
+    Зовнішню транзакцію (commit / rollback) не чіпає. У pipeline mode тіло блоку закінчується
+    синхронізацією (вкладений conn.pipeline()), тож помилка запиту з цього блоку вилітає
+    тут, а не на наступному fetch / commit — і відкочується саме цей savepoint.
+    """
+    ident = sql.Identifier(name)
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL("SAVEPOINT {}").format(ident))
+    try:
+        with conn.pipeline() if _in_pipeline(conn) else nullcontext():
+            yield conn
+    except BaseException:
+        with conn.cursor() as cur:
+            cur.execute(sql.SQL("ROLLBACK TO SAVEPOINT {}").format(ident))
+            cur.execute(sql.SQL("RELEASE SAVEPOINT {}").format(ident))
+        raise
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL("RELEASE SAVEPOINT {}").format(ident))
+
+
+@asynccontextmanager
+async def pg_async_connection() -> AsyncIterator[psycopg.AsyncConnection]:
+    """
+    Окреме асинхронне з'єднання (без пулу — потрібне лише в кількох місцях павука):
+
+        async with pg_async_connection() as aconn:
+            ...
+            await aconn.commit()
+    """
+    aconn = await get_pg_async_connection()
+    try:
+        yield aconn
+    except BaseException:
+        if not aconn.closed:
+            await aconn.rollback()
+        raise
     finally:
-        if conn is not None:
-            conn.close()
+        await aconn.close()
@@ -4,7 +4,7 @@ from __future__ import annotations
 import logging
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 
 from decouple import config
 from minio import Minio
@@ -111,10 +111,39 @@ class ObjectStorage:
             logger.exception("[S3] Unexpected upload error %s -> %s/%s: %s", file_path, bucket, object_name, e)
             raise
 
+    def list_objects(self, bucket: str, prefix: str) -> List[str]:
+        """Імена всіх об'єктів під prefix (рекурсивно)."""
+        try:
+            return [
+                obj.object_name
+                for obj in self.client.list_objects(bucket, prefix=prefix, recursive=True)
+                if not obj.is_dir
+            ]
+        except S3Error as e:
+            logger.exception("[S3] List failed %s/%s: %s", bucket, prefix, e)
+            raise
+
+    def download_file(self, bucket: str, object_name: str, file_path: Path) -> None:
+        try:
+            self.client.fget_object(bucket, object_name, str(file_path))
+            logger.debug("[S3] Downloaded %s/%s -> %s", bucket, object_name, file_path)
+        except S3Error as e:
+            logger.exception("[S3] Download failed %s/%s -> %s: %s", bucket, object_name, file_path, e)
+            raise
+
     # ---- Canonical object names (щоб не плодити різні формати) ----
 
+    VISURE_PREFIX = "visure/"
+
     def visura_object_name(self, cf: str) -> str:
-        return f"visure/{cf}.pdf"
+        return f"{self.VISURE_PREFIX}{cf}.pdf"
+
+    def cf_from_visura_object_name(self, object_name: str) -> Optional[str]:
+        """Зворотне до visura_object_name: 'visure/<CF>.pdf' -> '<CF>'."""
+        if not object_name.startswith(self.VISURE_PREFIX) or not object_name.lower().endswith(".pdf"):
+            return None
+        cf = object_name[len(self.VISURE_PREFIX):-len(".pdf")]
+        return cf if cf and "/" not in cf else None
 
     def attestazione_object_name(self, cf: str, contract_id: str) -> str:
         return f"attestazioni/{cf}/{contract_id}.docx"
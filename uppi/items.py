@@ -63,6 +63,32 @@ class UppiItem(scrapy.Item):
     # Локальний шлях до завантаженого PDF (якщо visura_downloaded == True)
     visura_download_path = scrapy.Field()  # str | None
 
+    # Завантажений PDF має той самий sha256, що й збережений у visure.checksum_sha256
+    # (парсинг, upsert immobili та upload у MinIO пропущено)
+    visura_unchanged = scrapy.Field()      # bool
+
+    # Структурована помилка парсингу візури (timeout / memory / crash / exception), якщо була
+    visura_parse_error = scrapy.Field()    # dict | None
+
+    # Звіт парсера (ParseReport.as_dict()): таймінги по сторінках, таблиці знайдені/пропущені, рядки
+    visura_parse_report = scrapy.Field()   # dict | None
+
+    # Запити до БД під час обробки item-а (QueryStats.summary()): кількість, час, рядки, найповільніші мітки
+    db_query_stats = scrapy.Field()        # dict | None
+
+    # Результат етапів process_item (кожен у своєму SAVEPOINT): {"persons": {"status": "ok"|"failed", "error"}, ...}
+    stage_outcomes = scrapy.Field()        # dict | None
+    # По одному запису на immobile: immobile_id, contract_id, status ("ok"|"partial"|"failed"),
+    # canone ("ok"|"failed"), attestazione ("generated"|"failed"), error
+    immobili_outcomes = scrapy.Field()     # list[dict] | None
+    # Скільки item чекав на advisory lock CF (інший воркер обробляв того самого власника)
+    owner_lock_wait_ms = scrapy.Field()    # float | None
+    # Чому item не оброблено (lock не взято / фатальна помилка транзакції); None — оброблено
+    processing_error = scrapy.Field()      # str | None
+
+    # ID задачі process_client, з якої прийшов item (черга jobs); ключ ідемпотентності render-задач
+    job_id = scrapy.Field()                # int | None
+
     # -------------------------------------------------------------------------
     # Діагностика автоматизації (навігація, капча)
     # -------------------------------------------------------------------------
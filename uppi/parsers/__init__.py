@@ -1,4 +1,15 @@
-from uppi.parsers.address_parser import AddressParts, parse_address
-from uppi.parsers.visura_pdf_parser import VisuraParser
+from importlib import import_module
+from typing import Any
 
-__all__ = ["AddressParts", "parse_address", "VisuraParser"]
+from uppi.parsers.address_parser import AddressParts, parse_address, parse_addresses
+
+__all__ = ["AddressParts", "parse_address", "parse_addresses", "VisuraParser"]
+
+
+def __getattr__(name: str) -> Any:
+    # VisuraParser тягне PyMuPDF — підвантажуємо тільки при першому зверненні
+    if name == "VisuraParser":
+        value = import_module("uppi.parsers.visura_pdf_parser").VisuraParser
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -2,7 +2,8 @@ from __future__ import annotations
 
 import re
 from dataclasses import dataclass
-from typing import Dict, Optional
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional
 
 
 # ----------------------------
@@ -87,6 +88,14 @@ _COMPONENT_PATTERNS = {
     ),
 }
 
+# Один прохід по хвосту замість трьох search(): які з компонентів взагалі можуть бути.
+# Ключові слова — префікси відповідних _COMPONENT_PATTERNS, тож якщо слова немає,
+# патерн гарантовано не знайде збігу і його можна не запускати.
+_COMPONENT_KEYWORDS_REGEX = re.compile(
+    r"\b(?:(?P<scala>SC)|(?P<interno>INT)|(?P<piano>PIANO|P\.))",
+    re.IGNORECASE,
+)
+
 
 # ----------------------------
 # Civico (house number)
@@ -107,11 +116,20 @@ _CIVICO_REGEXES = [
 # SNC = senza numero civico → номер відсутній
 _SNC_REGEX = re.compile(r"\b(N\.?\s*)?SNC\b", re.IGNORECASE)
 
+_MULTI_SPACE_REGEX = re.compile(r"\s{2,}")
+
+# Скільки різних нормалізованих адрес тримати в LRU-кеші parse_address
+ADDRESS_CACHE_SIZE = 65536
+
 
 # ----------------------------
 # Parser
 # ----------------------------
 
+def _normalize_raw(text: str) -> str:
+    return text.replace("\n", " ").strip()
+
+
 def parse_address(text: str) -> AddressParts:
     """
     Парсить італійську адресу у структурований вигляд.
@@ -123,12 +141,47 @@ def parse_address(text: str) -> AddressParts:
     4) Обробка SNC (окремий семантичний кейс)
     5) Парсинг номера
     6) Парсинг scala / interno / piano
+
+    Результат кешується (LRU) за нормалізованим рядком: AddressParts незмінний,
+    а одні й ті самі адреси повторюються між immobili та повторними парсингами.
     """
 
     if not isinstance(text, str):
         raise TypeError("parse_address expects a string")
 
-    raw = text.replace("\n", " ").strip()
+    return _parse_normalized(_normalize_raw(text))
+
+
+def parse_addresses(texts: Iterable[str]) -> List[AddressParts]:
+    """
+    Пакетний парсинг: той самий результат, що й [parse_address(t) for t in texts],
+    але кожна унікальна адреса в пакеті парситься не більше одного разу.
+    """
+    seen: Dict[str, AddressParts] = {}
+    out: List[AddressParts] = []
+    for text in texts:
+        if not isinstance(text, str):
+            raise TypeError("parse_addresses expects strings")
+
+        raw = _normalize_raw(text)
+        parts = seen.get(raw)
+        if parts is None:
+            parts = seen[raw] = _parse_normalized(raw)
+        out.append(parts)
+    return out
+
+
+def address_cache_info():
+    """Статистика LRU-кешу parse_address (hits, misses, maxsize, currsize)."""
+    return _parse_normalized.cache_info()
+
+
+def clear_address_cache() -> None:
+    _parse_normalized.cache_clear()
+
+
+@lru_cache(maxsize=ADDRESS_CACHE_SIZE)
+def _parse_normalized(raw: str) -> AddressParts:
     working = raw
 
     # ----------------------------
@@ -160,7 +213,7 @@ def parse_address(text: str) -> AddressParts:
 
     via_num: Optional[str] = None
 
-    if _SNC_REGEX.search(working_tail):
+    if "SNC" in working_tail.upper() and _SNC_REGEX.search(working_tail):
         # Явно вказано, що номера немає
         working_tail = _SNC_REGEX.sub(" ", working_tail).strip()
         via_num = None
@@ -185,7 +238,12 @@ def parse_address(text: str) -> AddressParts:
     interno: Optional[str] = None
     piano: Optional[str] = None
 
+    present = {m.lastgroup for m in _COMPONENT_KEYWORDS_REGEX.finditer(working_tail)}
+
     for key, pattern in _COMPONENT_PATTERNS.items():
+        if key not in present:
+            continue
+
         m = pattern.search(working_tail)
         if not m:
             continue
@@ -205,7 +263,7 @@ def parse_address(text: str) -> AddressParts:
     # 5. Final cleanup
     # ----------------------------
 
-    via_name = re.sub(r"\s{2,}", " ", working_tail).strip() or None
+    via_name = _MULTI_SPACE_REGEX.sub(" ", working_tail).strip() or None
 
     return AddressParts(
         via_type=via_type,
@@ -0,0 +1,258 @@
+"""
+Парсинг візур в окремому процесі-воркері з лімітами часу та пам'яті.
+
+camelot lattice (Ghostscript + OpenCV) на битих PDF з SISTER іноді зависає або
+роздувається до гігабайтів. Щоб це не валило весь Scrapy-процес:
+- VisuraParser працює в довгоживучому воркері (spawn, власна process group),
+- рядки immobili стрімляться в батьківський процес через Pipe,
+- батьківський процес стежить за часом очікування і RSS воркера,
+- при перевищенні воркер вбивається (разом з дочірніми процесами) і
+  перезапускається при наступному виклику, а викликач отримує VisuraParseError.
+"""
+from __future__ import annotations
+
+import logging
+import multiprocessing as mp
+import os
+import signal
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from uppi.parsers.visura_pdf_parser import TABLE_ENGINE_PYMUPDF, ParseReport, VisuraParser
+
+logger = logging.getLogger(__name__)
+
+PARSE_ERROR_TIMEOUT = "timeout"
+PARSE_ERROR_MEMORY = "memory"
+PARSE_ERROR_CRASH = "crash"
+PARSE_ERROR_EXCEPTION = "exception"
+
+
+@dataclass(eq=False)
+class VisuraParseError(Exception):
+    """Структурована помилка парсингу, яку отримує VisuraProcessor."""
+    kind: str
+    pdf_path: str
+    message: str
+    elapsed_sec: float = 0.0
+    rss_mb: Optional[float] = None
+    rows_emitted: int = 0
+
+    def __str__(self) -> str:
+        return f"[{self.kind}] {self.pdf_path}: {self.message}"
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "pdf_path": self.pdf_path,
+            "message": self.message,
+            "elapsed_sec": round(self.elapsed_sec, 3),
+            "rss_mb": None if self.rss_mb is None else round(self.rss_mb, 1),
+            "rows_emitted": self.rows_emitted,
+        }
+
+
+def _read_rss_mb(pid: int) -> Optional[float]:
+    """RSS процесу з /proc (Linux). На інших ОС — None (ліміт пам'яті не перевіряється)."""
+    try:
+        with open(f"/proc/{pid}/status", "r", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except (OSError, ValueError, IndexError):
+        return None
+    return None
+
+
+def _worker_main(conn, table_engine: str, parser_factory: Callable[..., Any] = VisuraParser) -> None:
+    """
+    Цикл воркера: отримує шлях до PDF, стрімить ("row", dict) і завершує
+    ("done", ParseReport.as_dict()) або ("error", text). None або закритий Pipe — вихід.
+    parser_factory(table_engine=...) має бути імпортованим з модуля (spawn його пікле).
+    """
+    # Власна process group, щоб при kill прибрати і дочірні процеси (Ghostscript тощо)
+    try:
+        os.setsid()
+    except (AttributeError, OSError):
+        pass
+
+    parser = parser_factory(table_engine=table_engine)
+    while True:
+        try:
+            pdf_path = conn.recv()
+        except (EOFError, OSError):
+            break
+        if pdf_path is None:
+            break
+
+        try:
+            report = ParseReport()
+            for row in parser.parse_iter(pdf_path, report=report):
+                conn.send(("row", row))
+            conn.send(("done", report.as_dict()))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+class SandboxedVisuraParser:
+    """
+    Та сама поверхня, що й у VisuraParser (parse / parse_iter), але парсинг іде у воркері.
+
+    timeout_sec — скільки максимум чекаємо на воркер в межах одного документа
+                  (час, коли споживач сам обробляє рядки, не рахується);
+    max_rss_mb  — ліміт RSS воркера; None або 0 вимикає перевірку;
+    parser_factory — клас / функція модуля з поверхнею VisuraParser (за замовчуванням VisuraParser).
+    """
+
+    def __init__(
+        self,
+        table_engine: str = TABLE_ENGINE_PYMUPDF,
+        timeout_sec: float = 120.0,
+        max_rss_mb: Optional[float] = 2048.0,
+        poll_interval_sec: float = 0.2,
+        parser_factory: Callable[..., Any] = VisuraParser,
+    ):
+        self.table_engine = table_engine
+        self.parser_factory = parser_factory
+        self.timeout_sec = timeout_sec
+        self.max_rss_mb = max_rss_mb or None
+        self.poll_interval_sec = poll_interval_sec
+
+        self._ctx = mp.get_context("spawn")
+        self._proc = None
+        self._conn = None
+
+    # ---- lifecycle ----
+
+    def _ensure_worker(self) -> None:
+        if self._proc is not None and self._proc.is_alive():
+            return
+
+        self._kill_worker()
+        parent_conn, child_conn = self._ctx.Pipe()
+        proc = self._ctx.Process(
+            target=_worker_main,
+            args=(child_conn, self.table_engine, self.parser_factory),
+            name="visura-parser",
+            daemon=True,
+        )
+        proc.start()
+        child_conn.close()
+
+        self._proc = proc
+        self._conn = parent_conn
+        logger.info("[PARSER_SANDBOX] Started parser worker pid=%s", proc.pid)
+
+    def _kill_worker(self) -> None:
+        proc, conn = self._proc, self._conn
+        self._proc = None
+        self._conn = None
+
+        if conn is not None:
+            try:
+                conn.close()
+            except OSError:
+                pass
+
+        if proc is None:
+            return
+
+        if proc.is_alive():
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except (AttributeError, OSError):
+                proc.kill()
+        proc.join(timeout=5)
+        logger.info("[PARSER_SANDBOX] Parser worker pid=%s stopped", proc.pid)
+
+    def close(self) -> None:
+        """Акуратно зупиняє воркер (наприклад, у close_spider)."""
+        if self._conn is not None and self._proc is not None and self._proc.is_alive():
+            try:
+                self._conn.send(None)
+                self._proc.join(timeout=2)
+            except OSError:
+                pass
+        self._kill_worker()
+
+    # ---- parsing ----
+
+    def parse(self, pdf_path: str | Path):
+        return list(self.parse_iter(pdf_path))
+
+    def parse_with_report(self, pdf_path: str | Path) -> Tuple[List[Dict[str, Any]], ParseReport]:
+        report = ParseReport()
+        rows = list(self.parse_iter(pdf_path, report=report))
+        return rows, report
+
+    def parse_iter(self, pdf_path: str | Path, report: Optional[ParseReport] = None) -> Iterator[Dict[str, Any]]:
+        pdf_path = str(pdf_path)
+        self._ensure_worker()
+        self._conn.send(pdf_path)
+
+        waited = 0.0
+        rows_emitted = 0
+        finished = False
+        try:
+            while True:
+                t0 = time.monotonic()
+                ready = self._conn.poll(self.poll_interval_sec)
+                waited += time.monotonic() - t0
+
+                if ready:
+                    try:
+                        kind, payload = self._conn.recv()
+                    except (EOFError, OSError):
+                        raise self._fail(PARSE_ERROR_CRASH, pdf_path, "worker pipe closed", waited, rows_emitted)
+
+                    if kind == "row":
+                        rows_emitted += 1
+                        yield payload
+                        continue
+                    if kind == "done":
+                        finished = True
+                        if report is not None:
+                            report.update_from(ParseReport.from_dict(payload))
+                        return
+                    # kind == "error": воркер живий, помилка в самому парсері
+                    finished = True
+                    raise VisuraParseError(PARSE_ERROR_EXCEPTION, pdf_path, str(payload), waited, None, rows_emitted)
+
+                if not self._proc.is_alive():
+                    raise self._fail(
+                        PARSE_ERROR_CRASH, pdf_path, f"worker exited with code {self._proc.exitcode}",
+                        waited, rows_emitted,
+                    )
+
+                if self.timeout_sec and waited > self.timeout_sec:
+                    raise self._fail(
+                        PARSE_ERROR_TIMEOUT, pdf_path, f"no result after {self.timeout_sec:.0f}s",
+                        waited, rows_emitted,
+                    )
+
+                rss_mb = _read_rss_mb(self._proc.pid) if self.max_rss_mb else None
+                if rss_mb is not None and rss_mb > self.max_rss_mb:
+                    raise self._fail(
+                        PARSE_ERROR_MEMORY, pdf_path, f"RSS {rss_mb:.0f} MB > limit {self.max_rss_mb:.0f} MB",
+                        waited, rows_emitted, rss_mb=rss_mb,
+                    )
+        finally:
+            if not finished:
+                # Споживач кинув генератор посеред документа або ліміт перевищено:
+                # у Pipe можуть лишитися рядки старого завдання, тому воркер перезапускаємо.
+                self._kill_worker()
+
+    def _fail(
+        self,
+        kind: str,
+        pdf_path: str,
+        message: str,
+        waited: float,
+        rows_emitted: int,
+        rss_mb: Optional[float] = None,
+    ) -> VisuraParseError:
+        logger.error("[PARSER_SANDBOX] %s on %s: %s (killing worker)", kind, pdf_path, message)
+        self._kill_worker()
+        return VisuraParseError(kind, pdf_path, message, waited, rss_mb, rows_emitted)
@@ -1,12 +1,13 @@
 from __future__ import annotations
 
+from dataclasses import asdict, dataclass, field
 from pathlib import Path
 import logging
 import re
-from typing import Any, Dict, List
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import fitz
-import camelot
 
 from uppi.parsers.address_parser import parse_address
 
@@ -16,6 +17,104 @@ DOWNLOADS_DIR = Path(__file__).resolve().parents[2] / "downloads"
 
 PDF_PATH = DOWNLOADS_DIR / "sample_visura.pdf"
 
+# Рушії витягування таблиць:
+#   - pymupdf: нативний find_tables() по вже відкритому fitz-документу (швидко, без Ghostscript/OpenCV)
+#   - camelot: lattice через Ghostscript/OpenCV (старий шлях, лишається як fallback)
+TABLE_ENGINE_PYMUPDF = "pymupdf"
+TABLE_ENGINE_CAMELOT = "camelot"
+TABLE_ENGINES = (TABLE_ENGINE_PYMUPDF, TABLE_ENGINE_CAMELOT)
+
+# Таблиця як список рядків, рядок як список текстів клітинок
+TableRows = List[List[str]]
+
+# Причини, з яких сторінку / таблицю пропущено (поле reason у ParseReport)
+PAGE_SKIP_NO_IMMOBILI = "no_immobili_table"
+TABLE_SKIP_EMPTY = "empty"
+TABLE_SKIP_INTABULAZIONE = "intabulazione"
+TABLE_SKIP_NO_REAL_ESTATE = "no_real_estate_columns"
+
+# Чому сторінку перечитано camelot-ом при table_engine=pymupdf (PageReport.fallback_reason)
+FALLBACK_PYMUPDF_ERROR = "pymupdf_error"
+FALLBACK_NO_TABLES = "pymupdf_no_tables"
+FALLBACK_NO_IMMOBILI_TABLES = "pymupdf_no_immobili_tables"
+
+
+@dataclass
+class PageReport:
+    """Телеметрія однієї сторінки (page — 1-based)."""
+    page: int
+    engine: Optional[str] = None  # фактичний рушій (None, якщо таблиці не витягувались)
+    text_sec: float = 0.0
+    tables_sec: float = 0.0
+    rows_sec: float = 0.0
+    tables_found: int = 0
+    tables_skipped: List[Dict[str, Any]] = field(default_factory=list)  # [{"table": idx, "reason": ...}]
+    rows_emitted: int = 0
+    skipped_reason: Optional[str] = None
+    fallback_reason: Optional[str] = None  # FALLBACK_*: PyMuPDF не дав таблиць immobili, читали camelot-ом
+    error: Optional[str] = None
+
+
+@dataclass
+class ParseReport:
+    """
+    Структурований звіт парсингу одного документа.
+    Заповнюється по ходу parse_iter(); зберігається у visure.parse_report.
+    """
+    pdf_path: str = ""
+    engine: str = TABLE_ENGINE_PYMUPDF
+    pages_total: int = 0
+    rows_emitted: int = 0
+    elapsed_sec: float = 0.0
+    error: Optional[str] = None
+    pages: List[PageReport] = field(default_factory=list)
+
+    @property
+    def tables_found(self) -> int:
+        return sum(p.tables_found for p in self.pages)
+
+    @property
+    def tables_skipped(self) -> int:
+        return sum(len(p.tables_skipped) for p in self.pages)
+
+    @property
+    def pages_skipped(self) -> int:
+        return sum(1 for p in self.pages if p.skipped_reason)
+
+    def slowest_page(self) -> Optional[PageReport]:
+        if not self.pages:
+            return None
+        return max(self.pages, key=lambda p: p.text_sec + p.tables_sec + p.rows_sec)
+
+    def as_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        for page in data["pages"]:
+            for key in ("text_sec", "tables_sec", "rows_sec"):
+                page[key] = round(page[key], 4)
+        data["elapsed_sec"] = round(self.elapsed_sec, 4)
+        data["tables_found"] = self.tables_found
+        data["tables_skipped"] = self.tables_skipped
+        data["pages_skipped"] = self.pages_skipped
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ParseReport":
+        pages = [PageReport(**p) for p in data.get("pages") or []]
+        return cls(
+            pdf_path=data.get("pdf_path") or "",
+            engine=data.get("engine") or TABLE_ENGINE_PYMUPDF,
+            pages_total=data.get("pages_total") or 0,
+            rows_emitted=data.get("rows_emitted") or 0,
+            elapsed_sec=data.get("elapsed_sec") or 0.0,
+            error=data.get("error"),
+            pages=pages,
+        )
+
+    def update_from(self, other: "ParseReport") -> None:
+        """Копіює вміст іншого звіту в цей об'єкт (звіт з воркера -> звіт викликача)."""
+        for name in self.__dataclass_fields__:
+            setattr(self, name, getattr(other, name))
+
 
 class VisuraParser:
     """
@@ -46,43 +145,97 @@ class VisuraParser:
     INTABULAZIONE_KEYWORDS = ["DATI ANAGRAFICI", "DIRITTI E ONERI REALI"]
 
     REAL_ESTATE_COLUMNS = {"Foglio", "Numero", "Sub", "Categoria", "Classe"}
+    REAL_ESTATE_HEADER = re.compile(r"\b(?:" + "|".join(sorted(REAL_ESTATE_COLUMNS)) + r")\b")
+
+    def __init__(self, table_engine: str = TABLE_ENGINE_PYMUPDF):
+        engine = (table_engine or TABLE_ENGINE_PYMUPDF).strip().lower()
+        if engine not in TABLE_ENGINES:
+            raise ValueError(f"Unknown table engine {table_engine!r}, expected one of {TABLE_ENGINES}")
+        self.table_engine = engine
 
     def parse(self, pdf_path: str | Path) -> List[Dict[str, Any]]:
+        """Повний список immobili. Для великих візур краще parse_iter()."""
+        return list(self.parse_iter(pdf_path))
+
+    def parse_with_report(self, pdf_path: str | Path) -> Tuple[List[Dict[str, Any]], ParseReport]:
+        report = ParseReport()
+        rows = list(self.parse_iter(pdf_path, report=report))
+        return rows, report
+
+    def parse_iter(self, pdf_path: str | Path, report: Optional[ParseReport] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Генератор: віддає один dict immobile одразу після обробки рядка таблиці.
+        У пам'яті тримається тільки стан поточної сторінки.
+
+        Якщо передано report, він заповнюється по ходу парсингу (час роботи
+        споживача між рядками в таймінги не входить).
+        """
         pdf_path = str(pdf_path)
         logger.info("[VISURA_PARSER] Парсимо PDF: %s", pdf_path)
 
+        if report is None:
+            report = ParseReport()
+        report.pdf_path = pdf_path
+        report.engine = self.table_engine
+
         try:
             doc = fitz.open(pdf_path)
         except Exception as e:
             logger.exception("[VISURA_PARSER] Не вдалося відкрити PDF %s: %s", pdf_path, e)
-            return []
+            report.error = f"open: {e}"
+            return
 
-        all_immobili: List[Dict[str, Any]] = []
+        report.pages_total = len(doc)
         try:
-            name_data = self._extract_name_cf(doc)
+            name_data: Dict[str, Any] = {}
 
             for page_idx in range(len(doc)):
+                page_report = PageReport(page=page_idx + 1)
+                report.pages.append(page_report)
+
+                t0 = time.perf_counter()
                 page = doc[page_idx]
-                comune_name, comune_code = self._extract_comune_for_page(page)
+                # Один прохід get_text на сторінку — спільний для name/CF, comune і детектора таблиць
+                text = page.get_text("text")
 
+                if page_idx == 0:
+                    name_data = self._extract_name_cf(text)
+
+                has_table = self._page_has_immobili_table(text)
+                page_report.text_sec = time.perf_counter() - t0
+                if not has_table:
+                    # Intestazione / legenda / footer — таблиць immobili тут немає, дорогий шлях пропускаємо
+                    page_report.skipped_reason = PAGE_SKIP_NO_IMMOBILI
+                    continue
+
+                comune_name, comune_code = self._extract_comune(text)
+
+                t0 = time.perf_counter()
                 try:
-                    tables = camelot.read_pdf(pdf_path, pages=str(page_idx + 1), flavor="lattice")
+                    tables, page_report.engine, page_report.fallback_reason = self._extract_tables(
+                        page, pdf_path, page_idx
+                    )
                 except Exception as e:
                     logger.exception(
-                        "[VISURA_PARSER] Помилка Camelot на сторінці %d (%s): %s",
+                        "[VISURA_PARSER] Помилка витягування таблиць на сторінці %d (%s): %s",
                         page_idx + 1,
                         pdf_path,
                         e,
                     )
+                    page_report.error = f"{type(e).__name__}: {e}"
                     continue
-
-                for table in tables:
-                    parsed = self._process_table(table)
-                    if parsed is None:
+                finally:
+                    page_report.tables_sec = time.perf_counter() - t0
+
+                page_report.tables_found = len(tables)
+                for table_idx, table in enumerate(tables):
+                    header, data_start_row, reason = self._classify_table(table)
+                    if reason:
+                        page_report.tables_skipped.append({"table": table_idx, "reason": reason})
                         continue
 
-                    immobili_list = parsed.get("immobili", [])
-                    for immobile in immobili_list:
+                    t0 = time.perf_counter()
+                    for immobile in self._iter_data_rows(header, table[data_start_row:]):
                         immobile.update(
                             {
                                 "locatore_surname": name_data.get("locatore_surname"),
@@ -92,14 +245,30 @@ class VisuraParser:
                                 "immobile_comune_code": comune_code,
                             }
                         )
-                        all_immobili.append(immobile)
-
-            logger.info("[VISURA_PARSER] Готово: знайдено %d immobili у %s", len(all_immobili), pdf_path)
-            logger.info(f"All immobili information is: {all_immobili}")
-            return all_immobili
+                        page_report.rows_sec += time.perf_counter() - t0
+                        page_report.rows_emitted += 1
+                        report.rows_emitted += 1
+                        yield immobile
+                        t0 = time.perf_counter()
+                    page_report.rows_sec += time.perf_counter() - t0
         finally:
+            report.elapsed_sec = sum(p.text_sec + p.tables_sec + p.rows_sec for p in report.pages)
             doc.close()
 
+        slowest = report.slowest_page()
+        logger.info(
+            "[VISURA_PARSER] Готово: знайдено %d immobili у %s (сторінок без таблиць пропущено: %d/%d, "
+            "таблиць: %d, пропущено: %d, %.2f c, найповільніша сторінка: %s)",
+            report.rows_emitted,
+            pdf_path,
+            report.pages_skipped,
+            report.pages_total,
+            report.tables_found,
+            report.tables_skipped,
+            report.elapsed_sec,
+            slowest.page if slowest else None,
+        )
+
     def _normalize_header(self, header: str) -> str:
         snake = re.sub(r"[^A-Za-z0-9]+", "_", header).strip("_").lower()
 
@@ -112,34 +281,105 @@ class VisuraParser:
 
         return snake
 
-    def _extract_name_cf(self, doc) -> Dict[str, Any]:
-        page = doc[0]
-        blocks = page.get_text("blocks")
-
-        for _, _, _, _, text, *_ in blocks:
-            for line in text.splitlines():
-                m = self.NAME_CF.match(line.strip())
-                if m:
-                    locatore_surname, locatore_name, cf = m.groups()
-                    return {"locatore_surname": locatore_surname, "locatore_name": locatore_name, "cf": cf}
+    def _extract_name_cf(self, text: str) -> Dict[str, Any]:
+        for line in text.splitlines():
+            m = self.NAME_CF.match(line.strip())
+            if m:
+                locatore_surname, locatore_name, cf = m.groups()
+                return {"locatore_surname": locatore_surname, "locatore_name": locatore_name, "cf": cf}
 
         logger.warning("[VISURA_PARSER] Не вдалося знайти ім'я/CF на першій сторінці")
         return {"locatore_surname": None, "locatore_name": None, "cf": None}
 
-    def _extract_comune_for_page(self, page) -> tuple[str | None, str | None]:
-        txt = page.get_text("text")
-        for line in txt.splitlines():
+    def _extract_comune(self, text: str) -> tuple[str | None, str | None]:
+        for line in text.splitlines():
             m = self.COMUNE_TABLE.search(line.strip())
             if m:
                 return m.group(1), m.group(2)
         return None, None
 
-    def _process_table(self, table):
-        df = table.df
-        if df.empty:
-            return None
+    def _page_has_immobili_table(self, text: str) -> bool:
+        """
+        Дешевий фільтр перед витягуванням таблиць: сторінка-кандидат, якщо в тексті є
+        рядок "Immobili siti nel Comune di ..." або хоча б дві колонки з REAL_ESTATE_COLUMNS.
+        """
+        if self.COMUNE_TABLE.search(text):
+            return True
+        found = {m.group(0) for m in self.REAL_ESTATE_HEADER.finditer(text)}
+        return len(found) >= 2
+
+    def _extract_tables(self, page, pdf_path: str, page_idx: int) -> Tuple[List[TableRows], str, Optional[str]]:
+        """
+        Витягує таблиці сторінки обраним рушієм. Повертає (таблиці, фактичний рушій, причина fallback).
+        Викликається для сторінок, що пройшли _page_has_immobili_table, тобто таблиця там очікується:
+        якщо PyMuPDF впав (або стара версія без find_tables), не знайшов таблиць або жодна не схожа
+        на таблицю immobili (_classify_table) — сторінку перечитуємо camelot-ом.
+        """
+        if self.table_engine != TABLE_ENGINE_PYMUPDF:
+            return self._extract_tables_camelot(pdf_path, page_idx), TABLE_ENGINE_CAMELOT, None
+
+        tables: List[TableRows] = []
+        try:
+            tables = self._extract_tables_pymupdf(page)
+        except Exception as e:
+            reason = FALLBACK_PYMUPDF_ERROR
+            logger.warning(
+                "[VISURA_PARSER] PyMuPDF find_tables впав на сторінці %d (%s), fallback на camelot: %s",
+                page_idx + 1,
+                pdf_path,
+                e,
+            )
+        else:
+            if not tables:
+                reason = FALLBACK_NO_TABLES
+            elif all(self._classify_table(table)[2] for table in tables):
+                reason = FALLBACK_NO_IMMOBILI_TABLES
+            else:
+                return tables, TABLE_ENGINE_PYMUPDF, None
+            logger.info(
+                "[VISURA_PARSER] PyMuPDF не дав таблиць immobili на сторінці %d (%s, %s), fallback на camelot",
+                page_idx + 1,
+                pdf_path,
+                reason,
+            )
 
-        first_row_text = " ".join(df.iloc[0]).upper()
+        try:
+            return self._extract_tables_camelot(pdf_path, page_idx), TABLE_ENGINE_CAMELOT, reason
+        except Exception as e:
+            if reason == FALLBACK_PYMUPDF_ERROR:
+                raise
+            # camelot недоступний / впав: лишаємо те, що дав PyMuPDF (таблиці підуть у tables_skipped)
+            logger.warning(
+                "[VISURA_PARSER] camelot fallback впав на сторінці %d (%s): %s", page_idx + 1, pdf_path, e
+            )
+            return tables, TABLE_ENGINE_PYMUPDF, reason
+
+    def _extract_tables_pymupdf(self, page) -> List[TableRows]:
+        # strategy="lines" — аналог camelot lattice: таблиці за лініями сітки
+        finder = page.find_tables(strategy="lines")
+        tables: List[TableRows] = []
+        for table in finder.tables:
+            # Об'єднані клітинки PyMuPDF повертає як None, camelot — як ""
+            rows = [[cell or "" for cell in row] for row in table.extract()]
+            tables.append(rows)
+        return tables
+
+    def _extract_tables_camelot(self, pdf_path: str, page_idx: int) -> List[TableRows]:
+        # camelot тягне pandas / OpenCV / Ghostscript — імпортуємо тільки коли він справді потрібен
+        import camelot
+
+        tables = camelot.read_pdf(pdf_path, pages=str(page_idx + 1), flavor="lattice")
+        return [[[str(cell) for cell in row] for row in table.df.values.tolist()] for table in tables]
+
+    def _classify_table(self, rows_raw: TableRows) -> Tuple[List[str], int, Optional[str]]:
+        """
+        Визначає нормалізований заголовок таблиці immobili.
+        Повертає (header, індекс першого рядка даних, причина пропуску або None).
+        """
+        if not rows_raw:
+            return [], 0, TABLE_SKIP_EMPTY
+
+        first_row_text = " ".join(rows_raw[0]).upper()
         if any(k in first_row_text for k in self.GROUPED_HEADER_KEYWORDS):
             header_row = 1
             data_start_row = 2
@@ -147,13 +387,16 @@ class VisuraParser:
             header_row = 0
             data_start_row = 1
 
-        header = [h.replace("\n", " ").strip() for h in list(df.iloc[header_row])]
+        if len(rows_raw) <= header_row:
+            return [], 0, TABLE_SKIP_EMPTY
+
+        header = [h.replace("\n", " ").strip() for h in rows_raw[header_row]]
         header_join = " ".join(header).upper()
         if any(k in header_join for k in self.INTABULAZIONE_KEYWORDS):
-            return None
+            return [], 0, TABLE_SKIP_INTABULAZIONE
 
         if not any(col in header for col in self.REAL_ESTATE_COLUMNS):
-            return None
+            return [], 0, TABLE_SKIP_NO_REAL_ESTATE
 
         normalized_header: List[str] = []
         for idx, col in enumerate(header):
@@ -173,14 +416,14 @@ class VisuraParser:
 
             normalized_header.append(col_clean)
 
-        header = [self._normalize_header(col) for col in normalized_header]
+        return [self._normalize_header(col) for col in normalized_header], data_start_row, None
 
-        rows: List[Dict[str, Any]] = []
-        for i in range(data_start_row, len(df)):
+    def _iter_data_rows(self, header: List[str], data_rows: TableRows) -> Iterator[Dict[str, Any]]:
+        for raw_row in data_rows:
             row_dict: Dict[str, Any] = {}
 
             for col_index, col_name in enumerate(header):
-                raw_value = df.iloc[i, col_index].strip()
+                raw_value = raw_row[col_index].strip() if col_index < len(raw_row) else ""
 
                 if "indirizzo" in col_name:
                     row_dict.update(parse_address(raw_value).as_dict())
@@ -196,9 +439,7 @@ class VisuraParser:
 
                 row_dict[col_name] = raw_value
 
-            rows.append(row_dict)
-
-        return {"immobili": rows} if rows else None
+            yield row_dict
 
     def _parse_superficie(self, text: str) -> Dict[str, Any]:
         txt = text.replace("\n", " ")
@@ -1,7 +1,27 @@
 # uppi/pipelines.py
 from __future__ import annotations
 
+from typing import Any, Dict
+
+from itemadapter import ItemAdapter
+
+from uppi.domain.db import close_pool, get_pool, pg_connection
+from uppi.services.db_repo import db_insert_run_ledger
+from uppi.services.job_workers import hand_off_fetched_item
+from uppi.services.jobs import fail_job
 from uppi.services.visura_processor import VisuraProcessor
+from uppi.utils.parse_utils import to_bool_or_none
+
+
+def _publish_stats(crawler, prefix: str, mapping: Dict[str, Any]) -> None:
+    """Пише mapping у Scrapy stats як prefix/key; вкладені dict — prefix/key/subkey."""
+    if crawler is None or crawler.stats is None:
+        return
+    for key, value in mapping.items():
+        if isinstance(value, dict):
+            _publish_stats(crawler, f"{prefix}/{key}", value)
+        else:
+            crawler.stats.set_value(f"{prefix}/{key}", value)
 
 
 class UppiPipeline:
@@ -12,5 +32,60 @@ class UppiPipeline:
     def __init__(self):
         self.processor = VisuraProcessor()
 
+    def open_spider(self, spider):
+        # scrapy crawl uppi -a force_render=true — генерувати й атестації з незміненим входом
+        self.processor.force_render = bool(to_bool_or_none(getattr(spider, "force_render", None)))
+
     def process_item(self, item, spider):
+        # Павук у режимі source=jobs: item — результат задачі fetch_visura, обробку робить process_client
+        job = getattr(spider, "leased_jobs", {}).get(ItemAdapter(item).get("locatore_cf"))
+        if job is not None:
+            try:
+                hand_off_fetched_item(item, job, self.processor.storage_service)
+            except Exception as e:
+                spider.logger.exception("[JOBS] Hand-off of fetch_visura job %s failed: %s", job.id, e)
+                fail_job(job, str(e))
+            return item
         return self.processor.process_item(item, spider)
+
+    def close_spider(self, spider):
+        self.processor.close()
+
+        query_stats = self.processor.query_stats
+        summary = {
+            # Метрики пулу з'єднань (очікування на вільне з'єднання, заміни)
+            "db_pool": get_pool().stats().as_dict(),
+            # Identity map персон / адрес: скільки upsert-ів пропущено в цьому прогоні
+            "identity_map": self.processor.identity_map.stats.as_dict(),
+            # Advisory lock CF: скільки разів і як довго чекали на інший воркер
+            "owner_lock": self.processor.owner_lock_stats.as_dict(),
+            # Запити до БД по мітках (db_repo-функція без префікса db_) + підсумок
+            "db_query": {
+                **query_stats.as_dict(),
+                "total_calls": query_stats.total_calls,
+                "total_ms": round(query_stats.total_sec * 1000, 2),
+                "total_rows": query_stats.total_rows,
+            },
+            # Атестації: скільки згенеровано, а скільки пропущено через незмінений вхід
+            "attestazione": dict(self.processor.attestazione_stats),
+        }
+
+        crawler = getattr(spider, "crawler", None)
+        for prefix, mapping in summary.items():
+            _publish_stats(crawler, prefix, mapping)
+        spider.logger.info("[DB_POOL] %s", summary["db_pool"])
+        spider.logger.info("[IDENTITY_MAP] %s", summary["identity_map"])
+        spider.logger.info("[OWNER_LOCK] %s", summary["owner_lock"])
+        spider.logger.info("[DB_QUERY] %s", query_stats.log_line(top=5))
+        spider.logger.info("[DOCX] %s", summary["attestazione"])
+
+        # Підсумок прогону — у run_ledger (порівняння прогонів між собою)
+        try:
+            with pg_connection() as conn:
+                db_insert_run_ledger(
+                    conn, spider.name, self.processor.started_at, self.processor.items_processed, summary
+                )
+                conn.commit()
+        except Exception as e:
+            spider.logger.warning("[RUN_LEDGER] Cannot write run ledger: %s", e)
+        close_pool()
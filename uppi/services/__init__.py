@@ -1,14 +1,33 @@
-from uppi.services.attestazione_generator import build_template_params
-from uppi.services.db_repo import VisuraState
-from uppi.services.storage_minio import StorageService
-from uppi.services.visura_policy import VisuraDecision, should_download_visura
-from uppi.services.visura_processor import VisuraProcessor
-
-__all__ = [
-    "build_template_params",
-    "VisuraState",
-    "StorageService",
-    "VisuraDecision",
-    "should_download_visura",
-    "VisuraProcessor",
-]
+"""
+Сервіси uppi.
+
+Імпорти ліниві (PEP 562): `from uppi.services import should_download_visura` не тягне
+VisuraProcessor з PyMuPDF, docx, MinIO та psycopg — модуль підвантажується при першому
+зверненні до атрибута.
+"""
+from importlib import import_module
+from typing import Any
+
+_EXPORTS = {
+    "build_template_params": "uppi.services.attestazione_generator",
+    "VisuraState": "uppi.services.db_repo",
+    "StorageService": "uppi.services.storage_minio",
+    "VisuraDecision": "uppi.services.visura_policy",
+    "should_download_visura": "uppi.services.visura_policy",
+    "VisuraProcessor": "uppi.services.visura_processor",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name: str) -> Any:
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(module_name), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
@@ -1,9 +1,10 @@
 from __future__ import annotations
 
+import json
 from typing import Any, Dict, List
 
 from uppi.domain.immobile import Immobile
-from uppi.utils.audit import format_person_fullname
+from uppi.utils.audit import format_person_fullname, sha256_text
 from uppi.utils.parse_utils import clean_str
 
 
@@ -296,3 +297,12 @@ def build_template_params(adapter, imm: Immobile, contract_ctx: Dict[str, Any])
         params["{{CAN_MENSILE}}"] = _fmt_num(agreed, 2)
 
     return params
+
+
+def template_params_fingerprint(params: Dict[str, str], template_version: str) -> str:
+    """
+    Відбиток входу атестації: параметри build_template_params + версія шаблону.
+    Той самий відбиток — той самий документ, тож повторно генерувати його не треба.
+    """
+    data = {"template_version": template_version, "params": params}
+    return sha256_text(json.dumps(data, sort_keys=True, ensure_ascii=False))
@@ -1,18 +1,18 @@
 # uppi/services/db_repo.py
 from __future__ import annotations
 
-import json
 import logging
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import date, datetime
 from typing import Any, Dict, List, Optional, Tuple
 
-import psycopg2
-import psycopg2.extras
 from itemadapter import ItemAdapter
-from psycopg2 import Error as Psycopg2Error
+from psycopg import Error as PsycopgError
+from psycopg.rows import dict_row
+from psycopg.types.json import Jsonb
 
 from uppi.domain.immobile import Immobile
+from uppi.services.identity_map import IdentityMap, address_content_hash
 from uppi.utils.db_utils.key_normalize import normalize_element_key
 from uppi.utils.parse_utils import clean_str, clean_sub, parse_date, safe_float
 
@@ -132,15 +132,10 @@ def immobile_db_row(imm: Immobile) -> Dict[str, Any]:
 # 1. ADDRESSES (New)
 # =========================================================
 
-def db_upsert_address(conn, addr_data: Dict[str, Any]) -> Optional[int]:
+def _address_params(addr_data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     """
-    Знаходить існуючу адресу або створює нову.
-    Повертає ID адреси.
-    
-    addr_data очікує ключі: 
-      - comune (обов'язково)
-      - via_full (обов'язково, або via_name як fallback)
-      - civico, piano, interno, scala (опціонально)
+    Нормалізує дані адреси для INSERT. None — критичних даних (comune / via_full) немає,
+    адресу не створюємо.
     """
     comune = clean_str(addr_data.get("comune"))
     # Формуємо повну назву вулиці, якщо вона розбита, або беремо вже готову
@@ -153,15 +148,44 @@ def db_upsert_address(conn, addr_data: Dict[str, Any]) -> Optional[int]:
             via_full = f"{via_type} {via_name}"
         elif via_name:
             via_full = via_name
-            
+
     # Якщо критичних даних немає - адресу не створюємо
     if not comune or not via_full:
         return None
 
-    civico = clean_str(addr_data.get("civico"))
-    piano = clean_str(addr_data.get("piano"))
-    interno = clean_str(addr_data.get("interno"))
-    scala = clean_str(addr_data.get("scala"))
+    return {
+        "comune": comune,
+        "via_full": via_full,
+        "civico": clean_str(addr_data.get("civico")),
+        "piano": clean_str(addr_data.get("piano")),
+        "interno": clean_str(addr_data.get("interno")),
+        "scala": clean_str(addr_data.get("scala")),
+    }
+
+
+def db_upsert_address(
+    conn, addr_data: Dict[str, Any], identity_map: Optional[IdentityMap] = None
+) -> Optional[int]:
+    """
+    Знаходить існуючу адресу або створює нову.
+    Повертає ID адреси.
+    
+    addr_data очікує ключі: 
+      - comune (обов'язково)
+      - via_full (обов'язково, або via_name як fallback)
+      - civico, piano, interno, scala (опціонально)
+
+    З identity_map адреса, вже записана в цьому прогоні (той самий content_hash),
+    повертається без запиту до БД.
+    """
+    params = _address_params(addr_data)
+    if params is None:
+        return None
+    content_hash = address_content_hash(params["comune"], params["via_full"], params["civico"])
+    if identity_map is not None:
+        cached_id = identity_map.get_address_id(content_hash)
+        if cached_id is not None:
+            return cached_id
 
     sql = """
     INSERT INTO public.addresses (comune, via_full, civico, piano, interno, scala)
@@ -175,32 +199,23 @@ def db_upsert_address(conn, addr_data: Dict[str, Any]) -> Optional[int]:
     )
     ON CONFLICT (content_hash) DO UPDATE 
     SET created_at = public.addresses.created_at -- Фіктивний апдейт, щоб повернути ID
-    RETURNING id;
+    RETURNING id, content_hash;
     """
-    
-    params = {
-        "comune": comune,
-        "via_full": via_full,
-        "civico": civico,
-        "piano": piano,
-        "interno": interno,
-        "scala": scala,
-    }
 
     try:
         with conn.cursor() as cur:
             cur.execute(sql, params)
             res = cur.fetchone()
-            if res:
-                return res[0]
-            # Теоретично сюди не має дійти, якщо ON CONFLICT працює коректно
-            # Але якщо раптом, пробуємо знайти вручну за хешем (для надійності)
-            cur.execute(
-                "SELECT id FROM public.addresses WHERE content_hash = md5(upper(trim(%s)) || '|' || upper(trim(regexp_replace(%s, '\s+', ' ', 'g'))) || '|' || upper(trim(COALESCE(%s, 'SNC'))))", 
-                (comune, via_full, civico)
-            )
-            res_fallback = cur.fetchone()
-            return res_fallback[0] if res_fallback else None
+            if not res:
+                # Теоретично сюди не має дійти, якщо ON CONFLICT працює коректно
+                # Але якщо раптом, пробуємо знайти вручну за хешем (для надійності)
+                cur.execute("SELECT id, content_hash FROM public.addresses WHERE content_hash = %s", (content_hash,))
+                res = cur.fetchone()
+            if not res:
+                return None
+            if identity_map is not None:
+                identity_map.remember_address(content_hash, res[1], res[0])
+            return res[0]
             
     except Exception as e:
         logger.error(f"[DB] Address upsert failed: {e}")
@@ -208,6 +223,84 @@ def db_upsert_address(conn, addr_data: Dict[str, Any]) -> Optional[int]:
         raise
 
 
+def db_bulk_upsert_addresses(
+    conn, addrs: List[Dict[str, Any]], identity_map: Optional[IdentityMap] = None
+) -> List[Optional[int]]:
+    """
+    Пакетна версія db_upsert_address: один INSERT ... ON CONFLICT (content_hash) на весь список.
+    Повертає ID у тому ж порядку (None там, де db_upsert_address теж повернув би None).
+
+    Семантика як у послідовних викликів: для кількох рядків з однаковим content_hash
+    вставляється перший (piano / interno / scala з нього), решта отримують той самий ID;
+    існуючі адреси не змінюються. Адреси, знайдені в identity_map, у запит не потрапляють.
+    """
+    ids: List[Optional[int]] = [None] * len(addrs)
+    hashes: Dict[int, str] = {}
+    values: List[Tuple[Any, ...]] = []
+    for idx, addr in enumerate(addrs):
+        params = _address_params(addr)
+        if params is None:
+            continue
+        if identity_map is not None:
+            hashes[idx] = address_content_hash(params["comune"], params["via_full"], params["civico"])
+            ids[idx] = identity_map.get_address_id(hashes[idx])
+            if ids[idx] is not None:
+                continue
+        values.append((
+                idx, params["comune"], params["via_full"], params["civico"],
+                params["piano"], params["interno"], params["scala"],
+            ))
+    if not values:
+        return ids
+
+    # Хеш рахуємо тим самим виразом, що й generated column addresses.content_hash,
+    # а дублікати в межах пакета прибираємо DISTINCT ON — інакше ON CONFLICT DO UPDATE
+    # впаде з "cannot affect row a second time".
+    sql = """
+    WITH input AS (
+        SELECT *
+        FROM unnest(
+            %s::int[], %s::text[], %s::text[], %s::text[], %s::text[], %s::text[], %s::text[]
+        ) AS t(ord, comune, via_full, civico, piano, interno, scala)
+    ),
+    hashed AS (
+        SELECT input.*,
+               md5(upper(trim(comune)) || '|' ||
+                   upper(trim(regexp_replace(via_full, '\\s+', ' ', 'g'))) || '|' ||
+                   upper(trim(COALESCE(civico, 'SNC')))) AS content_hash
+        FROM input
+    ),
+    upserted AS (
+        INSERT INTO public.addresses (comune, via_full, civico, piano, interno, scala)
+        SELECT DISTINCT ON (content_hash)
+               comune, via_full, COALESCE(civico, 'SNC'), piano, interno, scala
+        FROM hashed
+        ORDER BY content_hash, ord
+        ON CONFLICT (content_hash) DO UPDATE
+        SET created_at = public.addresses.created_at -- Фіктивний апдейт, щоб повернути ID
+        RETURNING id, content_hash
+    )
+    SELECT hashed.ord, upserted.id, upserted.content_hash
+    FROM hashed
+    JOIN upserted ON upserted.content_hash = hashed.content_hash;
+    """
+
+    try:
+        with conn.cursor() as cur:
+            # Один масив на колонку — кількість параметрів не залежить від розміру пакета
+            cur.execute(sql, [list(col) for col in zip(*values)])
+            rows = cur.fetchall()
+    except PsycopgError as e:
+        logger.error(f"[DB] Bulk address upsert failed ({len(values)} rows): {e}")
+        raise
+
+    for ord_, addr_id, db_hash in rows:
+        ids[ord_] = addr_id
+        if identity_map is not None:
+            identity_map.remember_address(hashes[ord_], db_hash, addr_id)
+    return ids
+
+
 # =========================================================
 # 2. PERSONS (Updated)
 # =========================================================
@@ -217,14 +310,20 @@ def db_upsert_person(
     cf: str, 
     surname: Optional[str], 
     name: Optional[str], 
-    address_id: Optional[int] = None
+    address_id: Optional[int] = None,
+    identity_map: Optional[IdentityMap] = None,
 ) -> None:
     """
     Оновлює або створює запис про особу (Locatore/Conduttore).
     Тепер підтримує лінк на адресу проживання.
+    З identity_map запис пропускається, якщо в цьому прогоні ця особа вже записана
+    з тими самими (або новішими) полями.
     """
     if not cf:
         return
+    payload = (surname, name, address_id)
+    if identity_map is not None and identity_map.person_unchanged(cf, payload):
+        return
 
     with conn.cursor() as cur:
         cur.execute(
@@ -240,6 +339,8 @@ def db_upsert_person(
             """,
             (cf, surname, name, address_id),
         )
+    if identity_map is not None:
+        identity_map.remember_person(cf, payload)
 
 
 # =========================================================
@@ -292,11 +393,32 @@ def db_upsert_visura(
             if result:
                 return result[0]
             raise RuntimeError(f"Failed to upsert visura for CF: {cf}")
-    except Psycopg2Error as e:
+    except PsycopgError as e:
         logger.error(f"[DB] db_upsert_visura error: {e}")
         raise
 
 
+def db_clear_visura_checksum(conn, cf: str) -> None:
+    """
+    Скидає checksum_sha256 візури (наприклад, якщо парсинг не вдався),
+    щоб наступне завантаження того самого PDF пройшло повну обробку.
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            "UPDATE public.visure SET checksum_sha256 = NULL, updated_at = now() WHERE locatore_cf = %s;",
+            (cf,),
+        )
+
+
+def db_update_visura_parse_report(conn, cf: str, report: Dict[str, Any]) -> None:
+    """Зберігає звіт VisuraParser (ParseReport.as_dict()) разом із записом візури."""
+    with conn.cursor() as cur:
+        cur.execute(
+            "UPDATE public.visure SET parse_report = %s, updated_at = now() WHERE locatore_cf = %s;",
+            (Jsonb(report), cf),
+        )
+
+
 @dataclass(frozen=True)
 class VisuraState:
     cf: str
@@ -304,12 +426,22 @@ class VisuraState:
     pdf_object: Optional[str]
     fetched_at: Optional[Any]
     id: Optional[int] = None # Додали ID
+    checksum_sha256: Optional[str] = None
+
+_VISURA_STATE_COLUMNS = "locatore_cf, pdf_bucket, pdf_object, fetched_at, id, checksum_sha256"
+
+
+def _visura_state_from_row(row) -> VisuraState:
+    return VisuraState(
+        cf=row[0], pdf_bucket=row[1], pdf_object=row[2], fetched_at=row[3], id=row[4], checksum_sha256=row[5]
+    )
+
 
 def fetch_visura_state(conn, cf: str) -> Optional[VisuraState]:
     with conn.cursor() as cur:
         cur.execute(
-            """
-            SELECT locatore_cf, pdf_bucket, pdf_object, fetched_at, id
+            f"""
+            SELECT {_VISURA_STATE_COLUMNS}
             FROM public.visure
             WHERE locatore_cf = %s;
             """,
@@ -318,7 +450,27 @@ def fetch_visura_state(conn, cf: str) -> Optional[VisuraState]:
         row = cur.fetchone()
     if not row:
         return None
-    return VisuraState(cf=row[0], pdf_bucket=row[1], pdf_object=row[2], fetched_at=row[3], id=row[4])
+    return _visura_state_from_row(row)
+
+
+FETCH_VISURA_STATES_SQL = f"""
+SELECT {_VISURA_STATE_COLUMNS}
+FROM public.visure
+WHERE locatore_cf = ANY(%s::text[]);
+"""
+
+
+async def fetch_visura_states_async(aconn, cfs: List[str]) -> Dict[str, VisuraState]:
+    """
+    Асинхронна версія fetch_visura_state для списку CF (psycopg.AsyncConnection):
+    один запит замість запиту на кожного клієнта. CF без візури в результаті відсутні.
+    """
+    if not cfs:
+        return {}
+    async with aconn.cursor() as cur:
+        await cur.execute(FETCH_VISURA_STATES_SQL, (list(cfs),))
+        rows = await cur.fetchall()
+    return {row[0]: _visura_state_from_row(row) for row in rows}
 
 
 # =========================================================
@@ -328,17 +480,12 @@ def fetch_visura_state(conn, cf: str) -> Optional[VisuraState]:
 
 # 4.1 Upsert Immobile with new fields
 
-def db_upsert_immobile(
-    conn, 
-    owner_cf: str, 
-    imm: Immobile, 
-    visura_addr_id: Optional[int] = None,
-    source_visura_id: Optional[int] = None
-) -> int:
-    """
-    Вставляє або оновлює Immobili (Master Data).
-    Використовує нові поля: micro_zona, zona_cens, visura_address_id.
-    """
+def _immobile_params(
+    owner_cf: str,
+    imm: Immobile,
+    visura_addr_id: Optional[int],
+    source_visura_id: Optional[int],
+) -> Dict[str, Any]:
     row = immobile_db_row(imm)
 
     # Валідація критичних полів
@@ -351,41 +498,7 @@ def db_upsert_immobile(
             f"Got foglio={foglio!r}, numero={numero!r}, owner_cf={owner_cf!r}"
         )
 
-    sub = row.get("sub") or ""
-
-    sql = """
-    INSERT INTO public.immobili (
-        owner_cf, source_visura_id, visura_address_id,
-        sez_urbana, foglio, numero, sub,
-        zona_cens, micro_zona, categoria, classe, consistenza, rendita,
-        superficie_totale, superficie_escluse, superficie_raw
-    )
-    VALUES (
-        %(owner_cf)s, %(source_visura_id)s, %(visura_addr_id)s,
-        %(sez_urbana)s, %(foglio)s, %(numero)s, %(sub)s,
-        %(zona_cens)s, %(micro_zona)s, %(categoria)s, %(classe)s, %(consistenza)s, %(rendita)s,
-        %(superficie_totale)s, %(superficie_escluse)s, %(superficie_raw)s
-    )
-    ON CONFLICT (owner_cf, foglio, numero, sub) DO UPDATE
-    SET
-        -- Оновлюємо дані з візури, якщо вони змінилися
-        source_visura_id   = COALESCE(EXCLUDED.source_visura_id, immobili.source_visura_id),
-        visura_address_id  = COALESCE(EXCLUDED.visura_address_id, immobili.visura_address_id),
-        
-        zona_cens          = COALESCE(EXCLUDED.zona_cens, immobili.zona_cens),
-        micro_zona         = COALESCE(EXCLUDED.micro_zona, immobili.micro_zona),
-        categoria          = COALESCE(EXCLUDED.categoria, immobili.categoria),
-        classe             = COALESCE(EXCLUDED.classe, immobili.classe),
-        consistenza        = COALESCE(EXCLUDED.consistenza, immobili.consistenza),
-        rendita            = COALESCE(EXCLUDED.rendita, immobili.rendita),
-        superficie_totale  = COALESCE(EXCLUDED.superficie_totale, immobili.superficie_totale),
-        superficie_escluse = COALESCE(EXCLUDED.superficie_escluse, immobili.superficie_escluse),
-        superficie_raw     = COALESCE(EXCLUDED.superficie_raw, immobili.superficie_raw),
-        updated_at         = now()
-    RETURNING id;
-    """
-
-    params = {
+    return {
         "owner_cf": owner_cf,
         "source_visura_id": source_visura_id,
         "visura_addr_id": visura_addr_id,
@@ -393,7 +506,7 @@ def db_upsert_immobile(
         "sez_urbana": row.get("sez_urbana"),
         "foglio": foglio,
         "numero": numero,
-        "sub": sub,
+        "sub": row.get("sub") or "",
         
         "zona_cens": row.get("zona_cens"),
         "micro_zona": row.get("micro_zona"),
@@ -407,68 +520,154 @@ def db_upsert_immobile(
         "superficie_raw": row.get("superficie_raw"),
     }
 
+
+# Колонки, які ON CONFLICT оновлює через COALESCE(EXCLUDED.x, immobili.x)
+_IMMOBILE_COALESCE_PARAMS = [
+    "source_visura_id", "visura_addr_id",
+    "zona_cens", "micro_zona", "categoria", "classe", "consistenza", "rendita",
+    "superficie_totale", "superficie_escluse", "superficie_raw",
+]
+
+# Колонки multi-row INSERT (у порядку колонок immobili) і типи їх масивів для unnest
+_IMMOBILE_INSERT_PARAMS = [
+    ("owner_cf", "text"), ("source_visura_id", "bigint"), ("visura_addr_id", "bigint"),
+    ("sez_urbana", "text"), ("foglio", "text"), ("numero", "text"), ("sub", "text"),
+    ("zona_cens", "text"), ("micro_zona", "text"), ("categoria", "text"), ("classe", "text"),
+    ("consistenza", "text"), ("rendita", "text"),
+    ("superficie_totale", "float8"), ("superficie_escluse", "float8"), ("superficie_raw", "text"),
+]
+_IMMOBILE_UNNEST_ARGS = ", ".join(f"%({col})s::{sql_type}[]" for col, sql_type in _IMMOBILE_INSERT_PARAMS)
+
+_IMMOBILE_UPSERT_SET = """
+    ON CONFLICT (owner_cf, foglio, numero, sub) DO UPDATE
+    SET
+        -- Оновлюємо дані з візури, якщо вони змінилися
+        source_visura_id   = COALESCE(EXCLUDED.source_visura_id, immobili.source_visura_id),
+        visura_address_id  = COALESCE(EXCLUDED.visura_address_id, immobili.visura_address_id),
+        
+        zona_cens          = COALESCE(EXCLUDED.zona_cens, immobili.zona_cens),
+        micro_zona         = COALESCE(EXCLUDED.micro_zona, immobili.micro_zona),
+        categoria          = COALESCE(EXCLUDED.categoria, immobili.categoria),
+        classe             = COALESCE(EXCLUDED.classe, immobili.classe),
+        consistenza        = COALESCE(EXCLUDED.consistenza, immobili.consistenza),
+        rendita            = COALESCE(EXCLUDED.rendita, immobili.rendita),
+        superficie_totale  = COALESCE(EXCLUDED.superficie_totale, immobili.superficie_totale),
+        superficie_escluse = COALESCE(EXCLUDED.superficie_escluse, immobili.superficie_escluse),
+        superficie_raw     = COALESCE(EXCLUDED.superficie_raw, immobili.superficie_raw),
+        updated_at         = now()
+"""
+
+
+def merge_duplicate_immobile_params(params_list: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[int]]:
+    """
+    Згортає рядки з однаковим (foglio, numero, sub) так, як це зробили б послідовні upsert-и:
+    INSERT бере перший рядок, кожен наступний ON CONFLICT оновлює COALESCE-колонки
+    своїми не-NULL значеннями.
+    Повертає (унікальні рядки, індекс унікального рядка для кожного вхідного).
+    """
+    merged: List[Dict[str, Any]] = []
+    positions: Dict[Tuple[str, str, str], int] = {}
+    mapping: List[int] = []
+    for params in params_list:
+        key = (params["foglio"], params["numero"], params["sub"])
+        pos = positions.get(key)
+        if pos is None:
+            positions[key] = pos = len(merged)
+            merged.append(dict(params))
+        else:
+            target = merged[pos]
+            for col in _IMMOBILE_COALESCE_PARAMS:
+                if params.get(col) is not None:
+                    target[col] = params[col]
+        mapping.append(pos)
+    return merged, mapping
+
+
+def db_upsert_immobile(
+    conn, 
+    owner_cf: str, 
+    imm: Immobile, 
+    visura_addr_id: Optional[int] = None,
+    source_visura_id: Optional[int] = None
+) -> int:
+    """
+    Вставляє або оновлює Immobili (Master Data).
+    Використовує нові поля: micro_zona, zona_cens, visura_address_id.
+    """
+    params = _immobile_params(owner_cf, imm, visura_addr_id, source_visura_id)
+
+    sql = """
+    INSERT INTO public.immobili (
+        owner_cf, source_visura_id, visura_address_id,
+        sez_urbana, foglio, numero, sub,
+        zona_cens, micro_zona, categoria, classe, consistenza, rendita,
+        superficie_totale, superficie_escluse, superficie_raw
+    )
+    VALUES (
+        %(owner_cf)s, %(source_visura_id)s, %(visura_addr_id)s,
+        %(sez_urbana)s, %(foglio)s, %(numero)s, %(sub)s,
+        %(zona_cens)s, %(micro_zona)s, %(categoria)s, %(classe)s, %(consistenza)s, %(rendita)s,
+        %(superficie_totale)s, %(superficie_escluse)s, %(superficie_raw)s
+    )
+    """ + _IMMOBILE_UPSERT_SET + """
+    RETURNING id;
+    """
+
     try:
         with conn.cursor() as cur:
             cur.execute(sql, params)
             return cur.fetchone()[0]
-    except Psycopg2Error as e:
-        logger.error(f"[DB] Immobile upsert failed for CF={owner_cf} F={foglio} N={numero} S={sub}: {e}")
+    except PsycopgError as e:
+        logger.error(
+            f"[DB] Immobile upsert failed for CF={owner_cf} "
+            f"F={params['foglio']} N={params['numero']} S={params['sub']}: {e}"
+        )
         raise
 
-# 4.2 Upsert Immobile Elements
-def db_upsert_immobile_elements(conn, immobile_id: int, adapter: ItemAdapter):
+
+def db_bulk_upsert_immobili(
+    conn,
+    owner_cf: str,
+    items: List[Tuple[Immobile, Optional[int]]],
+    source_visura_id: Optional[int] = None,
+) -> List[int]:
     """
-    Розумне оновлення елементів A-D.
-    - Якщо в адаптері ключ відсутній (None) -> дані в БД не чіпаємо (залишаються старі).
-    - Якщо значення "-" -> видаляємо запис з БД.
-    - Якщо є значення -> оновлюємо або вставляємо.
+    Пакетна версія db_upsert_immobile: items = [(Immobile, visura_addr_id), ...].
+    Один multi-row INSERT ... ON CONFLICT (owner_cf, foglio, numero, sub) ... RETURNING.
+    Повертає ID у порядку items (для дублікатів — той самий ID, як і при послідовних викликах).
     """
-    
-    # Список всіх можливих ключів елементів, щоб нічого не пропустити
-    all_keys = (
-        ["a1", "a2"]
-        + [f"b{i}" for i in range(1, 6)]
-        + [f"c{i}" for i in range(1, 8)]
-        + [f"d{i}" for i in range(1, 14)]
-    )
+    if not items:
+        return []
 
-    with conn.cursor() as cur:
-        for key in all_keys:
-            # Отримуємо "сире" значення з YAML
-            raw_val = adapter.get(key)
+    params_list = [_immobile_params(owner_cf, imm, addr_id, source_visura_id) for imm, addr_id in items]
+    merged, mapping = merge_duplicate_immobile_params(params_list)
 
-            # 1. Якщо в YAML ключ пропущений — пропускаємо (зберігаємо те, що вже є в БД)
-            if raw_val is None:
-                continue
+    sql = """
+    INSERT INTO public.immobili (
+        owner_cf, source_visura_id, visura_address_id,
+        sez_urbana, foglio, numero, sub,
+        zona_cens, micro_zona, categoria, classe, consistenza, rendita,
+        superficie_totale, superficie_escluse, superficie_raw
+    )
+    SELECT * FROM unnest(""" + _IMMOBILE_UNNEST_ARGS + """)
+    """ + _IMMOBILE_UPSERT_SET + """
+    RETURNING id, foglio, numero, sub;
+    """
+    # Один масив на колонку — кількість параметрів не залежить від розміру пакета
+    columns = {col: [p[col] for p in merged] for col, _ in _IMMOBILE_INSERT_PARAMS}
 
-            val = str(raw_val).strip()
-            
-            # Парсимо групу і код (наприклад, key='d12' -> grp='D', code='12')
-            grp = key[0].upper()
-            code = key[1:]
-
-            # 2. Якщо значення "-", це команда на видалення
-            if val == "-":
-                cur.execute(
-                    """
-                    DELETE FROM public.immobile_elements 
-                    WHERE immobile_id = %s AND grp = %s AND code = %s
-                    """,
-                    (immobile_id, grp, code)
-                )
-            
-            # 3. Якщо є будь-яке інше значення (наприклад "X"), записуємо/оновлюємо
-            elif val:
-                cur.execute(
-                    """
-                    INSERT INTO public.immobile_elements (immobile_id, grp, code, value)
-                    VALUES (%s, %s, %s, %s)
-                    ON CONFLICT (immobile_id, grp, code) 
-                    DO UPDATE SET value = EXCLUDED.value
-                    """,
-                    (immobile_id, grp, code, val)
-                )
+    try:
+        with conn.cursor() as cur:
+            cur.execute(sql, columns)
+            rows = cur.fetchall()
+    except PsycopgError as e:
+        logger.error(f"[DB] Bulk immobili upsert failed for CF={owner_cf} ({len(merged)} rows): {e}")
+        raise
 
+    # RETURNING не гарантує порядок VALUES — зіставляємо за ключем
+    ids_by_key = {(foglio, numero, sub): imm_id for imm_id, foglio, numero, sub in rows}
+    merged_ids = [ids_by_key[(p["foglio"], p["numero"], p["sub"])] for p in merged]
+    return [merged_ids[pos] for pos in mapping]
 
 def db_update_immobile_real_address(
     conn, 
@@ -516,13 +715,14 @@ def db_update_immobile_real_address(
     """
     params.append(immobile_id)
 
-    with conn.cursor() as cur:
-        try:
+    # Транзакцією керує викликач: у process_item це SAVEPOINT immobile-а, rollback тут
+    # відкотив би весь item (і advisory lock власника)
+    try:
+        with conn.cursor() as cur:
             cur.execute(sql, params)
-        except psycopg2.Error as e:
-            logger.error(f"[DB] Помилка оновлення immobili: {e}")
-            conn.rollback()
-            raise
+    except PsycopgError as e:
+        logger.error(f"[DB] Помилка оновлення immobili {immobile_id}: {e}")
+        raise
 
 
 def db_load_immobili(conn, owner_cf: str) -> List[Tuple[int, Immobile]]:
@@ -557,7 +757,7 @@ def db_load_immobili(conn, owner_cf: str) -> List[Tuple[int, Immobile]]:
     ORDER BY i.foglio, i.numero, i.sub;
     """
     
-    with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+    with conn.cursor(row_factory=dict_row) as cur:
         cur.execute(sql, (owner_cf,))
         rows = cur.fetchall()
 
@@ -613,243 +813,245 @@ def db_prune_old_immobili_without_contracts(conn, owner_cf: str, keep_ids: List[
     if not enabled or not keep_ids:
         return 0
 
+    # Кількість видалених — через RETURNING: у pipeline mode rowcount відомий лише після sync
     with conn.cursor() as cur:
         cur.execute(
             """
-            DELETE FROM public.immobili i
-            WHERE i.owner_cf=%s
-              AND NOT (i.id = ANY(%s))
-              AND NOT EXISTS (
-                SELECT 1 FROM public.contracts c WHERE c.immobile_id = i.id
-              );
+            WITH deleted AS (
+              DELETE FROM public.immobili i
+              WHERE i.owner_cf=%s
+                AND NOT (i.id = ANY(%s::bigint[]))
+                AND NOT EXISTS (
+                  SELECT 1 FROM public.contracts c WHERE c.immobile_id = i.id
+                )
+              RETURNING 1
+            )
+            SELECT count(*) FROM deleted;
             """,
             (owner_cf, keep_ids),
         )
-        return cur.rowcount
+        return cur.fetchone()[0]
 
 
 # =========================================================
 # 5. IMMOBILE ELEMENTS (Details)
 # =========================================================
 
-def db_apply_immobile_elements(conn, immobile_id: int, adapter: ItemAdapter) -> None:
+def immobile_element_changes(adapter: ItemAdapter) -> Tuple[List[str], List[str], List[str]]:
+    """
+    Розбирає елементи A-D з YAML на (codes, values, delete_codes) у форматі code='A1'.
+    - ключ відсутній (None) або порожній -> не чіпаємо;
+    - "-" -> видалення;
+    - будь-яке інше значення -> upsert.
+    """
+    codes: List[str] = []
+    values: List[str] = []
+    delete_codes: List[str] = []
+    for key in ELEMENT_KEYS:
+        raw_val = adapter.get(key)
+        if raw_val is None:
+            continue
+
+        val = str(raw_val).strip()
+        if val == "-":
+            delete_codes.append(key.upper())
+        elif val:
+            codes.append(key.upper())
+            values.append(val)
+    return codes, values, delete_codes
+
+
+def db_upsert_immobile_elements(conn, immobile_id: int, adapter: ItemAdapter) -> None:
+    """
+    Розумне оновлення елементів A-D одним запитом.
+    - Якщо в адаптері ключ відсутній (None) -> дані в БД не чіпаємо (залишаються старі).
+    - Якщо значення "-" -> видаляємо запис з БД.
+    - Якщо є значення -> оновлюємо або вставляємо.
+
+    Код зберігається як 'A1' (grp='A'). Рядки старого формату (code='1') для всіх
+    зачеплених ключів прибираються тим самим DELETE, тож дублікатів після
+    normalize_element_key не лишається.
     """
-    Оновлює елементи A/B/C/D для immobile.
-    Якщо в YAML передано "-" - видаляє елемент.
+    codes, values, delete_codes = immobile_element_changes(adapter)
+    if not codes and not delete_codes:
+        return
+
+    # DELETE і INSERT зачіпають різні рядки (видалені "-" / старий формат vs нові коди),
+    # тому їх можна виконати одним statement через data-modifying CTE.
+    sql = """
+    WITH deleted AS (
+        DELETE FROM public.immobile_elements
+        WHERE immobile_id = %(immobile_id)s
+          AND (
+                code = ANY(%(delete_codes)s::text[])
+             OR grp || code = ANY(%(touched_codes)s::text[])
+          )
+    )
+    INSERT INTO public.immobile_elements (immobile_id, grp, code, value)
+    SELECT %(immobile_id)s, left(t.code, 1), t.code, t.value
+    FROM unnest(%(codes)s::text[], %(values)s::text[]) AS t(code, value)
+    ON CONFLICT (immobile_id, grp, code)
+    DO UPDATE SET value = EXCLUDED.value;
     """
+
     with conn.cursor() as cur:
-        for k in ELEMENT_KEYS:
-            raw = adapter.get(k)
-            # Якщо ключа немає в адаптері (None) - пропускаємо (не чіпаємо БД)
-            # Щоб видалити, треба явно передати "-"
-            if raw is None:
-                continue
-                
-            val = str(raw).strip()
-            if val == "":
-                continue # Порожній рядок теж ігноруємо
-
-            grp = k[0].upper()
-            code = k.upper()
-
-            if val == "-":
-                cur.execute(
-                    "DELETE FROM public.immobile_elements WHERE immobile_id=%s AND grp=%s AND code=%s;",
-                    (immobile_id, grp, code),
-                )
-            else:
-                cur.execute(
-                    """
-                    INSERT INTO public.immobile_elements (immobile_id, grp, code, value)
-                    VALUES (%s, %s, %s, %s)
-                    ON CONFLICT (immobile_id, grp, code) DO UPDATE
-                    SET value = EXCLUDED.value;
-                    """,
-                    (immobile_id, grp, code, val),
-                )
+        cur.execute(sql, {
+            "immobile_id": immobile_id,
+            "delete_codes": delete_codes,
+            "touched_codes": codes + delete_codes,
+            "codes": codes,
+            "values": values,
+        })
 
 
 # =========================================================
 # 6. CONTRACTS (Updated)
 # =========================================================
 
-def db_upsert_contract(conn, immobile_id: int, adapter: ItemAdapter) -> str:
+CONTRACT_KINDS = ("CONCORDATO", "TRANSITORIO", "STUDENTI")
+DEFAULT_CONTRACT_KIND = "CONCORDATO"
+DEFAULT_DURATA_ANNI = 3
+
+# Поля контракту зі Smart Patch: (колонка, параметр, SQL-тип, є дефолт).
+# Значення = COALESCE(YAML, значення в БД, дефолт); "-" у YAML Python замінює на дефолт,
+# тож старе значення з БД ігнорується. Колонки без дефолту просто лишаються старими.
+CONTRACT_PATCH_FIELDS: Tuple[Tuple[str, str, str, bool], ...] = (
+    ("conduttore_cf", "cond_cf", "text", False),
+    ("start_date", "start_date", "date", True),
+    ("durata_anni", "durata", "integer", True),
+    ("decorrenza_data", "decorrenza", "date", False),
+    ("registrazione_data", "reg_data", "date", False),
+    ("registrazione_num", "reg_num", "text", False),
+    ("agenzia_entrate_sede", "ae_sede", "text", False),
+    ("canone_contrattuale_mensile", "canone", "numeric", False),
+    ("istat_rate", "istat", "numeric", True),
+    ("arredato_pct", "arredato", "numeric", True),
+    ("ignore_surcharges", "ignore_surcharges", "boolean", True),
+)
+
+
+def _patch_input(raw: Any, parse, deleted: Any) -> Any:
+    """YAML-сторона Smart Patch: "-" -> deleted (дефолт), порожньо -> None (лишити з БД), інакше parse(raw)."""
+    s_val = str(raw).strip() if raw is not None else ""
+    if s_val == "-":
+        return deleted
+    if s_val == "":
+        return None
+    return parse(raw)
+
+
+def contract_patch_params(adapter: ItemAdapter, today: Optional[date] = None) -> Dict[str, Any]:
     """
-    Створює або оновлює контракт з урахуванням логіки:
-    - CONTRACT_KIND: Reset to Default/YAML (no DB history).
-    - ARREDATO, DURATA, ISTAT: Patch (YAML > DB > Delete via "-").
-    - IGNORE_SURCHARGES: Patch logic.
+    Параметри для db_upsert_contract: YAML-значення (None = взяти з БД) та дефолти
+    (<param>_default), які застосовуються, коли немає ні YAML, ні значення в БД.
     """
-    
-    # 1. Отримуємо поточний стан з бази (якщо є), щоб знати "старі" значення
-    old_contract = {}
-    with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
-        cur.execute(
-            """
-            SELECT id, 
-                   contract_kind, durata_anni, arredato_pct, istat_rate, ignore_surcharges,
-                   start_date, decorrenza_data, registrazione_data, 
-                   registrazione_num, agenzia_entrate_sede, canone_contrattuale_mensile,
-                   conduttore_cf
-            FROM public.contracts 
-            WHERE immobile_id = %s 
-            ORDER BY created_at DESC LIMIT 1
-            """, 
-            (immobile_id,)
-        )
-        row = cur.fetchone()
-        if row:
-            old_contract = dict(row)
+    # CONTRACT_KIND (RESET LOGIC): не дивимось у БД. Або YAML, або CONCORDATO.
+    kind = (clean_str(adapter.get("contract_kind")) or DEFAULT_CONTRACT_KIND).upper()
+    if kind not in CONTRACT_KINDS:
+        logger.warning(f"[DB] Unknown contract kind '{kind}', defaulting to {DEFAULT_CONTRACT_KIND}")
+        kind = DEFAULT_CONTRACT_KIND
+
+    return {
+        "kind": kind,
+        "cond_cf": clean_str(adapter.get("conduttore_cf")),
+        # Якщо дати старту немає ні в YAML, ні в БД -> сьогодні
+        "start_date": parse_date(adapter.get("contratto_data")),
+        "start_date_default": today or date.today(),
+        "durata": _patch_input(adapter.get("durata_anni"), int, DEFAULT_DURATA_ANNI),
+        "durata_default": DEFAULT_DURATA_ANNI,
+        "decorrenza": parse_date(adapter.get("decorrenza_data")),
+        "reg_data": parse_date(adapter.get("registrazione_data")),
+        "reg_num": clean_str(adapter.get("registrazione_num")),
+        "ae_sede": clean_str(adapter.get("agenzia_entrate_sede")),
+        "canone": safe_float(adapter.get("canone_contrattuale_mensile")) or None,
+        "istat": _patch_input(adapter.get("istat"), lambda v: safe_float(v) or 0.0, 0.0),
+        "istat_default": 0.0,
+        "arredato": _patch_input(adapter.get("arredato"), lambda v: safe_float(v) or 0.0, 0.0),
+        "arredato_default": 0.0,
+        "ignore_surcharges": _patch_input(
+            adapter.get("ignore_surcharges"), lambda v: str(v).lower() in ("true", "1", "yes", "y"), False
+        ),
+        "ignore_surcharges_default": False,
+    }
 
-    contract_id = old_contract.get("id")
 
-    # 2. Підготовка нових значень
-    
-    # --- A. CONTRACT_KIND (RESET LOGIC) ---
-    # Не дивимось в old_contract. Або YAML, або CONCORDATO.
-    kind_raw = clean_str(adapter.get("contract_kind"))
-    new_kind = (kind_raw or "CONCORDATO").upper()
-    if new_kind not in ['CONCORDATO', 'TRANSITORIO', 'STUDENTI']:
-        logger.warning(f"[DB] Unknown contract kind '{new_kind}', defaulting to CONCORDATO")
-        new_kind = 'CONCORDATO'
-
-    # --- B. ARREDATO (SMART PATCH) ---
-    # YAML "-" -> 0.0 (видалено/пусто). YAML value -> float. YAML empty -> Old DB val.
-    raw_arredato = adapter.get("arredato")
-    old_arredato = float(old_contract.get("arredato_pct") or 0.0)
-    
-    if str(raw_arredato).strip() == "-":
-        new_arredato = 0.0
-    elif raw_arredato is not None and str(raw_arredato).strip() != "":
-        new_arredato = safe_float(raw_arredato) or 0.0
-    else:
-        new_arredato = old_arredato
-
-    # --- C. DURATA_ANNI (SMART PATCH) ---
-    raw_durata = adapter.get("durata_anni")
-    old_durata = old_contract.get("durata_anni") # int or None
-    
-    if str(raw_durata).strip() == "-":
-        new_durata = None # NULL в базі
-    elif raw_durata is not None and str(raw_durata).strip() != "":
-        new_durata = int(raw_durata)
-    else:
-        new_durata = old_durata
-        
-    # Default fallback, якщо і в базі було пусто, і в YAML пусто -> 3 роки (стандарт)
-    if new_durata is None:
-        new_durata = 3
+def _contract_patch_expr(param: str, sql_type: str, has_default: bool, db_column: Optional[str]) -> str:
+    parts = [f"%({param})s::{sql_type}"]
+    if db_column:
+        parts.append(db_column)
+    if has_default:
+        parts.append(f"%({param}_default)s::{sql_type}")
+    return parts[0] if len(parts) == 1 else f"COALESCE({', '.join(parts)})"
 
-    # --- D. ISTAT (SMART PATCH) ---
-    raw_istat = adapter.get("istat")
-    old_istat = float(old_contract.get("istat_rate") or 0.0)
-    
-    if str(raw_istat).strip() == "-":
-        new_istat = 0.0
-    elif raw_istat is not None and str(raw_istat).strip() != "":
-        new_istat = safe_float(raw_istat) or 0.0
-    else:
-        new_istat = old_istat
-
-    # --- E. IGNORE_SURCHARGES (SMART PATCH) ---
-    # Читаємо з extra або як окреме поле, якщо ви його додали в маппер
-    # Припускаємо, що воно є в adapter (потрібно додати в item_mapper.py, див. нижче)
-    raw_ignore = adapter.get("ignore_surcharges")
-    old_ignore = bool(old_contract.get("ignore_surcharges")) if old_contract else False
-    
-    if str(raw_ignore).strip() == "-":
-        new_ignore = False
-    elif raw_ignore is not None and str(raw_ignore).strip() != "":
-        # Парсинг булевого значення
-        s = str(raw_ignore).lower()
-        new_ignore = s in ("true", "1", "yes", "y")
-    else:
-        new_ignore = old_ignore
-
-    # --- F. Інші поля (Дата, CF і т.д.) ---
-    # Для них залишаємо логіку COALESCE в SQL або патчимо тут.
-    # Для чистоти коду простіше підготувати повний словник params і зробити простий UPDATE/INSERT.
-    
-    cond_cf = clean_str(adapter.get("conduttore_cf")) or old_contract.get("conduttore_cf")
-    
-    # Дати: Якщо в YAML пусто -> беремо старе
-    start_date = parse_date(adapter.get("contratto_data")) or old_contract.get("start_date")
-    decorrenza = parse_date(adapter.get("decorrenza_data")) or old_contract.get("decorrenza_data")
-    reg_data = parse_date(adapter.get("registrazione_data")) or old_contract.get("registrazione_data")
-    
-    reg_num = clean_str(adapter.get("registrazione_num")) or old_contract.get("registrazione_num")
-    ae_sede = clean_str(adapter.get("agenzia_entrate_sede")) or old_contract.get("agenzia_entrate_sede")
-    canone_val = safe_float(adapter.get("canone_contrattuale_mensile")) or old_contract.get("canone_contrattuale_mensile")
 
-    # Якщо start_date все ще None -> сьогодні
-    if not start_date:
-        from datetime import date
-        start_date = date.today()
+def _build_upsert_contract_sql() -> str:
+    update_set = ",\n            ".join(
+        f"{column} = {_contract_patch_expr(param, sql_type, has_default, f'c.{column}')}"
+        for column, param, sql_type, has_default in CONTRACT_PATCH_FIELDS
+    )
+    insert_cols = ", ".join(column for column, _, _, _ in CONTRACT_PATCH_FIELDS)
+    insert_vals = ",\n               ".join(
+        _contract_patch_expr(param, sql_type, has_default, None)
+        for _, param, sql_type, has_default in CONTRACT_PATCH_FIELDS
+    )
+    # latest — останній контракт immobile; UPDATE блокує його рядок, тож паралельний
+    # патч того самого контракту бачить уже закомічені значення (COALESCE з c.*).
+    return f"""
+    WITH latest AS (
+        SELECT id
+        FROM public.contracts
+        WHERE immobile_id = %(immobile_id)s
+        ORDER BY created_at DESC
+        LIMIT 1
+    ),
+    updated AS (
+        UPDATE public.contracts c SET
+            contract_kind = %(kind)s::contract_type,
+            {update_set},
+            updated_at = now()
+        FROM latest
+        WHERE c.id = latest.id
+        RETURNING c.id
+    ),
+    inserted AS (
+        INSERT INTO public.contracts (immobile_id, contract_kind, {insert_cols})
+        SELECT %(immobile_id)s, %(kind)s::contract_type,
+               {insert_vals}
+        WHERE NOT EXISTS (SELECT 1 FROM latest)
+        RETURNING id
+    )
+    SELECT id FROM updated
+    UNION ALL
+    SELECT id FROM inserted;
+    """
 
-    params = {
-        "immobile_id": immobile_id,
-        "cond_cf": cond_cf,
-        "kind": new_kind,
-        "start_date": start_date,
-        "durata": new_durata,
-        "decorrenza": decorrenza,
-        "reg_data": reg_data,
-        "reg_num": reg_num,
-        "ae_sede": ae_sede,
-        "canone": canone_val,
-        "istat": new_istat,
-        "arredato": new_arredato,
-        "ignore_surcharges": new_ignore
-    }
+
+UPSERT_CONTRACT_SQL = _build_upsert_contract_sql()
+
+
+def db_upsert_contract(conn, immobile_id: int, adapter: ItemAdapter) -> str:
+    """
+    Створює або оновлює останній контракт immobile одним запитом:
+    - CONTRACT_KIND: Reset to Default/YAML (no DB history).
+    - ARREDATO, DURATA, ISTAT, IGNORE_SURCHARGES: Patch (YAML > DB > Delete via "-" -> дефолт).
+    - Дати, conduttore, реєстрація, canone: YAML > DB.
+    """
+    params = {**contract_patch_params(adapter), "immobile_id": immobile_id}
 
     with conn.cursor() as cur:
-        if not contract_id:
-            # INSERT
-            sql = """
-            INSERT INTO public.contracts (
-                immobile_id, conduttore_cf, contract_kind, start_date, durata_anni,
-                decorrenza_data, registrazione_data, registrazione_num, agenzia_entrate_sede,
-                canone_contrattuale_mensile, istat_rate, arredato_pct, ignore_surcharges
-            ) VALUES (
-                %(immobile_id)s, %(cond_cf)s, %(kind)s, %(start_date)s, %(durata)s,
-                %(decorrenza)s, %(reg_data)s, %(reg_num)s, %(ae_sede)s,
-                %(canone)s, %(istat)s, %(arredato)s, %(ignore_surcharges)s
-            ) RETURNING id;
-            """
-            cur.execute(sql, params)
-            contract_id = cur.fetchone()[0]
-        else:
-            # UPDATE
-            # Ми вже вирішили всі конфлікти YAML/DB на рівні Python змінних,
-            # тому просто записуємо params.
-            sql = """
-            UPDATE public.contracts SET
-                conduttore_cf = %(cond_cf)s,
-                contract_kind = %(kind)s,
-                start_date    = %(start_date)s,
-                durata_anni   = %(durata)s,
-                
-                decorrenza_data      = %(decorrenza)s,
-                registrazione_data   = %(reg_data)s,
-                registrazione_num    = %(reg_num)s,
-                agenzia_entrate_sede = %(ae_sede)s,
-                
-                canone_contrattuale_mensile = %(canone)s,
-                istat_rate    = %(istat)s,
-                arredato_pct  = %(arredato)s,
-                ignore_surcharges = %(ignore_surcharges)s,
-                
-                updated_at = now()
-            WHERE id = %(id)s;
-            """
-            cur.execute(sql, {**params, "id": contract_id})
-            
-        return str(contract_id)
+        cur.execute(UPSERT_CONTRACT_SQL, params)
+        row = cur.fetchone()
+    if not row:
+        # Останній контракт видалили між SELECT і UPDATE всередині запиту
+        raise RuntimeError(f"Contract upsert for immobile {immobile_id} returned no row")
+    return str(row[0])
 
 
 def db_load_contract_context(conn, contract_id: str) -> Dict[str, Any]:
     """
     Завантажує повний контекст контракту для генерації документа.
+    Один запит: контракт + сторони + адреси, елементи A-D (json_object_agg)
+    та останній розрахунок канону (LATERAL ... LIMIT 1).
     """
     ctx: Dict[str, Any] = {
             "contract": {},
@@ -860,7 +1062,7 @@ def db_load_contract_context(conn, contract_id: str) -> Dict[str, Any]:
             "immobile": {}, 
         }
 
-    with conn.cursor(cursor_factory=psycopg2.extras.DictCursor) as cur:
+    with conn.cursor(row_factory=dict_row) as cur:
         sql_contract = """
         SELECT 
             c.*,
@@ -878,7 +1080,12 @@ def db_load_contract_context(conn, contract_id: str) -> Dict[str, Any]:
             COALESCE(ra.civico, va.civico) as imm_civico,
             COALESCE(ra.piano, va.piano) as imm_piano,
             COALESCE(ra.interno, va.interno) as imm_interno,
-            i.energy_class as imm_energy_class 
+            i.energy_class as imm_energy_class,
+
+            -- Елементи A-D: {"grp|code": value}, ключі нормалізуються в Python
+            el.elements as ctx_elements,
+            -- Останній розрахунок канону
+            lc.inputs as ctx_canone_inputs
             
         FROM public.contracts c
         JOIN public.immobili i ON c.immobile_id = i.id
@@ -890,6 +1097,20 @@ def db_load_contract_context(conn, contract_id: str) -> Dict[str, Any]:
         
         LEFT JOIN public.addresses va ON i.visura_address_id = va.id
         LEFT JOIN public.addresses ra ON i.real_address_id = ra.id
+
+        LEFT JOIN LATERAL (
+            SELECT json_object_agg(e.grp || '|' || e.code, e.value) AS elements
+            FROM public.immobile_elements e
+            WHERE e.immobile_id = i.id
+        ) el ON TRUE
+
+        LEFT JOIN LATERAL (
+            SELECT cc.inputs
+            FROM public.canone_calcoli cc
+            WHERE cc.contract_id = c.id
+            ORDER BY cc.calculated_at DESC
+            LIMIT 1
+        ) lc ON TRUE
         
         WHERE c.id = %s;
         """
@@ -897,7 +1118,10 @@ def db_load_contract_context(conn, contract_id: str) -> Dict[str, Any]:
         row = cur.fetchone()
         
         if row:
-            ctx["contract"] = dict(row)
+            contract = dict(row)
+            raw_elements = contract.pop("ctx_elements", None) or {}
+            canone_inputs = contract.pop("ctx_canone_inputs", None)
+            ctx["contract"] = contract
 
             # Спеціальна секція immobile для генератора та процесора
             ctx["immobile"] = {
@@ -923,39 +1147,20 @@ def db_load_contract_context(conn, contract_id: str) -> Dict[str, Any]:
                     "cf": row["cond_cf"], "name": row["cond_name"], "surname": row["cond_surname"],
                     "comune": row["cond_comune"], "via": row["cond_via"]
                 }
-                
-            immobile_id = row["immobile_id"]
 
-            # Завантаження елементів
-            cur.execute(
-                "SELECT grp, code, value FROM public.immobile_elements WHERE immobile_id=%s;",
-                (immobile_id,),
-            )
+            # Елементи
             elements: Dict[str, str] = {}
-            for grp, code, value in cur.fetchall():
-                key = normalize_element_key(str(grp or ""), str(code or ""))
+            for grp_code, value in raw_elements.items():
+                grp, _, code = grp_code.partition("|")
+                key = normalize_element_key(grp, code)
                 if not key:
                     continue
                 elements[key] = "" if value is None else str(value)
             ctx["elements"] = elements
 
-        # Останній розрахунок канону
-        cur.execute(
-            """
-            SELECT inputs::text
-            FROM public.canone_calcoli
-            WHERE contract_id=%s
-            ORDER BY calculated_at DESC
-            LIMIT 1;
-            """,
-            (contract_id,),
-        )
-        r = cur.fetchone()
-        if r and r[0]:
-            try:
-                ctx["canone_calc"] = json.loads(r[0])
-            except Exception:
-                ctx["canone_calc"] = None
+            # Останній розрахунок канону (JSONB psycopg вже повертає як dict)
+            if canone_inputs:
+                ctx["canone_calc"] = canone_inputs
 
     return ctx
 
@@ -987,10 +1192,38 @@ def db_insert_canone_calc(
             VALUES (%s, %s, %s, %s, %s)
             ON CONFLICT (contract_id, calculated_at) DO NOTHING;
             """,
-            (contract_id, psycopg2.extras.Json(inputs), min_val, max_val, result_mensile),
+            (contract_id, Jsonb(inputs), min_val, max_val, result_mensile),
         )
 
 
+INSERT_ATTESTAZIONE_SQL = """
+WITH snap AS (
+    SELECT encode(sha256(convert_to(d::text, 'UTF8')), 'hex') AS hash, d AS data, octet_length(d::text) AS size_bytes
+    FROM (SELECT %(snapshot)s::jsonb AS d) s
+), stored AS (
+    INSERT INTO public.attestazione_snapshots (hash, data, size_bytes)
+    SELECT hash, data, size_bytes FROM snap
+    ON CONFLICT (hash) DO NOTHING
+)
+INSERT INTO public.attestazioni (
+  contract_id,
+  output_bucket,
+  output_object,
+  snapshot_hash,
+  author_hash,
+  author_masked,
+  template_version,
+  error,
+  status,
+  input_fingerprint
+)
+SELECT %(contract_id)s::uuid, %(output_bucket)s::text, %(output_object)s::text, snap.hash,
+       %(author_hash)s::text, %(author_masked)s::text, %(template_version)s::text, %(error)s::text, %(status)s::text,
+       %(input_fingerprint)s::text
+FROM snap;
+"""
+
+
 def db_insert_attestazione_log(
     conn,
     contract_id: str,
@@ -1002,37 +1235,294 @@ def db_insert_attestazione_log(
     author_login_masked: str,
     author_login_sha256: str,
     template_version: str,
+    input_fingerprint: Optional[str] = None,
 ) -> None:
     """
     Логує факт генерації атестації.
+
+    Знімок параметрів зберігається один раз в attestazione_snapshots (ключ — sha256
+    канонічного jsonb::text, рахується на сервері), а attestazioni отримує лише посилання
+    snapshot_hash. Повторна генерація незміненого контракту додає тільки малий рядок.
+    input_fingerprint — відбиток входу шаблону (див. db_last_attestazione_fingerprint).
     """
-    # Додаємо метадані про автора та помилку в snapshot, бо в новій схемі немає окремих полів для цього
-    full_snapshot = params_snapshot.copy()
-    full_snapshot.update({
-        "error": error,
-        "author_masked": author_login_masked,
-        "template_version": template_version
-    })
+    with conn.cursor() as cur:
+        cur.execute(
+            INSERT_ATTESTAZIONE_SQL,
+            {
+                "contract_id": contract_id,
+                "output_bucket": output_bucket,
+                "output_object": output_object,
+                "snapshot": Jsonb(params_snapshot),
+                "author_hash": author_login_sha256,
+                "author_masked": author_login_masked,
+                "template_version": template_version,
+                "error": error,
+                "status": status,
+                "input_fingerprint": input_fingerprint,
+            },
+        )
 
+
+def db_last_attestazione_fingerprint(conn, contract_id: str) -> Optional[str]:
+    """Відбиток входу останньої успішної (generated) атестації контракту; None — такої немає."""
     with conn.cursor() as cur:
         cur.execute(
             """
-            INSERT INTO public.attestazioni (
-              contract_id,
-              output_bucket,
-              output_object,
-              full_data_snapshot,
-              author_hash,
-              status
-            )
-            VALUES (%s, %s, %s, %s, %s, %s);
+            SELECT input_fingerprint
+            FROM public.attestazioni
+            WHERE contract_id = %s AND status = 'generated'
+            ORDER BY generated_at DESC
+            LIMIT 1;
+            """,
+            (contract_id,),
+        )
+        row = cur.fetchone()
+    return row[0] if row else None
+
+
+def db_insert_run_ledger(conn, spider: str, started_at: datetime, items: int, stats: Dict[str, Any]) -> None:
+    """Записує підсумок прогону павука в run_ledger (метрики пулу, identity map, запитів)."""
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO public.run_ledger (spider, started_at, items, stats)
+            VALUES (%s, %s, %s, %s);
+            """,
+            (spider, started_at, items, Jsonb(stats)),
+        )
+
+
+# ---------------------------------------------------------
+# Advisory lock на власника (див. uppi/services/owner_lock.py)
+# ---------------------------------------------------------
+
+# Простір ключів для pg_advisory_xact_lock(int, int): окремо від MIGRATIONS_LOCK_KEY (bigint-форма)
+OWNER_LOCK_NAMESPACE = 7_310_002
+
+
+def db_try_lock_owner(conn, cf: str) -> bool:
+    """pg_try_advisory_xact_lock на CF: True — lock взято одразу."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_try_advisory_xact_lock(%s, hashtext(%s));", (OWNER_LOCK_NAMESPACE, cf))
+        return bool(cur.fetchone()[0])
+
+
+def db_lock_owner(conn, cf: str, timeout_ms: int) -> None:
+    """
+    Чекає на advisory lock CF не довше timeout_ms (інакше psycopg.errors.LockNotAvailable).
+    lock_timeout виставляється на час цього запиту і повертається до попереднього значення.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT current_setting('lock_timeout');")
+        prev_timeout = cur.fetchone()[0]
+        cur.execute("SELECT set_config('lock_timeout', %s, true);", (f"{int(timeout_ms)}ms",))
+        cur.execute("SELECT pg_advisory_xact_lock(%s, hashtext(%s));", (OWNER_LOCK_NAMESPACE, cf))
+        # fetch — точка синхронізації в pipeline mode: lock взято до наступних запитів item-а
+        cur.fetchone()
+        cur.execute("SELECT set_config('lock_timeout', %s, true);", (prev_timeout,))
+
+
+# ---------------------------------------------------------
+# Черга задач (jobs, міграція 0006; див. uppi/services/jobs.py)
+# ---------------------------------------------------------
+
+@dataclass
+class JobRow:
+    id: int
+    kind: str
+    idempotency_key: str
+    payload: Dict[str, Any]
+    # Номер спроби — fencing token для complete / fail
+    attempts: int
+    max_attempts: int
+
+
+_JOB_COLUMNS = "id, kind, idempotency_key, payload, attempts, max_attempts"
+
+LEASE_JOBS_SQL = f"""
+UPDATE public.jobs j
+SET status = 'running',
+    attempts = j.attempts + 1,
+    leased_by = %(worker)s,
+    run_after = now() + make_interval(secs => %(visibility_sec)s),
+    updated_at = now()
+FROM (
+  SELECT id
+  FROM public.jobs
+  WHERE kind = %(kind)s
+    AND status IN ('queued', 'running')
+    AND run_after <= now()
+    AND attempts < max_attempts
+  ORDER BY run_after, id
+  LIMIT %(limit)s
+  FOR UPDATE SKIP LOCKED
+) next
+WHERE j.id = next.id
+RETURNING {", ".join(f"j.{c}" for c in _JOB_COLUMNS.split(", "))};
+"""
+
+
+def _job_from_row(row) -> JobRow:
+    return JobRow(*row)
+
+
+def db_enqueue_job(
+    conn, kind: str, idempotency_key: str, payload: Dict[str, Any], max_attempts: int, delay_sec: float = 0.0
+) -> Optional[int]:
+    """Додає задачу. None — задача з таким (kind, idempotency_key) вже є (нову не створено)."""
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            INSERT INTO public.jobs (kind, idempotency_key, payload, max_attempts, run_after)
+            VALUES (%s, %s, %s, %s, now() + make_interval(secs => %s))
+            ON CONFLICT (kind, idempotency_key) DO NOTHING
+            RETURNING id;
             """,
-            (
-                contract_id,
-                output_bucket,
-                output_object,
-                psycopg2.extras.Json(full_snapshot),
-                author_login_sha256,
-                status,
-            ),
-        )
\ No newline at end of file
+            (kind, idempotency_key, Jsonb(payload), max_attempts, float(delay_sec)),
+        )
+        row = cur.fetchone()
+    return row[0] if row else None
+
+
+def db_lease_jobs(conn, kind: str, worker: str, limit: int, visibility_sec: float) -> List[JobRow]:
+    """Бере до limit готових задач kind (SKIP LOCKED) і ховає їх від інших воркерів на visibility_sec."""
+    with conn.cursor() as cur:
+        cur.execute(
+            LEASE_JOBS_SQL,
+            {"kind": kind, "worker": worker, "limit": limit, "visibility_sec": float(visibility_sec)},
+        )
+        return [_job_from_row(r) for r in cur.fetchall()]
+
+
+async def fetch_leased_jobs_async(aconn, kind: str, worker: str, limit: int, visibility_sec: float) -> List[JobRow]:
+    """Асинхронний db_lease_jobs — для start() павука (не блокує asyncio-реактор)."""
+    async with aconn.cursor() as cur:
+        await cur.execute(
+            LEASE_JOBS_SQL,
+            {"kind": kind, "worker": worker, "limit": limit, "visibility_sec": float(visibility_sec)},
+        )
+        return [_job_from_row(r) for r in await cur.fetchall()]
+
+
+EXTEND_JOB_LEASE_SQL = """
+UPDATE public.jobs
+SET run_after = now() + make_interval(secs => %s), updated_at = now()
+WHERE id = %s AND attempts = %s AND status = 'running'
+RETURNING id;
+"""
+
+# Повертає взяту, але не розпочату задачу в чергу разом зі спробою (attempts - 1)
+RELEASE_JOB_SQL = """
+UPDATE public.jobs
+SET status = 'queued', attempts = attempts - 1, leased_by = NULL, run_after = now(), updated_at = now()
+WHERE id = %s AND attempts = %s AND status = 'running'
+RETURNING id;
+"""
+
+
+def db_extend_job_lease(conn, job_id: int, attempt: int, visibility_sec: float) -> bool:
+    """Продовжує lease довгої задачі. False — lease уже втрачено (задачу взяв інший воркер)."""
+    with conn.cursor() as cur:
+        cur.execute(EXTEND_JOB_LEASE_SQL, (float(visibility_sec), job_id, attempt))
+        return cur.fetchone() is not None
+
+
+async def extend_job_lease_async(aconn, job_id: int, attempt: int, visibility_sec: float) -> bool:
+    """Асинхронний db_extend_job_lease — для павука."""
+    async with aconn.cursor() as cur:
+        await cur.execute(EXTEND_JOB_LEASE_SQL, (float(visibility_sec), job_id, attempt))
+        return await cur.fetchone() is not None
+
+
+def db_release_job(conn, job_id: int, attempt: int) -> bool:
+    """Віддає задачу назад у чергу, не витрачаючи спробу. False — lease уже втрачено."""
+    with conn.cursor() as cur:
+        cur.execute(RELEASE_JOB_SQL, (job_id, attempt))
+        return cur.fetchone() is not None
+
+
+async def release_job_async(aconn, job_id: int, attempt: int) -> bool:
+    """Асинхронний db_release_job — для павука."""
+    async with aconn.cursor() as cur:
+        await cur.execute(RELEASE_JOB_SQL, (job_id, attempt))
+        return await cur.fetchone() is not None
+
+
+def db_complete_job(conn, job_id: int, attempt: int, result: Optional[Dict[str, Any]]) -> bool:
+    """Позначає задачу виконаною. False — lease застарів (результат не записано)."""
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            UPDATE public.jobs
+            SET status = 'done', result = %s, last_error = NULL, finished_at = now(), updated_at = now()
+            WHERE id = %s AND attempts = %s AND status = 'running'
+            RETURNING id;
+            """,
+            (Jsonb(result) if result is not None else None, job_id, attempt),
+        )
+        return cur.fetchone() is not None
+
+
+def db_fail_job(conn, job_id: int, attempt: int, error: str, retry_delay_sec: Optional[float]) -> bool:
+    """
+    Помилка спроби: retry_delay_sec — повернути в чергу через стільки секунд,
+    None — остаточно failed. False — lease застарів.
+    """
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            UPDATE public.jobs
+            SET status = CASE WHEN %(retry)s THEN 'queued' ELSE 'failed' END,
+                run_after = CASE WHEN %(retry)s THEN now() + make_interval(secs => %(delay)s) ELSE run_after END,
+                finished_at = CASE WHEN %(retry)s THEN NULL ELSE now() END,
+                last_error = %(error)s,
+                updated_at = now()
+            WHERE id = %(id)s AND attempts = %(attempt)s AND status = 'running'
+            RETURNING id;
+            """,
+            {
+                "retry": retry_delay_sec is not None,
+                "delay": float(retry_delay_sec or 0.0),
+                "error": error,
+                "id": job_id,
+                "attempt": attempt,
+            },
+        )
+        return cur.fetchone() is not None
+
+
+def db_fail_expired_jobs(conn, kind: str) -> int:
+    """Задачі, чий lease прострочено на останній спробі (воркер помер), — остаточно failed."""
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            UPDATE public.jobs
+            SET status = 'failed', last_error = COALESCE(last_error, 'lease expired'),
+                finished_at = now(), updated_at = now()
+            WHERE kind = %s AND status IN ('queued', 'running') AND run_after <= now()
+              AND attempts >= max_attempts;
+            """,
+            (kind,),
+        )
+        return max(cur.rowcount, 0)
+
+
+def db_job_counts(conn) -> Dict[Tuple[str, str], int]:
+    """Кількість задач по (kind, status)."""
+    with conn.cursor() as cur:
+        cur.execute("SELECT kind, status, count(*) FROM public.jobs GROUP BY kind, status;")
+        return {(kind, status): n for kind, status, n in cur.fetchall()}
+
+
+def db_count_ready_jobs(conn, kind: str) -> int:
+    """Скільки задач kind зараз можна взяти в lease."""
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT count(*) FROM public.jobs
+            WHERE kind = %s AND status IN ('queued', 'running') AND run_after <= now()
+              AND attempts < max_attempts;
+            """,
+            (kind,),
+        )
+        return cur.fetchone()[0]
@@ -0,0 +1,159 @@
+# uppi/services/identity_map.py
+"""
+Identity map на час запуску (один VisuraProcessor = один прогін павука).
+
+Ті самі locatore / conduttore та адреси upsert-яться знову і знову: db_upsert_person
+до трьох разів на item для того самого CF, db_upsert_address — для кожного YAML
+з тією ж адресою. Карта пам'ятає, що вже записано в цьому прогоні, і db_repo
+пропускає запис, якщо payload не змінився:
+
+- адреси — за content_hash, порахованим у Python тим самим виразом, що й
+  generated column addresses.content_hash (ON CONFLICT адресу не змінює,
+  тож збіг хешу = той самий ID без запиту);
+- персони — за CF; COALESCE-семантика upsert-а означає, що запис нічого
+  не змінить, якщо кожне не-None поле збігається з уже записаним.
+
+Записи з поточної транзакції тримаються окремо і стають видимими для наступних
+items лише після commit() — після rollback-у їх ID у БД не існують. Так само
+savepoint() / rollback_to(): ROLLBACK TO SAVEPOINT скасовує лише записи після позначки.
+"""
+from __future__ import annotations
+
+import hashlib
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional, Tuple
+
+# PostgreSQL \s (regexp_replace у content_hash) — ASCII-пробільні символи
+_PG_WHITESPACE_REGEX = re.compile(r"[ \t\n\r\f\v]+")
+
+# (surname, name, residence_address_id)
+PersonState = Tuple[Optional[str], Optional[str], Optional[int]]
+
+# Стан незакомічених записів на момент SAVEPOINT: (адреси, персони)
+SavepointMark = Tuple[Dict[str, int], Dict[str, PersonState]]
+
+
+def _pg_upper(s: str) -> str:
+    # upper() у PostgreSQL змінює регістр посимвольно; Python розкладає деякі літери
+    # на кілька ('ß' -> 'SS'), і тоді хеші розійшлися б. Такі символи лишаємо як є.
+    return "".join(u if len(u := c.upper()) == 1 else c for c in s)
+
+
+def _pg_trim(s: str) -> str:
+    # trim() у PostgreSQL прибирає лише пробіли
+    return s.strip(" ")
+
+
+def address_content_hash(comune: str, via_full: str, civico: Optional[str]) -> str:
+    """Python-версія addresses.content_hash (див. migrations/0001_baseline.sql)."""
+    raw = "|".join((
+        _pg_upper(_pg_trim(comune)),
+        _pg_upper(_pg_trim(_PG_WHITESPACE_REGEX.sub(" ", via_full))),
+        _pg_upper(_pg_trim(civico if civico is not None else "SNC")),
+    ))
+    return hashlib.md5(raw.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class IdentityMapStats:
+    address_hits: int = 0
+    address_misses: int = 0
+    person_hits: int = 0
+    person_misses: int = 0
+    # Python-хеш не збігся з content_hash з БД — адреса не кешується
+    hash_mismatches: int = 0
+
+    @staticmethod
+    def _rate(hits: int, misses: int) -> float:
+        total = hits + misses
+        return round(hits / total, 4) if total else 0.0
+
+    @property
+    def address_hit_rate(self) -> float:
+        return self._rate(self.address_hits, self.address_misses)
+
+    @property
+    def person_hit_rate(self) -> float:
+        return self._rate(self.person_hits, self.person_misses)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "address_hits": self.address_hits,
+            "address_misses": self.address_misses,
+            "address_hit_rate": self.address_hit_rate,
+            "person_hits": self.person_hits,
+            "person_misses": self.person_misses,
+            "person_hit_rate": self.person_hit_rate,
+            "hash_mismatches": self.hash_mismatches,
+        }
+
+
+@dataclass
+class IdentityMap:
+    stats: IdentityMapStats = field(default_factory=IdentityMapStats)
+    _addresses: Dict[str, int] = field(default_factory=dict)
+    _persons: Dict[str, PersonState] = field(default_factory=dict)
+    _pending_addresses: Dict[str, int] = field(default_factory=dict)
+    _pending_persons: Dict[str, PersonState] = field(default_factory=dict)
+
+    # --- адреси ---
+
+    def get_address_id(self, content_hash: str) -> Optional[int]:
+        addr_id = self._pending_addresses.get(content_hash)
+        if addr_id is None:
+            addr_id = self._addresses.get(content_hash)
+        if addr_id is None:
+            self.stats.address_misses += 1
+        else:
+            self.stats.address_hits += 1
+        return addr_id
+
+    def remember_address(self, content_hash: str, db_content_hash: Optional[str], addr_id: int) -> None:
+        if db_content_hash is not None and db_content_hash != content_hash:
+            self.stats.hash_mismatches += 1
+            return
+        self._pending_addresses[content_hash] = addr_id
+
+    # --- персони ---
+
+    def _person_state(self, cf: str) -> Optional[PersonState]:
+        state = self._pending_persons.get(cf)
+        return state if state is not None else self._persons.get(cf)
+
+    def person_unchanged(self, cf: str, payload: PersonState) -> bool:
+        """True, якщо upsert з таким payload не змінить уже записаний у цьому прогоні рядок."""
+        state = self._person_state(cf)
+        unchanged = state is not None and all(
+            new is None or new == old for new, old in zip(payload, state)
+        )
+        if unchanged:
+            self.stats.person_hits += 1
+        else:
+            self.stats.person_misses += 1
+        return unchanged
+
+    def remember_person(self, cf: str, payload: PersonState) -> None:
+        # Так само, як COALESCE(EXCLUDED.x, persons.x) в upsert-і
+        state = self._person_state(cf) or (None, None, None)
+        self._pending_persons[cf] = tuple(
+            new if new is not None else old for new, old in zip(payload, state)
+        )
+
+    # --- транзакції ---
+
+    def commit(self) -> None:
+        self._addresses.update(self._pending_addresses)
+        self._persons.update(self._pending_persons)
+        self._pending_addresses.clear()
+        self._pending_persons.clear()
+
+    def rollback(self) -> None:
+        self._pending_addresses.clear()
+        self._pending_persons.clear()
+
+    def savepoint(self) -> SavepointMark:
+        return dict(self._pending_addresses), dict(self._pending_persons)
+
+    def rollback_to(self, mark: SavepointMark) -> None:
+        self._pending_addresses, self._pending_persons = dict(mark[0]), dict(mark[1])
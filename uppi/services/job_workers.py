@@ -0,0 +1,135 @@
+# uppi/services/job_workers.py
+"""
+Воркери черги jobs (див. uppi/services/jobs.py) навколо наявних кроків:
+
+- fetch_visura: павук у режимі source=jobs бере задачі замість clients.yml, а UppiPipeline
+  передає результат у hand_off_fetched_item — PDF іде в object storage, і в одній транзакції
+  створюється process_client та закривається fetch_visura;
+- process_client: VisuraProcessor.process_item (render_inline=False — атестації стають задачами);
+- render_attestazione: VisuraProcessor.render_attestazione_job.
+"""
+from __future__ import annotations
+
+import logging
+import tempfile
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from itemadapter import ItemAdapter
+
+from uppi.domain.db import pg_connection
+from uppi.items import UppiItem
+from uppi.services.db_repo import JobRow, db_complete_job
+from uppi.services.jobs import (
+    FETCH_VISURA,
+    PROCESS_CLIENT,
+    RENDER_ATTESTAZIONE,
+    JobFailed,
+    JobWorker,
+    enqueue_process_client,
+    fail_job,
+)
+from uppi.services.storage_minio import StorageService
+from uppi.services.visura_processor import VisuraProcessor
+from uppi.utils.parse_utils import clean_str
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class WorkerContext:
+    """Те, що VisuraProcessor очікує від spider: name і logger."""
+    name: str
+    logger: logging.Logger
+
+
+def hand_off_fetched_item(item, job: JobRow, storage_service: StorageService) -> bool:
+    """
+    Результат fetch_visura від павука -> задача process_client.
+    Невдале завантаження — повтор fetch_visura з backoff. False — задачу не закрито.
+    """
+    adapter = ItemAdapter(item)
+    cf = clean_str(adapter.get("locatore_cf"))
+    visura: Optional[Dict[str, str]] = None
+
+    if adapter.get("visura_source") == "sister":
+        download_path = clean_str(adapter.get("visura_download_path"))
+        if not adapter.get("visura_downloaded") or not download_path:
+            fail_job(job, (
+                f"visura not downloaded (nav={adapter.get('nav_to_visure_catastali')}, "
+                f"captcha={adapter.get('captcha_ok')})"
+            ))
+            return False
+        # process_client може виконатись на іншому вузлі — PDF має бути в object storage
+        bucket = storage_service.storage.cfg.visure_bucket
+        obj_name = storage_service.storage.visura_object_name(cf)
+        storage_service.upload_file(bucket, obj_name, Path(download_path), content_type="application/pdf")
+        visura = {"bucket": bucket, "object": obj_name}
+
+    fields = {k: v for k, v in adapter.items() if k != "visura_download_path"}
+    with pg_connection() as conn:
+        # Ключ — ID fetch-задачі: повтор після втраченого lease не створить другий process_client
+        process_job_id = enqueue_process_client(conn, fields, key=f"{cf}:{job.id}", visura=visura)
+        if not db_complete_job(conn, job.id, job.attempts, {"process_client_job_id": process_job_id}):
+            conn.rollback()
+            logger.warning("[JOBS] Lease of fetch_visura job %s for %s was lost, hand-off dropped", job.id, cf)
+            return False
+        conn.commit()
+    logger.info("[JOBS] %s: fetch_visura job %s -> process_client job %s", cf, job.id, process_job_id)
+    return True
+
+
+class ProcessClientWorker(JobWorker):
+    kind = PROCESS_CLIENT
+
+    def __init__(self, processor: Optional[VisuraProcessor] = None, force_render: bool = False, **kwargs):
+        super().__init__(**kwargs)
+        self.processor = processor or VisuraProcessor(render_inline=False, force_render=force_render)
+        self.context = WorkerContext(name=f"jobs:{self.kind}", logger=logging.getLogger(f"uppi.jobs.{self.kind}"))
+
+    def handle(self, job: JobRow) -> Optional[Dict[str, Any]]:
+        item = UppiItem(**job.payload["item"])
+        item["job_id"] = job.id
+        visura = job.payload.get("visura")
+        with tempfile.TemporaryDirectory(prefix="uppi_job_") as tmp:
+            if visura:
+                cf = clean_str(item.get("locatore_cf"))
+                path = Path(tmp) / f"{cf}.pdf"
+                self.processor.storage_service.download_file(visura["bucket"], visura["object"], path)
+                item["visura_download_path"] = str(path)
+            self.processor.process_item(item, self.context)
+
+        if item.get("processing_error"):
+            raise JobFailed(item["processing_error"])
+        return {
+            "stage_outcomes": item.get("stage_outcomes"),
+            "immobili_outcomes": item.get("immobili_outcomes"),
+            "db_query_stats": item.get("db_query_stats"),
+        }
+
+    def close(self) -> None:
+        self.processor.close()
+
+
+class RenderAttestazioneWorker(JobWorker):
+    kind = RENDER_ATTESTAZIONE
+
+    def __init__(self, processor: Optional[VisuraProcessor] = None, force_render: bool = False, **kwargs):
+        super().__init__(**kwargs)
+        self.processor = processor or VisuraProcessor(force_render=force_render)
+        self.context = WorkerContext(name=f"jobs:{self.kind}", logger=logging.getLogger(f"uppi.jobs.{self.kind}"))
+
+    def handle(self, job: JobRow) -> Optional[Dict[str, Any]]:
+        return self.processor.render_attestazione_job(job.payload, self.context)
+
+    def close(self) -> None:
+        self.processor.close()
+
+
+WORKERS = {
+    PROCESS_CLIENT: ProcessClientWorker,
+    RENDER_ATTESTAZIONE: RenderAttestazioneWorker,
+}
+# fetch_visura виконує павук (Playwright + SISTER): scrapy crawl uppi -a source=jobs
+SPIDER_KINDS = (FETCH_VISURA,)
@@ -0,0 +1,302 @@
+# uppi/services/jobs.py
+"""
+Черга задач у PostgreSQL (таблиця jobs, міграція 0006).
+
+Ланцюжок для одного клієнта:
+
+    fetch_visura        (павук: scrapy crawl uppi -a source=jobs)
+      -> process_client (VisuraProcessor.process_item; python -m uppi.cli.jobs work process_client)
+        -> render_attestazione по контракту (python -m uppi.cli.jobs work render_attestazione)
+
+Кожен вузол лише бере задачі з таблиці — інша координація не потрібна:
+- lease через FOR UPDATE SKIP LOCKED, задача невидима для інших на visibility timeout;
+- помилка -> повтор з експоненційним backoff (з jitter) до max_attempts, далі failed;
+- воркер помер -> lease прострочується, задачу бере інший (attempts як fencing token);
+- idempotency key: повторне додавання тієї самої задачі нічого не створює.
+
+Тут — API черги та базовий цикл воркера; конкретні воркери — uppi/services/job_workers.py.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+from dataclasses import dataclass
+from datetime import date
+from typing import Any, Callable, Dict, List, Mapping, Optional
+
+from decouple import config
+
+from uppi.domain.db import pg_connection
+from uppi.services.db_repo import (
+    JobRow,
+    db_complete_job,
+    db_enqueue_job,
+    db_extend_job_lease,
+    db_fail_expired_jobs,
+    db_fail_job,
+    db_lease_jobs,
+)
+from uppi.utils.audit import sha256_text
+from uppi.utils.parse_utils import prepare_for_json
+
+logger = logging.getLogger(__name__)
+
+FETCH_VISURA = "fetch_visura"
+PROCESS_CLIENT = "process_client"
+RENDER_ATTESTAZIONE = "render_attestazione"
+JOB_KINDS = (FETCH_VISURA, PROCESS_CLIENT, RENDER_ATTESTAZIONE)
+
+# На скільки секунд взята задача ховається від інших воркерів (потім вважається покинутою)
+JOBS_VISIBILITY_TIMEOUT_SEC = float(config("JOBS_VISIBILITY_TIMEOUT_SEC", default="900"))
+JOBS_MAX_ATTEMPTS = int(config("JOBS_MAX_ATTEMPTS", default="5"))
+# Backoff між спробами: base * 2^(attempt-1), не більше max, з jitter
+JOBS_BACKOFF_BASE_SEC = float(config("JOBS_BACKOFF_BASE_SEC", default="30"))
+JOBS_BACKOFF_MAX_SEC = float(config("JOBS_BACKOFF_MAX_SEC", default="3600"))
+# Скільки задач брати за один lease і як часто питати чергу, коли вона порожня
+JOBS_BATCH_SIZE = int(config("JOBS_BATCH_SIZE", default="10"))
+JOBS_POLL_SEC = float(config("JOBS_POLL_SEC", default="5"))
+
+
+def worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def retry_delay(
+    attempt: int,
+    base_sec: float = JOBS_BACKOFF_BASE_SEC,
+    max_sec: float = JOBS_BACKOFF_MAX_SEC,
+    rand: Callable[[], float] = random.random,
+) -> float:
+    """
+    Затримка перед наступною спробою (attempt — номер спроби, що щойно впала):
+    експонента з "equal jitter", щоб воркери після спільного збою не повторювали синхронно.
+    """
+    delay = min(max_sec, base_sec * (2 ** max(attempt - 1, 0)))
+    return delay / 2 + rand() * delay / 2
+
+
+def payload_digest(payload: Mapping[str, Any]) -> str:
+    """Стабільний хеш payload-у (ключі відсортовані) — частина idempotency key."""
+    return sha256_text(json.dumps(prepare_for_json(dict(payload)), sort_keys=True, default=str))[:16]
+
+
+# ---------------------------------------------------------
+# Додавання задач
+# ---------------------------------------------------------
+
+def enqueue_fetch_visura(conn, client: Mapping[str, Any], key: Optional[str] = None) -> Optional[int]:
+    """
+    Задача завантаження візури для запису з clients.yml.
+    Ключ за замовчуванням — CF + дата + хеш запису: повторний enqueue того самого
+    clients.yml у той самий день нічого не додає, змінений запис — додає.
+    """
+    cf = client.get("LOCATORE_CF")
+    key = key or f"{cf}:{date.today().isoformat()}:{payload_digest(client)}"
+    return db_enqueue_job(conn, FETCH_VISURA, key, {"client": prepare_for_json(dict(client))}, JOBS_MAX_ATTEMPTS)
+
+
+def enqueue_process_client(
+    conn, item: Mapping[str, Any], key: str, visura: Optional[Dict[str, str]] = None
+) -> Optional[int]:
+    """
+    Задача обробки item-а в VisuraProcessor. visura — {"bucket", "object"} щойно завантаженої
+    візури в object storage (воркер іншого вузла не бачить локальний PDF павука).
+    """
+    payload = {"item": prepare_for_json(dict(item)), "visura": visura}
+    return db_enqueue_job(conn, PROCESS_CLIENT, key, payload, JOBS_MAX_ATTEMPTS)
+
+
+def enqueue_render_attestazione(
+    conn,
+    item: Mapping[str, Any],
+    locatore_cf: str,
+    immobile_id: int,
+    contract_id: str,
+    key: str,
+    force_render: bool = False,
+) -> Optional[int]:
+    """
+    Задача генерації атестації контракту (комітиться в тій самій транзакції, що й контракт).
+    force_render — генерувати, навіть якщо відбиток входу не змінився.
+    """
+    payload = {
+        "locatore_cf": locatore_cf,
+        "immobile_id": immobile_id,
+        "contract_id": str(contract_id),
+        "item": prepare_for_json(dict(item)),
+        "force_render": force_render,
+    }
+    return db_enqueue_job(conn, RENDER_ATTESTAZIONE, key, payload, JOBS_MAX_ATTEMPTS)
+
+
+# ---------------------------------------------------------
+# Завершення задач (кожне — окрема коротка транзакція)
+# ---------------------------------------------------------
+
+def complete_job(job: JobRow, result: Optional[Dict[str, Any]] = None) -> bool:
+    with pg_connection() as conn:
+        ok = db_complete_job(conn, job.id, job.attempts, prepare_for_json(result) if result is not None else None)
+        conn.commit()
+    if not ok:
+        logger.warning("[JOBS] Lease of %s job %s (attempt %s) was lost, result dropped", job.kind, job.id, job.attempts)
+    return ok
+
+
+def fail_job(job: JobRow, error: str) -> Optional[float]:
+    """Помилка спроби. Повертає затримку до повтору або None, якщо задача остаточно failed."""
+    delay = retry_delay(job.attempts) if job.attempts < job.max_attempts else None
+    with pg_connection() as conn:
+        ok = db_fail_job(conn, job.id, job.attempts, error[:2000], delay)
+        conn.commit()
+    if not ok:
+        logger.warning("[JOBS] Lease of %s job %s (attempt %s) was lost", job.kind, job.id, job.attempts)
+    elif delay is None:
+        logger.error("[JOBS] %s job %s failed after %s attempts: %s", job.kind, job.id, job.attempts, error)
+    else:
+        logger.warning("[JOBS] %s job %s attempt %s failed, retry in %.0f s: %s",
+                       job.kind, job.id, job.attempts, delay, error)
+    return delay
+
+
+def extend_lease(job: JobRow, visibility_sec: float = JOBS_VISIBILITY_TIMEOUT_SEC) -> bool:
+    """Продовжує lease на visibility_sec від зараз. False — задачу вже взяв інший воркер."""
+    with pg_connection() as conn:
+        ok = db_extend_job_lease(conn, job.id, job.attempts, visibility_sec)
+        conn.commit()
+    return ok
+
+
+class LeaseHeartbeat:
+    """
+    Фоновий потік, що продовжує lease задачі кожні interval_sec (за замовчуванням — третина
+    visibility timeout), поки воркер її виконує. lost — lease втрачено, результат не запишеться.
+    """
+
+    def __init__(self, job: JobRow, visibility_sec: float, interval_sec: Optional[float] = None):
+        self.job = job
+        self.visibility_sec = visibility_sec
+        self.interval_sec = interval_sec if interval_sec is not None else visibility_sec / 3
+        self.lost = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_sec):
+            try:
+                if not extend_lease(self.job, self.visibility_sec):
+                    self.lost.set()
+                    logger.warning("[JOBS] Lease of %s job %s was lost while running", self.job.kind, self.job.id)
+                    return
+            except Exception as e:
+                # БД недоступна — спробуємо на наступному такті (запас — ще 2/3 timeout-у)
+                logger.warning("[JOBS] Cannot extend lease of job %s: %s", self.job.id, e)
+
+    def __enter__(self) -> "LeaseHeartbeat":
+        self._thread = threading.Thread(target=self._run, name=f"lease-{self.job.id}", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> bool:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return False
+
+
+# ---------------------------------------------------------
+# Базовий воркер
+# ---------------------------------------------------------
+
+class JobFailed(Exception):
+    """Задача не виконана, але воркер у порядку — повторити пізніше."""
+
+
+@dataclass
+class JobWorkerStats:
+    leased: int = 0
+    done: int = 0
+    retried: int = 0
+    failed: int = 0
+    # Lease прострочився до початку задачі (поки йшли попередні з пакета) і її взяв інший воркер
+    lost: int = 0
+
+    def as_dict(self) -> Dict[str, int]:
+        return {
+            "leased": self.leased, "done": self.done, "retried": self.retried,
+            "failed": self.failed, "lost": self.lost,
+        }
+
+
+class JobWorker:
+    """lease -> handle -> complete / fail. Підкласи задають kind і handle()."""
+
+    kind: str = ""
+
+    def __init__(
+        self,
+        worker: Optional[str] = None,
+        batch_size: int = JOBS_BATCH_SIZE,
+        visibility_sec: float = JOBS_VISIBILITY_TIMEOUT_SEC,
+    ):
+        self.worker = worker or worker_id()
+        self.batch_size = batch_size
+        self.visibility_sec = visibility_sec
+        self.stats = JobWorkerStats()
+
+    def handle(self, job: JobRow) -> Optional[Dict[str, Any]]:
+        raise NotImplementedError
+
+    def lease(self) -> List[JobRow]:
+        with pg_connection() as conn:
+            expired = db_fail_expired_jobs(conn, self.kind)
+            jobs = db_lease_jobs(conn, self.kind, self.worker, self.batch_size, self.visibility_sec)
+            conn.commit()
+        if expired:
+            logger.error("[JOBS] %s %s jobs exhausted their attempts with an expired lease", expired, self.kind)
+        self.stats.leased += len(jobs)
+        return jobs
+
+    def run_job(self, job: JobRow) -> None:
+        # Пакет бере спільний lease: поки виконувались попередні задачі, lease цієї міг минути.
+        # Продовження перевіряє, що задачу ніхто не перехопив, і відраховує timeout від зараз
+        if not extend_lease(job, self.visibility_sec):
+            logger.warning("[JOBS] %s job %s was re-leased by another worker, skipped", self.kind, job.id)
+            self.stats.lost += 1
+            return
+        try:
+            with LeaseHeartbeat(job, self.visibility_sec):
+                result = self.handle(job)
+        except Exception as e:
+            if not isinstance(e, JobFailed):
+                logger.exception("[JOBS] %s job %s crashed: %s", self.kind, job.id, e)
+            if fail_job(job, str(e)) is None:
+                self.stats.failed += 1
+            else:
+                self.stats.retried += 1
+        else:
+            if complete_job(job, result):
+                self.stats.done += 1
+
+    def run_once(self) -> int:
+        """Один lease + обробка. Повертає кількість взятих задач."""
+        jobs = self.lease()
+        for job in jobs:
+            self.run_job(job)
+        return len(jobs)
+
+    def run(self, poll_sec: float = JOBS_POLL_SEC, until_empty: bool = False) -> JobWorkerStats:
+        """Цикл воркера; until_empty — вийти, щойно черга порожня."""
+        logger.info("[JOBS] Worker %s started for %s", self.worker, self.kind)
+        while True:
+            if self.run_once():
+                continue
+            if until_empty:
+                break
+            time.sleep(poll_sec)
+        logger.info("[JOBS] Worker %s stopped: %s", self.worker, self.stats.as_dict())
+        return self.stats
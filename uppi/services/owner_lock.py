@@ -0,0 +1,92 @@
+# uppi/services/owner_lock.py
+"""
+Advisory lock на власника (locatore CF) на час транзакції item-а.
+
+Два воркери (два crawl-и, потоки pipeline, reparse_visure), що одночасно обробляють
+той самий CF, могли перемежати db_upsert_contract та db_prune_old_immobili_without_contracts
+і створювати дублікати контрактів. pg_advisory_xact_lock(OWNER_LOCK_NAMESPACE, hashtext(cf))
+серіалізує обробку одного власника між процесами та хостами; різні CF не блокують один одного.
+Lock знімається сам на commit / rollback.
+
+Спершу pg_try_advisory_xact_lock (без очікування); якщо CF зайнятий — чекаємо не довше
+DB_OWNER_LOCK_TIMEOUT_MS (lock_timeout лише на цей запит) і рахуємо очікування в OwnerLockStats.
+"""
+from __future__ import annotations
+
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from decouple import config
+from psycopg.errors import LockNotAvailable
+
+from uppi.services.db_repo import db_lock_owner, db_try_lock_owner
+
+logger = logging.getLogger(__name__)
+
+# Скільки чекати на lock CF, який обробляє інший воркер (мс)
+DB_OWNER_LOCK_TIMEOUT_MS = int(config("DB_OWNER_LOCK_TIMEOUT_MS", default="30000"))
+
+
+class OwnerLockTimeout(Exception):
+    """CF обробляє інший воркер довше за DB_OWNER_LOCK_TIMEOUT_MS."""
+
+    def __init__(self, cf: str, waited_sec: float):
+        super().__init__(f"owner lock for {cf} not acquired in {waited_sec * 1000:.0f} ms")
+        self.cf = cf
+        self.waited_sec = waited_sec
+
+
+@dataclass
+class OwnerLockStats:
+    acquired: int = 0
+    # Скільки разів CF уже був заблокований іншим воркером
+    contended: int = 0
+    timeouts: int = 0
+    wait_total_sec: float = 0.0
+    wait_max_sec: float = 0.0
+
+    def observe_wait(self, waited_sec: float) -> None:
+        self.wait_total_sec += waited_sec
+        self.wait_max_sec = max(self.wait_max_sec, waited_sec)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "acquired": self.acquired,
+            "contended": self.contended,
+            "timeouts": self.timeouts,
+            "wait_total_ms": round(self.wait_total_sec * 1000, 2),
+            "wait_max_ms": round(self.wait_max_sec * 1000, 2),
+        }
+
+
+def lock_owner(
+    conn,
+    cf: str,
+    stats: Optional[OwnerLockStats] = None,
+    timeout_ms: int = DB_OWNER_LOCK_TIMEOUT_MS,
+) -> float:
+    """
+    Бере transaction-level advisory lock на CF. Повертає час очікування (с).
+    Після OwnerLockTimeout транзакція в стані помилки — викликач робить rollback.
+    """
+    stats = stats if stats is not None else OwnerLockStats()
+    if db_try_lock_owner(conn, cf):
+        stats.acquired += 1
+        return 0.0
+
+    stats.contended += 1
+    logger.info("[OWNER_LOCK] CF %s is being processed by another worker, waiting up to %s ms", cf, timeout_ms)
+    t0 = time.perf_counter()
+    try:
+        db_lock_owner(conn, cf, timeout_ms)
+    except LockNotAvailable as e:
+        waited = time.perf_counter() - t0
+        stats.timeouts += 1
+        stats.observe_wait(waited)
+        raise OwnerLockTimeout(cf, waited) from e
+    waited = time.perf_counter() - t0
+    stats.acquired += 1
+    stats.observe_wait(waited)
+    return waited
@@ -0,0 +1,256 @@
+# uppi/services/query_stats.py
+"""
+Інструментація запитів db_repo: кількість викликів, час і рядки по мітці запиту.
+
+InstrumentedConnection обгортає з'єднання psycopg, яке VisuraProcessor передає в db_repo.
+Мітка запиту — ім'я функції db_repo, що його видала, без префікса db_
+(db_upsert_immobile -> "upsert_immobile", db_load_contract_context -> "load_contract_context");
+SAVEPOINT / RELEASE / ROLLBACK TO з uppi.domain.db.savepoint — "savepoint",
+інші запити поза db_repo — "other", commit / rollback — окремі мітки.
+
+Час виклику = execute + fetch* на тому ж курсорі: у pipeline mode execute повертається
+одразу, а відповідь сервера чекаємо на fetch або на commit (тоді час потрапляє в "commit").
+Рядки — rowcount там, де він уже відомий (у pipeline mode — після fetch).
+
+Виклики, довші за DB_SLOW_QUERY_MS, пишуться в логер uppi.slow_query: мітка, час, SQL
+і типи параметрів — без значень (там CF, імена, адреси).
+"""
+from __future__ import annotations
+
+import logging
+import sys
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from decouple import config
+
+# Поріг slow-query логу в мс (0 — вимкнено)
+DB_SLOW_QUERY_MS = float(config("DB_SLOW_QUERY_MS", default="250"))
+
+REPOSITORY_MODULE = "uppi.services.db_repo"
+OTHER_LABEL = "other"
+# Функції поза db_repo, чиї запити мають власну мітку: (модуль, функція) -> мітка
+SERVICE_LABELS = {("uppi.domain.db", "savepoint"): "savepoint"}
+
+slow_query_logger = logging.getLogger("uppi.slow_query")
+
+
+def calling_label(depth: int = 2) -> str:
+    """Мітка запиту за стеком: функція db_repo, службова функція з SERVICE_LABELS або "other"."""
+    frame = sys._getframe(depth)
+    while frame is not None:
+        module, name = frame.f_globals.get("__name__"), frame.f_code.co_name
+        if module == REPOSITORY_MODULE and not name.startswith("_"):
+            return statement_label(name)
+        if (module, name) in SERVICE_LABELS:
+            return SERVICE_LABELS[(module, name)]
+        frame = frame.f_back
+    return OTHER_LABEL
+
+
+def statement_label(function_name: Optional[str]) -> str:
+    if not function_name:
+        return OTHER_LABEL
+    return function_name[3:] if function_name.startswith("db_") else function_name
+
+
+def _redact_value(value: Any) -> Any:
+    if value is None:
+        return None
+    if isinstance(value, (list, tuple)):
+        return f"<{type(value).__name__}[{len(value)}]>"
+    return f"<{type(value).__name__}>"
+
+
+def redact_params(params: Any) -> Any:
+    """Параметри запиту для логу: тільки типи (і довжини масивів), без значень."""
+    if params is None:
+        return None
+    if isinstance(params, Mapping):
+        return {key: _redact_value(value) for key, value in params.items()}
+    if isinstance(params, (list, tuple)):
+        return [_redact_value(value) for value in params]
+    return _redact_value(params)
+
+
+@dataclass
+class StatementStats:
+    calls: int = 0
+    total_sec: float = 0.0
+    max_sec: float = 0.0
+    rows: int = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "total_ms": round(self.total_sec * 1000, 2),
+            "max_ms": round(self.max_sec * 1000, 2),
+            "rows": self.rows,
+        }
+
+
+@dataclass
+class QueryStats:
+    statements: Dict[str, StatementStats] = field(default_factory=dict)
+
+    def observe(self, label: str, elapsed: float, call_elapsed: float, new_call: bool, rows: int = 0) -> None:
+        """
+        Додає відрізок часу виклику. new_call — початок виклику (execute);
+        call_elapsed — накопичений час поточного виклику (для max).
+        """
+        st = self.statements.get(label)
+        if st is None:
+            st = self.statements[label] = StatementStats()
+        if new_call:
+            st.calls += 1
+        st.total_sec += elapsed
+        st.max_sec = max(st.max_sec, call_elapsed)
+        st.rows += rows
+
+    def merge(self, other: "QueryStats") -> None:
+        for label, src in other.statements.items():
+            dst = self.statements.setdefault(label, StatementStats())
+            dst.calls += src.calls
+            dst.total_sec += src.total_sec
+            dst.max_sec = max(dst.max_sec, src.max_sec)
+            dst.rows += src.rows
+
+    @property
+    def total_calls(self) -> int:
+        return sum(st.calls for st in self.statements.values())
+
+    @property
+    def total_sec(self) -> float:
+        return sum(st.total_sec for st in self.statements.values())
+
+    @property
+    def total_rows(self) -> int:
+        return sum(st.rows for st in self.statements.values())
+
+    def top(self, n: int = 3) -> List[Tuple[str, StatementStats]]:
+        return sorted(self.statements.items(), key=lambda kv: kv[1].total_sec, reverse=True)[:n]
+
+    def summary(self, top: int = 3) -> Dict[str, Any]:
+        """Підсумок для item-а: загальні цифри + найдовші мітки."""
+        return {
+            "statements": self.total_calls,
+            "total_ms": round(self.total_sec * 1000, 2),
+            "rows": self.total_rows,
+            "top": {label: st.as_dict() for label, st in self.top(top)},
+        }
+
+    def as_dict(self) -> Dict[str, Dict[str, Any]]:
+        return {label: st.as_dict() for label, st in sorted(self.statements.items())}
+
+    def log_line(self, top: int = 3) -> str:
+        parts = ", ".join(f"{label} {st.total_sec * 1000:.1f} ms x{st.calls}" for label, st in self.top(top))
+        return f"{self.total_calls} stmts, {self.total_sec * 1000:.1f} ms, {self.total_rows} rows; top: {parts or '-'}"
+
+
+class _InstrumentedCursor:
+    def __init__(self, cur, conn: "InstrumentedConnection"):
+        self._cur = cur
+        self._conn = conn
+        self._label: Optional[str] = None
+        self._query: Any = None
+        self._params: Any = None
+        self._call_elapsed = 0.0
+        self._rows_recorded = False
+
+    def __enter__(self):
+        self._cur.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        self._finish_call()
+        return self._cur.__exit__(*exc)
+
+    def close(self) -> None:
+        self._finish_call()
+        self._cur.close()
+
+    def _observe(self, elapsed: float, new_call: bool) -> None:
+        self._call_elapsed += elapsed
+        rows = 0
+        if not self._rows_recorded and self._cur.rowcount >= 0:
+            rows = self._cur.rowcount
+            self._rows_recorded = True
+        self._conn.stats.observe(self._label, elapsed, self._call_elapsed, new_call, rows)
+
+    def _finish_call(self) -> None:
+        if self._label is None:
+            return
+        threshold_ms = self._conn.slow_query_ms
+        elapsed_ms = self._call_elapsed * 1000
+        if threshold_ms > 0 and elapsed_ms >= threshold_ms:
+            slow_query_logger.warning(
+                "[SLOW_QUERY] %s %.1f ms params=%s sql=%s",
+                self._label, elapsed_ms, redact_params(self._params), " ".join(str(self._query).split())[:500],
+            )
+        self._label = None
+
+    def execute(self, query, params=None, **kwargs):
+        self._finish_call()
+        self._label = calling_label()
+        self._query, self._params = query, params
+        self._call_elapsed = 0.0
+        self._rows_recorded = False
+        t0 = time.perf_counter()
+        try:
+            self._cur.execute(query, params, **kwargs)
+        finally:
+            self._observe(time.perf_counter() - t0, new_call=True)
+        return self
+
+    def _timed_fetch(self, fetch, *args):
+        t0 = time.perf_counter()
+        try:
+            return fetch(*args)
+        finally:
+            if self._label is not None:
+                self._observe(time.perf_counter() - t0, new_call=False)
+
+    def fetchone(self):
+        return self._timed_fetch(self._cur.fetchone)
+
+    def fetchall(self):
+        return self._timed_fetch(self._cur.fetchall)
+
+    def fetchmany(self, size: int = 0):
+        return self._timed_fetch(self._cur.fetchmany, size)
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+
+class InstrumentedConnection:
+    """Обгортка з'єднання psycopg: статистика запитів по мітках у QueryStats."""
+
+    def __init__(self, conn, stats: QueryStats, slow_query_ms: float = DB_SLOW_QUERY_MS):
+        self._conn = conn
+        self.stats = stats
+        self.slow_query_ms = slow_query_ms
+
+    def cursor(self, *args, **kwargs):
+        return _InstrumentedCursor(self._conn.cursor(*args, **kwargs), self)
+
+    def _timed(self, label: str, fn):
+        t0 = time.perf_counter()
+        try:
+            return fn()
+        finally:
+            elapsed = time.perf_counter() - t0
+            self.stats.observe(label, elapsed, elapsed, new_call=True)
+
+    def commit(self) -> None:
+        self._timed("commit", self._conn.commit)
+
+    def rollback(self) -> None:
+        self._timed("rollback", self._conn.rollback)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
@@ -3,7 +3,7 @@ from __future__ import annotations
 from dataclasses import dataclass
 from pathlib import Path
 import logging
-from typing import Optional
+from typing import List, Optional
 
 from tenacity import (
     retry,
@@ -47,3 +47,12 @@ class StorageService:
     def upload_file(self, bucket: str, object_name: str, path: Path, content_type: str) -> StorageUploadResult:
         self.storage.upload_file(bucket, object_name, path, content_type=content_type),
         return StorageUploadResult(bucket=bucket, object_name=object_name)
+
+    @s3_retry
+    def list_objects(self, bucket: str, prefix: str) -> List[str]:
+        return self.storage.list_objects(bucket, prefix)
+
+    @s3_retry
+    def download_file(self, bucket: str, object_name: str, path: Path) -> Path:
+        self.storage.download_file(bucket, object_name, path)
+        return path
@@ -2,9 +2,10 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 
-from uppi.services.db_repo import VisuraState
+if TYPE_CHECKING:
+    from uppi.services.db_repo import VisuraState
 
 
 @dataclass(frozen=True)
@@ -1,40 +1,55 @@
 # uppi/services/visura_processor.py
 from __future__ import annotations
 
+import json
 import logging
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from itertools import chain, islice
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
 from itemadapter import ItemAdapter
 from decouple import config
 
-from uppi.domain.db import get_pg_connection
+from uppi.domain.db import pg_connection, pipeline, savepoint
 from uppi.domain.immobile import Immobile
 from uppi.domain.object_storage import ObjectStorage
 from uppi.domain.storage import get_attestazione_path, get_client_dir, get_visura_path
-from uppi.parsers.visura_pdf_parser import VisuraParser
-from uppi.services.attestazione_generator import build_template_params
+from uppi.parsers.sandboxed_parser import SandboxedVisuraParser, VisuraParseError
+from uppi.parsers.visura_pdf_parser import ParseReport, VisuraParser
+from uppi.services.attestazione_generator import build_template_params, template_params_fingerprint
+from uppi.services.identity_map import IdentityMap
+from uppi.services.jobs import enqueue_render_attestazione
+from uppi.services.owner_lock import OwnerLockStats, OwnerLockTimeout, lock_owner
+from uppi.services.query_stats import InstrumentedConnection, QueryStats
 from uppi.services.db_repo import (
+    VisuraState,
+    db_clear_visura_checksum,
+    db_bulk_upsert_addresses,
+    db_bulk_upsert_immobili,
     db_upsert_address,
     db_upsert_immobile_elements,
     db_upsert_person,
     db_upsert_visura,
-    db_upsert_immobile,
+    db_update_visura_parse_report,
     db_update_immobile_real_address,
     db_upsert_contract,
     db_load_immobili,
     db_load_contract_context,
     db_insert_canone_calc,
     db_insert_attestazione_log,
+    db_last_attestazione_fingerprint,
     db_prune_old_immobili_without_contracts,
+    fetch_visura_state,
     immobile_from_parsed_dict,
     immobile_db_row,
 )
 from uppi.services.storage_minio import StorageService
 from uppi.utils.audit import mask_username, safe_unlink, sha256_file, sha256_text
-from uppi.utils.parse_utils import clean_str, prepare_for_json, safe_float, split_full_name
+from uppi.utils.parse_utils import clean_str, prepare_for_json, safe_float, split_full_name, to_bool_or_none
 
-from uppi.docs.attestazione_template_filler import fill_attestazione_template, underscored
 from uppi.domain.pescara2018_calc import compute_base_canone
 from uppi.domain.canone_models import CanoneInput, ContractKind
 
@@ -46,6 +61,35 @@ TEMPLATE_VERSION = config("TEMPLATE_VERSION", default="pescara2018_v2").strip()
 PRUNE_OLD_IMMOBILI_WITHOUT_CONTRACTS = config("PRUNE_OLD_IMMOBILI_WITHOUT_CONTRACTS",
                                               default="True").strip().lower() == "true"
 DELETE_LOCAL_VISURA_AFTER_UPLOAD = config("DELETE_LOCAL_VISURA_AFTER_UPLOAD", default="False").strip().lower() == "true"
+# Рушій таблиць для VisuraParser: "pymupdf" (за замовчуванням) або "camelot"
+VISURA_TABLE_ENGINE = config("VISURA_TABLE_ENGINE", default="pymupdf").strip().lower()
+# Парсинг в ізольованому воркері з лімітами (див. uppi/parsers/sandboxed_parser.py)
+VISURA_PARSER_SANDBOX = config("VISURA_PARSER_SANDBOX", default="True").strip().lower() == "true"
+VISURA_PARSER_TIMEOUT_SEC = float(config("VISURA_PARSER_TIMEOUT_SEC", default="120"))
+VISURA_PARSER_MAX_RSS_MB = float(config("VISURA_PARSER_MAX_RSS_MB", default="2048"))
+# Скільки immobili з візури писати одним multi-row INSERT
+IMMOBILI_UPSERT_BATCH_SIZE = int(config("IMMOBILI_UPSERT_BATCH_SIZE", default="500"))
+
+
+# Поля item-а, що з'являються під час обробки (метрики, результати етапів, службові поля черги).
+# Не входять у знімок атестації та в payload задачі render_attestazione.
+ITEM_RUNTIME_FIELDS = frozenset({
+    "visura_unchanged",
+    "visura_parse_error",
+    "visura_parse_report",
+    "db_query_stats",
+    "stage_outcomes",
+    "immobili_outcomes",
+    "owner_lock_wait_ms",
+    "processing_error",
+    "job_id",
+})
+
+
+def item_digest(adapter: ItemAdapter) -> str:
+    """Хеш вхідних полів item-а (без ITEM_RUNTIME_FIELDS)."""
+    data = {k: v for k, v in adapter.items() if k not in ITEM_RUNTIME_FIELDS}
+    return sha256_text(json.dumps(prepare_for_json(data), sort_keys=True, default=str))[:16]
 
 
 def find_local_visura_pdf(cf: str, adapter: ItemAdapter) -> Optional[Path]:
@@ -94,13 +138,294 @@ def filter_immobiles_by_yaml(immobiles: List[Tuple[int, Immobile]], adapter: Ite
     return out
 
 
+def upsert_parsed_immobili(
+    conn,
+    owner_cf: str,
+    parsed_dicts: Iterable[Dict[str, Any]],
+    visura_db_id: Optional[int],
+    prune: bool,
+    identity_map: Optional[IdentityMap] = None,
+) -> List[int]:
+    """
+    Записує immobili з парсера візури (адреса з візури + Immobile Master Data)
+    і чистить старі immobili без контрактів. Повертає ID збережених immobili.
+    parsed_dicts може бути генератором (VisuraParser.parse_iter) — рядки пишуться пакетами
+    по IMMOBILI_UPSERT_BATCH_SIZE (адреси, потім immobili — по одному запиту на пакет).
+    Транзакцією керує викликач.
+    """
+    keep_ids: List[int] = []
+    parsed_iter = iter(parsed_dicts)
+    while True:
+        batch = list(islice(parsed_iter, IMMOBILI_UPSERT_BATCH_SIZE))
+        if not batch:
+            break
+
+        # А. Адреси з візури — один INSERT на пакет
+        v_addr_ids = db_bulk_upsert_addresses(conn, [
+            {
+                "comune": d.get("immobile_comune"),
+                "via_full": d.get("via_name") or d.get("indirizzo_raw"),
+                "civico": d.get("via_num"),
+                "piano": d.get("piano"),
+                "interno": d.get("interno"),
+                "scala": d.get("scala"),
+            }
+            for d in batch
+        ], identity_map=identity_map)
+
+        # Б. Immobile Master Data — один INSERT ... ON CONFLICT на пакет
+        keep_ids.extend(db_bulk_upsert_immobili(
+            conn, owner_cf,
+            [(immobile_from_parsed_dict(d), addr_id) for d, addr_id in zip(batch, v_addr_ids)],
+            source_visura_id=visura_db_id,
+        ))
+
+    # Очистка старих записів без контрактів
+    if keep_ids:
+        db_prune_old_immobili_without_contracts(conn, owner_cf, keep_ids, prune)
+
+    return keep_ids
+
+
 class VisuraProcessor:
-    def __init__(self, storage: Optional[ObjectStorage] = None, template_path: Optional[Path] = None):
+    def __init__(
+        self,
+        storage: Optional[ObjectStorage] = None,
+        template_path: Optional[Path] = None,
+        render_inline: bool = True,
+        force_render: bool = False,
+    ):
+        # False — атестації не генеруються в process_item, а ставляться в чергу (uppi/services/jobs.py)
+        self.render_inline = render_inline
+        # True — генерувати атестацію, навіть якщо відбиток входу не змінився
+        self.force_render = force_render
         self.storage_service = StorageService(storage)
         self.storage = storage or ObjectStorage()
         self.template_path = template_path or (
                 Path(__file__).resolve().parents[2] / "attestazione_template" / "template_attestazione_pescara.docx"
         )
+        if VISURA_PARSER_SANDBOX:
+            self.parser = SandboxedVisuraParser(
+                table_engine=VISURA_TABLE_ENGINE,
+                timeout_sec=VISURA_PARSER_TIMEOUT_SEC,
+                max_rss_mb=VISURA_PARSER_MAX_RSS_MB,
+            )
+        else:
+            self.parser = VisuraParser(table_engine=VISURA_TABLE_ENGINE)
+        # Персони та адреси, вже записані в цьому прогоні (див. uppi/services/identity_map.py)
+        self.identity_map = IdentityMap()
+        # Запити до БД за весь прогін по мітках (див. uppi/services/query_stats.py)
+        self.query_stats = QueryStats()
+        # Очікування на advisory lock CF, який обробляє інший воркер (див. uppi/services/owner_lock.py)
+        self.owner_lock_stats = OwnerLockStats()
+        # Результати ЕТАПУ 6 за прогін: generated / unchanged / queued / failed
+        self.attestazione_stats: Counter = Counter()
+        self.items_processed = 0
+        self.started_at = datetime.now(timezone.utc)
+
+    def close(self) -> None:
+        """Зупиняє воркер парсера (якщо він є)."""
+        close = getattr(self.parser, "close", None)
+        if close:
+            close()
+
+    @contextmanager
+    def _savepoint(self, conn, name: str) -> Iterator[None]:
+        """SAVEPOINT у БД + позначка в identity map: відкат блоку скасовує й закешовані в ньому ID."""
+        mark = self.identity_map.savepoint()
+        try:
+            with savepoint(conn, name):
+                yield
+        except BaseException:
+            self.identity_map.rollback_to(mark)
+            raise
+
+    @contextmanager
+    def _stage(self, conn, name: str, outcomes: Dict[str, Dict[str, Any]], spider) -> Iterator[None]:
+        """
+        Етап process_item у власному SAVEPOINT. Помилка етапу відкочує тільки його записи,
+        пишеться в outcomes[name] і не зупиняє обробку item-а.
+        """
+        try:
+            with self._savepoint(conn, name):
+                yield
+        except Exception as e:
+            spider.logger.exception("[PIPELINE] Stage %s rolled back: %s", name, e)
+            outcomes[name] = {"status": "failed", "error": str(e)}
+        else:
+            outcomes[name] = {"status": "ok", "error": None}
+
+    @staticmethod
+    def _render_item(adapter: ItemAdapter) -> Dict[str, Any]:
+        """Поля item-а з YAML / павука — без метрик і результатів поточної обробки."""
+        return {k: v for k, v in adapter.items() if k not in ITEM_RUNTIME_FIELDS}
+
+    def _render_attestazione(
+        self,
+        conn,
+        adapter: ItemAdapter,
+        locatore_cf: str,
+        immobile_id: int,
+        imm: Immobile,
+        contract_id: str,
+        contract_ctx: Dict[str, Any],
+        canone_result_snapshot: Optional[Dict[str, Any]],
+        force: bool = False,
+    ) -> str:
+        """
+        DOCX з шаблону, upload в object storage і запис в attestazioni. SAVEPOINT тримає викликач.
+        Повертає "unchanged", якщо відбиток входу збігся з останньою генерацією (нічого не робиться).
+        """
+        params = build_template_params(adapter, imm, contract_ctx)
+        fingerprint = template_params_fingerprint(params, TEMPLATE_VERSION)
+        if self._attestazione_unchanged(conn, contract_id, fingerprint, force):
+            return "unchanged"
+
+        output_path = get_attestazione_path(locatore_cf, contract_id, imm)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+
+        # python-docx потрібен тільки тут — не тягнемо його при старті pipeline
+        from uppi.docs.attestazione_template_filler import fill_attestazione_template, underscored
+
+        logger.debug(f"[DEBUG_ADDR] Contract CTX: {contract_ctx.get('immobile')}")
+        fill_attestazione_template(
+            template_path=str(self.template_path),
+            output_folder=str(output_path.parent),
+            filename=output_path.name,
+            params=params,
+            underscored=underscored,
+        )
+
+        out_bucket = self.storage.cfg.attestazioni_bucket
+        out_obj = self.storage.attestazione_object_name(locatore_cf, contract_id)
+
+        self.storage_service.upload_file(
+            out_bucket, out_obj, output_path,
+            content_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+        )
+
+        # Створюємо детальний знімок даних для аудиту
+        # Тут ми використовуємо immobile_db_row, щоб отримати очищені дані
+        imm_data_snapshot = immobile_db_row(imm)
+        # updated_at контракту змінюється на кожному upsert-і; у знімку він робив би кожен
+        # snapshot унікальним і ламав дедуплікацію в attestazione_snapshots
+        snapshot_ctx = {
+            **contract_ctx,
+            "contract": {k: v for k, v in contract_ctx["contract"].items() if k != "updated_at"},
+        }
+
+        params_snapshot = {
+            "locatore_cf": locatore_cf,
+            "immobile_id": immobile_id,
+            "contract_id": contract_id,
+            # Без метрик обробки (час очікування lock-у, статистика запитів): вони різні на кожному запуску
+            "yaml_item": self._render_item(adapter),
+            "immobile_master_data": imm_data_snapshot,  # ВИКОРИСТАННЯ ТУТ
+            "contract_ctx": snapshot_ctx,
+            "template_version": TEMPLATE_VERSION,
+            "canone_result": canone_result_snapshot,
+            "output": {"bucket": out_bucket, "object": out_obj},
+        }
+
+        clean_params = prepare_for_json(params_snapshot)
+        # Лог успішної генерації
+        db_insert_attestazione_log(
+            conn, contract_id, "generated", out_bucket, out_obj,
+            params_snapshot=clean_params,
+            error=None,
+            author_login_masked=mask_username(AE_USERNAME),
+            author_login_sha256=sha256_text(AE_USERNAME),
+            template_version=TEMPLATE_VERSION,
+            input_fingerprint=fingerprint,
+        )
+        return "generated"
+
+    def _attestazione_unchanged(self, conn, contract_id: str, fingerprint: str, force: bool = False) -> bool:
+        """Документ контракту вже згенеровано з тим самим входом (і force_render вимкнено)."""
+        if force or self.force_render:
+            return False
+        if db_last_attestazione_fingerprint(conn, contract_id) != fingerprint:
+            return False
+        logger.debug("[DOCX] Inputs of contract %s unchanged, rendering skipped", contract_id)
+        return True
+
+    @staticmethod
+    def _log_attestazione_failure(conn, contract_id: str, error: Exception) -> None:
+        db_insert_attestazione_log(
+            conn, contract_id, "failed", "", "",
+            {"error_stage": "generation_or_upload"},
+            error=str(error),
+            author_login_masked=mask_username(AE_USERNAME),
+            author_login_sha256=sha256_text(AE_USERNAME),
+            template_version=TEMPLATE_VERSION
+        )
+
+    def render_attestazione_job(self, payload: Dict[str, Any], spider) -> Dict[str, Any]:
+        """
+        Задача render_attestazione: окрема транзакція під lock-ом власника; контекст контракту
+        та останній canone_calcoli — з БД на момент рендеру. Помилка пишеться в attestazioni
+        (status failed) і летить далі — задачу повторить черга.
+        """
+        locatore_cf = payload["locatore_cf"]
+        immobile_id = int(payload["immobile_id"])
+        contract_id = payload["contract_id"]
+        adapter = ItemAdapter(dict(payload.get("item") or {}))
+
+        with pg_connection() as raw_conn:
+            conn = InstrumentedConnection(raw_conn, self.query_stats)
+            try:
+                lock_owner(conn, locatore_cf, self.owner_lock_stats)
+                imm = next((i for imm_id, i in db_load_immobili(conn, locatore_cf) if imm_id == immobile_id), None)
+                if imm is None:
+                    raise LookupError(f"immobile {immobile_id} of {locatore_cf} not found")
+                contract_ctx = db_load_contract_context(conn, contract_id)
+                canone_calc = contract_ctx.get("canone_calc") or {}
+                try:
+                    with self._savepoint(conn, "attestazione"):
+                        status = self._render_attestazione(
+                            conn, adapter, locatore_cf, immobile_id, imm, contract_id,
+                            contract_ctx, canone_calc.get("result"), force=bool(payload.get("force_render")),
+                        )
+                except Exception as e:
+                    spider.logger.exception("[DOCX] Failed for contract %s", contract_id)
+                    self._log_attestazione_failure(conn, contract_id, e)
+                    conn.commit()
+                    self.attestazione_stats["failed"] += 1
+                    raise
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+        self.attestazione_stats[status] += 1
+        return {"contract_id": contract_id, "attestazione": status}
+
+    def _is_visura_unchanged(
+        self,
+        prev_state: Optional[VisuraState],
+        checksum: str,
+        bucket: str,
+        obj_name: str,
+        adapter: ItemAdapter,
+    ) -> bool:
+        """
+        True, якщо щойно завантажена візура ідентична вже обробленій:
+        той самий sha256 і той самий об'єкт, який реально лежить у MinIO.
+        FORCE_UPDATE_VISURA завжди змушує повну обробку.
+        """
+        if to_bool_or_none(adapter.get("force_update_visura")):
+            return False
+        if prev_state is None or not prev_state.checksum_sha256:
+            return False
+        if prev_state.checksum_sha256 != checksum:
+            return False
+        if prev_state.pdf_bucket != bucket or prev_state.pdf_object != obj_name:
+            return False
+
+        try:
+            return self.storage_service.object_exists(bucket, obj_name)
+        except Exception as e:
+            logger.warning("[S3] Cannot check visura object %s/%s: %s", bucket, obj_name, e)
+            return False
 
     def process_item(self, item, spider):
         adapter = ItemAdapter(item)
@@ -111,121 +436,166 @@ class VisuraProcessor:
             return item
 
         cond_cf = clean_str(adapter.get("conduttore_cf"))
-        conn = get_pg_connection()
 
+        # З'єднання з процесного пулу; commit / rollback — у _process_in_transaction.
+        # Pipeline mode: upsert-и без RETURNING не чекають відповіді, синхронізація — на fetch / commit.
+        item_stats = QueryStats()
         try:
-            # --- ЕТАП 1: АДРЕСИ ТА ПЕРСОНИ (LOCATORE / CONDUTTORE) ---
+            with pg_connection() as raw_conn, pipeline(raw_conn):
+                conn = InstrumentedConnection(raw_conn, item_stats)
+                return self._process_in_transaction(conn, item, adapter, locatore_cf, cond_cf, spider)
+        finally:
+            self.query_stats.merge(item_stats)
+            self.items_processed += 1
+            adapter["db_query_stats"] = item_stats.summary()
+            spider.logger.info("[ITEM] CF=%s db: %s", locatore_cf, item_stats.log_line())
 
-            # 1.1. Адреса Locatore
-            loc_addr_id = None
-            if adapter.get("locatore_comune_res") and adapter.get("locatore_via"):
-                loc_addr_id = db_upsert_address(conn, {
-                    "comune": adapter.get("locatore_comune_res"),
-                    "via_full": adapter.get("locatore_via"),
-                    "civico": adapter.get("locatore_civico")
-                })
-
-            db_upsert_person(
-                conn, locatore_cf,
-                surname=clean_str(adapter.get("locatore_surname")),
-                name=clean_str(adapter.get("locatore_name")),
-                address_id=loc_addr_id
-            )
+    def _process_in_transaction(self, conn, item, adapter: ItemAdapter, locatore_cf: str, cond_cf, spider):
+        try:
+            stage_outcomes: Dict[str, Dict[str, Any]] = {}
+            immobili_outcomes: List[Dict[str, Any]] = []
+            adapter["stage_outcomes"] = stage_outcomes
+            adapter["immobili_outcomes"] = immobili_outcomes
 
-            # 1.2. Адреса Conduttore
-            if cond_cf:
-                cond_addr_id = None
-                if adapter.get("conduttore_comune"):
-                    cond_addr_id = db_upsert_address(conn, {
-                        "comune": adapter.get("conduttore_comune"),
-                        "via_full": adapter.get("conduttore_via") or ""
-                    })
+            # --- ЕТАП 0: LOCK ВЛАСНИКА ---
+            # Інший воркер з тим самим CF чекає тут до нашого commit / rollback
+            waited = lock_owner(conn, locatore_cf, self.owner_lock_stats)
+            adapter["owner_lock_wait_ms"] = round(waited * 1000, 2)
 
-                # Розділення повного імені Conduttore (якщо потрібно)
-                cond_full_name = clean_str(adapter.get("conduttore_nome"))
-                c_surname, c_name = split_full_name(cond_full_name)
+            # --- ЕТАП 1: АДРЕСИ ТА ПЕРСОНИ (LOCATORE / CONDUTTORE) ---
+            # Кожен етап — окремий SAVEPOINT (_stage): збій відкочує тільки його записи,
+            # наступні етапи працюють з тим, що вже є в БД
+
+            loc_addr_id = None
+            with self._stage(conn, "persons", stage_outcomes, spider):
+                # 1.1. Адреса Locatore
+                if adapter.get("locatore_comune_res") and adapter.get("locatore_via"):
+                    loc_addr_id = db_upsert_address(conn, {
+                        "comune": adapter.get("locatore_comune_res"),
+                        "via_full": adapter.get("locatore_via"),
+                        "civico": adapter.get("locatore_civico")
+                    }, identity_map=self.identity_map)
 
                 db_upsert_person(
-                    conn, cond_cf,
-                    surname=c_surname,
-                    name=c_name,
-                    address_id=cond_addr_id
+                    conn, locatore_cf,
+                    surname=clean_str(adapter.get("locatore_surname")),
+                    name=clean_str(adapter.get("locatore_name")),
+                    address_id=loc_addr_id,
+                    identity_map=self.identity_map
                 )
 
+                # 1.2. Адреса Conduttore
+                if cond_cf:
+                    cond_addr_id = None
+                    if adapter.get("conduttore_comune"):
+                        cond_addr_id = db_upsert_address(conn, {
+                            "comune": adapter.get("conduttore_comune"),
+                            "via_full": adapter.get("conduttore_via") or ""
+                        }, identity_map=self.identity_map)
+
+                    # Розділення повного імені Conduttore (якщо потрібно)
+                    cond_full_name = clean_str(adapter.get("conduttore_nome"))
+                    c_surname, c_name = split_full_name(cond_full_name)
+
+                    db_upsert_person(
+                        conn, cond_cf,
+                        surname=c_surname,
+                        name=c_name,
+                        address_id=cond_addr_id,
+                        identity_map=self.identity_map
+                    )
+            if stage_outcomes["persons"]["status"] == "failed":
+                loc_addr_id = None  # адресу відкочено разом з етапом
+
             # --- ЕТАП 2: ЗАВАНТАЖЕННЯ ТА ПАРСИНГ ВІЗУРИ ---
 
             visura_source = clean_str(adapter.get("visura_source"))
             visura_downloaded = bool(adapter.get("visura_downloaded"))
             pdf_path = None
             fetched_now = False
+            visura_unchanged = False
             visura_db_id = None
             pdf_to_delete: Path | None = None
 
-            if visura_source == "sister" and visura_downloaded:
-                pdf_path = find_local_visura_pdf(locatore_cf, adapter)
-                if pdf_path:
-                    checksum = sha256_file(pdf_path)
-                    bucket = self.storage.cfg.visure_bucket
-                    obj_name = self.storage.visura_object_name(locatore_cf)
-
-                    self.storage_service.upload_file(bucket, obj_name, pdf_path, content_type="application/pdf")
-                    fetched_now = True
-                    visura_db_id = db_upsert_visura(conn, locatore_cf, bucket, obj_name, checksum, fetched_now=True)
-                    pdf_to_delete = pdf_path
-            else:
-                # Навіть якщо не качали зараз, реєструємо запис або отримуємо існуючий ID
-                visura_db_id = db_upsert_visura(
-                    conn, locatore_cf, self.storage.cfg.visure_bucket,
-                    self.storage.visura_object_name(locatore_cf), None, fetched_now=False
-                )
+            with self._stage(conn, "visura", stage_outcomes, spider):
+                if visura_source == "sister" and visura_downloaded:
+                    pdf_path = find_local_visura_pdf(locatore_cf, adapter)
+                    if pdf_path:
+                        checksum = sha256_file(pdf_path)
+                        bucket = self.storage.cfg.visure_bucket
+                        obj_name = self.storage.visura_object_name(locatore_cf)
+
+                        prev_state = fetch_visura_state(conn, locatore_cf)
+                        visura_unchanged = self._is_visura_unchanged(prev_state, checksum, bucket, obj_name, adapter)
+                        if visura_unchanged:
+                            # Та сама візура, що вже збережена: upload, парсинг та upsert immobili пропускаємо.
+                            # fetched_at все одно оновлюємо нижче, щоб TTL рахувався від цього завантаження.
+                            logger.info("[PIPELINE] Visura for %s unchanged (sha256=%s), skipping parse/upload",
+                                        locatore_cf, checksum)
+                        else:
+                            self.storage_service.upload_file(bucket, obj_name, pdf_path, content_type="application/pdf")
+                        fetched_now = True
+                        visura_db_id = db_upsert_visura(conn, locatore_cf, bucket, obj_name, checksum, fetched_now=True)
+                        pdf_to_delete = pdf_path
+                else:
+                    # Навіть якщо не качали зараз, реєструємо запис або отримуємо існуючий ID
+                    visura_db_id = db_upsert_visura(
+                        conn, locatore_cf, self.storage.cfg.visure_bucket,
+                        self.storage.visura_object_name(locatore_cf), None, fetched_now=False
+                    )
+            visura_ok = stage_outcomes["visura"]["status"] == "ok"
+            if not visura_ok:
+                # Запис візури відкочено: не парсимо і лишаємо локальний PDF для наступного запуску
+                visura_db_id, pdf_to_delete = None, None
 
             # --- ЕТАП 3: ОБРОБКА IMMOBILI (З ПАРСЕРА) ---
 
-            keep_ids: List[int] = []
-            if fetched_now and pdf_path:
-                parser = VisuraParser()
-                parsed_dicts = parser.parse(pdf_path)
-
-                # Оновлюємо інформацію про Locatore з візури
-                if parsed_dicts:
-                    # Prendiamo i dati del locatore dal primo immobile trovato (sono uguali per tutti)
-                    first_item = parsed_dicts[0]
-                    v_name = first_item.get("locatore_name")
-                    v_surname = first_item.get("locatore_surname")
-
-                    # Aggiorniamo il database con i nomi VERI estratti dalla visura
-                    # solo se non sono già stati forniti manualmente via YAML
-                    db_upsert_person(
-                        conn, locatore_cf,
-                        surname=clean_str(adapter.get("locatore_surname")) or v_surname,
-                        name=clean_str(adapter.get("locatore_name")) or v_name,
-                        address_id=loc_addr_id
-                    )
-
-                for d in parsed_dicts:
-                    # А. Зберігаємо адресу з візури
-                    v_addr_id = db_upsert_address(conn, {
-                        "comune": d.get("immobile_comune"),
-                        "via_full": d.get("via_name") or d.get("indirizzo_raw"),
-                        "civico": d.get("via_num"),
-                        "piano": d.get("piano"),
-                        "interno": d.get("interno"),
-                        "scala": d.get("scala")
-                    })
-
-                    # Б. Створюємо/оновлюємо Immobile Master Data
-                    imm_obj = immobile_from_parsed_dict(d)
-                    imm_id = db_upsert_immobile(
-                        conn, locatore_cf, imm_obj,
-                        visura_addr_id=v_addr_id,
-                        source_visura_id=visura_db_id
-                    )
-                    keep_ids.append(imm_id)
+            adapter["visura_unchanged"] = visura_unchanged
 
-                # Очистка старих записів без контрактів
-                if keep_ids:
-                    db_prune_old_immobili_without_contracts(conn, locatore_cf, keep_ids,
-                                                            PRUNE_OLD_IMMOBILI_WITHOUT_CONTRACTS)
+            keep_ids: List[int] = []
+            if fetched_now and pdf_path and not visura_unchanged and visura_ok:
+                with self._stage(conn, "parse", stage_outcomes, spider):
+                    parse_report = ParseReport()
+                    try:
+                        # Стрімінг: immobili upsert-яться, поки парсер ще витягує наступні сторінки
+                        parsed_iter = self.parser.parse_iter(pdf_path, report=parse_report)
+                        first_item = next(parsed_iter, None)
+
+                        # Оновлюємо інформацію про Locatore з візури
+                        if first_item is not None:
+                            # Prendiamo i dati del locatore dal primo immobile trovato (sono uguali per tutti)
+                            v_name = first_item.get("locatore_name")
+                            v_surname = first_item.get("locatore_surname")
+
+                            # Aggiorniamo il database con i nomi VERI estratti dalla visura
+                            # solo se non sono già stati forniti manualmente via YAML
+                            db_upsert_person(
+                                conn, locatore_cf,
+                                surname=clean_str(adapter.get("locatore_surname")) or v_surname,
+                                name=clean_str(adapter.get("locatore_name")) or v_name,
+                                address_id=loc_addr_id,
+                                identity_map=self.identity_map
+                            )
+
+                            keep_ids = upsert_parsed_immobili(
+                                conn, locatore_cf, chain([first_item], parsed_iter), visura_db_id,
+                                PRUNE_OLD_IMMOBILI_WITHOUT_CONTRACTS, identity_map=self.identity_map
+                            )
+                    except VisuraParseError as e:
+                        # Парсер завис / з'їв пам'ять / впав: immobili, що вже записані, лишаються,
+                        # prune не виконується, а контракти йдуть по тому, що вже є в БД.
+                        spider.logger.error("[PIPELINE] Visura parse failed for %s: %s", locatore_cf, e)
+                        adapter["visura_parse_error"] = e.as_dict()
+                        # Скидаємо checksum, щоб наступний запуск не вважав цю візуру вже обробленою
+                        db_clear_visura_checksum(conn, locatore_cf)
+                        parse_report.error = str(e)
+
+                    # Звіт парсера (таймінги по сторінках, пропущені таблиці) — разом із записом візури
+                    adapter["visura_parse_report"] = parse_report.as_dict()
+                    db_update_visura_parse_report(conn, locatore_cf, adapter["visura_parse_report"])
+                if stage_outcomes["parse"]["status"] == "failed":
+                    # Immobili з візури відкочені — наступний запуск має розпарсити її знову
+                    db_clear_visura_checksum(conn, locatore_cf)
 
             # --- ЕТАП 4: ОПЕРАЦІЙНИЙ ЦИКЛ (КОНТРАКТИ ТА ГЕНЕРАЦІЯ) ---
 
@@ -233,241 +603,243 @@ class VisuraProcessor:
             selected = filter_immobiles_by_yaml(immobili_db, adapter)
 
             for immobile_id, imm in selected:
-                # 4.1.1 Обробка "реальної" адреси об'єкта (якщо вказана в YAML як override)
-                real_addr_id = None
-                if adapter.get("immobile_comune") or adapter.get("immobile_via"):
-                    real_addr_id = db_upsert_address(conn, {
-                        "comune": adapter.get("immobile_comune"),
-                        "via_full": adapter.get("immobile_via"),
-                        "civico": adapter.get("immobile_civico"),
-                        "piano": adapter.get("immobile_piano"),
-                        "interno": adapter.get("immobile_interno")
-                    })
-
-                # Оновлюємо Master Data нерухомості даними з YAML
-                db_update_immobile_real_address(
-                    conn, immobile_id,
-                    real_address_id=real_addr_id,
-                    energy_class=adapter.get("energy_class")
-                )
-
-                # 4.1.2 Записуємо елементи A-D в базу перед завантаженням контексту
-                db_upsert_immobile_elements(conn, immobile_id, adapter)
-
-                # 4.2. Контракт
-                # Створюємо або оновлюємо останній активний контракт
-                contract_id = db_upsert_contract(conn, immobile_id, adapter)
-
-                # Отримуємо повний контекст (включаючи джойни адрес та персон)
-                contract_ctx = db_load_contract_context(conn, contract_id)
-                # imm = contract_ctx['immobili']  # Оновлений Immobile з контексту
-
-                # --- ЕТАП 5: РОЗРАХУНОК КАНОНУ ---
-
-                canone_snapshot = {}
-                canone_result_snapshot = None
-
+                # Кожен immobile — окремий SAVEPOINT: помилка відкочує лише його записи,
+                # інші immobili та вже завантажені атестації комітяться разом з item-ом
+                outcome: Dict[str, Any] = {
+                    "immobile_id": immobile_id, "contract_id": None, "status": "ok",
+                    "canone": None, "attestazione": None, "error": None,
+                }
+                immobili_outcomes.append(outcome)
                 try:
-                    elements = contract_ctx.get("elements") or {}
-
-                    # Допоміжна функція для підрахунку заповнених елементів A-D
-                    def cnt(keys: List[str]) -> int:
-                        return sum(1 for k in keys if str(elements.get(k, "") or "").strip() != "")
-
-                    # -------------------------------------------------------------------------
-                    # 1. CONTRACT_KIND
-                    # Логіка: Завжди беремо з YAML або "CONCORDATO". Ніколи з БД.
-                    # -------------------------------------------------------------------------
-                    kind_raw = clean_str(adapter.get("contract_kind"))
-                    kind_str = (kind_raw or "CONCORDATO").upper()
-
-                    kind_enum = ContractKind.CONCORDATO
-                    try:
-                        kind_enum = ContractKind[kind_str]
-                    except KeyError:
-                        logger.warning(f"[CANONE] Unknown contract kind '{kind_str}', defaulting to CONCORDATO")
-                        kind_enum = ContractKind.CONCORDATO
-
-                    # -------------------------------------------------------------------------
-                    # 2. ENERGY_CLASS (Smart Patch)
-                    # Логіка: 
-                    #   - YAML == "-" -> None (видалено)
-                    #   - YAML == "A" -> "A" (оновлено)
-                    #   - YAML == None -> беремо з БД (contract_ctx['immobile']['energy_class'])
-                    # -------------------------------------------------------------------------
-                    yaml_energy = clean_str(adapter.get("energy_class"))
-                    db_energy = contract_ctx.get("immobile", {}).get(
-                        "energy_class")  # Тепер це поле доступне завдяки фіксу в db_repo
-
-                    if yaml_energy == "-":
-                        final_energy = None
-                    elif yaml_energy:
-                        final_energy = yaml_energy.upper()
-                    else:
-                        final_energy = db_energy
-
-                        # -------------------------------------------------------------------------
-                    # 3. ISTAT (Smart Patch)
-                    # -------------------------------------------------------------------------
-                    yaml_istat = adapter.get("istat")
-                    db_istat = contract_ctx.get("contract", {}).get("istat_rate")
-
-                    final_istat = None
-                    if str(yaml_istat).strip() == "-":
-                        final_istat = None
-                    elif yaml_istat is not None and str(yaml_istat).strip() != "":
-                        final_istat = safe_float(yaml_istat)
-                    elif db_istat is not None:
-                        final_istat = float(db_istat)
-
-                    # -------------------------------------------------------------------------
-                    # 4. DURATA (Smart Patch)
-                    # -------------------------------------------------------------------------
-                    yaml_durata = adapter.get("durata_anni")
-                    db_durata = contract_ctx.get("contract", {}).get("durata_anni")
-
-                    final_durata = 3  # Default 3
-                    if str(yaml_durata).strip() == "-":
-                        final_durata = 3  # Якщо видалили, повертаємось до дефолту
-                    elif yaml_durata is not None and str(yaml_durata).strip() != "":
-                        final_durata = int(yaml_durata)
-                    elif db_durata is not None:
-                        final_durata = int(db_durata)
-
-                    # -------------------------------------------------------------------------
-                    # 5. ARREDATO (Smart Patch)
-                    # -------------------------------------------------------------------------
-                    yaml_arredato = adapter.get("arredato")
-                    db_arredato = contract_ctx.get("contract", {}).get("arredato_pct")
-
-                    final_arredato = 0.0
-                    if str(yaml_arredato).strip() == "-":
-                        final_arredato = 0.0
-                    elif yaml_arredato is not None and str(yaml_arredato).strip() != "":
-                        final_arredato = safe_float(yaml_arredato) or 0.0
-                    elif db_arredato is not None:
-                        final_arredato = float(db_arredato)
-
-                    # -------------------------------------------------------------------------
-                    # 6. IGNORE_SURCHARGES
-                    # -------------------------------------------------------------------------
-                    yaml_ignore = adapter.get("ignore_surcharges")
-                    db_ignore = contract_ctx.get("contract", {}).get("ignore_surcharges")
-
-                    final_ignore = False
-                    if str(yaml_ignore).strip() == "-":
-                        final_ignore = False
-                    elif yaml_ignore is not None and str(yaml_ignore).strip() != "":
-                        final_ignore = str(yaml_ignore).lower() in ("true", "1", "yes", "y")
-                    elif db_ignore is not None:
-                        final_ignore = bool(db_ignore)
-
-                    # --- Створення об'єкта вхідних даних ---
-                    can_in = CanoneInput(
-                        superficie_catastale=float(imm.superficie_totale or adapter.get("superficie_totale") or 0),
-                        micro_zona=clean_str(imm.micro_zona),
-                        foglio=clean_str(imm.foglio),
-                        categoria_catasto=clean_str(imm.categoria),
-                        classe_catasto=clean_str(imm.classe),
-                        count_a=cnt(["a1", "a2"]),
-                        count_b=cnt([f"b{i}" for i in range(1, 6)]),
-                        count_c=cnt([f"c{i}" for i in range(1, 8)]),
-                        count_d=cnt([f"d{i}" for i in range(1, 14)]),
-
-                        arredato=final_arredato,
-                        energy_class=final_energy,
-                        contract_kind=kind_enum,
-                        durata_anni=final_durata,
-                        istat=final_istat,
-                        ignore_surcharges=final_ignore,
-                    )
-
-                    # Логування для відлагодження
-                    logger.debug(
-                        f"[CALC_INPUT] K={kind_str} En={final_energy} Arr={final_arredato} Dur={final_durata} Ign={final_ignore}")
-
-                    can_res = compute_base_canone(can_in)
-
-                    # Очищення даних для збереження в JSON
-                    canone_snapshot = prepare_for_json(can_in.__dict__)
-                    canone_result_snapshot = prepare_for_json(can_res.__dict__) if can_res else {}
-
-                    # Збереження результатів розрахунку в БД
-                    db_insert_canone_calc(
-                        conn, contract_id, "pescara2018_base",
-                        inputs={"canone_input": canone_snapshot, "result": canone_result_snapshot},
-                        result_mensile=safe_float(getattr(can_res, "canone_finale_mensile", None))
-                    )
-
-                    # Перезавантажуємо контекст після розрахунку для генератора
-                    contract_ctx = db_load_contract_context(conn, contract_id)
-
-                except Exception as e:
-                    spider.logger.warning("[CANONE] Calculation skipped or failed for contract %s: %s", contract_id, e)
-
-                # --- ЕТАП 6: ГЕНЕРАЦІЯ ТА UPLOAD ДОКУМЕНТА ---
-
-                params = build_template_params(adapter, imm, contract_ctx)
-                output_path = get_attestazione_path(locatore_cf, contract_id, imm)
-                output_path.parent.mkdir(parents=True, exist_ok=True)
-
-                try:
-                    logger.debug(f"[DEBUG_ADDR] Contract CTX: {contract_ctx.get('immobile')}")
-                    fill_attestazione_template(
-                        template_path=str(self.template_path),
-                        output_folder=str(output_path.parent),
-                        filename=output_path.name,
-                        params=params,
-                        underscored=underscored,
-                    )
-
-                    out_bucket = self.storage.cfg.attestazioni_bucket
-                    out_obj = self.storage.attestazione_object_name(locatore_cf, contract_id)
-
-                    self.storage_service.upload_file(
-                        out_bucket, out_obj, output_path,
-                        content_type="application/vnd.openxmlformats-officedocument.wordprocessingml.document"
-                    )
-
-                    # Створюємо детальний знімок даних для аудиту
-                    # Тут ми використовуємо immobile_db_row, щоб отримати очищені дані
-                    imm_data_snapshot = immobile_db_row(imm)
-
-                    params_snapshot = {
-                        "locatore_cf": locatore_cf,
-                        "immobile_id": immobile_id,
-                        "contract_id": contract_id,
-                        "yaml_item": dict(adapter.asdict()),
-                        "immobile_master_data": imm_data_snapshot,  # ВИКОРИСТАННЯ ТУТ
-                        "contract_ctx": contract_ctx,
-                        "template_version": TEMPLATE_VERSION,
-                        "canone_result": canone_result_snapshot,
-                        "output": {"bucket": out_bucket, "object": out_obj},
-                    }
-
-                    clean_params = prepare_for_json(params_snapshot)
-                    # Лог успішної генерації
-                    db_insert_attestazione_log(
-                        conn, contract_id, "generated", out_bucket, out_obj,
-                        params_snapshot=clean_params,
-                        error=None,
-                        author_login_masked=mask_username(AE_USERNAME),
-                        author_login_sha256=sha256_text(AE_USERNAME),
-                        template_version=TEMPLATE_VERSION
-                    )
-
+                    with self._savepoint(conn, "immobile"):
+                        # 4.1.1 Обробка "реальної" адреси об'єкта (якщо вказана в YAML як override)
+                        real_addr_id = None
+                        if adapter.get("immobile_comune") or adapter.get("immobile_via"):
+                            real_addr_id = db_upsert_address(conn, {
+                                "comune": adapter.get("immobile_comune"),
+                                "via_full": adapter.get("immobile_via"),
+                                "civico": adapter.get("immobile_civico"),
+                                "piano": adapter.get("immobile_piano"),
+                                "interno": adapter.get("immobile_interno")
+                            }, identity_map=self.identity_map)
+
+                        # Оновлюємо Master Data нерухомості даними з YAML
+                        db_update_immobile_real_address(
+                            conn, immobile_id,
+                            real_address_id=real_addr_id,
+                            energy_class=adapter.get("energy_class")
+                        )
+
+                        # 4.1.2 Записуємо елементи A-D в базу перед завантаженням контексту
+                        db_upsert_immobile_elements(conn, immobile_id, adapter)
+
+                        # 4.2. Контракт
+                        # Створюємо або оновлюємо останній активний контракт
+                        contract_id = db_upsert_contract(conn, immobile_id, adapter)
+                        outcome["contract_id"] = contract_id
+
+                        # Отримуємо повний контекст (включаючи джойни адрес та персон)
+                        contract_ctx = db_load_contract_context(conn, contract_id)
+                        # imm = contract_ctx['immobili']  # Оновлений Immobile з контексту
+
+                        # --- ЕТАП 5: РОЗРАХУНОК КАНОНУ ---
+
+                        canone_snapshot = {}
+                        canone_result_snapshot = None
+                        prev_canone_calc = contract_ctx.get("canone_calc")
+
+                        try:
+                            with self._savepoint(conn, "canone"):
+                                elements = contract_ctx.get("elements") or {}
+
+                                # Допоміжна функція для підрахунку заповнених елементів A-D
+                                def cnt(keys: List[str]) -> int:
+                                    return sum(1 for k in keys if str(elements.get(k, "") or "").strip() != "")
+
+                                # -------------------------------------------------------------------------
+                                # 1. CONTRACT_KIND
+                                # Логіка: Завжди беремо з YAML або "CONCORDATO". Ніколи з БД.
+                                # -------------------------------------------------------------------------
+                                kind_raw = clean_str(adapter.get("contract_kind"))
+                                kind_str = (kind_raw or "CONCORDATO").upper()
+
+                                kind_enum = ContractKind.CONCORDATO
+                                try:
+                                    kind_enum = ContractKind[kind_str]
+                                except KeyError:
+                                    logger.warning(f"[CANONE] Unknown contract kind '{kind_str}', defaulting to CONCORDATO")
+                                    kind_enum = ContractKind.CONCORDATO
+
+                                # -------------------------------------------------------------------------
+                                # 2. ENERGY_CLASS (Smart Patch)
+                                # Логіка: 
+                                #   - YAML == "-" -> None (видалено)
+                                #   - YAML == "A" -> "A" (оновлено)
+                                #   - YAML == None -> беремо з БД (contract_ctx['immobile']['energy_class'])
+                                # -------------------------------------------------------------------------
+                                yaml_energy = clean_str(adapter.get("energy_class"))
+                                db_energy = contract_ctx.get("immobile", {}).get(
+                                    "energy_class")  # Тепер це поле доступне завдяки фіксу в db_repo
+
+                                if yaml_energy == "-":
+                                    final_energy = None
+                                elif yaml_energy:
+                                    final_energy = yaml_energy.upper()
+                                else:
+                                    final_energy = db_energy
+
+                                    # -------------------------------------------------------------------------
+                                # 3. ISTAT (Smart Patch)
+                                # -------------------------------------------------------------------------
+                                yaml_istat = adapter.get("istat")
+                                db_istat = contract_ctx.get("contract", {}).get("istat_rate")
+
+                                final_istat = None
+                                if str(yaml_istat).strip() == "-":
+                                    final_istat = None
+                                elif yaml_istat is not None and str(yaml_istat).strip() != "":
+                                    final_istat = safe_float(yaml_istat)
+                                elif db_istat is not None:
+                                    final_istat = float(db_istat)
+
+                                # -------------------------------------------------------------------------
+                                # 4. DURATA (Smart Patch)
+                                # -------------------------------------------------------------------------
+                                yaml_durata = adapter.get("durata_anni")
+                                db_durata = contract_ctx.get("contract", {}).get("durata_anni")
+
+                                final_durata = 3  # Default 3
+                                if str(yaml_durata).strip() == "-":
+                                    final_durata = 3  # Якщо видалили, повертаємось до дефолту
+                                elif yaml_durata is not None and str(yaml_durata).strip() != "":
+                                    final_durata = int(yaml_durata)
+                                elif db_durata is not None:
+                                    final_durata = int(db_durata)
+
+                                # -------------------------------------------------------------------------
+                                # 5. ARREDATO (Smart Patch)
+                                # -------------------------------------------------------------------------
+                                yaml_arredato = adapter.get("arredato")
+                                db_arredato = contract_ctx.get("contract", {}).get("arredato_pct")
+
+                                final_arredato = 0.0
+                                if str(yaml_arredato).strip() == "-":
+                                    final_arredato = 0.0
+                                elif yaml_arredato is not None and str(yaml_arredato).strip() != "":
+                                    final_arredato = safe_float(yaml_arredato) or 0.0
+                                elif db_arredato is not None:
+                                    final_arredato = float(db_arredato)
+
+                                # -------------------------------------------------------------------------
+                                # 6. IGNORE_SURCHARGES
+                                # -------------------------------------------------------------------------
+                                yaml_ignore = adapter.get("ignore_surcharges")
+                                db_ignore = contract_ctx.get("contract", {}).get("ignore_surcharges")
+
+                                final_ignore = False
+                                if str(yaml_ignore).strip() == "-":
+                                    final_ignore = False
+                                elif yaml_ignore is not None and str(yaml_ignore).strip() != "":
+                                    final_ignore = str(yaml_ignore).lower() in ("true", "1", "yes", "y")
+                                elif db_ignore is not None:
+                                    final_ignore = bool(db_ignore)
+
+                                # --- Створення об'єкта вхідних даних ---
+                                can_in = CanoneInput(
+                                    superficie_catastale=float(imm.superficie_totale or adapter.get("superficie_totale") or 0),
+                                    micro_zona=clean_str(imm.micro_zona),
+                                    foglio=clean_str(imm.foglio),
+                                    categoria_catasto=clean_str(imm.categoria),
+                                    classe_catasto=clean_str(imm.classe),
+                                    count_a=cnt(["a1", "a2"]),
+                                    count_b=cnt([f"b{i}" for i in range(1, 6)]),
+                                    count_c=cnt([f"c{i}" for i in range(1, 8)]),
+                                    count_d=cnt([f"d{i}" for i in range(1, 14)]),
+
+                                    arredato=final_arredato,
+                                    energy_class=final_energy,
+                                    contract_kind=kind_enum,
+                                    durata_anni=final_durata,
+                                    istat=final_istat,
+                                    ignore_surcharges=final_ignore,
+                                )
+
+                                # Логування для відлагодження
+                                logger.debug(
+                                    f"[CALC_INPUT] K={kind_str} En={final_energy} Arr={final_arredato} Dur={final_durata} Ign={final_ignore}")
+
+                                can_res = compute_base_canone(can_in)
+
+                                # Очищення даних для збереження в JSON
+                                canone_snapshot = prepare_for_json(can_in.__dict__)
+                                canone_result_snapshot = prepare_for_json(can_res.__dict__) if can_res else {}
+
+                                # Збереження результатів розрахунку в БД
+                                canone_inputs = {"canone_input": canone_snapshot, "result": canone_result_snapshot}
+                                db_insert_canone_calc(
+                                    conn, contract_id, "pescara2018_base",
+                                    inputs=canone_inputs,
+                                    result_mensile=safe_float(getattr(can_res, "canone_finale_mensile", None))
+                                )
+
+                                # Це і є останній canone_calcoli контракту — підставляємо в контекст без перезавантаження
+                                contract_ctx["canone_calc"] = canone_inputs
+                            outcome["canone"] = "ok"
+                        except Exception as e:
+                            spider.logger.warning("[CANONE] Calculation skipped or failed for contract %s: %s", contract_id, e)
+                            outcome["canone"] = "failed"
+                            # Запис розрахунку відкочено — у документ іде попередній canone_calcoli
+                            canone_result_snapshot = None
+                            contract_ctx["canone_calc"] = prev_canone_calc
+
+                        # --- ЕТАП 6: ГЕНЕРАЦІЯ ТА UPLOAD ДОКУМЕНТА ---
+
+                        if not self.render_inline:
+                            # Воркер черги: документ генерує задача render_attestazione,
+                            # яка стає видимою разом з контрактом (та сама транзакція).
+                            # Незмінений вхід — задача не потрібна
+                            fingerprint = template_params_fingerprint(
+                                build_template_params(adapter, imm, contract_ctx), TEMPLATE_VERSION
+                            )
+                            if self._attestazione_unchanged(conn, contract_id, fingerprint):
+                                outcome["attestazione"] = "unchanged"
+                            else:
+                                enqueue_render_attestazione(
+                                    conn, self._render_item(adapter), locatore_cf, immobile_id, contract_id,
+                                    key=f"{contract_id}:{adapter.get('job_id') or item_digest(adapter)}",
+                                    force_render=self.force_render,
+                                )
+                                outcome["attestazione"] = "queued"
+                        else:
+                            try:
+                                with self._savepoint(conn, "attestazione"):
+                                    outcome["attestazione"] = self._render_attestazione(
+                                        conn, adapter, locatore_cf, immobile_id, imm, contract_id,
+                                        contract_ctx, canone_result_snapshot,
+                                    )
+                            except Exception as e:
+                                spider.logger.exception("[DOCX] Failed for contract %s", contract_id)
+                                self._log_attestazione_failure(conn, contract_id, e)
+                                outcome["attestazione"] = "failed"
+                        self.attestazione_stats[outcome["attestazione"]] += 1
                 except Exception as e:
-                    spider.logger.exception("[DOCX] Failed for contract %s", contract_id)
-                    db_insert_attestazione_log(
-                        conn, contract_id, "failed", "", "",
-                        {"error_stage": "generation_or_upload"},
-                        error=str(e),
-                        author_login_masked=mask_username(AE_USERNAME),
-                        author_login_sha256=sha256_text(AE_USERNAME),
-                        template_version=TEMPLATE_VERSION
-                    )
+                    spider.logger.exception("[PIPELINE] Immobile %s of CF %s rolled back: %s", immobile_id, locatore_cf, e)
+                    # Новий контракт відкочено разом з immobile — його ID у БД не існує
+                    outcome.update(status="failed", contract_id=None, error=str(e))
+                    continue
+                if outcome["canone"] == "failed" or outcome["attestazione"] == "failed":
+                    outcome["status"] = "partial"
 
             conn.commit()
+            self.identity_map.commit()
+
+            failed = [o["immobile_id"] for o in immobili_outcomes if o["status"] == "failed"]
+            failed_stages = [name for name, o in stage_outcomes.items() if o["status"] == "failed"]
+            if failed or failed_stages:
+                spider.logger.warning(
+                    "[PIPELINE] CF %s committed with failures: stages=%s immobili=%s",
+                    locatore_cf, failed_stages, failed,
+                )
 
             # Очистка тимчасових файлів
             if DELETE_LOCAL_VISURA_AFTER_UPLOAD and pdf_to_delete:
@@ -475,11 +847,18 @@ class VisuraProcessor:
 
             return item
 
+        except OwnerLockTimeout as e:
+            # CF зайнятий іншим воркером: нічого не записано, item обробить наступний запуск
+            spider.logger.warning("[OWNER_LOCK] %s", e)
+            adapter["owner_lock_wait_ms"] = round(e.waited_sec * 1000, 2)
+            adapter["processing_error"] = str(e)
+            conn.rollback()
+            self.identity_map.rollback()
+            return item
+
         except Exception as e:
             spider.logger.exception("[PIPELINE] Fatal error processing CF %s: %s", locatore_cf, e)
-            if conn:
-                conn.rollback()
+            adapter["processing_error"] = str(e)
+            conn.rollback()
+            self.identity_map.rollback()
             return item
-        finally:
-            if conn:
-                conn.close()
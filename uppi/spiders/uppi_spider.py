@@ -4,7 +4,7 @@
 Логіка:
 - start():
     - чистить state.json та captcha_images
-    - читає clients.yml
+    - читає clients.yml (або, з -a source=jobs, бере задачі fetch_visura з черги jobs)
     - для тих, у кого візура вже є в БД і не FORCE_UPDATE_VISURA — не чіпає SISTER, просто yield UppiItem
     - для решти — додає в self.clients_to_fetch
     - якщо список не порожній — стартує Playwright-логін в AE
@@ -25,7 +25,6 @@ import shutil
 from typing import Any, Dict, List, Optional
 
 import scrapy
-from decouple import config
 from playwright.async_api import Page, TimeoutError as PlaywrightTimeoutError
 
 from uppi.ae.auth import authenticate_user
@@ -33,34 +32,31 @@ from uppi.ae.captcha import solve_captcha_if_present
 from uppi.ae.download import download_document
 from uppi.ae.sister_navigation import open_sister_service, navigate_to_visure_catastali
 from uppi.ae.uppi_selectors import UppiSelectors
-from uppi.config import AppConfig
+from uppi.config import AppConfig, get_ae_config
 from uppi.domain.clients import load_clients
-from uppi.domain.db import get_pg_connection
+from uppi.domain.db import pg_async_connection
 from uppi.items import UppiItem
-from uppi.services.db_repo import fetch_visura_state
+from uppi.services.db_repo import (
+    extend_job_lease_async,
+    fetch_leased_jobs_async,
+    fetch_visura_states_async,
+    release_job_async,
+)
+from uppi.services.jobs import FETCH_VISURA, JOBS_BATCH_SIZE, JOBS_VISIBILITY_TIMEOUT_SEC, worker_id
 from uppi.services.storage_minio import StorageService
 from uppi.services.visura_policy import should_download_visura
 from uppi.utils.item_mapper import map_yaml_to_item
 from uppi.utils.playwright_helpers import apply_stealth, log_requests, get_webgl_vendor
 from uppi.utils.stealth import STEALTH_SCRIPT
 
-# Конфіг з env
-AE_LOGIN_URL = config("AE_LOGIN_URL")
-AE_URL_SERVIZI = config("AE_URL_SERVIZI")
-SISTER_LOGOUT_URL = config("SISTER_LOGOUT_URL")
-
-TWO_CAPTCHA_API_KEY = config("TWO_CAPTCHA_API_KEY")
-AE_USERNAME = config("AE_USERNAME")
-AE_PASSWORD = config("AE_PASSWORD")
-AE_PIN = config("AE_PIN")
-
-
 class UppiSpider(scrapy.Spider):
     name = "uppi"
     allowed_domains = ["agenziaentrate.gov.it"]
 
     # Тут складатимемо клієнтів, для яких треба реально йти в SISTER
     clients_to_fetch: List[Dict[str, Any]]
+    # Режим -a source=jobs: CF -> взята задача fetch_visura
+    leased_jobs: Dict[str, Any]
 
     async def start(self):
         """
@@ -91,18 +87,33 @@ class UppiSpider(scrapy.Spider):
         except Exception as e:
             self.logger.warning("[START] Failed to remove captcha_images folder: %s", e)
 
-        # Завантажуємо клієнтів з clients.yml
-        clients = load_clients()
+        # Клієнти: з clients.yml або (-a source=jobs) з задач fetch_visura черги jobs
+        self.leased_jobs = {}
+        if getattr(self, "source", "clients") == "jobs":
+            clients = await self._lease_fetch_jobs()
+        else:
+            clients = load_clients()
         if not clients:
-            self.logger.error("[START] No clients found in clients.yml, aborting spider")
+            self.logger.error("[START] No clients to process, aborting spider")
             return
 
         self.clients_to_fetch = []
-        self.logger.info("[START] Loaded %d clients from clients.yml", len(clients))
+        self.logger.info("[START] Loaded %d clients", len(clients))
 
         app_config = AppConfig.from_env()
         storage_service = StorageService()
 
+        # Стан візур з БД — одним асинхронним запитом, не блокуючи asyncio-реактор
+        db_states: Optional[Dict[str, Any]] = None
+        try:
+            async with pg_async_connection() as aconn:
+                db_states = await fetch_visura_states_async(
+                    aconn, [c.get("LOCATORE_CF") for c in clients if c.get("LOCATORE_CF")]
+                )
+                await aconn.commit()
+        except Exception as e:
+            self.logger.exception("[DB] Error checking visura presence: %s", e)
+
         # Вирішуємо, кого потрібно качати з SISTER
         for client in clients:
             cf = client.get("LOCATORE_CF")
@@ -112,17 +123,8 @@ class UppiSpider(scrapy.Spider):
 
             force_update = bool(client.get("FORCE_UPDATE_VISURA"))
 
-            try:
-                conn = get_pg_connection()
-                try:
-                    db_state = fetch_visura_state(conn, cf)
-                    conn.commit()
-                finally:
-                    conn.close()
-            except Exception as e:
-                self.logger.exception("[DB] Error checking visura presence for %s: %s", cf, e)
-                # Якщо БД не відповіла — краще спробувати сходити в SISTER, ніж пропустити
-                db_state = None
+            # Якщо БД не відповіла — краще спробувати сходити в SISTER, ніж пропустити
+            db_state = db_states.get(cf) if db_states is not None else None
 
             bucket = storage_service.storage.cfg.visure_bucket
             obj_name = storage_service.storage.visura_object_name(cf)
@@ -175,7 +177,7 @@ class UppiSpider(scrapy.Spider):
 
         # Стартуємо Playwright-логін у AE
         yield scrapy.Request(
-            url=AE_LOGIN_URL,
+            url=get_ae_config().login_url,
             callback=self.login_and_fetch_visura,
             meta={
                 "playwright": True,
@@ -186,6 +188,59 @@ class UppiSpider(scrapy.Spider):
             dont_filter=True,
         )
 
+    async def _lease_fetch_jobs(self) -> List[Dict[str, Any]]:
+        """
+        Бере до -a batch=N (JOBS_BATCH_SIZE) задач fetch_visura. Задачі запам'ятовуються в
+        self.leased_jobs за CF — UppiPipeline передає по них результат далі (hand_off_fetched_item).
+        Задача, до якої павук не дійшов (логін не вдався), повернеться в чергу після visibility timeout.
+        Друга задача на той самий CF у пакеті одразу повертається в чергу без витрати спроби.
+        """
+        batch = int(getattr(self, "batch", JOBS_BATCH_SIZE))
+        clients = []
+        try:
+            async with pg_async_connection() as aconn:
+                jobs = await fetch_leased_jobs_async(aconn, FETCH_VISURA, worker_id(), batch, JOBS_VISIBILITY_TIMEOUT_SEC)
+                for job in jobs:
+                    client = job.payload.get("client") or {}
+                    cf = client.get("LOCATORE_CF")
+                    if cf and cf not in self.leased_jobs:
+                        self.leased_jobs[cf] = job
+                        clients.append(client)
+                        continue
+                    # Без CF або дубль CF у пакеті: не виконуємо, але й не тримаємо running до timeout-у
+                    await release_job_async(aconn, job.id, job.attempts)
+                    self.logger.info("[JOBS] fetch_visura job %s released back to queue (CF=%s)", job.id, cf)
+                await aconn.commit()
+        except Exception as e:
+            self.logger.exception("[JOBS] Cannot lease fetch_visura jobs: %s", e)
+            self.leased_jobs.clear()
+            return []
+
+        self.logger.info("[JOBS] Leased %d fetch_visura jobs", len(clients))
+        return clients
+
+    async def _extend_job_lease(self, cf: Optional[str]) -> bool:
+        """
+        Продовжує lease задачі CF перед обробкою клієнта: пакет бере спільний lease, і поки
+        павук проходить попередніх клієнтів, він міг минути. False — задачу вже взяв інший
+        воркер, клієнта пропускаємо. Без черги (clients.yml) або без задачі — завжди True.
+        """
+        job = self.leased_jobs.get(cf) if cf else None
+        if job is None:
+            return True
+        try:
+            async with pg_async_connection() as aconn:
+                ok = await extend_job_lease_async(aconn, job.id, job.attempts, JOBS_VISIBILITY_TIMEOUT_SEC)
+                await aconn.commit()
+        except Exception as e:
+            # БД недоступна — пробуємо обробити: фіналізація однаково захищена attempts
+            self.logger.warning("[JOBS] Cannot extend lease of job %s (CF=%s): %s", job.id, cf, e)
+            return True
+        if not ok:
+            self.leased_jobs.pop(cf, None)
+            self.logger.warning("[JOBS] fetch_visura job %s (CF=%s) was re-leased by another worker, skipped", job.id, cf)
+        return ok
+
     async def login_and_fetch_visura(self, response):
         """
         Playwright-callback:
@@ -208,14 +263,16 @@ class UppiSpider(scrapy.Spider):
         except Exception as e:
             self.logger.warning("[LOGIN] Pre-navigation setup failed: %s", e)
 
+        ae = get_ae_config()
+
         # Логін у AE
         login_ok = False
         try:
             login_ok = await authenticate_user(
                 page=page,
-                ae_username=AE_USERNAME,
-                ae_password=AE_PASSWORD,
-                ae_pin=AE_PIN,
+                ae_username=ae.username,
+                ae_password=ae.password,
+                ae_pin=ae.pin,
                 logger=self.logger,
             )
         except PlaywrightTimeoutError as err:
@@ -233,7 +290,7 @@ class UppiSpider(scrapy.Spider):
         try:
             sister_page = await open_sister_service(
                 ae_page=page,
-                servizi_url=AE_URL_SERVIZI,
+                servizi_url=ae.url_servizi,
                 logger=self.logger,
                 safe_close_page=self.safe_close_page,
             )
@@ -252,6 +309,8 @@ class UppiSpider(scrapy.Spider):
             total = len(self.clients_to_fetch)
             for idx, client in enumerate(self.clients_to_fetch, start=1):
                 cf = client.get("LOCATORE_CF")
+                if not await self._extend_job_lease(cf):
+                    continue
                 comune = client.get("COMUNE") or "PESCARA"
                 tipo_catasto = client.get("TIPO_CATASTO") or "F"
                 ufficio_label = client.get("UFFICIO_PROVINCIALE_LABEL") or "PESCARA Territorio"
@@ -298,7 +357,7 @@ class UppiSpider(scrapy.Spider):
                 # 2. Обробка CAPTCHA (якщо є)
                 captcha_ok = await solve_captcha_if_present(
                     page=sister_page,
-                    two_captcha_key=TWO_CAPTCHA_API_KEY,
+                    two_captcha_key=ae.two_captcha_api_key,
                     logger=self.logger,
                     codice_fiscale=cf,
                 )
@@ -405,7 +464,7 @@ class UppiSpider(scrapy.Spider):
                 )
                 page = await context.new_page()
                 try:
-                    await page.goto(SISTER_LOGOUT_URL, wait_until="networkidle", timeout=8_000)
+                    await page.goto(get_ae_config().sister_logout_url, wait_until="networkidle", timeout=8_000)
                     self.logger.info("[LOGOUT] Navigated to logout endpoint (temp page)")
                     await page.wait_for_timeout(600)
                 except Exception as e:
@@ -443,7 +502,7 @@ class UppiSpider(scrapy.Spider):
             # 2) Якщо через UI не вдалось — йдемо на endpoint
             if not ui_success:
                 try:
-                    await page.goto(SISTER_LOGOUT_URL, wait_until="networkidle", timeout=8_000)
+                    await page.goto(get_ae_config().sister_logout_url, wait_until="networkidle", timeout=8_000)
                     # LOGOUT_BUTTON тут умовний маркер, може не з'явитись — не критично
                     try:
                         await page.wait_for_selector(UppiSelectors.LOGOUT_BUTTON, timeout=8_000)
@@ -509,7 +568,7 @@ class UppiSpider(scrapy.Spider):
 
         # Якщо сторінки немає — плануємо окремий Request для відкриття нової сторінки з logout URL
         try:
-            logout_full_url = SISTER_LOGOUT_URL
+            logout_full_url = get_ae_config().sister_logout_url
             req = scrapy.Request(
                 url=logout_full_url,
                 callback=self._logout_callback,
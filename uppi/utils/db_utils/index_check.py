@@ -0,0 +1,192 @@
+"""
+EXPLAIN-перевірка: кожен запит db_repo йде по індексу.
+
+Сценарій викликає всі функції db_repo на тестових даних (CF CHECK_CF) в одній
+транзакції, яка потім відкочується. Перед кожним execute той самий SQL з тими ж
+параметрами проганяється через EXPLAIN (FORMAT JSON) — без виконання. Функцію,
+що видала запит, визначаємо за стеком викликів.
+
+enable_seqscan = off: на малих (dev) таблицях планувальник обрав би Seq Scan навіть
+за наявності індексу; з вимкненим Seq Scan лишається тільки там, де індексу немає.
+
+    python -m uppi.utils.db_utils.migrate check-indexes
+"""
+from __future__ import annotations
+
+import inspect
+import sys
+from datetime import datetime, timezone
+from dataclasses import dataclass, field
+from typing import Any, Dict, List
+
+from itemadapter import ItemAdapter
+
+from uppi.domain.immobile import Immobile
+from uppi.services import db_repo
+
+CHECK_CF = "IDXCHECK0000001"
+CHECK_COMUNE = "IDXCHECK"
+
+
+def seq_scans(plan: Dict[str, Any]) -> List[str]:
+    """Таблиці, які план читає Seq Scan-ом (рекурсивно по вузлах плану EXPLAIN FORMAT JSON)."""
+    found: List[str] = []
+    if plan.get("Node Type") == "Seq Scan":
+        found.append(plan.get("Relation Name", "?"))
+    for child in plan.get("Plans", []):
+        found.extend(seq_scans(child))
+    return found
+
+
+@dataclass
+class QueryPlan:
+    function: str
+    sql: str
+    seq_scans: List[str]
+
+
+@dataclass
+class IndexCheckReport:
+    plans: List[QueryPlan] = field(default_factory=list)
+    # Функції db_repo, які сценарій не викликав (запити не перевірені)
+    unexercised: List[str] = field(default_factory=list)
+
+    @property
+    def ok(self) -> bool:
+        return not self.unexercised and not any(p.seq_scans for p in self.plans)
+
+
+def _repository_caller() -> str:
+    # Найближча публічна функція db_repo у стеку (приватні хелпери — частина її запитів)
+    frame = sys._getframe(2)
+    while frame is not None:
+        if frame.f_globals.get("__name__") == db_repo.__name__ and not frame.f_code.co_name.startswith("_"):
+            return frame.f_code.co_name
+        frame = frame.f_back
+    return "?"
+
+
+def _explain(conn, report: IndexCheckReport, function: str, sql: str, params: Any) -> None:
+    with conn.cursor() as cur:
+        cur.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+        plan = cur.fetchone()[0][0]["Plan"]
+    report.plans.append(QueryPlan(function=function, sql=" ".join(sql.split()), seq_scans=seq_scans(plan)))
+
+
+class _ExplainingCursor:
+    def __init__(self, conn, cur, report: IndexCheckReport):
+        self._conn = conn
+        self._cur = cur
+        self._report = report
+
+    def __enter__(self):
+        self._cur.__enter__()
+        return self
+
+    def __exit__(self, *exc):
+        return self._cur.__exit__(*exc)
+
+    def execute(self, sql, params=None, **kwargs):
+        _explain(self._conn, self._report, _repository_caller(), sql, params)
+        return self._cur.execute(sql, params, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+
+class ExplainingConnection:
+    """Обгортка з'єднання для db_repo: EXPLAIN перед кожним запитом."""
+
+    def __init__(self, conn, report: IndexCheckReport):
+        self._conn = conn
+        self._report = report
+
+    def cursor(self, *args, **kwargs):
+        return _ExplainingCursor(self._conn, self._conn.cursor(*args, **kwargs), self._report)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+
+def repository_functions() -> List[str]:
+    return sorted(
+        name for name, obj in vars(db_repo).items()
+        if inspect.isfunction(obj) and obj.__module__ == db_repo.__name__
+        and (name.startswith("db_") or name.startswith("fetch_"))
+    )
+
+
+def exercise_repository(conn) -> None:
+    """Викликає кожну функцію db_repo, що ходить у БД (порядок — як у process_item)."""
+    db_repo.db_try_lock_owner(conn, CHECK_CF)
+    db_repo.db_lock_owner(conn, CHECK_CF, 1000)
+    addr = {"comune": CHECK_COMUNE, "via_full": "VIA DEGLI INDICI", "civico": "1"}
+    addr_id = db_repo.db_upsert_address(conn, addr)
+    db_repo.db_bulk_upsert_addresses(conn, [addr, {**addr, "civico": "2"}])
+    db_repo.db_upsert_person(conn, CHECK_CF, "CHECK", "INDEX", addr_id)
+
+    visura_id = db_repo.db_upsert_visura(conn, CHECK_CF, "idx-check", "idx-check.pdf", "0" * 64, fetched_now=True)
+    db_repo.fetch_visura_state(conn, CHECK_CF)
+    db_repo.db_update_visura_parse_report(conn, CHECK_CF, {"check": True})
+    db_repo.db_clear_visura_checksum(conn, CHECK_CF)
+
+    imm = Immobile(foglio="1", numero="1", sub="1", categoria="A/2", superficie_totale=50.0)
+    (imm_id,) = db_repo.db_bulk_upsert_immobili(conn, CHECK_CF, [(imm, addr_id)], source_visura_id=visura_id)
+    db_repo.db_upsert_immobile(conn, CHECK_CF, imm, addr_id, visura_id)
+    db_repo.db_update_immobile_real_address(conn, imm_id, addr_id, "E")
+    db_repo.db_load_immobili(conn, CHECK_CF)
+    db_repo.db_upsert_immobile_elements(conn, imm_id, ItemAdapter({"a1": "X", "b1": "-"}))
+
+    contract_id = db_repo.db_upsert_contract(conn, imm_id, ItemAdapter({"durata_anni": "3"}))
+    db_repo.db_insert_canone_calc(conn, contract_id, "check", {"result": {}}, 100.0)
+    db_repo.db_load_contract_context(conn, contract_id)
+    db_repo.db_insert_attestazione_log(
+        conn, contract_id, "check", "idx-check", "idx-check.docx", {}, None, "***", "0" * 64, "check"
+    )
+    db_repo.db_last_attestazione_fingerprint(conn, contract_id)
+    db_repo.db_prune_old_immobili_without_contracts(conn, CHECK_CF, [imm_id], True)
+    db_repo.db_insert_run_ledger(conn, "idx-check", datetime.now(timezone.utc), 0, {})
+
+    job_id = db_repo.db_enqueue_job(conn, "process_client", CHECK_CF, {"check": True}, 3)
+    db_repo.db_count_ready_jobs(conn, "process_client")
+    db_repo.db_lease_jobs(conn, "process_client", "idx-check", 1, 60)
+    db_repo.db_extend_job_lease(conn, job_id or 0, 1, 60)
+    db_repo.db_release_job(conn, job_id or 0, 1)
+    db_repo.db_fail_job(conn, job_id or 0, 1, "check", 60)
+    db_repo.db_complete_job(conn, job_id or 0, 1, {"check": True})
+    db_repo.db_fail_expired_jobs(conn, "process_client")
+    db_repo.db_job_counts(conn)
+
+
+def run_index_check(conn) -> IndexCheckReport:
+    report = IndexCheckReport()
+    conn.rollback()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SET LOCAL enable_seqscan = off;")
+        exercise_repository(ExplainingConnection(conn, report))
+        # Async-функції сценарій не викликає — їх SQL перевіряємо напряму
+        _explain(conn, report, "fetch_visura_states_async", db_repo.FETCH_VISURA_STATES_SQL, ([CHECK_CF],))
+        _explain(conn, report, "fetch_leased_jobs_async", db_repo.LEASE_JOBS_SQL, {
+            "kind": "fetch_visura", "worker": "idx-check", "limit": 1, "visibility_sec": 60.0,
+        })
+        _explain(conn, report, "extend_job_lease_async", db_repo.EXTEND_JOB_LEASE_SQL, (60.0, 0, 1))
+        _explain(conn, report, "release_job_async", db_repo.RELEASE_JOB_SQL, (0, 1))
+    finally:
+        conn.rollback()
+    covered = {p.function for p in report.plans}
+    report.unexercised = [name for name in repository_functions() if name not in covered]
+    return report
+
+
+def print_report(report: IndexCheckReport, out=None) -> bool:
+    out = out or sys.stdout
+    for plan in report.plans:
+        status = f"SEQ SCAN: {', '.join(plan.seq_scans)}" if plan.seq_scans else "ok"
+        print(f"  {plan.function:<45} {status}", file=out)
+        if plan.seq_scans:
+            print(f"      {plan.sql[:200]}", file=out)
+    for name in report.unexercised:
+        print(f"  {name:<45} НЕ ПЕРЕВІРЕНО (немає в сценарії)", file=out)
+    print("OK: усі запити йдуть по індексах" if report.ok else "FAIL", file=out)
+    return report.ok
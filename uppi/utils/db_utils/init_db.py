@@ -1,48 +1,49 @@
+"""
+Ініціалізація / оновлення схеми БД — застосовує всі міграції з migrations/.
+
+    python -m uppi.utils.db_utils.init_db
+
+Те саме, що `python -m uppi.utils.db_utils.migrate`. Підключення — через
+uppi.domain.db (DB_* з .env, у т.ч. DB_SSL_MODE).
+"""
+import sys
+
 import psycopg
-from decouple import config
 
-def execute_sql_file(filename, db_config):
+from uppi.domain.db import get_pg_connection
+from uppi.utils.db_utils.migrate import main
+
+
+def execute_sql_file(filename):
     """
-    Виконує SQL-запити з вказаного файлу для ініціалізації схеми бази даних.
+    Виконує SQL-запити з вказаного файлу однією транзакцією (напр. truncate_all_tables.sql).
+    Зміни схеми — лише через міграції.
     """
     conn = None
-    cursor = None
-    
+
     try:
-        print(f"Спроба підключення до {db_config['host']}...")
-        conn = psycopg.connect(**db_config)
-        cursor = conn.cursor()
-        
+        conn = get_pg_connection()
+
         print(f"Читання файлу {filename}...")
         with open(filename, 'r', encoding='utf-8') as f:
             sql_script = f.read()
-        
+
         print("Виконання SQL-запитів...")
-        cursor.execute(sql_script)
-        
+        with conn.cursor() as cursor:
+            cursor.execute(sql_script)
+
         conn.commit()
-        print("Схему успішно створено!")
-        
-    except Exception as e:
+        print("Готово!")
+
+    except (OSError, psycopg.Error) as e:
         print(f"❌ Помилка при виконанні: {e}")
         if conn:
             conn.rollback()
     finally:
-        if cursor:
-            cursor.close()
-        if conn: 
+        if conn:
             conn.close()
         print("З'єднання закрите.")
 
-#  НАЛАШТУВАННЯ БАЗИ ДАНИХ З .ENV ФАЙЛУ
-config_db = {
-    "dbname": config("DB_NAME", default="uppi_db"),
-    "user": config("DB_USER", default="uppi_user"),     
-    "password": config("DB_PASSWORD", default="uppi_password"), 
-    "host": config("DB_HOST", default="localhost"),
-    "port": config("DB_PORT", default="5432"),
-    "sslmode": "require" 
-}
 
 if __name__ == "__main__":
-    execute_sql_file('uppi/utils/db_utils/uppi_schema.sql', config_db)
\ No newline at end of file
+    sys.exit(main(["up"]))
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+"""
+Версійовані міграції схеми PostgreSQL.
+
+Міграції — файли migrations/NNNN_name.sql, застосовуються по зростанню NNNN,
+кожна у своїй транзакції разом із записом у public.schema_migrations
+(version, name, checksum). Застосовану міграцію не можна редагувати: зміна
+checksum — помилка, нова зміна схеми = новий файл.
+
+Паралельні запуски серіалізуються session advisory lock-ом.
+
+Запуск:
+    python -m uppi.utils.db_utils.migrate                  # застосувати нові міграції
+    python -m uppi.utils.db_utils.migrate status           # що застосовано / що ні
+    python -m uppi.utils.db_utils.migrate check-indexes    # EXPLAIN усіх запитів db_repo
+"""
+from __future__ import annotations
+
+import argparse
+import hashlib
+import logging
+import re
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = Path(__file__).resolve().parent / "migrations"
+MIGRATION_FILE_REGEX = re.compile(r"^(\d{4})_([a-z0-9_]+)\.sql$")
+
+# Ключ pg_advisory_lock для раннера (довільна константа, унікальна в межах БД)
+MIGRATIONS_LOCK_KEY = 7_310_001
+
+SCHEMA_MIGRATIONS_DDL = """
+CREATE TABLE IF NOT EXISTS public.schema_migrations (
+  version       INTEGER PRIMARY KEY,
+  name          TEXT NOT NULL,
+  checksum      TEXT NOT NULL,
+  applied_at    TIMESTAMPTZ NOT NULL DEFAULT now(),
+  execution_ms  INTEGER
+);
+"""
+
+
+class MigrationError(RuntimeError):
+    """Стан schema_migrations не узгоджується з каталогом міграцій."""
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    name: str
+    path: Path
+
+    @property
+    def sql(self) -> str:
+        return self.path.read_text(encoding="utf-8")
+
+    @property
+    def checksum(self) -> str:
+        return hashlib.sha256(self.path.read_bytes()).hexdigest()
+
+    @property
+    def label(self) -> str:
+        return f"{self.version:04d}_{self.name}"
+
+
+def discover_migrations(directory: Path = MIGRATIONS_DIR) -> List[Migration]:
+    migrations: Dict[int, Migration] = {}
+    for path in sorted(directory.glob("*.sql")):
+        m = MIGRATION_FILE_REGEX.match(path.name)
+        if not m:
+            raise MigrationError(f"Назва міграції не у форматі NNNN_name.sql: {path.name}")
+        version = int(m.group(1))
+        if version in migrations:
+            raise MigrationError(f"Дві міграції з версією {version:04d}: {migrations[version].path.name}, {path.name}")
+        migrations[version] = Migration(version=version, name=m.group(2), path=path)
+    return [migrations[v] for v in sorted(migrations)]
+
+
+def applied_migrations(conn) -> Dict[int, Tuple[str, str]]:
+    """version -> (name, checksum) із schema_migrations (таблиця створюється, якщо її немає)."""
+    with conn.cursor() as cur:
+        cur.execute(SCHEMA_MIGRATIONS_DDL)
+        cur.execute("SELECT version, name, checksum FROM public.schema_migrations ORDER BY version;")
+        rows = cur.fetchall()
+    conn.commit()
+    return {version: (name, checksum) for version, name, checksum in rows}
+
+
+def pending_migrations(applied: Dict[int, Tuple[str, str]], migrations: List[Migration]) -> List[Migration]:
+    """
+    Міграції, яких ще немає в БД. Кидає MigrationError, якщо застосовану міграцію
+    змінили або видалили з каталогу.
+    """
+    known = {m.version: m for m in migrations}
+    missing = sorted(set(applied) - set(known))
+    if missing:
+        raise MigrationError(f"Міграції є в БД, але не в каталозі: {', '.join(f'{v:04d}' for v in missing)}")
+    for version, (_, checksum) in applied.items():
+        if known[version].checksum != checksum:
+            raise MigrationError(f"Застосовану міграцію {known[version].label} змінено (checksum не збігається)")
+    return [m for m in migrations if m.version not in applied]
+
+
+def apply_migration(conn, migration: Migration) -> float:
+    """Застосовує одну міграцію в одній транзакції. Повертає час виконання в секундах."""
+    t0 = time.perf_counter()
+    try:
+        with conn.cursor() as cur:
+            # Без параметрів psycopg виконує кілька statement-ів за раз (DO $$ ... $$ теж)
+            cur.execute(migration.sql)
+            elapsed = time.perf_counter() - t0
+            cur.execute(
+                """
+                INSERT INTO public.schema_migrations (version, name, checksum, execution_ms)
+                VALUES (%s, %s, %s, %s);
+                """,
+                (migration.version, migration.name, migration.checksum, int(elapsed * 1000)),
+            )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return elapsed
+
+
+def migrate(conn, migrations: Optional[List[Migration]] = None, target: Optional[int] = None) -> List[Migration]:
+    """
+    Застосовує всі нові міграції (до target включно, якщо задано). Повертає застосовані.
+    """
+    migrations = discover_migrations() if migrations is None else migrations
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_lock(%s);", (MIGRATIONS_LOCK_KEY,))
+    conn.commit()
+    try:
+        pending = pending_migrations(applied_migrations(conn), migrations)
+        if target is not None:
+            pending = [m for m in pending if m.version <= target]
+        for migration in pending:
+            elapsed = apply_migration(conn, migration)
+            logger.info("[MIGRATE] %s застосовано за %.0f мс", migration.label, elapsed * 1000)
+        return pending
+    finally:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_unlock(%s);", (MIGRATIONS_LOCK_KEY,))
+        conn.commit()
+
+
+def print_status(conn, migrations: List[Migration]) -> None:
+    applied = applied_migrations(conn)
+    for m in migrations:
+        if m.version not in applied:
+            state = "pending"
+        elif applied[m.version][1] != m.checksum:
+            state = "CHANGED"
+        else:
+            state = "applied"
+        print(f"  {m.label:<40} {state}")
+    for version in sorted(set(applied) - {m.version for m in migrations}):
+        print(f"  {version:04d}_{applied[version][0]:<35} MISSING FROM DIR")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Міграції схеми PostgreSQL")
+    parser.add_argument("command", nargs="?", default="up", choices=["up", "status", "check-indexes"])
+    parser.add_argument("--target", type=int, help="Застосувати міграції лише до цієї версії включно")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+
+    from uppi.domain.db import get_pg_connection
+
+    migrations = discover_migrations()
+    conn = get_pg_connection()
+    try:
+        if args.command == "status":
+            print_status(conn, migrations)
+            return 0
+        if args.command == "check-indexes":
+            from uppi.utils.db_utils.index_check import print_report, run_index_check
+
+            return 0 if print_report(run_index_check(conn)) else 1
+        try:
+            applied = migrate(conn, migrations, target=args.target)
+        except MigrationError as e:
+            logger.error("[MIGRATE] %s", e)
+            return 1
+        print(f"Застосовано міграцій: {len(applied)}" + (f" ({', '.join(m.label for m in applied)})" if applied else ""))
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,6 @@
-BEGIN;
+-- Базова схема (колишній uppi_schema.sql).
+-- Транзакцією керує раннер міграцій (uppi/utils/db_utils/migrate.py), тому без BEGIN/COMMIT.
+-- Ідемпотентна: БД, створені ще через init_db.py, отримують її як першу застосовану міграцію.
 
 -- =========================================================
 -- 0. EXTENSIONS & TYPES
@@ -57,6 +59,7 @@ CREATE TABLE IF NOT EXISTS public.persons (
   updated_at          TIMESTAMPTZ DEFAULT now()
 );
 
+DROP TRIGGER IF EXISTS trg_persons_upd ON public.persons;
 CREATE TRIGGER trg_persons_upd BEFORE UPDATE ON public.persons FOR EACH ROW EXECUTE FUNCTION set_updated_at();
 
 -- =========================================================
@@ -68,6 +71,7 @@ CREATE TABLE IF NOT EXISTS public.visure (
   pdf_bucket      TEXT NOT NULL,
   pdf_object      TEXT NOT NULL,
   checksum_sha256 TEXT,
+  parse_report    JSONB, -- Телеметрія останнього парсингу (таймінги по сторінках, пропущені таблиці)
   fetched_at      TIMESTAMPTZ DEFAULT now(),
   updated_at      TIMESTAMPTZ DEFAULT now(),
   
@@ -75,6 +79,9 @@ CREATE TABLE IF NOT EXISTS public.visure (
   UNIQUE(locatore_cf)
 );
 
+-- Для БД, створених до появи колонки
+ALTER TABLE public.visure ADD COLUMN IF NOT EXISTS parse_report JSONB;
+
 -- =========================================================
 -- 4. IMMOBILI (Master Data: Property Units)
 -- =========================================================
@@ -116,6 +123,7 @@ CREATE TABLE IF NOT EXISTS public.immobili (
 );
 
 CREATE INDEX IF NOT EXISTS idx_immobili_owner_cf ON public.immobili(owner_cf);
+DROP TRIGGER IF EXISTS trg_immobili_upd ON public.immobili;
 CREATE TRIGGER trg_immobili_upd BEFORE UPDATE ON public.immobili FOR EACH ROW EXECUTE FUNCTION set_updated_at();
 
 -- =========================================================
@@ -165,6 +173,7 @@ CREATE TABLE IF NOT EXISTS public.contracts (
 );
 
 CREATE INDEX IF NOT EXISTS idx_contracts_immobile_id ON public.contracts(immobile_id);
+DROP TRIGGER IF EXISTS trg_contracts_upd ON public.contracts;
 CREATE TRIGGER trg_contracts_upd BEFORE UPDATE ON public.contracts FOR EACH ROW EXECUTE FUNCTION set_updated_at();
 
 -- =========================================================
@@ -206,5 +215,3 @@ CREATE TABLE IF NOT EXISTS public.canone_calcoli (
 );
 
 CREATE INDEX IF NOT EXISTS idx_canone_calcoli_contract_id ON public.canone_calcoli(contract_id);
-
-COMMIT;
\ No newline at end of file
@@ -0,0 +1,19 @@
+-- Індекси під запити, які реально виконує db_repo (фільтр по owner_cf, а не visura_cf).
+-- Перевірка: python -m uppi.utils.db_utils.migrate check-indexes
+
+-- immobili(owner_cf, foglio, numero, sub): вже є як UNIQUE (ON CONFLICT у db_bulk_upsert_immobili,
+-- WHERE owner_cf у db_load_immobili / prune). Окремий індекс по owner_cf — його префікс, зайвий.
+DROP INDEX IF EXISTS public.idx_immobili_owner_cf;
+
+-- contracts: "останній контракт об'єкта" (UPSERT_CONTRACT_SQL) —
+-- WHERE immobile_id = ? ORDER BY created_at DESC LIMIT 1 без сортування.
+CREATE INDEX IF NOT EXISTS idx_contracts_immobile_created
+    ON public.contracts(immobile_id, created_at DESC);
+DROP INDEX IF EXISTS public.idx_contracts_immobile_id;
+
+-- canone_calcoli(contract_id, calculated_at DESC): останній розрахунок у db_load_contract_context
+-- обслуговує UNIQUE(contract_id, calculated_at) зворотним index scan-ом; одноколонковий індекс — його префікс.
+DROP INDEX IF EXISTS public.idx_canone_calcoli_contract_id;
+
+-- attestazioni(contract_id) — idx_attestazioni_contract_id, addresses(content_hash) — idx_addresses_hash:
+-- обидва вже в 0001_baseline.sql.
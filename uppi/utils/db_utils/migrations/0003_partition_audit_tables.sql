@@ -0,0 +1,117 @@
+-- Місячне range-партиціонування журналів canone_calcoli (calculated_at) та attestazioni (generated_at).
+-- Партиції — <table>_pYYYYMM (місяці за UTC) + <table>_default для рядків поза створеними діапазонами.
+-- Нові партиції та retention: python -m uppi.utils.db_utils.partitions
+
+-- Створює партицію місяця month_start (рядки з _default у цьому діапазоні переносяться в неї).
+-- Повертає true, якщо партицію створено.
+CREATE OR REPLACE FUNCTION public.ensure_monthly_partition(parent TEXT, key_column TEXT, month_start DATE)
+RETURNS BOOLEAN AS $$
+DECLARE
+  m         DATE := date_trunc('month', month_start)::date;
+  part      TEXT := format('%s_p%s', parent, to_char(m, 'YYYYMM'));
+  lo        TIMESTAMPTZ := m::timestamp AT TIME ZONE 'UTC';
+  hi        TIMESTAMPTZ := (m + INTERVAL '1 month')::timestamp AT TIME ZONE 'UTC';
+BEGIN
+  IF to_regclass(format('public.%I', part)) IS NOT NULL THEN
+    RETURN false;
+  END IF;
+
+  EXECUTE format('CREATE TABLE public.%I (LIKE public.%I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', part, parent);
+
+  -- ATTACH перевіряє, що в _default немає рядків нового діапазону — переносимо їх заздалегідь
+  IF to_regclass(format('public.%I', parent || '_default')) IS NOT NULL THEN
+    EXECUTE format(
+      'WITH moved AS (DELETE FROM public.%I WHERE %I >= $1 AND %I < $2 RETURNING *) INSERT INTO public.%I SELECT * FROM moved',
+      parent || '_default', key_column, key_column, part
+    ) USING lo, hi;
+  END IF;
+
+  EXECUTE format('ALTER TABLE public.%I ATTACH PARTITION public.%I FOR VALUES FROM (%L) TO (%L)', parent, part, lo, hi);
+  RETURN true;
+END;
+$$ LANGUAGE plpgsql;
+
+-- =========================================================
+-- CANONE_CALCOLI
+-- =========================================================
+ALTER TABLE public.canone_calcoli RENAME TO canone_calcoli_legacy;
+ALTER INDEX IF EXISTS public.canone_calcoli_pkey RENAME TO canone_calcoli_legacy_pkey;
+ALTER INDEX IF EXISTS public.canone_calcoli_contract_id_calculated_at_key
+  RENAME TO canone_calcoli_legacy_contract_id_calculated_at_key;
+
+-- PK / UNIQUE партиціонованої таблиці мають містити ключ партиціонування
+CREATE TABLE public.canone_calcoli (
+  id             UUID NOT NULL DEFAULT gen_random_uuid(),
+  contract_id    UUID NOT NULL REFERENCES public.contracts(id) ON DELETE CASCADE,
+
+  inputs         JSONB, -- Що зайшло в калькулятор (площа, зона, елементи)
+  min_val        NUMERIC(12, 2), -- Базова вилка
+  max_val        NUMERIC(12, 2),
+  result_mensile NUMERIC(12, 2), -- Фінальна цифра
+
+  calculated_at  TIMESTAMPTZ NOT NULL DEFAULT now(),
+
+  CONSTRAINT canone_calcoli_pkey PRIMARY KEY (id, calculated_at),
+  -- Обслуговує і "останній розрахунок контракту" (зворотний index scan у кожній партиції)
+  CONSTRAINT canone_calcoli_contract_id_calculated_at_key UNIQUE (contract_id, calculated_at)
+) PARTITION BY RANGE (calculated_at);
+
+CREATE TABLE public.canone_calcoli_default PARTITION OF public.canone_calcoli DEFAULT;
+
+SELECT public.ensure_monthly_partition('canone_calcoli', 'calculated_at', m::date)
+FROM generate_series(
+  date_trunc('month', COALESCE((SELECT min(calculated_at) FROM public.canone_calcoli_legacy), now()) AT TIME ZONE 'UTC'),
+  date_trunc('month', now() AT TIME ZONE 'UTC') + INTERVAL '3 months',
+  INTERVAL '1 month'
+) AS m;
+
+INSERT INTO public.canone_calcoli (id, contract_id, inputs, min_val, max_val, result_mensile, calculated_at)
+SELECT id, contract_id, inputs, min_val, max_val, result_mensile, calculated_at
+FROM public.canone_calcoli_legacy;
+
+DROP TABLE public.canone_calcoli_legacy;
+
+-- =========================================================
+-- ATTESTAZIONI
+-- =========================================================
+ALTER TABLE public.attestazioni RENAME TO attestazioni_legacy;
+ALTER INDEX IF EXISTS public.attestazioni_pkey RENAME TO attestazioni_legacy_pkey;
+DROP INDEX IF EXISTS public.idx_attestazioni_contract_id;
+
+CREATE TABLE public.attestazioni (
+  id                  UUID NOT NULL DEFAULT gen_random_uuid(),
+  contract_id         UUID NOT NULL REFERENCES public.contracts(id) ON DELETE CASCADE,
+  generated_at        TIMESTAMPTZ NOT NULL DEFAULT now(),
+
+  output_bucket       TEXT NOT NULL,
+  output_object       TEXT NOT NULL,
+
+  -- Повний знімок даних, що пішли в шаблон (JSON).
+  -- Це дозволяє відтворити документ навіть якщо дані в contracts/immobili змінилися.
+  full_data_snapshot  JSONB NOT NULL,
+
+  author_hash         TEXT, -- хеш юзера, що запустив процес
+  status              TEXT NOT NULL DEFAULT 'generated',
+
+  CONSTRAINT attestazioni_pkey PRIMARY KEY (id, generated_at)
+) PARTITION BY RANGE (generated_at);
+
+-- attestazioni(contract_id) + "остання атестація контракту" для retention
+CREATE INDEX idx_attestazioni_contract_generated ON public.attestazioni(contract_id, generated_at DESC);
+
+CREATE TABLE public.attestazioni_default PARTITION OF public.attestazioni DEFAULT;
+
+SELECT public.ensure_monthly_partition('attestazioni', 'generated_at', m::date)
+FROM generate_series(
+  date_trunc('month', COALESCE((SELECT min(generated_at) FROM public.attestazioni_legacy), now()) AT TIME ZONE 'UTC'),
+  date_trunc('month', now() AT TIME ZONE 'UTC') + INTERVAL '3 months',
+  INTERVAL '1 month'
+) AS m;
+
+INSERT INTO public.attestazioni (
+  id, contract_id, generated_at, output_bucket, output_object, full_data_snapshot, author_hash, status
+)
+SELECT id, contract_id, COALESCE(generated_at, now()), output_bucket, output_object, full_data_snapshot, author_hash, status
+FROM public.attestazioni_legacy;
+
+DROP TABLE public.attestazioni_legacy;
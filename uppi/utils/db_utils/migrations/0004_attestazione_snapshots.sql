@@ -0,0 +1,54 @@
+-- Content-addressed знімки атестацій: однаковий full_data_snapshot зберігається один раз,
+-- attestazioni посилається на нього через snapshot_hash.
+-- hash = sha256(jsonb::text): текст jsonb канонічний (порядок ключів, пробіли), тож той самий
+-- вміст дає той самий ключ і тут, і в db_insert_attestazione_log.
+-- Звіт про економію місця: python -m uppi.utils.db_utils.snapshots
+
+CREATE TABLE IF NOT EXISTS public.attestazione_snapshots (
+  hash        TEXT PRIMARY KEY,
+  data        JSONB NOT NULL,
+  size_bytes  INTEGER NOT NULL, -- octet_length(data::text): скільки займав би знімок у кожному рядку
+  created_at  TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Метадані, що раніше домішувались у snapshot, стають колонками (інакше кожен знімок унікальний)
+ALTER TABLE public.attestazioni
+  ADD COLUMN snapshot_hash     TEXT REFERENCES public.attestazione_snapshots(hash),
+  ADD COLUMN author_masked     TEXT,
+  ADD COLUMN template_version  TEXT,
+  ADD COLUMN error             TEXT;
+
+-- Перенесення: прибираємо домішані метадані та contract.updated_at (змінюється на кожному upsert-і)
+CREATE TEMP TABLE attestazioni_snapshot_migration ON COMMIT DROP AS
+SELECT
+  a.id,
+  a.generated_at,
+  a.full_data_snapshot->>'error' AS error,
+  a.full_data_snapshot->>'author_masked' AS author_masked,
+  a.full_data_snapshot->>'template_version' AS template_version,
+  s.data,
+  encode(sha256(convert_to(s.data::text, 'UTF8')), 'hex') AS hash
+FROM public.attestazioni a
+CROSS JOIN LATERAL (
+  SELECT (a.full_data_snapshot - 'error' - 'author_masked') #- '{contract_ctx,contract,updated_at}' AS data
+) s;
+
+INSERT INTO public.attestazione_snapshots (hash, data, size_bytes)
+SELECT DISTINCT ON (hash) hash, data, octet_length(data::text)
+FROM attestazioni_snapshot_migration
+ORDER BY hash
+ON CONFLICT (hash) DO NOTHING;
+
+UPDATE public.attestazioni a
+SET snapshot_hash = m.hash,
+    error = m.error,
+    author_masked = m.author_masked,
+    template_version = m.template_version
+FROM attestazioni_snapshot_migration m
+WHERE a.id = m.id AND a.generated_at = m.generated_at;
+
+ALTER TABLE public.attestazioni ALTER COLUMN snapshot_hash SET NOT NULL;
+ALTER TABLE public.attestazioni DROP COLUMN full_data_snapshot;
+
+-- GC знімків після retention (NOT EXISTS по snapshot_hash)
+CREATE INDEX IF NOT EXISTS idx_attestazioni_snapshot_hash ON public.attestazioni(snapshot_hash);
@@ -0,0 +1,14 @@
+-- Журнал прогонів павука: один рядок на прогін із підсумковими метриками
+-- (db_pool, identity_map, db_query — статистика запитів по мітках, див. uppi/services/query_stats.py).
+-- Пише UppiPipeline.close_spider.
+
+CREATE TABLE IF NOT EXISTS public.run_ledger (
+  id           BIGSERIAL PRIMARY KEY,
+  spider       TEXT NOT NULL,
+  started_at   TIMESTAMPTZ NOT NULL,
+  finished_at  TIMESTAMPTZ NOT NULL DEFAULT now(),
+  items        INTEGER NOT NULL DEFAULT 0,
+  stats        JSONB NOT NULL DEFAULT '{}'::jsonb
+);
+
+CREATE INDEX IF NOT EXISTS idx_run_ledger_spider_started ON public.run_ledger(spider, started_at DESC);
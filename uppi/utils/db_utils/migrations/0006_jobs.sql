@@ -0,0 +1,31 @@
+-- Черга задач у PostgreSQL: кілька вузлів беруть роботу з однієї таблиці без іншої координації
+-- (uppi/services/jobs.py, python -m uppi.cli.jobs).
+--
+-- Lease: UPDATE ... FROM (SELECT ... FOR UPDATE SKIP LOCKED) — воркери не чекають один на одного.
+-- Visibility timeout: взята задача отримує run_after = now() + timeout; якщо воркер помер і не
+-- завершив її, вона знову стає видимою для lease після run_after (attempts росте).
+-- attempts — також fencing token: complete / fail застарілого lease-у нічого не змінюють.
+-- Ідемпотентність: UNIQUE (kind, idempotency_key) + INSERT ... ON CONFLICT DO NOTHING.
+
+CREATE TABLE IF NOT EXISTS public.jobs (
+  id               BIGSERIAL PRIMARY KEY,
+  kind             TEXT NOT NULL CHECK (kind IN ('fetch_visura', 'process_client', 'render_attestazione')),
+  idempotency_key  TEXT NOT NULL,
+  payload          JSONB NOT NULL DEFAULT '{}'::jsonb,
+  status           TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'done', 'failed')),
+  attempts         INTEGER NOT NULL DEFAULT 0,
+  max_attempts     INTEGER NOT NULL DEFAULT 5,
+  run_after        TIMESTAMPTZ NOT NULL DEFAULT now(),
+  leased_by        TEXT,
+  last_error       TEXT,
+  result           JSONB,
+  created_at       TIMESTAMPTZ NOT NULL DEFAULT now(),
+  updated_at       TIMESTAMPTZ NOT NULL DEFAULT now(),
+  finished_at      TIMESTAMPTZ,
+  CONSTRAINT uq_jobs_kind_idempotency_key UNIQUE (kind, idempotency_key)
+);
+
+-- Lease: готові (queued) і прострочені (running з минулим run_after) задачі одного kind
+CREATE INDEX IF NOT EXISTS idx_jobs_ready
+  ON public.jobs(kind, run_after)
+  WHERE status IN ('queued', 'running');
@@ -0,0 +1,8 @@
+-- Інкрементальна генерація атестацій: відбиток входу (параметри шаблону + TEMPLATE_VERSION,
+-- uppi/services/attestazione_generator.template_params_fingerprint) зберігається з кожною
+-- успішною генерацією. Якщо відбиток останньої generated-атестації контракту збігається з
+-- поточним, рендер / upload / запис пропускаються (--force-render — згенерувати все одно).
+-- Пошук останньої атестації контракту йде по idx_attestazioni_contract_generated.
+
+ALTER TABLE public.attestazioni
+  ADD COLUMN IF NOT EXISTS input_fingerprint TEXT;
@@ -0,0 +1,47 @@
+-- Знімки атестацій, записані до ITEM_RUNTIME_FIELDS (uppi/services/visura_processor.py), тягнуть
+-- у yaml_item службові поля прогону (метрики, outcomes, job_id) — такий знімок унікальний на кожен
+-- прогін, і 0004 їх не дедуплікує. Прибираємо ті самі ключі з yaml_item, перераховуємо hash
+-- (та сама формула, що в 0004 / db_insert_attestazione_log), перевішуємо attestazioni на новий
+-- знімок і видаляємо старі, на які більше ніхто не посилається.
+-- Список ключів має збігатися з ITEM_RUNTIME_FIELDS (перевіряє tests/test_attestazione_snapshots.py).
+
+CREATE TEMP TABLE snapshot_runtime_rehash ON COMMIT DROP AS
+SELECT
+  s.hash AS old_hash,
+  n.data,
+  encode(sha256(convert_to(n.data::text, 'UTF8')), 'hex') AS new_hash
+FROM public.attestazione_snapshots s
+CROSS JOIN (
+  SELECT ARRAY[
+    'visura_unchanged',
+    'visura_parse_error',
+    'visura_parse_report',
+    'db_query_stats',
+    'stage_outcomes',
+    'immobili_outcomes',
+    'owner_lock_wait_ms',
+    'processing_error',
+    'job_id'
+  ]::text[] AS keys
+) k
+CROSS JOIN LATERAL (
+  SELECT jsonb_set(s.data, '{yaml_item}', (s.data->'yaml_item') - k.keys) AS data
+) n
+WHERE jsonb_typeof(s.data->'yaml_item') = 'object'
+  AND (s.data->'yaml_item') ?| k.keys;
+
+INSERT INTO public.attestazione_snapshots (hash, data, size_bytes)
+SELECT DISTINCT ON (new_hash) new_hash, data, octet_length(data::text)
+FROM snapshot_runtime_rehash
+ORDER BY new_hash
+ON CONFLICT (hash) DO NOTHING;
+
+UPDATE public.attestazioni a
+SET snapshot_hash = r.new_hash
+FROM snapshot_runtime_rehash r
+WHERE a.snapshot_hash = r.old_hash;
+
+DELETE FROM public.attestazione_snapshots s
+USING snapshot_runtime_rehash r
+WHERE s.hash = r.old_hash
+  AND NOT EXISTS (SELECT 1 FROM public.attestazioni a WHERE a.snapshot_hash = s.hash);
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Обслуговування місячних партицій canone_calcoli / attestazioni (міграція 0003).
+
+- Створює партиції наперед (поточний місяць + AUDIT_PARTITIONS_AHEAD) і для місяців,
+  рядки яких потрапили в <table>_default (їх переносить ensure_monthly_partition).
+- Retention: у партиціях, старших за AUDIT_RETENTION_MONTHS, видаляє рядки, для яких
+  у контракту є новіший запис; порожня партиція дропається цілком. Останній запис
+  кожного контракту лишається, хоч би яким старим він був.
+- Після retention прибирає знімки attestazione_snapshots без посилань.
+
+Запуск (напр. щодня з cron):
+    python -m uppi.utils.db_utils.partitions
+    python -m uppi.utils.db_utils.partitions --dry-run
+    python -m uppi.utils.db_utils.partitions --retention-months 12 --months-ahead 6
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import re
+import sys
+from dataclasses import dataclass, field
+from datetime import date, datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from decouple import config
+from psycopg import sql
+
+from uppi.utils.db_utils.snapshots import gc_snapshots
+
+logger = logging.getLogger(__name__)
+
+AUDIT_RETENTION_MONTHS = int(config("AUDIT_RETENTION_MONTHS", default="24"))
+AUDIT_PARTITIONS_AHEAD = int(config("AUDIT_PARTITIONS_AHEAD", default="3"))
+
+PARTITION_NAME_REGEX = re.compile(r"_p(\d{4})(\d{2})$")
+
+
+@dataclass(frozen=True)
+class PartitionedTable:
+    name: str
+    key_column: str
+
+
+PARTITIONED_TABLES = (
+    PartitionedTable("canone_calcoli", "calculated_at"),
+    PartitionedTable("attestazioni", "generated_at"),
+)
+
+
+def month_start(d: date) -> date:
+    return date(d.year, d.month, 1)
+
+
+def add_months(d: date, months: int) -> date:
+    idx = d.year * 12 + (d.month - 1) + months
+    return date(idx // 12, idx % 12 + 1, 1)
+
+
+def partition_month(partition_name: str) -> Optional[date]:
+    """Місяць партиції з суфікса _pYYYYMM (None для _default)."""
+    m = PARTITION_NAME_REGEX.search(partition_name)
+    return date(int(m.group(1)), int(m.group(2)), 1) if m else None
+
+
+def expired_partitions(partitions: List[str], cutoff: date) -> List[str]:
+    """Партиції, весь діапазон яких старший за cutoff (перший місяць, що зберігається повністю)."""
+    return sorted(p for p in partitions if (month := partition_month(p)) is not None and month < cutoff)
+
+
+@dataclass
+class MaintenanceReport:
+    created: List[str] = field(default_factory=list)
+    dropped: List[str] = field(default_factory=list)
+    # partition -> видалено (або для dry-run: було б видалено) рядків
+    rows_deleted: Dict[str, int] = field(default_factory=dict)
+    snapshots_deleted: int = 0
+
+    def print(self, dry_run: bool = False) -> None:
+        verb = "було б " if dry_run else ""
+        print("=" * 80)
+        print(f"Створено партицій: {len(self.created)}" + (f" ({', '.join(self.created)})" if self.created else ""))
+        print(f"Дропнуто {verb}партицій: {len(self.dropped)}" + (f" ({', '.join(self.dropped)})" if self.dropped else ""))
+        for partition, rows in sorted(self.rows_deleted.items()):
+            print(f"  {partition:<35} {verb}видалено рядків: {rows}")
+        print(f"Осиротілих знімків атестацій {verb}видалено: {self.snapshots_deleted}")
+
+
+def list_partitions(conn, table: PartitionedTable) -> List[str]:
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT c.relname
+            FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = %s::regclass
+            ORDER BY c.relname;
+            """,
+            (f"public.{table.name}",),
+        )
+        return [row[0] for row in cur.fetchall()]
+
+
+def _default_partition_months(conn, table: PartitionedTable) -> List[date]:
+    query = sql.SQL(
+        "SELECT DISTINCT date_trunc('month', {key} AT TIME ZONE 'UTC')::date FROM public.{default} ORDER BY 1;"
+    ).format(key=sql.Identifier(table.key_column), default=sql.Identifier(f"{table.name}_default"))
+    with conn.cursor() as cur:
+        cur.execute(query)
+        return [row[0] for row in cur.fetchall()]
+
+
+def ensure_partitions(conn, table: PartitionedTable, today: date, months_ahead: int, dry_run: bool = False) -> List[str]:
+    existing = set(list_partitions(conn, table))
+    current = month_start(today)
+    months = {add_months(current, i) for i in range(months_ahead + 1)}
+    months.update(_default_partition_months(conn, table))
+
+    created: List[str] = []
+    for month in sorted(months):
+        name = f"{table.name}_p{month:%Y%m}"
+        if name in existing:
+            continue
+        if not dry_run:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT public.ensure_monthly_partition(%s, %s, %s);",
+                    (table.name, table.key_column, month),
+                )
+            conn.commit()
+        created.append(name)
+    return created
+
+
+def _superseded_condition(table: PartitionedTable) -> sql.Composed:
+    # Рядок застарів, якщо у того ж контракту є новіший (в будь-якій партиції)
+    return sql.SQL(
+        "EXISTS (SELECT 1 FROM public.{table} newer "
+        "WHERE newer.contract_id = old.contract_id AND newer.{key} > old.{key})"
+    ).format(table=sql.Identifier(table.name), key=sql.Identifier(table.key_column))
+
+
+def apply_retention(
+    conn, table: PartitionedTable, cutoff: date, dry_run: bool = False
+) -> Tuple[List[str], Dict[str, int]]:
+    """Повертає (дропнуті партиції, видалені рядки по партиціях). Кожна партиція — окрема транзакція."""
+    dropped: List[str] = []
+    rows_deleted: Dict[str, int] = {}
+    superseded = _superseded_condition(table)
+    for partition in expired_partitions(list_partitions(conn, table), cutoff):
+        part = sql.Identifier(partition)
+        with conn.cursor() as cur:
+            if dry_run:
+                cur.execute(
+                    sql.SQL(
+                        "SELECT count(*) FILTER (WHERE {superseded}), bool_and({superseded}) IS NOT FALSE "
+                        "FROM public.{part} old;"
+                    ).format(part=part, superseded=superseded)
+                )
+                deleted, now_empty = cur.fetchone()
+            else:
+                cur.execute(
+                    sql.SQL(
+                        "WITH deleted AS (DELETE FROM public.{part} old WHERE {superseded} RETURNING 1) "
+                        "SELECT count(*) FROM deleted;"
+                    ).format(part=part, superseded=superseded)
+                )
+                deleted = cur.fetchone()[0]
+                cur.execute(sql.SQL("SELECT NOT EXISTS (SELECT 1 FROM public.{part});").format(part=part))
+                now_empty = cur.fetchone()[0]
+                if now_empty:
+                    cur.execute(sql.SQL("DROP TABLE public.{part};").format(part=part))
+        if dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+        if now_empty:
+            dropped.append(partition)
+        if deleted:
+            rows_deleted[partition] = deleted
+        logger.info("[PARTITIONS] %s: застарілих рядків %s%s", partition, deleted, ", партицію дропнуто" if now_empty else "")
+    return dropped, rows_deleted
+
+
+def run_maintenance(
+    conn,
+    today: Optional[date] = None,
+    months_ahead: int = AUDIT_PARTITIONS_AHEAD,
+    retention_months: int = AUDIT_RETENTION_MONTHS,
+    dry_run: bool = False,
+) -> MaintenanceReport:
+    today = today or datetime.now(timezone.utc).date()
+    cutoff = add_months(month_start(today), -retention_months)
+    report = MaintenanceReport()
+    for table in PARTITIONED_TABLES:
+        report.created.extend(ensure_partitions(conn, table, today, months_ahead, dry_run=dry_run))
+        dropped, rows_deleted = apply_retention(conn, table, cutoff, dry_run=dry_run)
+        report.dropped.extend(dropped)
+        report.rows_deleted.update(rows_deleted)
+    report.snapshots_deleted = gc_snapshots(conn, dry_run=dry_run)
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Партиції та retention для canone_calcoli / attestazioni")
+    parser.add_argument("--months-ahead", type=int, default=AUDIT_PARTITIONS_AHEAD,
+                        help="Скільки майбутніх місячних партицій тримати створеними")
+    parser.add_argument("--retention-months", type=int, default=AUDIT_RETENTION_MONTHS,
+                        help="Скільки місяців історії зберігати повністю (крім останнього запису контракту)")
+    parser.add_argument("--dry-run", action="store_true", help="Лише показати, що буде зроблено")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+
+    from uppi.domain.db import get_pg_connection
+
+    conn = get_pg_connection()
+    try:
+        report = run_maintenance(
+            conn, months_ahead=args.months_ahead, retention_months=args.retention_months, dry_run=args.dry_run
+        )
+    finally:
+        conn.close()
+    report.print(dry_run=args.dry_run)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
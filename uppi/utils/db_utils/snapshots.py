@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Content-addressed знімки атестацій (attestazione_snapshots, міграції 0004 і 0008 — знімки
+до ITEM_RUNTIME_FIELDS перераховано без службових полів прогону в yaml_item).
+
+- storage_report: скільки місця займали б знімки в кожному рядку attestazioni
+  і скільки займають після дедуплікації.
+- gc_snapshots: видаляє знімки, на які вже не посилається жодна атестація
+  (після retention у партиціях, див. partitions.py).
+
+Запуск:
+    python -m uppi.utils.db_utils.snapshots           # звіт
+    python -m uppi.utils.db_utils.snapshots --gc      # + прибрати осиротілі знімки
+"""
+from __future__ import annotations
+
+import argparse
+import logging
+import sys
+from dataclasses import dataclass
+from typing import List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SnapshotStorageReport:
+    attestazioni: int
+    snapshots: int
+    # Сума size_bytes по всіх атестаціях — стільки займали б знімки, збережені в кожному рядку
+    logical_bytes: int
+    # Сума size_bytes унікальних знімків
+    stored_bytes: int
+    # Фактичний розмір таблиці attestazione_snapshots (з TOAST та індексами)
+    table_bytes: int
+
+    @property
+    def saved_bytes(self) -> int:
+        return self.logical_bytes - self.stored_bytes
+
+    @property
+    def dedup_ratio(self) -> float:
+        return round(self.logical_bytes / self.stored_bytes, 2) if self.stored_bytes else 0.0
+
+    def print(self) -> None:
+        print("=" * 80)
+        print(f"Атестацій: {self.attestazioni}, унікальних знімків: {self.snapshots}")
+        print(f"Знімки без дедуплікації: {self.logical_bytes / 1024:.1f} KiB")
+        print(f"Знімки з дедуплікацією:  {self.stored_bytes / 1024:.1f} KiB (таблиця на диску: {self.table_bytes / 1024:.1f} KiB)")
+        print(f"Збережено: {self.saved_bytes / 1024:.1f} KiB (x{self.dedup_ratio})")
+
+
+def storage_report(conn) -> SnapshotStorageReport:
+    with conn.cursor() as cur:
+        cur.execute(
+            """
+            SELECT
+              (SELECT count(*) FROM public.attestazioni),
+              (SELECT count(*) FROM public.attestazione_snapshots),
+              (SELECT COALESCE(sum(s.size_bytes), 0)
+                 FROM public.attestazioni a
+                 JOIN public.attestazione_snapshots s ON s.hash = a.snapshot_hash),
+              (SELECT COALESCE(sum(size_bytes), 0) FROM public.attestazione_snapshots),
+              pg_total_relation_size('public.attestazione_snapshots');
+            """
+        )
+        row = cur.fetchone()
+    conn.rollback()
+    return SnapshotStorageReport(*(int(v) for v in row))
+
+
+def gc_snapshots(conn, dry_run: bool = False) -> int:
+    """Видаляє знімки без посилань. Повертає кількість (для dry-run — скільки було б видалено)."""
+    with conn.cursor() as cur:
+        # Блокує нові INSERT-и (ROW EXCLUSIVE) і чекає на транзакції, що вже посилаються на
+        # знімок через ON CONFLICT DO NOTHING, — інакше їх FK-перевірка впала б на видаленому рядку
+        cur.execute("LOCK TABLE public.attestazione_snapshots IN SHARE ROW EXCLUSIVE MODE;")
+        cur.execute(
+            """
+            WITH deleted AS (
+              DELETE FROM public.attestazione_snapshots s
+              WHERE NOT EXISTS (SELECT 1 FROM public.attestazioni a WHERE a.snapshot_hash = s.hash)
+              RETURNING 1
+            )
+            SELECT count(*) FROM deleted;
+            """
+        )
+        deleted = cur.fetchone()[0]
+    if dry_run:
+        conn.rollback()
+    else:
+        conn.commit()
+    logger.info("[SNAPSHOTS] Осиротілих знімків: %s%s", deleted, " (dry-run)" if dry_run else "")
+    return deleted
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Звіт / GC для attestazione_snapshots")
+    parser.add_argument("--gc", action="store_true", help="Видалити знімки, на які не посилається жодна атестація")
+    parser.add_argument("--dry-run", action="store_true", help="Для --gc: лише порахувати")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(message)s")
+
+    from uppi.domain.db import get_pg_connection
+
+    conn = get_pg_connection()
+    try:
+        if args.gc:
+            gc_snapshots(conn, dry_run=args.dry_run)
+        storage_report(conn).print()
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
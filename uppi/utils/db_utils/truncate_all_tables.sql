@@ -2,8 +2,8 @@ DO $$
 DECLARE 
     r RECORD;
 BEGIN
-    -- Проходимо по всіх таблицях у схемі public
-    FOR r IN (SELECT tablename FROM pg_tables WHERE schemaname = 'public') LOOP
+    -- Проходимо по всіх таблицях у схемі public (крім журналу міграцій — схема лишається тією ж)
+    FOR r IN (SELECT tablename FROM pg_tables WHERE schemaname = 'public' AND tablename <> 'schema_migrations') LOOP
         EXECUTE 'TRUNCATE TABLE public.' || quote_ident(r.tablename) || ' RESTART IDENTITY CASCADE';
     END LOOP;
 END $$;
\ No newline at end of file
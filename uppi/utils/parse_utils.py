@@ -6,6 +6,7 @@ from enum import Enum
 import re
 from datetime import date, datetime
 from typing import Any, Optional
+from uuid import UUID
 
 
 def clean_str(v: Any) -> Optional[str]:
@@ -81,7 +82,7 @@ def parse_date(v: Any) -> Optional[date]:
 
 # JSON encoder that converts Decimal and Enum to JSON-serializable formats
 def prepare_for_json(obj):
-    """Рекурсивно конвертує Decimal та Enum у формати, придатні для JSON."""
+    """Рекурсивно конвертує Decimal, Enum, дати та UUID (psycopg 3 повертає uuid.UUID) у формати JSON."""
     if isinstance(obj, dict):
         return {k: prepare_for_json(v) for k, v in obj.items()}
     elif isinstance(obj, list):
@@ -92,6 +93,8 @@ def prepare_for_json(obj):
         return obj.value
     elif isinstance(obj, (date, datetime)):
         return obj.isoformat()
+    elif isinstance(obj, UUID):
+        return str(obj)
     return obj
 
 